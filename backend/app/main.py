@@ -1,16 +1,38 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from app.services.chatbot import StoryboardChatbot, ChatRequest, ChatResponse
-from app.utils.image_search import GoogleImageSearch
+from fastapi.responses import JSONResponse, PlainTextResponse, FileResponse, Response, StreamingResponse
+from app.services.chatbot import StoryboardChatbot, ChatRequest, ChatResponse, ChatTurnFailed
+from app.utils.image_search import GoogleImageSearch, next_image_candidate
+from app.utils.image_library import get_image_library
+from app.services.image_proxy import get_image_proxy
+from app.services.image_query_index import get_image_query_index
+from app.services.image_resolver import get_image_resolver, image_progress, PENDING
+from app.services.story_writer import StoryWriter
+from app.services.story_versions import get_story_versions
+from app.services.project_events import project_events, STORY_UPDATED, STORYBOARD_UPDATED, CHAT_MESSAGE, PING, RESYNC
+from app.services.story_search import get_story_search, index_chat, index_storyboard
+from app.services.project_archive import export_projects, import_archive, ArchiveError, ArchiveConflict, ARCHIVE_FORMATS, ON_CONFLICT
+from app.services.storage_gc import collect_garbage, GCInProgress
+from app.services.shared_cache import get_shared_cache
+from app.services.chat_admission import chat_admission, AdmissionRejected, Ticket
+from app.services.idempotency import get_idempotency_store, fingerprint, IdempotencyConflict, MAX_KEY_LENGTH, NEW as IDEMPOTENT_NEW
 from app.utils.json_extractor import extract_json_from_text, convert_to_story_format
+from app.utils.storage import get_data_dir, get_project_dir
+from app.utils import storage_io
+from app.utils.file_lock import project_lock
+from app.utils.storage_io import read_json, write_json
+from app.utils.metrics import REGISTRY, MetricsMiddleware, record_cache, CHAT_STREAM_FIRST_TOKEN, IDEMPOTENT_REQUESTS
+from app.utils.tracing import TracingMiddleware, ring_buffer, group_traces, stage_breakdown
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import re
 import json
+import asyncio
+import tempfile
+import time
 from datetime import datetime
 from pathlib import Path
-from dotenv import load_dotenv
-
-load_dotenv()
+from config.settings import config_service, get_settings
 
 app = FastAPI()
 
@@ -25,6 +47,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+# Reload configuration when llm_config.json or .env changes (CONFIG_WATCH_INTERVAL, 0 disables)
+config_service.start_watcher()
+
 @app.get("/")
 async def root():
     return {"message": "Hello from FastAPI backend!"}
@@ -33,6 +61,47 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "backend"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics for backend routes, upstream calls and storyboard generation"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/traces")
+async def list_traces(limit: int = 20):
+    """List the most recent request traces from the in-memory buffer"""
+    return {"success": True, "traces": group_traces(ring_buffer.spans(), limit=limit)}
+
+@app.get("/api/traces/stages")
+async def get_trace_stages(route: Optional[str] = None):
+    """Per-stage latency breakdown over buffered spans, optionally limited to one route's traces"""
+    spans = ring_buffer.spans()
+    if route:
+        trace_ids = {s["trace_id"] for s in spans if s["parent_id"] is None and s["name"].endswith(f" {route}")}
+        spans = [s for s in spans if s["trace_id"] in trace_ids]
+    return {"success": True, "stages": stage_breakdown(spans)}
+
+@app.get("/api/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Get every buffered span of one trace, in start order"""
+    spans = sorted((s for s in ring_buffer.spans() if s["trace_id"] == trace_id), key=lambda s: s["start_time"])
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return {"success": True, "trace_id": trace_id, "spans": spans}
+
+@app.get("/api/admin/config")
+async def get_config():
+    """Current configuration snapshot with secrets redacted"""
+    return {"success": True, "config": config_service.describe()}
+
+@app.post("/api/admin/config/reload")
+async def reload_config():
+    """Re-read llm_config.json and the environment and swap in a new configuration snapshot"""
+    try:
+        settings, changed = config_service.reload()
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid configuration, keeping version {config_service.get().version}: {e}")
+    return {"success": True, "version": settings.version, "changed": changed}
+
 @app.get("/api/test")
 async def test_endpoint():
     return {
@@ -47,13 +116,36 @@ class ProjectRequest(BaseModel):
     typeName: str
     userInput: str
 
+def _create_project_files(project_dir: Path, project_file: Path, project_data: dict):
+    project_dir.mkdir(parents=True, exist_ok=True)
+    with project_lock(project_dir):
+        write_json(project_file, project_data)
+
+async def _idempotent(route: str, idempotency_key: Optional[str], payload: BaseModel, run: Callable[[], Awaitable[Any]]):
+    """
+    Run a request once per ``Idempotency-Key``: retries wait for the first run
+    or replay its response (marked ``Idempotent-Replayed: true``)
+    """
+    if not idempotency_key or not get_settings().idempotency.enabled:
+        return await run()
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+    try:
+        result, outcome = await get_idempotency_store().run(route, idempotency_key, fingerprint(payload), run)
+    except IdempotencyConflict as e:
+        IDEMPOTENT_REQUESTS.inc(route=route, result="conflict")
+        raise HTTPException(status_code=422, detail=str(e))
+    IDEMPOTENT_REQUESTS.inc(route=route, result=outcome)
+    return JSONResponse(result, headers={"Idempotent-Replayed": "true"} if outcome != IDEMPOTENT_NEW else None)
+
 @app.post("/api/create-project")
-async def create_project(request: ProjectRequest):
-    """Create a new project folder and JSON file"""
+async def create_project(request: ProjectRequest, idempotency_key: Optional[str] = Header(None)):
+    """Create a new project folder and JSON file; a retry with the same ``Idempotency-Key`` gets the first response"""
+    return await _idempotent("create-project", idempotency_key, request, lambda: _create_project(request))
+
+async def _create_project(request: ProjectRequest):
     try:
-        # Create project directory
-        project_dir = Path(__file__).parent.parent.parent / "data" / f"project_{request.projectId}"
-        project_dir.mkdir(parents=True, exist_ok=True)
+        project_dir = get_project_dir(request.projectId)
 
         # Create project metadata
         project_data = {
@@ -65,50 +157,62 @@ async def create_project(request: ProjectRequest):
             "storyboard": None
         }
 
-        # Save project file
+        # Create project directory and save project file
         project_file = project_dir / f"project_type{request.typeId}.json"
-        with open(project_file, "w") as f:
-            json.dump(project_data, f, indent=2)
+        await storage_io.write(_create_project_files, project_dir, project_file, project_data)
 
         return {"success": True, "projectId": request.projectId, "projectDir": str(project_dir)}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating project: {str(e)}")
 
+def _load_project(project_dir: Path) -> dict:
+    """Read a project file and its listed stories"""
+    if not project_dir.exists():
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    # Find project file
+    project_files = list(project_dir.glob("project_type*.json"))
+    if not project_files:
+        raise HTTPException(status_code=404, detail="Project file not found")
+
+    # Read project data
+    project_data = read_json(project_files[0])
+
+    # Read story files if they exist
+    stories = []
+    story_ids = []
+    pending_files = []
+    if "stories" in project_data and project_data["stories"]:
+        for story_name in project_data["stories"]:
+            story_file = project_dir / f"{story_name}.json"
+            if story_file.exists():
+                story_data = read_json(story_file)
+                stories.append(story_data)
+                story_ids.append(story_name)
+                if isinstance(story_data, dict) and story_data.get("image_status") == PENDING:
+                    pending_files.append(story_file)
+
+    return {"project": project_data, "stories": stories, "story_ids": story_ids, "pending_files": pending_files}
+
 @app.get("/api/project/{project_id}")
 async def get_project(project_id: str):
     """Get project data by ID"""
     try:
-        # Find project directory
-        project_dir = Path(__file__).parent.parent.parent / "data" / f"project_{project_id}"
-        if not project_dir.exists():
-            raise HTTPException(status_code=404, detail="Project not found")
+        loaded = await storage_io.read(_load_project, get_project_dir(project_id))
 
-        # Find project file
-        project_files = list(project_dir.glob("project_type*.json"))
-        if not project_files:
-            raise HTTPException(status_code=404, detail="Project file not found")
-
-        # Read project data
-        with open(project_files[0], "r") as f:
-            project_data = json.load(f)
-
-        # Read story files if they exist
-        stories = []
-        if "stories" in project_data and project_data["stories"]:
-            for story_name in project_data["stories"]:
-                story_file = project_dir / f"{story_name}.json"
-                if story_file.exists():
-                    with open(story_file, "r") as f:
-                        story_data = json.load(f)
-                        stories.append(story_data)
-
-        # Return project data with stories
-        return {
+        # Pending images left behind by a restart are queued again; queued ones are not duplicated
+        if loaded["pending_files"]:
+            get_image_resolver().submit(loaded["pending_files"])
+
+        # Return project data with stories, encoded off the event loop (a long storyboard is hundreds of KB)
+        return await storage_io.read(JSONResponse, {
             "success": True,
-            "project": project_data,
-            "stories": stories
-        }
+            "project": loaded["project"],
+            "stories": loaded["stories"],
+            "story_ids": loaded["story_ids"],
+            "images": image_progress(loaded["stories"])
+        })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading project: {str(e)}")
@@ -129,43 +233,219 @@ class ChatRequestWithProject(BaseModel):
     conversation_history: Optional[List[dict]] = []
     project_id: Optional[str] = None
 
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat_with_ai(request: ChatRequestWithProject):
-    """Send a message to the AI chatbot for storyboard assistance"""
-    try:
-        if not request.message.strip():
-            raise HTTPException(status_code=400, detail="Message cannot be empty")
+def _chat_upstream() -> Tuple[str, int]:
+    """The upstream chat turns go to, and how many turns it may run at once"""
+    if chatbot_service.router is not None:
+        return "router", sum(provider.max_concurrency for provider in chatbot_service.router.providers)
+    return "langflow", get_settings().admission.upstream_concurrency * len(chatbot_service.pool.endpoints)
 
-        # Convert dict conversation history to ChatMessage objects for chatbot service
-        from app.services.chatbot import ChatMessage as ServiceChatMessage
-        chat_history = []
-        if request.conversation_history:
-            for msg in request.conversation_history:
-                chat_history.append(ServiceChatMessage(role=msg.get("role", "user"), content=msg.get("content", "")))
+async def _admit_chat_turn(project_id: Optional[str]) -> Ticket:
+    """Wait for an upstream slot, or answer 429/503 with Retry-After when the turn is refused"""
+    upstream, capacity = _chat_upstream()
+    try:
+        return await chat_admission.admit(upstream, capacity, project_id)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
-        ai_response = chatbot_service.generate_response(
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat_with_ai(request: ChatRequestWithProject, idempotency_key: Optional[str] = Header(None)):
+    """
+    Send a message to the AI chatbot for storyboard assistance
+
+    A retry with the same ``Idempotency-Key`` waits for the turn already
+    running (or gets its stored reply) instead of starting another Langflow run.
+    Such requests get 502/504 when the AI service fails, so the failure is not
+    stored and the retry reaches the service again; without a key the apology
+    is the reply.
+    """
+    return await _idempotent("chat", idempotency_key, request, lambda: _chat_turn(request, raise_errors=bool(idempotency_key)))
+
+async def _chat_turn(request: ChatRequestWithProject, raise_errors: bool = False) -> ChatResponse:
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+
+    # Convert dict conversation history to ChatMessage objects for chatbot service
+    from app.services.chatbot import ChatMessage as ServiceChatMessage
+    chat_history = []
+    if request.conversation_history:
+        for msg in request.conversation_history:
+            chat_history.append(ServiceChatMessage(role=msg.get("role", "user"), content=msg.get("content", "")))
+
+    ticket = await _admit_chat_turn(request.project_id)
+    try:
+        # a turn waits on Langflow and writes story files; neither may hold up the event loop
+        ai_response = await ticket.run(
+            chatbot_service.generate_response,
             user_message=request.message,
             conversation_history=chat_history,
-            project_id=request.project_id
+            project_id=request.project_id,
+            raise_errors=raise_errors
         )
 
         return ChatResponse(message=ai_response, success=True)
 
+    except ChatTurnFailed as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
+# Streamed chat turns still running; kept referenced until they finish, even if their client went away
+_orphaned_turns = set()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_with_ai_stream(request: ChatRequestWithProject, idempotency_key: Optional[str] = Header(None)):
+    """
+    Send a message to the AI chatbot and stream the reply as server-sent events
+
+    Events: ``start`` straight away, ``token`` for each piece of the answer
+    (``reset`` means discard the pieces so far), ``screen`` for each storyboard
+    screen saved, ``saved`` once the stories are in the project, then ``done``
+    with the full message, or ``error`` with the HTTP ``status`` ``/api/chat``
+    would have answered if the AI service failed. Comment lines are sent as
+    heartbeats while nothing else is happening so proxies keep the connection open.
+
+    A retry with the same ``Idempotency-Key`` attaches to the turn already
+    running (or gets its stored reply) instead of starting another Langflow
+    run: it gets heartbeats and the final ``done``, marked ``replayed``, but
+    not the tokens and screens. Keyed turns are admitted after the stream
+    starts, so a refused one ends with an ``error`` event carrying 429/503
+    and ``retry_after``.
+    """
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    keyed = bool(idempotency_key) and get_settings().idempotency.enabled
+    if keyed and len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+
+    from app.services.chatbot import ChatMessage as ServiceChatMessage
+    chat_history = [ServiceChatMessage(role=msg.get("role", "user"), content=msg.get("content", ""))
+                    for msg in request.conversation_history or []]
+    # refused turns get a plain 429/503 before the event stream starts; a keyed retry
+    # must not be refused for the turn it is waiting for, so those are admitted in the run
+    ticket = None if keyed else await _admit_chat_turn(request.project_id)
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def on_event(event: str, data: dict):
+        # called from the chatbot's worker threads
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    async def stream_turn(ticket: Ticket) -> dict:
+        message = await ticket.run(
+            chatbot_service.generate_response,
+            user_message=request.message,
+            conversation_history=chat_history,
+            project_id=request.project_id,
+            on_event=on_event,
+            raise_errors=True,
+        )
+        return {"message": message, "success": True}
+
+    async def keyed_turn() -> dict:
+        return await stream_turn(await _admit_chat_turn(request.project_id))
+
+    async def run_turn():
+        try:
+            if keyed:
+                result, outcome = await get_idempotency_store().run("chat-stream", idempotency_key, fingerprint(request), keyed_turn)
+                IDEMPOTENT_REQUESTS.inc(route="chat-stream", result=outcome)
+                if outcome != IDEMPOTENT_NEW:
+                    result = {**result, "replayed": True}
+            else:
+                result = await stream_turn(ticket)
+            queue.put_nowait(("done", result))
+        except ChatTurnFailed as e:
+            queue.put_nowait(("error", {"detail": str(e), "status": e.status_code, "success": False}))
+        except IdempotencyConflict as e:
+            IDEMPOTENT_REQUESTS.inc(route="chat-stream", result="conflict")
+            queue.put_nowait(("error", {"detail": str(e), "status": 422, "success": False}))
+        except HTTPException as e:
+            error = {"detail": e.detail, "status": e.status_code, "success": False}
+            if e.headers and "Retry-After" in e.headers:
+                error["retry_after"] = int(e.headers["Retry-After"])
+            queue.put_nowait(("error", error))
+        except Exception as e:
+            queue.put_nowait(("error", {"detail": f"Error generating response: {str(e)}", "success": False}))
+
+    start = time.perf_counter()
+    # started here rather than in events() so the admitted slot is used (and released) even if
+    # the client is gone before the stream begins; the worker thread cannot be interrupted
+    turn = asyncio.create_task(run_turn())
+    _orphaned_turns.add(turn)
+    turn.add_done_callback(_orphaned_turns.discard)
+
+    async def events():
+        first_token = True
+        heartbeat = get_settings().langflow.stream_heartbeat
+        yield _sse("start", {"project_id": request.project_id})
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if event == "token" and first_token:
+                first_token = False
+                CHAT_STREAM_FIRST_TOKEN.observe(time.perf_counter() - start)
+            yield _sse(event, data)
+            if event in ("done", "error"):
+                break
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/chat/langflow-stats")
+async def get_langflow_stats():
+    """Compare session (delta) and full-context Langflow calls, and show per-host load and latency"""
+    return {
+        "success": True,
+        "stats": chatbot_service.sessions.get_stats(),
+        "hosts": chatbot_service.pool.get_stats()
+    }
+
+@app.get("/api/chat/admission-stats")
+async def get_chat_admission_stats():
+    """Running and queued chat turns per upstream, and turns refused by reason"""
+    return {"success": True, **chat_admission.get_stats()}
+
+@app.get("/api/idempotency-stats")
+async def get_idempotency_stats():
+    """Idempotency keys held by this worker and requests by outcome"""
+    return {"success": True, **get_idempotency_store().get_stats()}
+
+@app.get("/api/chat/llm-stats")
+async def get_llm_stats():
+    """Per-provider load, latency and failures for the LLM router (when CHAT_BACKEND=router)"""
+    if chatbot_service.router is None:
+        return {"success": True, "enabled": False, "providers": []}
+    return {"success": True, "enabled": True, "providers": chatbot_service.router.get_stats()}
+
+def _save_chat_file(project_dir: Path, project_id: str, messages_data: List[dict], want_known_ids: bool):
+    """Write the chat history, returning the message ids it held before when asked"""
+    if not project_dir.exists():
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    chat_file = project_dir / "chat_history.json"
+    known_ids = None
+    with project_lock(project_dir):
+        if want_known_ids and chat_file.exists():
+            known_ids = {msg.get("id") for msg in read_json(chat_file).get("messages", [])}
+
+        write_json(chat_file, {
+            "projectId": project_id,
+            "messages": messages_data,
+            "lastUpdated": datetime.now().isoformat()
+        })
+    return known_ids
+
 @app.post("/api/chat/save")
 async def save_chat_messages(request: SaveChatRequest):
     """Save chat messages for a project"""
     try:
-        # Find project directory
-        project_dir = Path(__file__).parent.parent.parent / "data" / f"project_{request.projectId}"
-        if not project_dir.exists():
-            raise HTTPException(status_code=404, detail="Project not found")
-
-        # Save chat history to file
-        chat_file = project_dir / "chat_history.json"
-
         # Convert messages to dict format
         messages_data = []
         for msg in request.messages:
@@ -176,46 +456,38 @@ async def save_chat_messages(request: SaveChatRequest):
                 "createdAt": msg.createdAt
             })
 
-        # Save to file
-        with open(chat_file, "w") as f:
-            json.dump({
-                "projectId": request.projectId,
-                "messages": messages_data,
-                "lastUpdated": datetime.now().isoformat()
-            }, f, indent=2)
+        # Messages not in the saved history yet are pushed to other editors of the project
+        known_ids = await storage_io.write(_save_chat_file, get_project_dir(request.projectId), request.projectId,
+                                           messages_data, project_events.has_subscribers(request.projectId))
+
+        for msg in messages_data:
+            if known_ids is None or msg["id"] not in known_ids:
+                project_events.publish(request.projectId, CHAT_MESSAGE, {"message": msg})
+        await storage_io.write(index_chat, request.projectId, messages_data)
 
         return {"success": True, "message": "Chat history saved"}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving chat history: {str(e)}")
 
+def _load_chat_history(project_dir: Path) -> dict:
+    if not project_dir.exists():
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    # Return empty history if the chat file doesn't exist
+    chat_file = project_dir / "chat_history.json"
+    return read_json(chat_file) if chat_file.exists() else {}
+
 @app.get("/api/chat/history/{project_id}")
 async def get_chat_history(project_id: str):
     """Get chat history for a project"""
     try:
-        # Find project directory
-        project_dir = Path(__file__).parent.parent.parent / "data" / f"project_{project_id}"
-        if not project_dir.exists():
-            raise HTTPException(status_code=404, detail="Project not found")
-
-        # Read chat history file
-        chat_file = project_dir / "chat_history.json"
-
-        if chat_file.exists():
-            with open(chat_file, "r") as f:
-                data = json.load(f)
-                return {
-                    "success": True,
-                    "messages": data.get("messages", []),
-                    "lastUpdated": data.get("lastUpdated")
-                }
-        else:
-            # Return empty history if file doesn't exist
-            return {
-                "success": True,
-                "messages": [],
-                "lastUpdated": None
-            }
+        data = await storage_io.read(_load_chat_history, get_project_dir(project_id))
+        return {
+            "success": True,
+            "messages": data.get("messages", []),
+            "lastUpdated": data.get("lastUpdated")
+        }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading chat history: {str(e)}")
@@ -235,7 +507,8 @@ async def search_images(request: ImageSearchRequest):
             raise HTTPException(status_code=400, detail="Query cannot be empty")
 
         searcher = GoogleImageSearch()
-        results = searcher.search_images(
+        results = await asyncio.to_thread(
+            searcher.search_images,
             query=request.query,
             num_results=request.num_results,
             image_size=request.image_size,
@@ -264,7 +537,9 @@ async def get_first_image(query: str, image_type: Optional[str] = None):
             raise HTTPException(status_code=400, detail="Query cannot be empty")
 
         searcher = GoogleImageSearch()
-        result = searcher.get_first_image(query, image_type=image_type)
+        # the Custom Search call takes up to IMAGE_SEARCH_TIMEOUT seconds; keep it off the event loop
+        results = await asyncio.to_thread(searcher.search_images, query, num_results=1, image_type=image_type)
+        result = results[0] if results else None
 
         if result:
             return {
@@ -286,12 +561,142 @@ async def get_first_image(query: str, image_type: Optional[str] = None):
         raise HTTPException(status_code=500, detail=f"Error searching image: {str(e)}")
 
 
+@app.get("/api/library/{file_path:path}")
+async def get_library_image(file_path: str):
+    """Serve an image from the local stock library"""
+    # checks the manifest and may re-index the library, so it runs with the other disk reads
+    library = await storage_io.read(get_image_library)
+    path = library.resolve(file_path)
+    if path is None or not await storage_io.read(path.is_file):
+        raise HTTPException(status_code=404, detail="Library image not found")
+    return FileResponse(path)
+
+@app.get("/api/library-stats")
+async def get_library_stats():
+    """Images and terms in the local stock library index"""
+    library = await storage_io.read(get_image_library)
+    return {"success": True, "stats": library.get_stats()}
+
+@app.get("/api/search/query-stats")
+async def get_image_query_stats():
+    """Image searches answered from earlier similar queries instead of Google"""
+    return {"success": True, "stats": get_image_query_index().get_stats()}
+
+def _story_search():
+    search = get_story_search()
+    if search is None:
+        raise HTTPException(status_code=503, detail="Story search is turned off (STORY_SEARCH_INDEX=false)")
+    return search
+
+@app.get("/api/search/stories")
+async def search_stories(q: str, project_id: Optional[str] = None, kind: Optional[str] = None, limit: int = 20):
+    """Full-text search over story screens and chat messages, best matches first"""
+    search = _story_search()
+    try:
+        result = await asyncio.to_thread(search.search, q, project_id, kind, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "query": q, **result}
+
+@app.get("/api/search/stories-stats")
+async def get_story_search_stats():
+    """Documents and projects in the full-text index"""
+    return {"success": True, "stats": await asyncio.to_thread(_story_search().get_stats)}
+
+
 class JSONExtractionRequest(BaseModel):
     text: str
     validate: Optional[bool] = True
     convert_to_stories: Optional[bool] = True
 
 
+@app.get("/api/images/{image_hash}")
+async def get_proxied_image(image_hash: str, request: Request, w: Optional[int] = None, format: Optional[str] = None):
+    """
+    Serve a cached story image by content hash
+
+    ``w`` picks the nearest configured thumbnail width (panel size by default)
+    and ``format`` is ``webp``, ``jpeg`` or ``original``; without it WebP is
+    served to browsers that accept it. Content never changes for a hash, so
+    responses are cacheable for a year.
+    """
+    proxy = get_image_proxy()
+    record = await storage_io.read(proxy.get_record, image_hash)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    fmt = format or ("webp" if "image/webp" in request.headers.get("accept", "") else "jpeg")
+    if fmt not in ("webp", "jpeg", "original"):
+        raise HTTPException(status_code=400, detail="format must be webp, jpeg or original")
+
+    if fmt == "original":
+        path, media_type = proxy.original_path(image_hash), record.content_type
+    else:
+        path, media_type = await asyncio.to_thread(proxy.variant, image_hash, w, fmt)
+
+    etag = f'"{path.name}"'
+    headers = {
+        "Cache-Control": f"public, max-age={proxy.settings.cache_max_age}, immutable",
+        "ETag": etag,
+    }
+    if format is None:
+        headers["Vary"] = "Accept"
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+def _advance_story_image(story_file: Path) -> dict:
+    """Move a story file on to its next image candidate under the project lock"""
+    with project_lock(story_file.parent):
+        try:
+            story = read_json(story_file)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Story not found")
+
+        candidate = next_image_candidate(story)
+        record_cache("image_candidates", candidate is not None)
+        if candidate is None:
+            raise HTTPException(status_code=409, detail="No stored image candidates for this story")
+
+        proxy = get_image_proxy()
+        if proxy.settings.enabled:
+            proxy.rewrite_story(story)
+
+        write_json(story_file, story)
+    return story
+
+@app.post("/api/project/{project_id}/stories/{story_id}/next-image")
+async def next_story_image(project_id: str, story_id: str):
+    """
+    Switch a story to its next ranked image candidate
+
+    Candidates are stored on the story when it is generated, so this never
+    calls the search API; it wraps around after the last candidate.
+    """
+    project_dir = get_project_dir(project_id)
+    story_file = project_dir / f"{story_id}.json"
+    if not re.fullmatch(r"story_[\w-]+", story_id):
+        raise HTTPException(status_code=404, detail="Story not found")
+    # may download the new image, so it runs on the default executor rather than the write pool
+    story = await asyncio.to_thread(_advance_story_image, story_file)
+    project_events.publish(project_id, STORY_UPDATED, {"story_id": story_id, "story": story})
+
+    return {
+        "success": True,
+        "story": story,
+        "candidate_index": story["image_candidate_index"],
+        "candidate_count": len(story["image_candidates"]),
+    }
+
+@app.get("/api/images-stats")
+async def get_image_proxy_stats():
+    """Originals and thumbnails held by the local image cache, and background resolution jobs"""
+    return {
+        "success": True,
+        "stats": await storage_io.read(get_image_proxy().get_stats),
+        "resolver": get_image_resolver().get_stats(),
+    }
+
 @app.post("/api/extract-json")
 async def extract_json_from_ai_output(request: JSONExtractionRequest):
     """Extract JSON data from AI output text"""
@@ -333,42 +738,217 @@ class SaveStoriesRequest(BaseModel):
 
 
 @app.post("/api/project/{project_id}/save-stories")
-async def save_stories_to_project(project_id: str, request: SaveStoriesRequest):
-    """Save extracted stories to a project"""
+async def save_stories_to_project(project_id: str, request: SaveStoriesRequest, idempotency_key: Optional[str] = Header(None)):
+    """Save extracted stories to a project; a retry with the same ``Idempotency-Key`` gets the first response"""
+    return await _idempotent(f"save-stories/{project_id}", idempotency_key, request, lambda: _save_stories(project_id, request))
+
+async def _save_stories(project_id: str, request: SaveStoriesRequest):
     try:
         # Find project directory
-        project_dir = Path(__file__).parent.parent.parent / "data" / f"project_{project_id}"
-        if not project_dir.exists():
+        project_dir = get_project_dir(project_id)
+        if not await storage_io.read(project_dir.exists):
             raise HTTPException(status_code=404, detail="Project not found")
 
-        # Save stories to individual files
-        story_files = []
-        for i, story in enumerate(request.stories):
-            story_filename = f"story_{i+1}"
-            story_file = project_dir / f"{story_filename}.json"
-
-            with open(story_file, "w") as f:
-                json.dump(story, f, indent=2)
-
-            story_files.append(story_filename)
-
-        # Update project file with story references
-        project_files = list(project_dir.glob("project_type*.json"))
-        if project_files:
-            with open(project_files[0], "r") as f:
-                project_data = json.load(f)
-
-            project_data["stories"] = story_files
-            project_data["lastUpdated"] = datetime.now().isoformat()
-
-            with open(project_files[0], "w") as f:
-                json.dump(project_data, f, indent=2)
+        # Only screens whose content or image changed are rewritten; screens dropped
+        # from the storyboard have their files removed
+        writer = StoryWriter(project_dir, search_images=False, source="save")
+        for story in request.stories:
+            writer.add(story)
+        story_files = await storage_io.write(writer.finish)
 
         return {
             "success": True,
             "message": f"Saved {len(request.stories)} stories to project",
-            "story_files": story_files
+            "story_files": story_files,
+            "changes": writer.stats,
+            "revision": writer.revision
         }
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error saving stories: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error saving stories: {str(e)}")
+
+
+async def _project_versions(project_id: str):
+    project_dir = get_project_dir(project_id)
+    if not await storage_io.read(project_dir.exists):
+        raise HTTPException(status_code=404, detail="Project not found")
+    return get_story_versions(project_dir)
+
+async def _get_revision(versions, revision: int):
+    found = await storage_io.read(versions.get, revision)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Revision {revision} not found")
+    return found
+
+@app.get("/api/project/{project_id}/revisions")
+async def list_revisions(project_id: str):
+    """List a project's storyboard revisions, newest first"""
+    versions = await _project_versions(project_id)
+    revisions = await storage_io.read(versions.list)
+    return {
+        "success": True,
+        "revisions": [
+            {
+                "revision": r.revision,
+                "created_at": r.created_at,
+                "source": r.source,
+                "parent": r.parent,
+                "restored_from": r.restored_from,
+                "screens": len(r.stories),
+            }
+            for r in reversed(revisions)
+        ]
+    }
+
+@app.get("/api/project/{project_id}/revisions/{revision}")
+async def get_revision(project_id: str, revision: int):
+    """One revision's manifest and story bodies"""
+    versions = await _project_versions(project_id)
+    found = await _get_revision(versions, revision)
+    stories = await storage_io.read(versions.stories, found)
+    return {"success": True, "revision": found.model_dump(), "stories": stories}
+
+@app.get("/api/project/{project_id}/revisions/{revision}/diff")
+async def diff_revisions(project_id: str, revision: int, against: Optional[int] = None):
+    """Compare a revision with another one (its parent by default), screen by screen"""
+    versions = await _project_versions(project_id)
+    new = await _get_revision(versions, revision)
+    if against is None and new.parent is None:
+        raise HTTPException(status_code=400, detail=f"Revision {revision} has no parent to compare with")
+    old = await _get_revision(versions, new.parent if against is None else against)
+    return {"success": True, **await storage_io.read(versions.diff, old, new)}
+
+@app.post("/api/project/{project_id}/revisions/{revision}/restore")
+async def restore_revision(project_id: str, revision: int):
+    """Make an earlier revision the current storyboard (recorded as a new revision)"""
+    versions = await _project_versions(project_id)
+    found = await _get_revision(versions, revision)
+    try:
+        restored = await storage_io.write(versions.restore, found)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    names = [entry.name for entry in restored.stories]
+    await storage_io.write(lambda: index_storyboard(project_id, zip(names, versions.stories(restored))))
+    project_events.publish(project_id, STORYBOARD_UPDATED, {
+        "stories": [entry.name for entry in restored.stories],
+        "revision": restored.revision,
+        "restored_from": revision,
+    })
+    return {
+        "success": True,
+        "revision": restored.revision,
+        "restored_from": revision,
+        "story_files": [entry.name for entry in restored.stories]
+    }
+
+def _archive_response(project_dirs: List[Path], fmt: str, images: bool, basename: str) -> StreamingResponse:
+    try:
+        chunks = export_projects(project_dirs, fmt, include_images=images)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    content_type, extension = ARCHIVE_FORMATS[fmt]
+    return StreamingResponse(chunks, media_type=content_type, headers={
+        "Content-Disposition": f'attachment; filename="{basename}.{extension}"',
+    })
+
+@app.get("/api/project/{project_id}/export")
+async def export_project(project_id: str, format: str = "tar.gz", images: bool = False):
+    """Download one project as a tar, tar.gz or zip archive, optionally with its cached images"""
+    project_dir = get_project_dir(project_id)
+    if not await storage_io.read(lambda: project_dir.exists() and any(project_dir.glob("project_type*.json"))):
+        raise HTTPException(status_code=404, detail="Project not found")
+    return _archive_response([project_dir], format, images, f"project_{project_id}")
+
+@app.get("/api/projects/export")
+async def export_all_projects(format: str = "tar.gz", images: bool = False):
+    """Download every project as one archive, streamed as it is written"""
+    data_dir = get_data_dir()
+    project_dirs = await storage_io.read(
+        lambda: sorted(p for p in data_dir.glob("project_*") if p.is_dir()) if data_dir.exists() else [])
+    return _archive_response(project_dirs, format, images, f"storyboard-projects-{datetime.now():%Y%m%d-%H%M%S}")
+
+@app.post("/api/projects/import")
+async def import_projects(request: Request, on_conflict: str = "fail"):
+    """Import an exported archive sent as the request body; nothing is written unless every entry is valid"""
+    if on_conflict not in ON_CONFLICT:
+        raise HTTPException(status_code=400, detail=f"on_conflict must be one of {', '.join(ON_CONFLICT)}")
+    data_dir = get_data_dir()
+    await storage_io.write(data_dir.mkdir, parents=True, exist_ok=True)
+    # zip needs random access and tar members are validated one by one, so the upload is spooled to disk
+    upload = await storage_io.write(tempfile.NamedTemporaryFile, dir=data_dir, prefix=".upload-", delete=False)
+    try:
+        with upload:
+            async for chunk in request.stream():
+                await storage_io.write(upload.write, chunk)
+        result = await storage_io.write(import_archive, Path(upload.name), on_conflict)
+    except ArchiveConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await storage_io.write(Path(upload.name).unlink, missing_ok=True)
+
+    # editors open on a replaced project refetch it
+    for project_id in result.replaced:
+        project_events.publish(project_id, RESYNC, {})
+    return {"success": True, **result.model_dump()}
+
+@app.get("/api/storage-io-stats")
+async def get_storage_io_stats():
+    """Worker limits and running/queued file operations of the storage read and write pools"""
+    return {"success": True, "pools": storage_io.get_storage_io().get_stats()}
+
+@app.get("/api/shared-cache-stats")
+async def get_shared_cache_stats():
+    """Entries and message log position of the cache shared by workers in multi-worker mode"""
+    shared = get_shared_cache()
+    if shared is None:
+        return {"success": True, "enabled": False}
+    return {"success": True, "enabled": True, "stats": await storage_io.read(shared.get_stats)}
+
+@app.post("/api/admin/gc")
+async def run_storage_gc(dry_run: bool = True, images: bool = True):
+    """
+    Find unreferenced story files, duplicate screens, empty projects and
+    unused blobs and cached images; remove them and compact story lists
+    unless ``dry_run`` (the default)
+    """
+    try:
+        report = await storage_io.write(collect_garbage, dry_run=dry_run, images=images)
+    except GCInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, **report.model_dump()}
+
+@app.websocket("/ws/project/{project_id}")
+async def project_events_socket(websocket: WebSocket, project_id: str):
+    """
+    Push a project's changes to a connected editor
+
+    Messages are JSON objects with ``type``, ``project_id``, ``seq``, ``ts``
+    and ``data``: ``story.added`` / ``story.updated`` (story id and body),
+    ``storyboard.updated`` (the story list after a save or restore),
+    ``image.resolved`` (story id and image fields) and ``chat.message``.
+    ``resync`` means events were dropped and the project should be refetched;
+    ``ping`` is sent on idle connections.
+    """
+    if not await storage_io.read(get_project_dir(project_id).exists):
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    subscription = project_events.subscribe(project_id)
+    try:
+        await websocket.send_json({"type": "subscribed", "project_id": project_id})
+        while True:
+            message = await subscription.next()
+            if message is None:
+                message = json.dumps({"type": PING, "project_id": project_id})
+            await websocket.send_text(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        project_events.unsubscribe(subscription)
+
+@app.get("/api/project-events-stats")
+async def get_project_events_stats():
+    """Open project event connections and events published"""
+    return {"success": True, "stats": project_events.get_stats()}
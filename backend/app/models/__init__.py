@@ -10,7 +10,11 @@ from .project import (
     Type2VideoRequirements,
     Type3VideoRequirements,
     ProjectRequirements,
-    Project
+    Project,
+    StoredProject,
+    StoredStory,
+    StoredChatMessage,
+    StoredChatHistory
 )
 
 __all__ = [
@@ -19,5 +23,9 @@ __all__ = [
     "Type2VideoRequirements",
     "Type3VideoRequirements",
     "ProjectRequirements",
-    "Project"
+    "Project",
+    "StoredProject",
+    "StoredStory",
+    "StoredChatMessage",
+    "StoredChatHistory"
 ]
\ No newline at end of file
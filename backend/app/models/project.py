@@ -1,6 +1,6 @@
 from typing import Optional, Union, List
 from enum import Enum
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 class VideoType(int, Enum):
@@ -85,4 +85,39 @@ class Project(BaseModel):
     @classmethod
     def from_dict(cls, data: dict) -> 'Project':
         """Create instance from dictionary"""
-        return cls.model_validate(data)
\ No newline at end of file
+        return cls.model_validate(data)
+
+# Records as they are stored in a project folder (see ``project_archive``)
+class StoredProject(BaseModel):
+    """Contents of a project's ``project_type{n}.json`` file"""
+    model_config = ConfigDict(extra="allow")
+
+    id: str = Field(..., description="Project identifier, matching the folder name")
+    type: Optional[int] = Field(None, description="Storyboard type id")
+    typeName: Optional[str] = Field(None, description="Storyboard type name")
+    userInput: Optional[str] = Field(None, description="The user's description of the video")
+    createdAt: Optional[str] = Field(None, description="Creation timestamp")
+    stories: List[str] = Field(default_factory=list, description="Story file names in display order")
+
+class StoredStory(BaseModel):
+    """Contents of a ``story_*.json`` file; screens carry whatever fields the model produced"""
+    model_config = ConfigDict(extra="allow")
+
+    screen_number: Optional[Union[int, str]] = Field(None, description="Screen number")
+    image_url: Optional[str] = Field(None, description="Chosen image")
+    image_status: Optional[str] = Field(None, description="Background image resolution state")
+    image_candidates: Optional[List[dict]] = Field(None, description="Stored image search results")
+
+class StoredChatMessage(BaseModel):
+    """One message in ``chat_history.json``"""
+    id: str
+    role: str
+    content: str
+    createdAt: Optional[str] = None
+
+class StoredChatHistory(BaseModel):
+    """Contents of a project's ``chat_history.json`` file"""
+    model_config = ConfigDict(extra="allow")
+
+    projectId: Optional[str] = None
+    messages: List[StoredChatMessage] = Field(default_factory=list)
@@ -0,0 +1,271 @@
+"""
+Admission control for chat turns
+
+Every ``/api/chat`` turn holds a Langflow (or LLM router) request for tens of
+seconds. Without a limit a burst sends all of them upstream at once, the
+upstream slows down for everyone and turns start timing out together. The
+controller admits at most a fixed number of turns per upstream and queues the
+rest in arrival order:
+
+    ticket = await chat_admission.admit("langflow", capacity, project_id)
+    reply = await ticket.run(chatbot_service.generate_response, ...)
+
+- A project may only have ``CHAT_PROJECT_CONCURRENCY`` turns running or
+  waiting; one more is refused straight away (429), since an editor sending
+  a second turn before the first one answered gains nothing from waiting.
+- At most ``CHAT_QUEUE_SIZE`` turns wait per upstream; later ones are
+  refused straight away (503), and a waiting turn that gets no slot within
+  ``CHAT_MAX_QUEUE_TIME`` seconds is refused too (503).
+
+Refusals carry a ``Retry-After`` estimate from the recent turn duration and
+the queue ahead. ``Ticket.run`` keeps the slot until the turn's worker thread
+finishes, even when the client has gone away, because the upstream is still
+busy with it. Limits are per worker process.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+from app.utils.metrics import CHAT_ADMISSION_QUEUE_DEPTH, CHAT_ADMISSION_REJECTED, CHAT_ADMISSION_RUNNING, CHAT_ADMISSION_WAIT
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PROJECT_LIMIT = "project_limit"
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+
+# Assumed turn duration until one has been measured
+INITIAL_TURN_SECONDS = 10.0
+# Weight of the latest turn in the moving average of turn durations
+DURATION_WEIGHT = 0.2
+MAX_RETRY_AFTER = 300
+
+
+class AdmissionRejected(Exception):
+    """Raised when a turn is refused; ``status_code`` is 429 or 503"""
+
+    def __init__(self, reason: str, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "project_id", "granted")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, project_id: Optional[str]):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.project_id = project_id
+        self.granted = False
+
+
+class _Gate:
+    """Slots and waiting turns of one upstream"""
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self.running = 0
+        self.waiters: Deque[_Waiter] = deque()
+        self.avg_turn = INITIAL_TURN_SECONDS
+        self.admitted = 0
+        self.rejected = {PROJECT_LIMIT: 0, QUEUE_FULL: 0, QUEUE_TIMEOUT: 0}
+
+
+class Ticket:
+    """An admitted turn; releasing it hands the slot to the next waiting turn"""
+
+    def __init__(self, controller: Optional["AdmissionController"], gate: Optional[_Gate], project_id: Optional[str]):
+        self._controller = controller
+        self._gate = gate
+        self.project_id = project_id
+        self.started_at = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        """Give the slot back; safe to call from any thread and more than once"""
+        if self._controller is not None:
+            self._controller._release(self)
+        else:
+            self.released = True
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run the turn on a worker thread and release the slot when it finishes"""
+        started = False
+
+        def call():
+            nonlocal started
+            started = True
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.release()
+
+        try:
+            return await asyncio.to_thread(call)
+        except asyncio.CancelledError:
+            if not started:
+                # the thread never picked it up, so nothing else will release it
+                self.release()
+            raise
+
+
+class AdmissionController:
+    """Per-upstream concurrency limits with a bounded FIFO queue, plus a per-project limit"""
+
+    def __init__(self):
+        self._gates: Dict[str, _Gate] = {}
+        self._projects: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _gate(self, upstream: str, capacity: int) -> _Gate:
+        gate = self._gates.get(upstream)
+        if gate is None:
+            gate = self._gates[upstream] = _Gate(upstream, capacity)
+        elif gate.capacity != capacity:
+            # the configuration was reloaded; extra slots go to whoever is waiting
+            gate.capacity = capacity
+            self._fill(gate)
+        return gate
+
+    def _retry_after(self, gate: _Gate, ahead: int) -> int:
+        """Seconds until a turn with ``ahead`` others in front of it would likely get a slot"""
+        turns = ahead / max(1, gate.capacity) + 1
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(gate.avg_turn * turns)))
+
+    def _reject(self, gate: _Gate, reason: str, status_code: int, detail: str, ahead: int) -> AdmissionRejected:
+        gate.rejected[reason] += 1
+        CHAT_ADMISSION_REJECTED.inc(upstream=gate.name, reason=reason)
+        return AdmissionRejected(reason, status_code, detail, self._retry_after(gate, ahead))
+
+    def _publish(self, gate: _Gate):
+        CHAT_ADMISSION_RUNNING.set(gate.running, upstream=gate.name)
+        CHAT_ADMISSION_QUEUE_DEPTH.set(len(gate.waiters), upstream=gate.name)
+
+    def _add_project(self, project_id: Optional[str], delta: int):
+        if project_id is None:
+            return
+        count = self._projects.get(project_id, 0) + delta
+        if count > 0:
+            self._projects[project_id] = count
+        else:
+            self._projects.pop(project_id, None)
+
+    def _fill(self, gate: _Gate):
+        """Hand free slots to waiting turns in arrival order"""
+        while gate.waiters and gate.running < gate.capacity:
+            waiter = gate.waiters.popleft()
+            waiter.granted = True
+            try:
+                waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+            except RuntimeError:
+                # its event loop has closed; nobody is left to use the slot
+                self._add_project(waiter.project_id, -1)
+                continue
+            gate.running += 1
+            gate.admitted += 1
+
+    async def admit(self, upstream: str, capacity: int, project_id: Optional[str] = None) -> Ticket:
+        """
+        Wait for a slot on ``upstream`` (at most ``capacity`` turns run at once)
+
+        Raises:
+            AdmissionRejected: If the project already has its limit of turns,
+                the queue is full or no slot freed up within the queue time
+        """
+        settings = get_settings().admission
+        if not settings.enabled or capacity <= 0:
+            return Ticket(None, None, project_id)
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            gate = self._gate(upstream, capacity)
+            if project_id is not None and 0 < settings.project_concurrency <= self._projects.get(project_id, 0):
+                raise self._reject(gate, PROJECT_LIMIT, 429, "A reply for this project is still being generated", 0)
+            if gate.running < gate.capacity and not gate.waiters:
+                gate.running += 1
+                gate.admitted += 1
+                self._add_project(project_id, 1)
+                self._publish(gate)
+                return Ticket(self, gate, project_id)
+            if len(gate.waiters) >= settings.queue_size:
+                raise self._reject(gate, QUEUE_FULL, 503, "The AI service is at capacity; please retry shortly", len(gate.waiters))
+            waiter = _Waiter(loop, project_id)
+            gate.waiters.append(waiter)
+            self._add_project(project_id, 1)
+            self._publish(gate)
+
+        queued_at = time.perf_counter()
+        cancelled = False
+        try:
+            await asyncio.wait({waiter.future}, timeout=settings.max_queue_time)
+        except asyncio.CancelledError:
+            cancelled = True
+        with self._lock:
+            if waiter.granted:
+                ticket = Ticket(self, gate, project_id)
+            else:
+                gate.waiters.remove(waiter)
+                self._add_project(project_id, -1)
+                self._publish(gate)
+                if cancelled:
+                    raise asyncio.CancelledError()
+                raise self._reject(gate, QUEUE_TIMEOUT, 503, "Timed out waiting for the AI service; please retry shortly", len(gate.waiters))
+        CHAT_ADMISSION_WAIT.observe(time.perf_counter() - queued_at, upstream=upstream)
+        if cancelled:
+            ticket.release()
+            raise asyncio.CancelledError()
+        return ticket
+
+    def _release(self, ticket: Ticket):
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            gate = ticket._gate
+            duration = time.perf_counter() - ticket.started_at
+            gate.avg_turn += DURATION_WEIGHT * (duration - gate.avg_turn)
+            gate.running -= 1
+            self._add_project(ticket.project_id, -1)
+            self._fill(gate)
+            self._publish(gate)
+
+    def get_stats(self) -> dict:
+        settings = get_settings().admission
+        with self._lock:
+            return {
+                "enabled": settings.enabled,
+                "project_concurrency": settings.project_concurrency,
+                "queue_size": settings.queue_size,
+                "max_queue_time": settings.max_queue_time,
+                "active_projects": len(self._projects),
+                "upstreams": {
+                    gate.name: {
+                        "capacity": gate.capacity,
+                        "running": gate.running,
+                        "queued": len(gate.waiters),
+                        "admitted": gate.admitted,
+                        "rejected": dict(gate.rejected),
+                        "avg_turn_sec": round(gate.avg_turn, 3),
+                    }
+                    for gate in self._gates.values()
+                },
+            }
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+chat_admission = AdmissionController()
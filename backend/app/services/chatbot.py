@@ -1,12 +1,28 @@
-import os
 import requests
 import json
 import time
-from pathlib import Path
+import logging
 from pydantic import BaseModel
-from typing import List, Optional
-
-from app.utils.image_search import search_image
+from typing import Callable, List, Optional, Tuple
+
+from app.utils.storage import get_data_dir
+from config.settings import Settings, config_service, get_settings
+from app.utils.metrics import UPSTREAM_DURATION, UPSTREAM_PAYLOAD_BYTES, record_cache
+from app.utils.tracing import tracer, trace_headers
+from app.services.langflow_sessions import LangflowSessionStore
+from app.services.langflow_pool import LangflowPool, SessionHostUnavailable
+from app.services.llm_router import LLMRouter
+from app.services.story_writer import ScreenStream, StoryWriter, named_screens
+
+logger = logging.getLogger(__name__)
+
+# Used when chat turns go straight to the configured LLMs instead of the Langflow flow
+STORYBOARD_SYSTEM_PROMPT = (
+    "You are a storyboard assistant that helps marketing teams plan short videos. "
+    "When asked for a storyboard, reply with a JSON array in a ```json block where each screen has "
+    "screen_number, voiceover_text, target_duration_sec, screen_type, on_screen_visual_keywords and action_notes. "
+    "For small edits, answer briefly and only change what was asked."
+)
 
 class ChatMessage(BaseModel):
     role: str
@@ -20,25 +36,116 @@ class ChatResponse(BaseModel):
     message: str
     success: bool
 
+class ChatTurnFailed(Exception):
+    """A turn the AI service could not answer; ``str()`` is the message shown to the user"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @classmethod
+    def from_exception(cls, e: Exception) -> "ChatTurnFailed":
+        if isinstance(e, requests.exceptions.Timeout):
+            return cls("The AI service is taking too long to respond. Please try again with a shorter message.", 504)
+        if isinstance(e, requests.exceptions.RequestException):
+            return cls(f"I'm having trouble connecting to the AI service right now. Please try again later. Error: {str(e)}")
+        if isinstance(e, ValueError):
+            return cls(f"I received an unexpected response format. Please try again later. Error: {str(e)}")
+        return cls(f"I'm having trouble processing your request right now. Please try again later. Error: {str(e)}", 500)
+
+
+class StreamRelay:
+    """Fans streamed response text out to the screen pipeline and an event callback"""
+
+    def __init__(self, screens: Optional[ScreenStream] = None, on_event: Optional[Callable[[str, dict], None]] = None):
+        self.screens = screens
+        self.on_event = on_event
+
+    def __call__(self, chunk: str):
+        if self.on_event is not None:
+            self.on_event("token", {"chunk": chunk})
+        if self.screens is not None:
+            self.screens(chunk)
+
+    def reset(self):
+        """The streamed answer is being discarded and the turn re-run"""
+        if self.screens is not None:
+            self.screens.reset()
+        if self.on_event is not None:
+            self.on_event("reset", {})
+
+
 class StoryboardChatbot:
     def __init__(self):
-        self.api_key = os.getenv("LANGFLOW_API_KEY")
-        if not self.api_key:
+        self.pool = None
+        self.sessions = None
+        self.router = None
+        self._settings = None
+        self._apply_settings(get_settings())
+
+        # Pick up timeouts, host lists and routing changes when the configuration is reloaded
+        config_service.subscribe(self._apply_settings)
+
+    def _apply_settings(self, settings: Settings):
+        """Configure the chatbot from a settings snapshot, rebuilding only what changed"""
+        langflow = settings.langflow
+        if not langflow.api_key:
             raise ValueError("LANGFLOW_API_KEY environment variable not found. Please set your API key in the environment variables.")
+        previous = self._settings
 
-        # Langflow configuration - make URL and flow ID configurable
-        langflow_host = os.getenv("LANGFLOW_HOST", "localhost:7860")
-        flow_id = os.getenv("LANGFLOW_FLOW_ID", "6bc20709-5eac-463b-b5e7-28388dd6e560")
-        self.url = f"http://{langflow_host}/api/v1/run/{flow_id}"
-
+        self.api_key = langflow.api_key
         self.headers = {
             "Content-Type": "application/json",
             "x-api-key": self.api_key
         }
+        self.timeout = langflow.timeout
+        # Stream flow output so storyboard screens are saved while the rest is still generating
+        self.stream = langflow.stream
+
+        # Langflow configuration - hosts and flow ID are configurable
+        # LANGFLOW_HOSTS takes a comma-separated list to balance over several instances
+        pool_keys = ("hosts", "flow_id", "breaker_failures", "breaker_reset")
+        if self.pool is None or any(getattr(langflow, k) != getattr(previous.langflow, k) for k in pool_keys):
+            retired, self.pool = self.pool, LangflowPool.from_settings(langflow)
+            if retired is not None:
+                retired.shutdown()
+        else:
+            self.pool.apply_hedging(langflow)
+        self.url = self.pool.endpoints[0].url
+
+        self.data_dir = get_data_dir()
 
-    def generate_response(self, user_message: str, conversation_history: List[ChatMessage] = None, project_id: str = None) -> str:
-        """Generate AI response for storyboard editing assistance using Langflow"""
-        print("!!!!!")
+        # Reuse one Langflow session per project so the flow keeps its own memory
+        # and each turn only uploads the new message instead of the whole brief
+        self.reuse_sessions = langflow.reuse_sessions
+        if self.sessions is None or settings.storage != previous.storage:
+            self.sessions = LangflowSessionStore(self.data_dir, ttl_seconds=langflow.session_ttl)
+        else:
+            self.sessions.ttl_seconds = langflow.session_ttl
+
+        # CHAT_BACKEND=router sends turns to the providers in llm_config.json instead of Langflow
+        if settings.llm.chat_backend.lower() != "router":
+            self.router = None
+        elif self.router is None or settings.llm != previous.llm:
+            self.router = LLMRouter.from_settings(settings.llm)
+
+        self._settings = settings
+
+    def generate_response(self, user_message: str, conversation_history: List[ChatMessage] = None, project_id: str = None,
+                          on_event: Optional[Callable[[str, dict], None]] = None, raise_errors: bool = False) -> str:
+        """
+        Generate AI response for storyboard editing assistance using Langflow
+
+        ``on_event(event, data)`` is told about progress while the turn runs:
+        ``token`` for each piece of the answer (``reset`` if the pieces so far
+        are being thrown away), ``screen`` for each storyboard screen saved and
+        ``saved`` once the stories are linked into the project. Passing it
+        streams the Langflow run even when ``LANGFLOW_STREAM`` is off. It may be
+        called from worker threads.
+
+        When the AI service fails the reply is an apology for the user, or with
+        ``raise_errors`` a ``ChatTurnFailed`` carrying it is raised instead.
+        """
         # Build context from conversation history
         context = ""
         if conversation_history:
@@ -48,46 +155,212 @@ class StoryboardChatbot:
         # Combine context with current message
         full_message = f"{context}user: {user_message}" if context else user_message
 
+        on_saved = None
+        if on_event is not None:
+            def on_saved(index, story_id, story):
+                on_event("screen", {"index": index, "story_id": story_id, "story": story})
+
+        screens = None
+        with tracer.span("chatbot.generate_response", project_id=project_id):
+            try:
+                # Check if message contains "json" and project_id is provided
+                wants_json = bool(user_message.find("json") and project_id)
+
+                if self.router is not None:
+                    ai_response = self._run_router(user_message, conversation_history)
+                    if on_event is not None:
+                        on_event("token", {"chunk": ai_response})
+                else:
+                    relay = None
+                    if self.stream or on_event is not None:
+                        project_dir = self.data_dir / f"project_{project_id}"
+                        if wants_json and project_dir.exists():
+                            screens = ScreenStream(project_dir, deferred=get_settings().image_search.deferred, on_saved=on_saved)
+                        relay = StreamRelay(screens, on_event)
+                    response_data = self._run_flow(user_message, full_message, project_id, on_chunk=relay)
+
+                    # Full response dumps are only useful when debugging flow output shapes
+                    logger.debug(f"Langflow response: {response_data}")
+
+                    # Extract the AI response text
+                    with tracer.span("chatbot.extract_response_text"):
+                        ai_response = self._extract_response_text(response_data)
+
+                if wants_json:
+                    logger.debug(f"Looking for storyboard JSON in the response for project {project_id}")
+                    try:
+                        # Screens picked out of the stream are already saved; link them into
+                        # the project, or parse the full text if none could be picked out
+                        # a reply to "shorten screen 2" that only holds screen 2 is merged, anything else replaces the storyboard
+                        edited = named_screens(user_message)
+                        story_files = screens.finish(edited) if screens is not None else None
+                        if story_files is None:
+                            story_files = self._extract_and_save_json(ai_response, project_id, on_saved=on_saved, edited=edited)
+                        if story_files and on_event is not None:
+                            on_event("saved", {"project_id": project_id, "stories": story_files})
+                    except Exception as e:
+                        logger.warning(f"Error extracting/saving JSON: {e}")
+                        # Continue with response even if JSON extraction fails
+
+                return ai_response
+
+            except Exception as e:
+                if screens is not None:
+                    # screens saved before the failure must not change the live storyboard
+                    screens.discard()
+                failure = ChatTurnFailed.from_exception(e)
+                if raise_errors:
+                    raise failure from e
+                return str(failure)
+
+    def _run_flow(self, user_message: str, full_message: str, project_id: str = None, on_chunk=None) -> dict:
+        """
+        Run the Langflow flow for one turn, reusing the project's session when possible
+
+        With a live session only the new user message is sent, since the flow
+        already holds the earlier turns in its memory. Without one (first turn,
+        expired or rejected session, or no project) the full context is sent and
+        a new session is opened for the following turns. The full context is
+        also sent when the session's Langflow host is ejected, and a session
+        whose first turn another host answered is not kept.
+
+        ``on_chunk`` receives the response text as it streams in; if the session
+        answer is thrown away, its ``reset`` is called before the full context is sent.
+        """
+        session = self.sessions.get(project_id) if project_id and self.reuse_sessions else None
+        if project_id and self.reuse_sessions:
+            record_cache("langflow_session", session is not None)
+
+        if session is not None:
+            try:
+                response_data, _ = self._post_to_langflow(user_message, session.session_id, mode="session", on_chunk=on_chunk)
+                if response_data.get("session_id") in (None, session.session_id):
+                    self.sessions.touch(session)
+                    return response_data
+                logger.info(f"Langflow did not keep session {session.session_id}, resending full context")
+                if on_chunk is not None:
+                    on_chunk.reset()
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code not in (400, 404, 410, 422):
+                    raise
+                logger.info(f"Langflow rejected session {session.session_id} ({e.response.status_code}), resending full context")
+            except SessionHostUnavailable as e:
+                logger.info(f"{e}, resending full context")
+            self.sessions.invalidate(project_id)
+
+        session = self.sessions.open(project_id) if project_id and self.reuse_sessions else None
+        response_data, moved = self._post_to_langflow(full_message, session.session_id if session else None, mode="full", on_chunk=on_chunk)
+        if session is not None:
+            if moved:
+                # the flow memory is on a host later turns will not be sent to
+                self.sessions.invalidate(project_id)
+            else:
+                self.sessions.touch(session)
+        return response_data
+
+    def _run_router(self, user_message: str, conversation_history: List[ChatMessage] = None) -> str:
+        """Answer one turn through the LLM router, picking the fast or strong tier by request kind"""
+        messages = [{"role": "system", "content": STORYBOARD_SYSTEM_PROMPT}]
+        for msg in (conversation_history or [])[-5:]:
+            messages.append({"role": "assistant" if msg.role == "assistant" else "user", "content": msg.content})
+        messages.append({"role": "user", "content": user_message})
+
+        kind = self.router.classify(user_message, messages)
+        return self.router.complete(messages, kind=kind)
+
+    def _post_to_langflow(self, input_value: str, session_id: Optional[str] = None, mode: str = "full",
+                          on_chunk=None) -> Tuple[dict, bool]:
+        """
+        Post one run request to Langflow and record bytes sent and latency for the input mode
+
+        With ``on_chunk`` the run is streamed: each token chunk is passed to it
+        as it arrives and the run result from the final ``end`` event is returned.
+        A ``session`` mode request only goes to the session's home host.
+
+        Returns:
+            The run result, and whether a host other than the session's home answered
+        """
         # Langflow API payload
         payload = {
             "output_type": "chat",
             "input_type": "chat",
-            "input_value": full_message
+            "input_value": input_value
         }
-
-        try:
-            # Increase timeout to 6 minutes for Langflow processing
-            response = requests.post(self.url, json=payload, headers=self.headers, timeout=360)
-            response.raise_for_status()  # Raise exception for bad status codes
-
-            # Parse Langflow response
-            response_data = response.json()
-
-            # Debug: Print response structure (remove in production)
-            print(f"Langflow response: {response_data}")
-
-            # Extract the AI response text
-            ai_response = self._extract_response_text(response_data)
-
-            # Check if message contains "json" and project_id is provided
-            if user_message.find("json") and project_id:
-                print("FIND JSON IN RESPONSE!!!!!!!")
+        if session_id:
+            payload["session_id"] = session_id
+
+        body = json.dumps(payload).encode("utf-8")
+        start = time.perf_counter()
+
+        with tracer.span("langflow.post", mode=mode, bytes_sent=len(body)), \
+                UPSTREAM_DURATION.time(upstream="langflow", status="error") as labels:
+            try:
+                # Langflow processing can take minutes (LANGFLOW_TIMEOUT, 6 minutes by default)
+                headers = {**self.headers, **trace_headers()}
+                response = self.pool.post(body, headers, timeout=self.timeout, affinity_key=session_id,
+                                          stream=on_chunk is not None, pinned=mode == "session")
+            except requests.exceptions.Timeout:
+                labels["status"] = "timeout"
+                raise
+            labels["status"] = response.status_code
+            try:
+                response.raise_for_status()  # Raise exception for bad status codes
+
+                # Parse Langflow response
+                if on_chunk is not None:
+                    response_data, received = self._read_stream(response, on_chunk)
+                else:
+                    response_data, received = response.json(), len(response.content)
+            finally:
+                if on_chunk is not None:
+                    # a stream left unread holds its connection and keeps its host busy in the pool
+                    response.close()
+
+        latency = time.perf_counter() - start
+        self.sessions.record_call(mode, len(body), latency)
+        UPSTREAM_PAYLOAD_BYTES.observe(len(body), upstream="langflow", direction="sent")
+        UPSTREAM_PAYLOAD_BYTES.observe(received, upstream="langflow", direction="received")
+        logger.info(f"Langflow {mode} call: {len(body)} bytes sent, {received} received in {latency:.2f}s")
+
+        return response_data, getattr(response, "session_moved", False)
+
+    def _read_stream(self, response: requests.Response, on_chunk) -> tuple:
+        """
+        Consume a streamed Langflow run
+
+        Langflow sends one JSON event per line: ``token`` events carry the next
+        piece of the answer and the ``end`` event carries the same result a
+        non-streamed run returns. If the stream ends without one, the tokens
+        are joined into a ``{"text": ...}`` result.
+
+        Returns:
+            The run result and the number of bytes received
+        """
+        received = 0
+        chunks = []
+        response_data = None
+        with tracer.span("langflow.stream") as span:
+            for line in response.iter_lines():
+                received += len(line)
+                if not line.strip():
+                    continue
                 try:
-                    self._extract_and_save_json(ai_response, project_id)
-                except Exception as e:
-                    print(f"Error extracting/saving JSON: {e}")
-                    # Continue with response even if JSON extraction fails
-
-            return ai_response
-
-        except requests.exceptions.Timeout:
-            return "The AI service is taking too long to respond. Please try again with a shorter message."
-        except requests.exceptions.RequestException as e:
-            return f"I'm having trouble connecting to the AI service right now. Please try again later. Error: {str(e)}"
-        except ValueError as e:
-            return f"I received an unexpected response format. Please try again later. Error: {str(e)}"
-        except Exception as e:
-            return f"I'm having trouble processing your request right now. Please try again later. Error: {str(e)}"
+                    event = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping unreadable Langflow stream line: {line[:200]!r}")
+                    continue
+                data = event.get("data") or {}
+                if event.get("event") == "token" and data.get("chunk"):
+                    chunks.append(data["chunk"])
+                    on_chunk(data["chunk"])
+                elif event.get("event") == "end":
+                    response_data = data.get("result")
+                elif event.get("event") == "error":
+                    raise ValueError(f"Langflow stream error: {data.get('error') or data}")
+            span.set_attribute("tokens", len(chunks))
+        if response_data is None:
+            response_data = {"text": "".join(chunks)}
+        return response_data, received
 
     def _extract_response_text(self, response_data: dict) -> str:
         """Extract text from Langflow response data"""
@@ -145,58 +418,26 @@ class StoryboardChatbot:
         # Fallback: return the entire response as string for debugging
         return f"Response received but couldn't extract text. Full response: {str(response_data)}"
 
-    def _extract_and_save_json(self, ai_response: str, project_id: str):
-        """Extract JSON from AI response and save to project folder"""
+    def _extract_and_save_json(self, ai_response: str, project_id: str, on_saved=None, edited=None) -> Optional[List[str]]:
+        """Extract JSON from AI response and save to project folder, returning the new story file names"""
         from app.utils.json_extractor import extract_json_from_text
 
         # Extract JSON from the AI response
-        result = extract_json_from_text(ai_response, validate=False)
+        with tracer.span("json.extract", chars=len(ai_response)):
+            result = extract_json_from_text(ai_response, validate=False)
 
         if not result.success or not result.data:
-            print(f"No JSON found in AI response for project {project_id}")
+            logger.info(f"No JSON found in AI response for project {project_id}")
             return
 
         # Find project directory
-        project_dir = Path(__file__).parent.parent.parent.parent / "data" / f"project_{project_id}"
+        project_dir = self.data_dir / f"project_{project_id}"
         if not project_dir.exists():
-            print(f"Project directory not found: {project_dir}")
+            logger.warning(f"Project directory not found: {project_dir}")
             return
 
-        # Generate story IDs and save individual story files
-        story_files = []
-        timestamp = int(time.time())
-
-        for i, story_data in enumerate(result.data):
-            story_id = f"{timestamp + i}"
-            story_filename = f"story_{story_id}"
-            story_file = project_dir / f"{story_filename}.json"
-            story_data["image_url"] = search_image(story_data.get("on_screen_visual_keywords", ""))
-
-            # Save individual story file
-            with open(story_file, "w") as f:
-                json.dump(story_data, f, indent=2)
-
-            story_files.append(story_filename)
-            print(f"Saved story file: {story_filename}.json")
-
-        # Update project file with story references
-        project_files = list(project_dir.glob("project_type*.json"))
-        if project_files:
-            with open(project_files[0], "r") as f:
-                project_data = json.load(f)
-
-            # Add or update stories field
-            if "stories" not in project_data:
-                project_data["stories"] = []
-
-            # Append new story files to existing ones
-            project_data["stories"].extend(story_files)
-            project_data["lastUpdated"] = time.time()
-
-            # Save updated project file
-            with open(project_files[0], "w") as f:
-                json.dump(project_data, f, indent=2)
-
-            print(f"Updated project file with {len(story_files)} new stories")
-        else:
-            print("No project file found to update")
\ No newline at end of file
+        # Image lookups and story writes run on the story writer's thread pool
+        writer = StoryWriter(project_dir, deferred=get_settings().image_search.deferred, on_saved=on_saved)
+        for story_data in result.data:
+            writer.add(story_data)
+        return writer.finish(edited)
@@ -0,0 +1,239 @@
+"""
+Idempotency keys for requests that start expensive or non-repeatable work
+
+The frontend gives up on a chat turn after 380 seconds and sends it again
+(the editor retries a dropped ``/api/chat/stream`` once); the onboarding page
+may also retry ``create-project`` and its first chat turn. Without a key each retry starts another multi-minute Langflow run and
+writes another batch of story files. A request sent with an
+``Idempotency-Key`` header instead runs once per key:
+
+    result, outcome = await store.run("chat", key, fingerprint(body), lambda: run_turn(body))
+
+- The first request starts the work as its own task, so it keeps running
+  (and its result is kept) when that client goes away.
+- A retry while it runs waits for the same result (``attached``).
+- A retry after it finished gets the stored result (``replayed``) until
+  the key expires after ``IDEMPOTENCY_TTL`` seconds.
+- Reusing a key for a different request body raises
+  ``IdempotencyConflict``.
+
+Only successful results are kept: when the work fails, requests waiting on
+it get the same error and the key is free for the next attempt.
+
+In multi-worker mode the key is claimed in the shared cache, so a retry that
+lands on another worker waits for the run of the worker that claimed it
+(polling the shared entry) and replays its stored result. A claim older than
+``in_flight_timeout`` is presumed lost with its worker and taken over.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from app.services.shared_cache import SharedCache, get_shared_cache
+from config.settings import IdempotencySettings, get_settings
+
+logger = logging.getLogger(__name__)
+
+SHARED_NAMESPACE = "idempotency"
+
+NEW = "new"
+ATTACHED = "attached"
+REPLAYED = "replayed"
+
+RUNNING = "running"
+DONE = "done"
+
+# Longest accepted Idempotency-Key header
+MAX_KEY_LENGTH = 255
+# Seconds between sweeps of expired keys out of the shared cache
+PRUNE_INTERVAL = 60.0
+
+
+class IdempotencyConflict(ValueError):
+    """Raised when a key is reused for a different request"""
+
+
+def fingerprint(payload: Any) -> str:
+    """Hash of a request body, so a key cannot be replayed for a different request"""
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "future", "expires_at", "outcome")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        # a thread-safe future, so requests on any event loop can wait for it
+        self.future: Future = Future()
+        self.expires_at = float("inf")
+        self.outcome = NEW
+
+
+class IdempotencyStore:
+    """Runs work once per key and keeps successful results for retries"""
+
+    def __init__(self, settings: IdempotencySettings = None, shared: Optional[SharedCache] = None):
+        self.settings = settings or IdempotencySettings()
+        self.shared = shared
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.stats = {NEW: 0, ATTACHED: 0, REPLAYED: 0, "conflicts": 0, "failed": 0}
+
+    def _prune(self, now: float):
+        for name in [name for name, entry in self._entries.items() if entry.expires_at <= now]:
+            del self._entries[name]
+        finished = [name for name, entry in self._entries.items() if entry.future.done()]
+        for name in finished[:max(0, len(self._entries) - self.settings.max_keys)]:
+            del self._entries[name]
+
+    async def run(self, scope: str, key: str, request_fingerprint: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """
+        Run ``func`` once for ``key`` within ``scope`` and return its
+        JSON-encoded result, with whether this request ran it (``new``), waited
+        for a run in progress (``attached``) or got a stored result (``replayed``)
+
+        Raises:
+            IdempotencyConflict: If the key was used for a request with a different fingerprint
+        """
+        name = f"{scope}\n{key}"
+        owner = False
+        with self._lock:
+            self._prune(time.time())
+            entry = self._entries.get(name)
+            if entry is not None and entry.fingerprint != request_fingerprint:
+                self.stats["conflicts"] += 1
+                raise IdempotencyConflict("This Idempotency-Key was already used for a different request")
+            if entry is None:
+                entry = self._entries[name] = _Entry(request_fingerprint)
+                owner = True
+            outcome = entry.outcome if owner else (REPLAYED if entry.future.done() else ATTACHED)
+
+        if owner:
+            # its own task: a client that goes away must not cancel the work retries will wait for
+            task = asyncio.create_task(self._claim_and_run(name, entry, func))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        try:
+            result = await asyncio.shield(asyncio.wrap_future(entry.future))
+        except IdempotencyConflict:
+            with self._lock:
+                self.stats["conflicts"] += 1
+            raise
+        if owner:
+            outcome = entry.outcome
+        with self._lock:
+            self.stats[outcome] += 1
+        self._prune_shared()
+        return result, outcome
+
+    async def _claim_and_run(self, name: str, entry: _Entry, func: Callable[[], Awaitable[Any]]):
+        claimed = False
+        try:
+            while self.shared is not None:
+                claim = json.dumps({"state": RUNNING, "fingerprint": entry.fingerprint, "started_at": time.time()})
+                record = self.shared.setdefault(SHARED_NAMESPACE, name, claim)
+                if record is None:
+                    claimed = True
+                    break
+                record = json.loads(record)
+                if record["fingerprint"] != entry.fingerprint:
+                    raise IdempotencyConflict("This Idempotency-Key was already used for a different request")
+                if record["state"] == DONE:
+                    entry.expires_at = record["expires_at"]
+                    if entry.outcome == NEW:
+                        entry.outcome = REPLAYED
+                    entry.future.set_result(record["result"])
+                    return
+                if time.time() - record["started_at"] > self.settings.in_flight_timeout:
+                    logger.warning("Taking over idempotent request %r claimed %.0fs ago", name, time.time() - record["started_at"])
+                    self.shared.delete(SHARED_NAMESPACE, [name], notify=False)
+                    continue
+                # another worker is running it
+                entry.outcome = ATTACHED
+                await asyncio.sleep(get_settings().deployment.poll_interval)
+            result = jsonable_encoder(await func())
+        except BaseException as e:
+            with self._lock:
+                if self._entries.get(name) is entry:
+                    del self._entries[name]
+                if not isinstance(e, IdempotencyConflict):
+                    self.stats["failed"] += 1
+            if claimed:
+                self._release_claim(name)
+            if not isinstance(e, Exception):
+                # shutting down; whoever waits is cancelled too
+                entry.future.cancel()
+                raise
+            entry.future.set_exception(e)
+            return
+
+        entry.expires_at = time.time() + self.settings.ttl
+        entry.future.set_result(result)
+        if self.shared is not None:
+            record = {"state": DONE, "fingerprint": entry.fingerprint, "result": result, "expires_at": entry.expires_at}
+            try:
+                self.shared.set(SHARED_NAMESPACE, name, json.dumps(record), notify=False)
+            except sqlite3.Error as e:
+                logger.warning("Could not share the result of idempotent request %r: %s", name, e)
+
+    def _release_claim(self, name: str):
+        try:
+            self.shared.delete(SHARED_NAMESPACE, [name], notify=False)
+        except sqlite3.Error as e:
+            logger.warning("Could not release idempotency claim %r: %s", name, e)
+
+    def _prune_shared(self):
+        now = time.time()
+        if self.shared is None or now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        expired = []
+        try:
+            for name, value in self.shared.items(SHARED_NAMESPACE):
+                record = json.loads(value)
+                if record["state"] == DONE and record["expires_at"] <= now:
+                    expired.append(name)
+                elif record["state"] == RUNNING and now - record["started_at"] > 2 * self.settings.in_flight_timeout:
+                    expired.append(name)
+            self.shared.delete(SHARED_NAMESPACE, expired, notify=False)
+        except (sqlite3.Error, ValueError, KeyError) as e:
+            logger.warning("Could not prune shared idempotency keys: %s", e)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "keys": len(self._entries),
+                "in_flight": sum(1 for entry in self._entries.values() if not entry.future.done()),
+                **self.stats,
+            }
+
+
+_store: Optional[IdempotencyStore] = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Shared store; rebuilt when the idempotency settings or the shared cache change"""
+    global _store
+    settings = get_settings().idempotency
+    shared = get_shared_cache()
+    store = _store
+    if store is None or store.settings != settings or store.shared is not shared:
+        with _store_lock:
+            if _store is None or _store.settings != settings or _store.shared is not shared:
+                _store = IdempotencyStore(settings, shared)
+            store = _store
+    return store
@@ -0,0 +1,490 @@
+"""
+Local image proxy with a content-addressed cache
+
+Each chosen image is fetched once, stored under the SHA-256 of its bytes and
+served from ``/api/images/{hash}`` with long-lived cache headers. Panel-sized
+thumbnails (JPEG and WebP) are rendered in a process pool so resizing never
+runs on the request threads. Story records are rewritten to point at the
+proxied URL, with the original kept in ``image_source_url``.
+
+Layout under the cache directory:
+    objects/ab/<hash>           original bytes
+    objects/ab/<hash>.json      ImageRecord metadata
+    urls/cd/<sha256(url)>       hash of the image fetched from that URL
+    variants/ab/<hash>_w640.webp
+
+Metadata read from disk is cached per process; originals the garbage
+collector removes are dropped from that cache in every worker.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from pydantic import BaseModel
+
+from app.services.shared_cache import get_shared_cache, subscribe
+from app.utils.metrics import UPSTREAM_DURATION, UPSTREAM_PAYLOAD_BYTES, record_cache
+from app.utils.storage import get_data_dir
+from app.utils.storage_io import read_json, write_bytes, write_json
+from app.utils.tracing import tracer
+from config.settings import ImageProxySettings, get_settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails need Pillow; without it originals are served as-is
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+PROXY_PREFIX = "/api/images/"
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+SHARED_CHANNEL = "image_proxy"
+
+# format name -> (Pillow format, content type, file extension)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+}
+
+# leading bytes -> content type, used when an origin sends a wrong or missing Content-Type
+MAGIC_NUMBERS = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+class ImageFetchError(Exception):
+    """Raised when an origin image cannot be fetched or is not an image"""
+
+
+class ImageRecord(BaseModel):
+    """Metadata for one cached original"""
+    hash: str
+    content_type: str
+    bytes: int
+    source_url: str
+    fetched_at: float
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def sniff_content_type(data: bytes) -> Optional[str]:
+    for magic, content_type in MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def render_variant(source: str, target: str, width: int, fmt: str, quality: int) -> int:
+    """
+    Resize an original to ``width`` and encode it (runs in a worker process)
+
+    Returns:
+        Size of the written file in bytes
+    """
+    pil_format = VARIANT_FORMATS[fmt][0]
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        if pil_format == "JPEG" and img.mode != "RGB":
+            img = img.convert("RGB")
+        elif pil_format == "WEBP" and img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+        Path(target).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        img.save(tmp, pil_format, quality=quality)
+        os.replace(tmp, target)
+    return os.path.getsize(target)
+
+
+def _image_size(path: Path) -> Tuple[Optional[int], Optional[int]]:
+    if Image is None:
+        return None, None
+    try:
+        with Image.open(path) as img:
+            return img.width, img.height
+    except Exception:
+        return None, None
+
+
+class ImageProxy:
+    """Fetches, stores and resizes images for the ``/api/images`` endpoint"""
+
+    def __init__(self, cache_dir: Path, settings: ImageProxySettings = None):
+        self.cache_dir = Path(cache_dir)
+        self.settings = settings or ImageProxySettings()
+        self._records: Dict[str, ImageRecord] = {}
+        self._urls: Dict[str, str] = {}
+        self._url_locks: Dict[str, threading.Lock] = {}
+        self._variant_futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    # --- paths -------------------------------------------------------------
+
+    def _object_path(self, image_hash: str) -> Path:
+        return self.cache_dir / "objects" / image_hash[:2] / image_hash
+
+    def _meta_path(self, image_hash: str) -> Path:
+        return self.cache_dir / "objects" / image_hash[:2] / f"{image_hash}.json"
+
+    def _url_path(self, url: str) -> Path:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / "urls" / key[:2] / key
+
+    def _variant_path(self, image_hash: str, width: int, fmt: str) -> Path:
+        ext = VARIANT_FORMATS[fmt][2]
+        return self.cache_dir / "variants" / image_hash[:2] / f"{image_hash}_w{width}.{ext}"
+
+    # --- originals ---------------------------------------------------------
+
+    def get_record(self, image_hash: str) -> Optional[ImageRecord]:
+        """Metadata for a cached original, or None for unknown or malformed hashes"""
+        if not HASH_PATTERN.match(image_hash or ""):
+            return None
+        record = self._records.get(image_hash)
+        if record is not None:
+            return record
+        meta_path = self._meta_path(image_hash)
+        if not meta_path.exists() or not self._object_path(image_hash).exists():
+            return None
+        record = ImageRecord(**read_json(meta_path))
+        self._records[image_hash] = record
+        return record
+
+    def original_path(self, image_hash: str) -> Path:
+        return self._object_path(image_hash)
+
+    def lookup_url(self, url: str) -> Optional[str]:
+        """Hash of an already fetched URL, without touching the network"""
+        image_hash = self._urls.get(url)
+        if image_hash is None:
+            url_path = self._url_path(url)
+            if not url_path.exists():
+                return None
+            image_hash = url_path.read_text().strip()
+        if self.get_record(image_hash) is None:
+            return None
+        self._urls[url] = image_hash
+        try:
+            # about to be linked from a story; keeps the garbage collector's age check from taking it
+            os.utime(self._object_path(image_hash))
+        except OSError:
+            pass
+        return image_hash
+
+    def fetch(self, url: str) -> ImageRecord:
+        """
+        Fetch an origin image once and store it under the hash of its bytes
+
+        Concurrent calls for the same URL wait for the first one instead of
+        downloading again.
+
+        Raises:
+            ImageFetchError: If the download fails, is too large or is not an image
+        """
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        try:
+            with url_lock:
+                image_hash = self.lookup_url(url)
+                record_cache("image_proxy", image_hash is not None)
+                if image_hash:
+                    return self.get_record(image_hash)
+
+                with tracer.span("image.fetch", url=url[:200]):
+                    data, content_type = self._download(url)
+
+                image_hash = hashlib.sha256(data).hexdigest()
+                object_path = self._object_path(image_hash)
+                if not object_path.exists():
+                    object_path.parent.mkdir(parents=True, exist_ok=True)
+                    write_bytes(object_path, data)
+                width, height = _image_size(object_path)
+                record = ImageRecord(
+                    hash=image_hash, content_type=content_type, bytes=len(data), source_url=url,
+                    fetched_at=time.time(), width=width, height=height,
+                )
+                write_bytes(self._meta_path(image_hash), record.model_dump_json().encode("utf-8"))
+                self._url_path(url).parent.mkdir(parents=True, exist_ok=True)
+                write_bytes(self._url_path(url), image_hash.encode("utf-8"))
+                self._records[image_hash] = record
+                self._urls[url] = image_hash
+        finally:
+            with self._lock:
+                self._url_locks.pop(url, None)
+
+        self.prewarm(image_hash)
+        return record
+
+    def adopt(self, record: ImageRecord, path: Path):
+        """Move an original whose bytes were already checked against ``record.hash`` into the cache"""
+        object_path = self._object_path(record.hash)
+        if object_path.exists():
+            Path(path).unlink(missing_ok=True)
+        else:
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = object_path.with_name(f"{object_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            shutil.move(str(path), tmp)
+            os.replace(tmp, object_path)
+        if not self._meta_path(record.hash).exists():
+            write_bytes(self._meta_path(record.hash), record.model_dump_json().encode("utf-8"))
+        if record.source_url and not self._url_path(record.source_url).exists():
+            self._url_path(record.source_url).parent.mkdir(parents=True, exist_ok=True)
+            write_bytes(self._url_path(record.source_url), record.hash.encode("utf-8"))
+
+    def forget(self, hashes: List[str], notify: bool = True):
+        """
+        Drop cached metadata for removed originals, here and (unless ``notify``
+        is off) in the other workers, so no story is pointed at them again
+        """
+        dropped = set(hashes)
+        if not dropped:
+            return
+        with self._lock:
+            for image_hash in dropped:
+                self._records.pop(image_hash, None)
+            for url in [url for url, image_hash in self._urls.items() if image_hash in dropped]:
+                del self._urls[url]
+        shared = get_shared_cache() if notify else None
+        if shared is not None:
+            try:
+                shared.publish(SHARED_CHANNEL, payload=json.dumps(sorted(dropped)))
+            except sqlite3.Error as e:
+                logger.warning("Could not tell other workers about %d removed images: %s", len(dropped), e)
+
+    def _download(self, url: str) -> Tuple[bytes, str]:
+        max_bytes = self.settings.max_bytes
+        try:
+            with UPSTREAM_DURATION.time(upstream="image_origin", status="error") as labels:
+                response = requests.get(url, timeout=self.settings.fetch_timeout, stream=True,
+                                        headers={"User-Agent": "storyboard-image-proxy/1.0"})
+                labels["status"] = response.status_code
+                response.raise_for_status()
+
+                declared = int(response.headers.get("Content-Length") or 0)
+                if declared > max_bytes:
+                    raise ImageFetchError(f"{url} is {declared} bytes, over the {max_bytes} byte limit")
+
+                chunks, total = [], 0
+                for chunk in response.iter_content(64 * 1024):
+                    total += len(chunk)
+                    if total > max_bytes:
+                        raise ImageFetchError(f"{url} exceeds the {max_bytes} byte limit")
+                    chunks.append(chunk)
+                data = b"".join(chunks)
+        except requests.exceptions.RequestException as e:
+            raise ImageFetchError(f"Could not fetch {url}: {e}")
+
+        UPSTREAM_PAYLOAD_BYTES.observe(len(data), upstream="image_origin", direction="received")
+        content_type = sniff_content_type(data)
+        declared_type = (response.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type is None and declared_type.startswith("image/") and declared_type != "image/svg+xml":
+            content_type = declared_type
+        if content_type is None:
+            raise ImageFetchError(f"{url} did not return an image ({declared_type or 'no content type'})")
+        return data, content_type
+
+    def proxy_url(self, url: Optional[str]) -> Optional[str]:
+        """
+        Fetch an origin image and return its proxied URL
+
+        Anything that cannot be proxied (empty, already proxied, not http(s),
+        fetch failures) is returned unchanged so a board never loses its image.
+        """
+        if not url or not isinstance(url, str) or url.startswith(PROXY_PREFIX) or not url.startswith(("http://", "https://")):
+            return url
+        try:
+            return PROXY_PREFIX + self.fetch(url).hash
+        except ImageFetchError as e:
+            logger.warning(f"Keeping origin image URL: {e}")
+            return url
+
+    def cached_proxy_url(self, url: Optional[str]) -> Optional[str]:
+        """Proxied URL for an already cached origin, else the URL unchanged"""
+        if not url or not isinstance(url, str) or url.startswith(PROXY_PREFIX):
+            return url
+        image_hash = self.lookup_url(url)
+        return PROXY_PREFIX + image_hash if image_hash else url
+
+    def rewrite_story(self, story: dict, fetch: bool = True) -> bool:
+        """Point a story record at the proxy, keeping the origin in ``image_source_url``"""
+        url = story.get("image_url")
+        proxied = self.proxy_url(url) if fetch else self.cached_proxy_url(url)
+        if proxied == url:
+            return False
+        story["image_source_url"] = url
+        story["image_url"] = proxied
+        return True
+
+    # --- variants ----------------------------------------------------------
+
+    def pick_width(self, width: Optional[int]) -> int:
+        """Snap a requested width to the configured sizes so the variant cache stays bounded"""
+        widths = sorted(self.settings.widths)
+        if not width:
+            return self.settings.default_width
+        return next((w for w in widths if w >= width), widths[-1])
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the server process has threads that may hold locks
+                self._executor = ProcessPoolExecutor(max_workers=self.settings.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _submit_variant(self, image_hash: str, width: int, fmt: str) -> Optional[Future]:
+        target = self._variant_path(image_hash, width, fmt)
+        key = str(target)
+        with self._lock:
+            future = self._variant_futures.get(key)
+            if future is not None:
+                return future
+        if target.exists():
+            return None
+        quality = self.settings.webp_quality if fmt == "webp" else self.settings.jpeg_quality
+        future = self._get_executor().submit(render_variant, str(self._object_path(image_hash)), key, width, fmt, quality)
+        with self._lock:
+            self._variant_futures[key] = future
+        future.add_done_callback(lambda _: self._variant_futures.pop(key, None))
+        return future
+
+    def prewarm(self, image_hash: str):
+        """Start rendering the default panel variants without waiting for them"""
+        if Image is None:
+            return
+        for fmt in VARIANT_FORMATS:
+            try:
+                self._submit_variant(image_hash, self.settings.default_width, fmt)
+            except Exception as e:
+                logger.warning(f"Could not schedule thumbnail for {image_hash}: {e}")
+
+    def variant(self, image_hash: str, width: Optional[int], fmt: str) -> Tuple[Path, str]:
+        """
+        Path and content type of a resized variant, rendering it if needed
+
+        Falls back to the original when Pillow is unavailable or the image
+        cannot be decoded.
+        """
+        record = self.get_record(image_hash)
+        if record is None:
+            raise FileNotFoundError(image_hash)
+        original = (self._object_path(image_hash), record.content_type)
+        if Image is None or fmt not in VARIANT_FORMATS:
+            return original
+
+        width = self.pick_width(width)
+        target = self._variant_path(image_hash, width, fmt)
+        if not target.exists():
+            with tracer.span("image.resize", width=width, format=fmt):
+                try:
+                    future = self._submit_variant(image_hash, width, fmt)
+                    if future is not None:
+                        future.result(timeout=30)
+                except Exception as e:
+                    logger.warning(f"Serving original for {image_hash}: resize failed ({e})")
+                    return original
+        return target, VARIANT_FORMATS[fmt][1]
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def get_stats(self) -> dict:
+        originals = [p for p in (self.cache_dir / "objects").glob("*/*") if p.suffix != ".json"]
+        variants = list((self.cache_dir / "variants").glob("*/*"))
+        return {
+            "originals": len(originals),
+            "original_bytes": sum(p.stat().st_size for p in originals),
+            "variants": len(variants),
+            "variant_bytes": sum(p.stat().st_size for p in variants),
+            "thumbnails_enabled": Image is not None,
+        }
+
+
+_proxy: Optional[ImageProxy] = None
+_proxy_lock = threading.Lock()
+
+
+def get_image_proxy() -> ImageProxy:
+    """Shared proxy for the current settings; rebuilt when the image proxy or storage settings change"""
+    global _proxy
+    settings = get_settings()
+    cache_dir = settings.image_proxy.cache_dir or (get_data_dir() / "images")
+    proxy = _proxy
+    if proxy is None or proxy.cache_dir != Path(cache_dir) or proxy.settings != settings.image_proxy:
+        with _proxy_lock:
+            if _proxy is None or _proxy.cache_dir != Path(cache_dir) or _proxy.settings != settings.image_proxy:
+                if _proxy is not None:
+                    _proxy.shutdown()
+                _proxy = ImageProxy(cache_dir, settings.image_proxy)
+            proxy = _proxy
+    return proxy
+
+
+def _forget_everywhere(_key: Optional[str], payload: Optional[str]):
+    if _proxy is not None and payload:
+        _proxy.forget(json.loads(payload), notify=False)
+
+
+subscribe(SHARED_CHANNEL, _forget_everywhere)
+
+
+def rewrite_project_stories(project_dir: Path, proxy: ImageProxy = None) -> int:
+    """Rewrite every story file in a project to proxied image URLs; returns the number changed"""
+    proxy = proxy or get_image_proxy()
+    changed = 0
+    for story_file in sorted(Path(project_dir).glob("story_*.json")):
+        story = read_json(story_file)
+        if isinstance(story, dict) and proxy.rewrite_story(story):
+            write_json(story_file, story)
+            changed += 1
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch story images into the local proxy cache")
+    parser.add_argument("--project", action="append", help="Project id to rewrite (default: all projects)")
+    args = parser.parse_args()
+
+    data_dir = get_data_dir()
+    project_dirs: List[Path] = (
+        [data_dir / f"project_{project_id}" for project_id in args.project] if args.project
+        else sorted(p for p in data_dir.glob("project_*") if p.is_dir())
+    )
+    proxy = get_image_proxy()
+    total = 0
+    for project_dir in project_dirs:
+        changed = rewrite_project_stories(project_dir, proxy)
+        total += changed
+        print(f"{project_dir.name}: rewrote {changed} stories")
+    proxy.shutdown()
+    print(f"Rewrote {total} stories; cache: {proxy.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Reuse of earlier image searches for similar visual keywords
+
+``on_screen_visual_keywords`` differ in small ways between screens and
+projects ("brand logos, upward arrow" vs "Upward arrows and a brand logo"),
+so the keywords are canonicalized first: lowercased, stop words dropped,
+plurals folded to the singular and the terms sorted. Canonical queries are
+kept in an inverted index with the ranked candidates they returned, and a new
+query whose TF-IDF cosine similarity to an indexed one reaches the configured
+threshold reuses those candidates instead of calling Google.
+
+Entries are appended to ``image_queries.jsonl`` in the data directory so the
+index survives restarts; the file is compacted when it holds mostly
+superseded lines. In multi-worker mode the entries live in the shared cache
+instead (seeded once from the JSONL file), and a search indexed by one worker
+is inserted into every other worker's index when they see its invalidation.
+"""
+
+import logging
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from app.services.shared_cache import SharedCache, get_shared_cache, subscribe
+from app.utils.image_search import search_image_candidates
+from app.utils.keywords import canonicalize
+from app.utils.metrics import IMAGE_SEARCHES_AVOIDED, record_cache
+from app.utils.storage import get_data_dir
+from config.settings import ImageSearchSettings, get_settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "image_queries.jsonl"
+SHARED_NAMESPACE = "image_query"
+
+class IndexedQuery(BaseModel):
+    """One past search and the candidates it produced"""
+    canonical: str
+    query: str
+    candidates: List[dict]
+    created_at: float
+    reused: int = 0
+
+
+class ImageQueryIndex:
+    """
+    Finds past image searches similar enough to answer a new query
+
+    Lookups only score entries that share at least one term with the query,
+    through the term -> entries inverted index, so cost grows with the
+    overlap rather than with the size of the index.
+    """
+
+    def __init__(self, index_file: Path, settings: ImageSearchSettings = None, shared: Optional[SharedCache] = None):
+        self.index_file = Path(index_file)
+        self.settings = settings or ImageSearchSettings()
+        self.shared = shared
+        self._entries: Dict[str, IndexedQuery] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "exact_hits": 0, "similar_hits": 0, "misses": 0}
+        self._load()
+
+    # --- persistence -------------------------------------------------------
+
+    def _load(self):
+        if self.shared is not None and self._load_shared():
+            return
+        if not self.index_file.exists():
+            return
+        lines = 0
+        with open(self.index_file, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                lines += 1
+                try:
+                    self._insert(IndexedQuery.model_validate_json(line))
+                except ValueError as e:
+                    logger.warning(f"Skipping unreadable image query entry: {e}")
+        self._evict()
+        if self.shared is not None:
+            # first start in multi-worker mode: the JSONL entries seed the shared store
+            for entry in self._entries.values():
+                self.shared.set(SHARED_NAMESPACE, entry.canonical, entry.model_dump_json(), notify=False)
+        elif lines > 2 * max(1, len(self._entries)):
+            self._compact()
+
+    def _load_shared(self) -> bool:
+        rows = self.shared.items(SHARED_NAMESPACE)
+        for _, value in rows:
+            try:
+                self._insert(IndexedQuery.model_validate_json(value))
+            except ValueError as e:
+                logger.warning(f"Skipping unreadable shared image query entry: {e}")
+        self._evict()
+        return bool(rows)
+
+    def apply_shared(self, canonical: str):
+        """Pick up an entry another worker added to the shared store"""
+        value = self.shared.get(SHARED_NAMESPACE, canonical) if self.shared is not None else None
+        with self._lock:
+            if value is None:
+                self._remove(canonical)
+                return
+            self._insert(IndexedQuery.model_validate_json(value))
+            self._evict()
+
+    def _store(self, entry: IndexedQuery, evicted: List[str]):
+        if self.shared is None:
+            self._append(entry)
+            return
+        try:
+            self.shared.set(SHARED_NAMESPACE, entry.canonical, entry.model_dump_json())
+            # every worker evicts by the same rules, so this needs no invalidation
+            self.shared.delete(SHARED_NAMESPACE, evicted, notify=False)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not share image query entry {entry.canonical!r}: {e}")
+
+    def _append(self, entry: IndexedQuery):
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.index_file, "a") as f:
+            f.write(entry.model_dump_json() + "\n")
+
+    def _compact(self):
+        tmp = self.index_file.with_suffix(".jsonl.tmp")
+        with open(tmp, "w") as f:
+            for entry in self._entries.values():
+                f.write(entry.model_dump_json() + "\n")
+        tmp.replace(self.index_file)
+
+    # --- index -------------------------------------------------------------
+
+    def _insert(self, entry: IndexedQuery):
+        self._remove(entry.canonical)
+        self._entries[entry.canonical] = entry
+        for term in entry.canonical.split():
+            self._postings.setdefault(term, set()).add(entry.canonical)
+
+    def _remove(self, canonical: str):
+        if self._entries.pop(canonical, None) is None:
+            return
+        for term in canonical.split():
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.discard(canonical)
+                if not postings:
+                    del self._postings[term]
+
+    def _evict(self) -> List[str]:
+        now = time.time()
+        evicted = [c for c, e in self._entries.items() if now - e.created_at > self.settings.query_index_ttl]
+        for canonical in evicted:
+            self._remove(canonical)
+        overflow = len(self._entries) - self.settings.query_index_size
+        if overflow > 0:
+            oldest = sorted(self._entries, key=lambda c: self._entries[c].created_at)[:overflow]
+            for canonical in oldest:
+                self._remove(canonical)
+            evicted.extend(oldest)
+        return evicted
+
+    def _idf(self, term: str) -> float:
+        return math.log((len(self._entries) + 1) / (len(self._postings.get(term, ())) + 1)) + 1
+
+    def _similarity(self, terms: List[str], other: List[str]) -> float:
+        weights = {t: self._idf(t) for t in set(terms) | set(other)}
+        shared = sum(weights[t] ** 2 for t in set(terms) & set(other))
+        norm = math.sqrt(sum(weights[t] ** 2 for t in terms)) * math.sqrt(sum(weights[t] ** 2 for t in other))
+        return shared / norm if norm else 0.0
+
+    def find(self, query: str) -> Tuple[Optional[IndexedQuery], float]:
+        """
+        Best indexed match for a query
+
+        Returns:
+            The matching entry and its similarity, or ``(None, best score)``
+            if nothing reached the threshold
+        """
+        canonical = canonicalize(query)
+        if not canonical:
+            return None, 0.0
+        with self._lock:
+            entry = self._entries.get(canonical)
+            if entry is not None and time.time() - entry.created_at <= self.settings.query_index_ttl:
+                return entry, 1.0
+            if not self.settings.reuse_similar:
+                return None, 0.0
+
+            terms = canonical.split()
+            neighbours = set().union(*(self._postings.get(t, set()) for t in terms))
+            best, best_score = None, 0.0
+            for other in neighbours:
+                score = self._similarity(terms, other.split())
+                if score > best_score:
+                    best, best_score = self._entries[other], score
+        if best is not None and best_score >= self.settings.reuse_threshold \
+                and time.time() - best.created_at <= self.settings.query_index_ttl:
+            return best, best_score
+        return None, best_score
+
+    def add(self, query: str, candidates: List[dict]):
+        """Index the candidates a search returned; empty results are not kept"""
+        canonical = canonicalize(query)
+        if not canonical or not candidates:
+            return
+        entry = IndexedQuery(canonical=canonical, query=query, candidates=candidates, created_at=time.time())
+        with self._lock:
+            self._insert(entry)
+            evicted = self._evict()
+            self._store(entry, evicted)
+
+    def lookup_or_search(self, query: str) -> List[dict]:
+        """
+        Ranked candidates for a query, reusing a similar past search when possible
+
+        Returns copies of the stored candidates so callers can annotate them.
+        """
+        entry, score = self.find(query)
+        with self._lock:
+            self.stats["lookups"] += 1
+            if entry is None:
+                self.stats["misses"] += 1
+            else:
+                self.stats["exact_hits" if score >= 1.0 else "similar_hits"] += 1
+                entry.reused += 1
+        record_cache("image_query", entry is not None)
+
+        if entry is not None:
+            IMAGE_SEARCHES_AVOIDED.inc(match="exact" if score >= 1.0 else "similar")
+            logger.info(f"Reusing image results of {entry.query!r} for {query!r} (similarity {score:.2f})")
+            return [dict(candidate) for candidate in entry.candidates]
+
+        candidates = search_image_candidates(query)
+        self.add(query, candidates)
+        return [dict(candidate) for candidate in candidates]
+
+    def get_stats(self) -> dict:
+        """Index size and how many upstream searches were avoided"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+            stats["terms"] = len(self._postings)
+        stats["searches_avoided"] = stats["exact_hits"] + stats["similar_hits"]
+        stats["reuse_rate"] = round(stats["searches_avoided"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+        stats["threshold"] = self.settings.reuse_threshold
+        return stats
+
+
+_index: Optional[ImageQueryIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_image_query_index() -> ImageQueryIndex:
+    """Shared index for the current settings; rebuilt when the data directory or search settings change"""
+    global _index
+    settings = get_settings().image_search
+    index_file = get_data_dir() / INDEX_FILENAME
+    shared = get_shared_cache()
+    index = _index
+    if index is None or index.index_file != index_file or index.settings != settings or index.shared is not shared:
+        with _index_lock:
+            if _index is None or _index.index_file != index_file or _index.settings != settings or _index.shared is not shared:
+                _index = ImageQueryIndex(index_file, settings, shared)
+            index = _index
+    return index
+
+
+def _apply_shared(canonical: Optional[str], _payload: Optional[str]):
+    if _index is not None and canonical:
+        _index.apply_shared(canonical)
+
+
+subscribe(SHARED_NAMESPACE, _apply_shared)
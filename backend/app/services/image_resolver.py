@@ -0,0 +1,159 @@
+"""
+Background image resolution for freshly generated stories
+
+Stories are written as soon as the storyboard text is parsed, marked with
+``image_status: pending``. The resolver then searches (or reuses) image
+candidates for each one on a small thread pool and patches the story file in
+place, so the chat response never waits for image search. Each story ends up
+``ready`` (an image was attached), ``missing`` (nothing usable was found) or
+``error``.
+"""
+
+import contextvars
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_for
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from app.utils.file_lock import project_lock
+from app.utils.image_search import attach_image_candidates
+from app.utils.storage import project_id_of
+from app.utils.storage_io import read_json, write_json
+from app.utils.tracing import tracer
+from app.services.project_events import project_events, IMAGE_RESOLVED
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+READY = "ready"
+MISSING = "missing"
+ERROR = "error"
+
+
+def image_progress(stories: Iterable[dict]) -> Dict[str, int]:
+    """Count stories by image status; stories without a status count as ready"""
+    progress = {"total": 0, PENDING: 0, READY: 0, MISSING: 0, ERROR: 0}
+    for story in stories:
+        progress["total"] += 1
+        status = story.get("image_status", READY) if isinstance(story, dict) else READY
+        progress[status if status in progress else READY] += 1
+    return progress
+
+
+class ImageResolver:
+    """Resolves pending story images on a thread pool, one job per story file"""
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-resolver")
+        self._in_flight: Dict[Path, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, READY: 0, MISSING: 0, ERROR: 0}
+
+    def submit(self, story_files: Iterable[Path]) -> List[Future]:
+        """
+        Queue pending story files for resolution
+
+        Files that already have a job queued or running are not queued again,
+        so this is safe to call for every pending story a reader comes across.
+        """
+        futures = []
+        for story_file in story_files:
+            story_file = Path(story_file)
+            with self._lock:
+                future = self._in_flight.get(story_file)
+                if future is None:
+                    # copy the context so the job's spans join the trace of the request that queued it
+                    future = self._executor.submit(contextvars.copy_context().run, self._resolve, story_file)
+                    self._in_flight[story_file] = future
+                    self.stats["submitted"] += 1
+                    future.add_done_callback(lambda _, key=story_file: self._done(key))
+            futures.append(future)
+        return futures
+
+    def _done(self, story_file: Path):
+        with self._lock:
+            self._in_flight.pop(story_file, None)
+
+    def _resolve(self, story_file: Path) -> Optional[str]:
+        from app.services.image_proxy import get_image_proxy
+        from app.services.image_query_index import get_image_query_index
+
+        try:
+            story = read_json(story_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot resolve image for {story_file}: {e}")
+            return None
+        if story.get("image_status") != PENDING:
+            return story.get("image_status")
+
+        keywords = story.get("on_screen_visual_keywords", "")
+        try:
+            with tracer.span("image.resolve", story=story_file.name):
+                candidates = get_image_query_index().lookup_or_search(keywords)
+                attach_image_candidates(story, candidates)
+                proxy = get_image_proxy()
+                if proxy.settings.enabled:
+                    proxy.rewrite_story(story)
+            status = READY if story.get("image_url") else MISSING
+        except Exception as e:
+            logger.warning(f"Image resolution failed for {story_file}: {e}")
+            status = ERROR
+        story["image_status"] = status
+
+        with project_lock(story_file.parent), self._lock:
+            # the story may have been saved over or deleted while we searched, here or in another worker
+            try:
+                current = read_json(story_file)
+            except (OSError, ValueError):
+                return None
+            if current.get("image_status") != PENDING or current.get("on_screen_visual_keywords", "") != keywords:
+                return current.get("image_status")
+            current.update({k: v for k, v in story.items() if k.startswith("image_")})
+            write_json(story_file, current)
+            self.stats[status] += 1
+        # candidates stay server-side ("next image" reads them from the file) to keep the event small
+        project_events.publish(project_id_of(story_file.parent), IMAGE_RESOLVED, {
+            "story_id": story_file.stem,
+            **{k: v for k, v in current.items() if k.startswith("image_") and k != "image_candidates"},
+        })
+        return status
+
+    def drain(self, timeout: Optional[float] = None):
+        """Wait for the jobs queued so far to finish"""
+        with self._lock:
+            futures = list(self._in_flight.values())
+        wait_for(futures, timeout=timeout)
+
+    def pending(self) -> int:
+        """Jobs queued or running"""
+        with self._lock:
+            return len(self._in_flight)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._in_flight), "workers": self.workers}
+
+
+_resolver: Optional[ImageResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_image_resolver() -> ImageResolver:
+    """Shared resolver; rebuilt when the worker count changes"""
+    global _resolver
+    workers = get_settings().image_search.resolver_workers
+    resolver = _resolver
+    if resolver is None or resolver.workers != workers:
+        with _resolver_lock:
+            if _resolver is None or _resolver.workers != workers:
+                if _resolver is not None:
+                    _resolver.shutdown(wait=False)
+                _resolver = ImageResolver(workers)
+            resolver = _resolver
+    return resolver
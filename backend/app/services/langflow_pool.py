@@ -0,0 +1,416 @@
+import time
+import random
+import threading
+import zlib
+import contextvars
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import requests
+
+from app.utils.metrics import LANGFLOW_HOST_OUTSTANDING, LANGFLOW_CIRCUIT_STATE, LANGFLOW_HEDGED_REQUESTS
+
+if TYPE_CHECKING:
+    from config.settings import LangflowSettings
+
+logger = logging.getLogger(__name__)
+
+
+class NoHealthyLangflowHost(requests.exceptions.ConnectionError):
+    """Raised when every Langflow host is ejected or has failed"""
+
+
+class SessionHostUnavailable(NoHealthyLangflowHost):
+    """Raised when the host holding a session's flow memory is ejected; nothing was sent"""
+
+
+class CircuitBreaker:
+    """
+    Ejects a host after consecutive failures and probes it again after a cool-down
+
+    ``closed`` lets every request through, ``open`` rejects them until
+    ``reset_timeout`` has passed, then ``half_open`` lets a single trial request
+    through whose outcome closes or reopens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether a request could be sent now, without claiming the half-open trial"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return not self._trial_in_flight
+
+    def allow(self) -> bool:
+        """Claim permission to send one request"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class LangflowEndpoint:
+    """One Langflow host with its load, latency window and circuit breaker"""
+
+    def __init__(self, host: str, flow_id: str, breaker: CircuitBreaker, window: int = 200):
+        self.host = host
+        self.url = f"http://{host}/api/v1/run/{flow_id}"
+        self.breaker = breaker
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+    def _update_gauges(self):
+        LANGFLOW_HOST_OUTSTANDING.set(self.outstanding, host=self.host)
+        LANGFLOW_CIRCUIT_STATE.set({"closed": 0, "half_open": 1, "open": 2}[self.breaker.state], host=self.host)
+
+    def begin(self):
+        with self._lock:
+            self.outstanding += 1
+            self.requests += 1
+        self._update_gauges()
+
+    def finish(self, latency: Optional[float], ok: bool):
+        with self._lock:
+            self.outstanding -= 1
+            if latency is not None:
+                self.latencies.append(latency)
+            if not ok:
+                self.failures += 1
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        self._update_gauges()
+
+    def get_stats(self) -> dict:
+        p50, p95 = self.latency_percentile(50), self.latency_percentile(95)
+        return {
+            "host": self.host,
+            "state": self.breaker.state,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "p50_sec": round(p50, 3) if p50 is not None else None,
+            "p95_sec": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class LangflowPool:
+    """
+    Spreads Langflow run requests over several hosts
+
+    Picks the healthy host with the fewest outstanding requests. Hosts that
+    keep failing are ejected by their circuit breaker. Connection errors and
+    5xx responses fail over to the next host. With hedging enabled, a request
+    still running after the pool's latency percentile is duplicated on a
+    second host and the first good answer wins.
+
+    Requests for a Langflow session go to the session's home host, picked by
+    a hash of the session id so every worker and restart agrees on it, and are
+    never hedged or failed over: the flow memory lives on that host only.
+    """
+
+    def __init__(
+        self,
+        hosts: List[str],
+        flow_id: str,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        hedge: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_delay: float = 5.0,
+        hedge_min_samples: int = 20,
+    ):
+        if not hosts:
+            raise ValueError("At least one Langflow host is required")
+        self.endpoints = [
+            LangflowEndpoint(host, flow_id, CircuitBreaker(failure_threshold, reset_timeout))
+            for host in hosts
+        ]
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(hosts)), thread_name_prefix="langflow-hedge")
+
+    @classmethod
+    def from_settings(cls, langflow: "LangflowSettings") -> "LangflowPool":
+        """Build a pool from the ``langflow`` section of the settings snapshot"""
+        return cls(
+            list(langflow.hosts),
+            langflow.flow_id,
+            failure_threshold=langflow.breaker_failures,
+            reset_timeout=langflow.breaker_reset,
+            hedge=langflow.hedge,
+            hedge_percentile=langflow.hedge_percentile,
+            hedge_min_delay=langflow.hedge_min_delay,
+        )
+
+    def apply_hedging(self, langflow: "LangflowSettings"):
+        """Update hedging settings in place; they do not need a new pool"""
+        self.hedge = langflow.hedge
+        self.hedge_percentile = langflow.hedge_percentile
+        self.hedge_min_delay = langflow.hedge_min_delay
+
+    def home(self, affinity_key: str) -> LangflowEndpoint:
+        """The host that serves a session, the same in every worker for the same host list"""
+        return self.endpoints[zlib.crc32(affinity_key.encode("utf-8")) % len(self.endpoints)]
+
+    def _choose(self, exclude=()) -> Optional[LangflowEndpoint]:
+        candidates = [e for e in self.endpoints if e not in exclude and e.breaker.available()]
+        if not candidates:
+            return None
+
+        random.shuffle(candidates)
+        candidates.sort(key=lambda e: e.outstanding)
+        for endpoint in candidates:
+            if endpoint.breaker.allow():
+                return endpoint
+        return None
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        latencies = sorted(latency for e in self.endpoints for latency in list(e.latencies))
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        threshold = latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))]
+        return max(self.hedge_min_delay, threshold)
+
+    def _send(self, endpoint: LangflowEndpoint, body: bytes, headers: dict, timeout: float, stream: bool = False) -> Tuple[requests.Response, LangflowEndpoint]:
+        endpoint.begin()
+        start = time.perf_counter()
+        try:
+            if stream:
+                response = requests.post(endpoint.url, data=body, headers=headers, timeout=timeout,
+                                         params={"stream": "true"}, stream=True)
+            else:
+                response = requests.post(endpoint.url, data=body, headers=headers, timeout=timeout)
+        except requests.exceptions.RequestException:
+            endpoint.finish(None, ok=False)
+            raise
+        if stream and response.status_code < 500:
+            self._finish_after_body(response, endpoint, start)
+        else:
+            endpoint.finish(time.perf_counter() - start, ok=response.status_code < 500)
+        return response, endpoint
+
+    @staticmethod
+    def _finish_after_body(response: requests.Response, endpoint: LangflowEndpoint, start: float):
+        """
+        Keep a streamed request outstanding on its host until its body is read
+
+        The run is only over when the stream ends: that is when the host stops
+        counting it, its breaker hears the outcome and its latency is recorded.
+        A read error counts as a failure; a response closed before the end
+        releases the host without a latency sample.
+        """
+        finished = threading.Lock()
+        iter_content, close = response.iter_content, response.close
+
+        def finish(latency: Optional[float], ok: bool):
+            if finished.acquire(blocking=False):
+                endpoint.finish(latency, ok=ok)
+
+        def tracked_iter_content(*args, **kwargs):
+            # iter_lines reads through iter_content
+            try:
+                yield from iter_content(*args, **kwargs)
+            except requests.exceptions.RequestException:
+                finish(None, ok=False)
+                raise
+            finish(time.perf_counter() - start, ok=True)
+
+        def tracked_close():
+            try:
+                close()
+            finally:
+                finish(None, ok=True)
+
+        response.iter_content = tracked_iter_content
+        response.close = tracked_close
+
+    def _submit(self, endpoint: LangflowEndpoint, body: bytes, headers: dict, timeout: float):
+        # each thread gets its own copy of the context so trace spans keep their parent
+        return self._executor.submit(contextvars.copy_context().run, self._send, endpoint, body, headers, timeout)
+
+    def _send_hedged(self, endpoint: LangflowEndpoint, body: bytes, headers: dict, timeout: float, tried: set):
+        delay = self.hedge_delay() if self.hedge else None
+        if delay is None:
+            return self._send(endpoint, body, headers, timeout)
+
+        try:
+            primary = self._submit(endpoint, body, headers, timeout)
+        except RuntimeError:
+            # a settings reload retired this pool while the request was on its way
+            return self._send(endpoint, body, headers, timeout)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        backup_endpoint = self._choose(exclude=tried)
+        if backup_endpoint is None:
+            return primary.result()
+        try:
+            backup = self._submit(backup_endpoint, body, headers, timeout)
+        except RuntimeError:
+            return primary.result()
+        tried.add(backup_endpoint)
+        LANGFLOW_HEDGED_REQUESTS.inc()
+        logger.info(f"Hedging Langflow request on {backup_endpoint.host} after {delay:.1f}s on {endpoint.host}")
+
+        pending = {primary, backup}
+        error, error_result = None, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+                if result[0].status_code < 500:
+                    return result
+                error_result = result
+        if error_result is not None:
+            return error_result
+        raise error
+
+    def post(self, body: bytes, headers: dict, timeout: float, affinity_key: Optional[str] = None, stream: bool = False,
+             pinned: bool = False) -> requests.Response:
+        """
+        Send one run request through the pool
+
+        Args:
+            body: Encoded JSON payload
+            headers: Request headers
+            timeout: Per-attempt timeout in seconds
+            affinity_key: Session id; the request is sent once to the session's
+                home host, or to another host if that one is ejected
+            stream: Ask Langflow to stream events (``?stream=true``) and return
+                as soon as headers arrive; streamed requests are never hedged.
+                The request counts against its host until the body has been
+                read or the response is closed, so callers must do one of them
+            pinned: The request relies on the session's flow memory and may only
+                go to its home host
+
+        Returns:
+            The first non-5xx response, or the last 5xx response if every host
+            failed. With ``affinity_key`` its ``session_moved`` attribute tells
+            whether a host other than the session's home answered it.
+
+        Raises:
+            NoHealthyLangflowHost: If no host could be tried
+            SessionHostUnavailable: If a pinned request's home host is ejected
+            requests.exceptions.Timeout: If the chosen host timed out (not retried)
+        """
+        if affinity_key:
+            return self._post_session(body, headers, timeout, affinity_key, stream, pinned)
+
+        tried = set()
+        last_error, last_response = None, None
+
+        for _ in range(len(self.endpoints)):
+            endpoint = self._choose(exclude=tried)
+            if endpoint is None:
+                break
+            tried.add(endpoint)
+            try:
+                if stream:
+                    response, served_by = self._send(endpoint, body, headers, timeout, stream=True)
+                else:
+                    response, served_by = self._send_hedged(endpoint, body, headers, timeout, tried)
+            except requests.exceptions.Timeout:
+                if last_response is not None:
+                    last_response.close()
+                raise
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Langflow host {endpoint.host} failed: {e}")
+                last_error = e
+                continue
+
+            if response.status_code >= 500:
+                logger.warning(f"Langflow host {served_by.host} returned {response.status_code}")
+                # only the last failed response is handed back; the others would hold their connections
+                if last_response is not None:
+                    last_response.close()
+                last_response = response
+                continue
+
+            if last_response is not None:
+                last_response.close()
+            return response
+
+        if last_response is not None:
+            return last_response
+        if last_error is not None:
+            raise last_error
+        raise NoHealthyLangflowHost("All Langflow hosts are currently ejected")
+
+    def _post_session(self, body: bytes, headers: dict, timeout: float, affinity_key: str, stream: bool,
+                      pinned: bool) -> requests.Response:
+        home = self.home(affinity_key)
+        endpoint = home if home.breaker.allow() else None
+        if endpoint is None:
+            if pinned:
+                raise SessionHostUnavailable(f"Langflow host {home.host} holding session {affinity_key} is ejected")
+            endpoint = self._choose(exclude={home})
+            if endpoint is None:
+                raise NoHealthyLangflowHost("All Langflow hosts are currently ejected")
+        response, _ = self._send(endpoint, body, headers, timeout, stream=stream)
+        response.session_moved = endpoint is not home
+        return response
+
+    def shutdown(self, wait: bool = False):
+        """Stop the hedging threads; requests already running finish, later ones go unhedged"""
+        self._executor.shutdown(wait=wait)
+
+    def get_stats(self) -> List[dict]:
+        """Per-host state, load and latency"""
+        return [endpoint.get_stats() for endpoint in self.endpoints]
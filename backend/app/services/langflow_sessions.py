@@ -0,0 +1,191 @@
+import json
+import time
+import uuid
+import threading
+import logging
+import sqlite3
+import weakref
+from pathlib import Path
+from typing import Dict, Optional
+from pydantic import BaseModel
+
+from app.services.shared_cache import get_shared_cache, subscribe
+from app.utils.storage_io import write_json
+
+logger = logging.getLogger(__name__)
+
+SESSION_FILENAME = "langflow_session.json"
+SHARED_CHANNEL = "langflow_session"
+
+# every store in this process, so invalidations from other workers reach them
+_stores: "weakref.WeakSet[LangflowSessionStore]" = weakref.WeakSet()
+
+
+class LangflowSession(BaseModel):
+    """A Langflow session bound to one project"""
+    session_id: str
+    project_id: str
+    created_at: float
+    last_used: float
+    turns: int = 0
+
+
+class LangflowCallStats(BaseModel):
+    """Running totals for Langflow calls made in one input mode"""
+    calls: int = 0
+    bytes_sent: int = 0
+    total_latency_sec: float = 0.0
+
+    @property
+    def avg_bytes_sent(self) -> float:
+        return self.bytes_sent / self.calls if self.calls else 0.0
+
+    @property
+    def avg_latency_sec(self) -> float:
+        return self.total_latency_sec / self.calls if self.calls else 0.0
+
+
+class LangflowSessionStore:
+    """
+    Maps projects to Langflow session ids so the flow keeps its own memory across turns
+
+    The session for a project is kept in memory and mirrored to
+    ``langflow_session.json`` in the project folder, so it survives backend
+    restarts. Sessions idle for longer than ``ttl_seconds`` are treated as
+    expired and the caller falls back to sending the full context again.
+
+    In multi-worker mode a new session is written to the file straight away
+    and every change tells the other workers to drop their copy, so the next
+    turn in any worker reads the current session from the file.
+    """
+
+    def __init__(self, data_dir: Path, ttl_seconds: float = 6 * 3600):
+        self.data_dir = Path(data_dir)
+        self.ttl_seconds = ttl_seconds
+        self._sessions: Dict[str, LangflowSession] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, LangflowCallStats] = {
+            "session": LangflowCallStats(),
+            "full": LangflowCallStats(),
+        }
+        _stores.add(self)
+
+    def _session_file(self, project_id: str) -> Path:
+        return self.data_dir / f"project_{project_id}" / SESSION_FILENAME
+
+    def _load(self, project_id: str) -> Optional[LangflowSession]:
+        session_file = self._session_file(project_id)
+        if not session_file.exists():
+            return None
+        try:
+            with open(session_file, "r") as f:
+                return LangflowSession.model_validate(json.load(f))
+        except (ValueError, OSError) as e:
+            logger.warning(f"Ignoring unreadable Langflow session for project {project_id}: {e}")
+            return None
+
+    def _save(self, session: LangflowSession):
+        session_file = self._session_file(session.project_id)
+        if not session_file.parent.exists():
+            return
+        # other workers may read the file while it is replaced
+        write_json(session_file, session.model_dump())
+
+    def get(self, project_id: str) -> Optional[LangflowSession]:
+        """Return the live session for a project, or None if there is none or it has expired"""
+        with self._lock:
+            session = self._sessions.get(project_id)
+            if session is None:
+                session = self._load(project_id)
+                if session is not None:
+                    self._sessions[project_id] = session
+            if session is None:
+                return None
+            if time.time() - session.last_used > self.ttl_seconds:
+                logger.info(f"Langflow session {session.session_id} for project {project_id} expired")
+                self._sessions.pop(project_id, None)
+                return None
+            return session
+
+    def open(self, project_id: str) -> LangflowSession:
+        """Start a new session for a project, replacing any previous one"""
+        now = time.time()
+        session = LangflowSession(
+            session_id=f"project_{project_id}_{uuid.uuid4().hex[:12]}",
+            project_id=project_id,
+            created_at=now,
+            last_used=now,
+        )
+        with self._lock:
+            self._sessions[project_id] = session
+            if get_shared_cache() is not None:
+                try:
+                    self._save(session)
+                except OSError as e:
+                    logger.warning(f"Could not persist Langflow session for project {project_id}: {e}")
+        self._notify(project_id)
+        return session
+
+    def touch(self, session: LangflowSession):
+        """Record a successful turn on a session"""
+        with self._lock:
+            session.last_used = time.time()
+            session.turns += 1
+            self._sessions[session.project_id] = session
+            try:
+                self._save(session)
+            except OSError as e:
+                logger.warning(f"Could not persist Langflow session for project {session.project_id}: {e}")
+        self._notify(session.project_id)
+
+    def invalidate(self, project_id: str):
+        """Forget the session for a project so the next turn resends the full context"""
+        with self._lock:
+            self._sessions.pop(project_id, None)
+            session_file = self._session_file(project_id)
+            if session_file.exists():
+                session_file.unlink()
+        self._notify(project_id)
+
+    def forget(self, project_id: str):
+        """Drop the in-memory copy of a project's session; the file is read again on next use"""
+        with self._lock:
+            self._sessions.pop(project_id, None)
+
+    def _notify(self, project_id: str):
+        shared = get_shared_cache()
+        if shared is None:
+            return
+        try:
+            shared.publish(SHARED_CHANNEL, project_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not tell other workers about the Langflow session of project {project_id}: {e}")
+
+    def record_call(self, mode: str, bytes_sent: int, latency_sec: float):
+        """Add one Langflow call to the per-mode totals"""
+        with self._lock:
+            stats = self.stats.setdefault(mode, LangflowCallStats())
+            stats.calls += 1
+            stats.bytes_sent += bytes_sent
+            stats.total_latency_sec += latency_sec
+
+    def get_stats(self) -> Dict[str, dict]:
+        """Summarize bytes sent and latency per input mode"""
+        with self._lock:
+            return {
+                mode: {
+                    "calls": stats.calls,
+                    "bytes_sent": stats.bytes_sent,
+                    "avg_bytes_sent": round(stats.avg_bytes_sent, 1),
+                    "avg_latency_sec": round(stats.avg_latency_sec, 3),
+                }
+                for mode, stats in self.stats.items()
+            }
+
+
+def _forget_everywhere(project_id: Optional[str], _payload: Optional[str]):
+    for store in list(_stores):
+        store.forget(project_id)
+
+
+subscribe(SHARED_CHANNEL, _forget_everywhere)
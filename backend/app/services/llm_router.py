@@ -0,0 +1,317 @@
+import time
+import threading
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+import requests
+
+from app.utils.metrics import UPSTREAM_DURATION, LLM_ROUTED_REQUESTS, LLM_PROVIDER_IN_FLIGHT
+from app.utils.tracing import tracer, trace_headers
+
+if TYPE_CHECKING:
+    from config.settings import LLMSettings
+
+logger = logging.getLogger(__name__)
+
+# Request kinds the router distinguishes
+EDIT = "edit"
+GENERATE = "generate"
+
+FAST = "fast"
+STRONG = "strong"
+
+# Words that mark a turn as a full storyboard generation rather than a small edit
+GENERATION_HINTS = ("json", "storyboard", "generate", "all screens", "start over", "regenerate")
+
+
+class AllProvidersFailed(requests.exceptions.ConnectionError):
+    """Raised when every configured LLM provider failed, timed out or was saturated"""
+
+
+class LLMProvider(ABC):
+    """
+    One model endpoint from ``config_list`` with its own concurrency limit and latency window
+
+    Subclasses build the provider's HTTP request and parse its reply; the base
+    class handles slots, timing and error accounting.
+    """
+
+    api_type = ""
+    default_base_url = ""
+
+    def __init__(
+        self,
+        model: str,
+        api_key: str,
+        tier: str = STRONG,
+        max_concurrency: int = 4,
+        timeout: float = 120.0,
+        base_url: Optional[str] = None,
+        temperature: float = 0.1,
+        window: int = 100,
+    ):
+        self.model = model
+        self.api_key = api_key
+        self.tier = tier
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.base_url = (base_url or self.default_base_url).rstrip("/")
+        self.temperature = temperature
+        self.name = f"{self.api_type}:{model}"
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=window)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """Take one concurrency slot, waiting up to ``timeout`` seconds"""
+        if timeout > 0:
+            acquired = self._slots.acquire(timeout=timeout)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if acquired:
+            with self._lock:
+                self.in_flight += 1
+            LLM_PROVIDER_IN_FLIGHT.set(self.in_flight, provider=self.name)
+        return acquired
+
+    def release(self, latency: Optional[float], ok: bool):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            if latency is not None and ok:
+                self.latencies.append(latency)
+            if not ok:
+                self.failures += 1
+        self._slots.release()
+        LLM_PROVIDER_IN_FLIGHT.set(self.in_flight, provider=self.name)
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+    def complete(self, messages: List[Dict[str, str]], timeout: Optional[float] = None) -> str:
+        """Send chat messages and return the reply text"""
+        url, payload, headers = self._build_request(messages)
+        response = requests.post(url, json=payload, headers={**headers, **trace_headers()}, timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return self._parse_response(response.json())
+
+    @abstractmethod
+    def _build_request(self, messages: List[Dict[str, str]]):
+        """Return ``(url, payload, headers)`` for a chat request"""
+
+    @abstractmethod
+    def _parse_response(self, data: dict) -> str:
+        """Pull the reply text out of the provider's response body"""
+
+    def get_stats(self) -> dict:
+        p50, p95 = self.latency_percentile(50), self.latency_percentile(95)
+        return {
+            "provider": self.name,
+            "tier": self.tier,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "p50_sec": round(p50, 3) if p50 is not None else None,
+            "p95_sec": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI-compatible ``/v1/chat/completions`` endpoint"""
+
+    api_type = "openai"
+    default_base_url = "https://api.openai.com"
+
+    def _build_request(self, messages):
+        payload = {"model": self.model, "messages": messages, "temperature": self.temperature}
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        return f"{self.base_url}/v1/chat/completions", payload, headers
+
+    def _parse_response(self, data):
+        try:
+            return data["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            raise ValueError(f"Unexpected OpenAI response: {str(data)[:200]}")
+
+
+class GeminiProvider(LLMProvider):
+    """Gemini ``generateContent`` REST endpoint"""
+
+    api_type = "google"
+    default_base_url = "https://generativelanguage.googleapis.com"
+
+    def _build_request(self, messages):
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        contents = [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+            for m in messages if m["role"] != "system"
+        ]
+        payload = {"contents": contents, "generationConfig": {"temperature": self.temperature}}
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
+        headers = {"x-goog-api-key": self.api_key, "Content-Type": "application/json"}
+        return f"{self.base_url}/v1beta/models/{self.model}:generateContent", payload, headers
+
+    def _parse_response(self, data):
+        try:
+            return "".join(part.get("text", "") for part in data["candidates"][0]["content"]["parts"])
+        except (KeyError, IndexError, TypeError):
+            raise ValueError(f"Unexpected Gemini response: {str(data)[:200]}")
+
+
+PROVIDER_TYPES = {
+    OpenAIProvider.api_type: OpenAIProvider,
+    GeminiProvider.api_type: GeminiProvider,
+}
+
+
+class LLMRouter:
+    """
+    Routes chat turns across the providers in ``llm_config.json``
+
+    Small edit turns go to the ``fast`` tier and full storyboard generations
+    (or prompts above ``large_prompt_chars``) to the ``strong`` tier. Within a
+    tier, providers are tried fastest-first by their rolling median latency;
+    the other tier is the fallback. A provider whose concurrency slots are all
+    taken is skipped rather than queued behind, and errors or timeouts move on
+    to the next provider.
+    """
+
+    def __init__(self, providers: List[LLMProvider], large_prompt_chars: int = 4000, queue_timeout: float = 10.0):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        self.large_prompt_chars = large_prompt_chars
+        self.queue_timeout = queue_timeout
+
+    @classmethod
+    def from_settings(cls, llm: "LLMSettings") -> "LLMRouter":
+        """
+        Build a router from the ``llm`` section of the settings snapshot
+
+        Each ``config_list`` entry may set ``tier`` (fast/strong),
+        ``max_concurrency``, ``timeout`` and ``base_url``; the ``routing``
+        section holds ``large_prompt_chars`` and ``queue_timeout``. Entries
+        without an API key are skipped.
+        """
+        providers = []
+        for entry in llm.config_list:
+            provider_cls = PROVIDER_TYPES.get(entry.get("api_type", "openai"))
+            if provider_cls is None:
+                logger.warning(f"Skipping {entry.get('model')}: unsupported api_type {entry.get('api_type')}")
+                continue
+            if not entry.get("api_key"):
+                logger.warning(f"Skipping {entry.get('model')}: no API key configured")
+                continue
+            providers.append(provider_cls(
+                model=entry["model"],
+                api_key=entry["api_key"],
+                tier=entry.get("tier", STRONG),
+                max_concurrency=int(entry.get("max_concurrency", 4)),
+                timeout=float(entry.get("timeout", 120)),
+                base_url=entry.get("base_url"),
+                temperature=entry.get("temperature", llm.temperature),
+            ))
+
+        return cls(
+            providers,
+            large_prompt_chars=llm.routing.large_prompt_chars,
+            queue_timeout=llm.routing.queue_timeout,
+        )
+
+    @classmethod
+    def from_config(cls, config_path: str = None) -> "LLMRouter":
+        """Build a router straight from an LLM config file (default: the current settings)"""
+        from config.settings import get_settings, load_settings
+
+        settings = load_settings(config_path) if config_path else get_settings()
+        return cls.from_settings(settings.llm)
+
+    def classify(self, user_message: str, messages: List[Dict[str, str]]) -> str:
+        """Decide whether a turn is a small edit or a full generation"""
+        prompt_chars = sum(len(m["content"]) for m in messages)
+        lowered = user_message.lower()
+        has_history = any(m["role"] == "assistant" for m in messages)
+        if not has_history or prompt_chars >= self.large_prompt_chars or any(h in lowered for h in GENERATION_HINTS):
+            return GENERATE
+        return EDIT
+
+    def candidates(self, kind: str) -> List[LLMProvider]:
+        """Providers in the order they should be tried for a request kind"""
+        preferred = FAST if kind == EDIT else STRONG
+
+        def latency_key(provider):
+            # providers without samples go first so they get measured
+            p50 = provider.latency_percentile(50)
+            return p50 if p50 is not None else 0.0
+
+        primary = sorted((p for p in self.providers if p.tier == preferred), key=latency_key)
+        fallback = sorted((p for p in self.providers if p.tier != preferred), key=latency_key)
+        return primary + fallback
+
+    def complete(self, messages: List[Dict[str, str]], kind: str = GENERATE) -> str:
+        """
+        Answer chat messages with the best available provider
+
+        Args:
+            messages: Chat messages with ``role`` and ``content``
+            kind: ``edit`` or ``generate``
+
+        Returns:
+            The reply text from the first provider that succeeded
+
+        Raises:
+            AllProvidersFailed: If every provider failed or stayed saturated
+        """
+        candidates = self.candidates(kind)
+        errors = []
+        tried = set()
+
+        while len(tried) < len(candidates):
+            provider = next((p for p in candidates if p not in tried and p.acquire()), None)
+            if provider is None:
+                # every untried provider is at its limit; wait for the preferred one
+                provider = next(p for p in candidates if p not in tried)
+                if not provider.acquire(timeout=self.queue_timeout):
+                    LLM_ROUTED_REQUESTS.inc(provider=provider.name, kind=kind, result="saturated")
+                    errors.append(f"{provider.name}: saturated")
+                    tried.add(provider)
+                    continue
+            tried.add(provider)
+
+            start = time.perf_counter()
+            ok = False
+            try:
+                with tracer.span("llm.complete", provider=provider.name, kind=kind), \
+                        UPSTREAM_DURATION.time(upstream=provider.name, status="error") as labels:
+                    try:
+                        text = provider.complete(messages)
+                    except requests.exceptions.Timeout:
+                        labels["status"] = "timeout"
+                        raise
+                    labels["status"] = 200
+                ok = True
+                LLM_ROUTED_REQUESTS.inc(provider=provider.name, kind=kind, result="ok")
+                return text
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(f"LLM provider {provider.name} failed for {kind} request: {e}")
+                LLM_ROUTED_REQUESTS.inc(provider=provider.name, kind=kind, result="error")
+                errors.append(f"{provider.name}: {e}")
+            finally:
+                provider.release(time.perf_counter() - start, ok)
+
+        raise AllProvidersFailed("All LLM providers failed: " + "; ".join(errors))
+
+    def get_stats(self) -> List[dict]:
+        """Per-provider load, latency and failures"""
+        return [provider.get_stats() for provider in self.providers]
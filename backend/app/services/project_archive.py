@@ -0,0 +1,618 @@
+"""
+Streaming export and import of project folders
+
+An export is a tar (optionally gzipped) or zip archive produced as a stream of
+chunks, so a multi-gigabyte backup is sent without ever being held in memory:
+JSON files are read one at a time and cached images are copied in fixed-size
+pieces. Layout inside the archive:
+
+    manifest.json                      format version and the exported project ids
+    projects/<id>/project_type1.json   project file, story files, chat history
+    projects/<id>/revisions.jsonl      revision manifests (see ``story_versions``)
+    blobs/ab/<hash>.json               story bodies referenced by those revisions
+    images/ab/<hash>                   cached originals of the stories' proxied images
+    images/ab/<hash>.json              their ImageRecord metadata
+
+Langflow session files stay out of exports; they point at flow memory on this
+deployment's Langflow hosts, and an imported project starts a fresh session.
+
+Imports are spooled to disk first, then every entry is checked (paths, sizes,
+the models in ``app.models.project``, content hashes) while it is unpacked into
+a staging folder next to the projects. Nothing touches the live data until the
+whole archive has passed; each project folder is then moved into place with a
+rename, so readers see either the old project or the new one.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import tarfile
+import time
+import uuid
+import zipfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from app.models.project import StoredChatHistory, StoredProject, StoredStory
+from app.services.image_proxy import HASH_PATTERN, PROXY_PREFIX, ImageRecord, get_image_proxy
+from app.services.story_search import index_project
+from app.services.story_versions import BLOBS_DIRNAME, REVISIONS_FILENAME, Revision, blob_hash
+from app.utils.file_lock import project_lock
+from app.utils.metrics import PROJECT_ARCHIVE_BYTES
+from app.utils.storage import get_data_dir, project_id_of
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+CHUNK_SIZE = 64 * 1024
+# Largest JSON entry accepted on import; they are parsed in memory to be validated
+MAX_JSON_BYTES = 32 * 1024 * 1024
+
+# format -> (content type, file extension)
+ARCHIVE_FORMATS = {
+    "tar": ("application/x-tar", "tar"),
+    "tar.gz": ("application/gzip", "tar.gz"),
+    "zip": ("application/zip", "zip"),
+}
+
+ON_CONFLICT = ("fail", "skip", "replace")
+
+PROJECT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+PROJECT_FILE_PATTERN = re.compile(r"^project_type\d+\.json$")
+STORY_FILE_PATTERN = re.compile(r"^(story_[A-Za-z0-9_-]+)\.json$")
+CHAT_FILENAME = "chat_history.json"
+
+
+class ArchiveError(ValueError):
+    """Raised when an archive is malformed or fails validation; nothing has been imported"""
+
+
+class ArchiveConflict(ArchiveError):
+    """Raised when an imported project already exists and conflicts are not skipped or replaced"""
+
+
+class ImportResult(BaseModel):
+    """What an import changed"""
+    imported: List[str] = []
+    replaced: List[str] = []
+    skipped: List[str] = []
+    blobs: int = 0
+    images: int = 0
+    ignored_entries: int = 0
+
+
+# --- export ------------------------------------------------------------------
+
+
+class _ChunkSink:
+    """Write-only file object whose output is collected and handed out in pieces"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _TarStream:
+    """Tar members written header by header, gzipped on the fly when asked"""
+
+    def __init__(self, compress: bool):
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        self._offset = 0
+
+    def _out(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        return self._gzip.compress(data) if self._gzip else data
+
+    def _header(self, name: str, size: int, mtime: float) -> bytes:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        return self._out(info.tobuf(format=tarfile.PAX_FORMAT))
+
+    def _padding(self, size: int) -> bytes:
+        return self._out(b"\0" * (-size % tarfile.BLOCKSIZE))
+
+    def add_bytes(self, name: str, data: bytes, mtime: float) -> Iterator[bytes]:
+        yield self._header(name, len(data), mtime)
+        yield self._out(data)
+        yield self._padding(len(data))
+
+    def add_file(self, name: str, path: Path, size: int, mtime: float) -> Iterator[bytes]:
+        yield self._header(name, size, mtime)
+        remaining = size
+        with open(path, "rb") as f:
+            while remaining:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise OSError(f"{path} shrank while it was being exported")
+                remaining -= len(chunk)
+                yield self._out(chunk)
+        yield self._padding(size)
+
+    def close(self) -> Iterator[bytes]:
+        end = 2 * tarfile.BLOCKSIZE
+        yield self._out(b"\0" * (end + -(self._offset + end) % tarfile.RECORDSIZE))
+        if self._gzip:
+            yield self._gzip.flush()
+
+
+class _ZipStream:
+    """Zip members written through a non-seekable sink (sizes go in data descriptors)"""
+
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, "w", allowZip64=True)
+
+    @staticmethod
+    def _info(name: str, mtime: float, compress_type: int) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+        info.compress_type = compress_type
+        info.external_attr = 0o644 << 16
+        return info
+
+    def add_bytes(self, name: str, data: bytes, mtime: float) -> Iterator[bytes]:
+        with self._zip.open(self._info(name, mtime, zipfile.ZIP_DEFLATED), "w") as dest:
+            dest.write(data)
+        yield self._sink.drain()
+
+    def add_file(self, name: str, path: Path, size: int, mtime: float) -> Iterator[bytes]:
+        # images are already compressed
+        info = self._info(name, mtime, zipfile.ZIP_STORED)
+        info.file_size = size
+        with self._zip.open(info, "w") as dest, open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                dest.write(chunk)
+                yield self._sink.drain()
+        yield self._sink.drain()
+
+    def close(self) -> Iterator[bytes]:
+        self._zip.close()
+        yield self._sink.drain()
+
+
+def _open_stream(fmt: str):
+    if fmt == "zip":
+        return _ZipStream()
+    if fmt in ("tar", "tar.gz"):
+        return _TarStream(compress=fmt == "tar.gz")
+    raise ValueError(f"Unknown archive format {fmt!r}; expected one of {', '.join(ARCHIVE_FORMATS)}")
+
+
+def _read_small(path: Path) -> Tuple[bytes, float]:
+    with open(path, "rb") as f:
+        return f.read(), os.fstat(f.fileno()).st_mtime
+
+
+def _project_entries(project_dir: Path, image_hashes: Set[str], blob_hashes: Set[str]) -> Iterator[Tuple[str, bytes, float]]:
+    """(file name, bytes, mtime) for the files of one project, noting the images and blobs they reference"""
+    project_files = sorted(project_dir.glob("project_type*.json"))
+    data, mtime = _read_small(project_files[0])
+    yield project_files[0].name, data, mtime
+
+    for name in dict.fromkeys(json.loads(data).get("stories") or []):
+        story_file = project_dir / f"{name}.json"
+        if not STORY_FILE_PATTERN.match(story_file.name) or not story_file.exists():
+            continue
+        data, mtime = _read_small(story_file)
+        try:
+            url = json.loads(data).get("image_url")
+        except (ValueError, AttributeError):
+            url = None
+        if isinstance(url, str) and url.startswith(PROXY_PREFIX):
+            image_hash = url[len(PROXY_PREFIX):].split("?", 1)[0]
+            if HASH_PATTERN.match(image_hash):
+                image_hashes.add(image_hash)
+        yield story_file.name, data, mtime
+
+    for extra in (CHAT_FILENAME, REVISIONS_FILENAME):
+        path = project_dir / extra
+        if not path.exists():
+            continue
+        data, mtime = _read_small(path)
+        if extra == REVISIONS_FILENAME:
+            for line in data.decode("utf-8").splitlines():
+                if line.strip():
+                    blob_hashes.update(entry["blob"] for entry in json.loads(line).get("stories", []))
+        yield extra, data, mtime
+
+
+def export_projects(project_dirs: Iterable[Path], fmt: str = "tar.gz", include_images: bool = False) -> Iterator[bytes]:
+    """
+    Stream an archive of the given project folders
+
+    Yields the archive in chunks; memory use does not grow with the number of
+    projects or the size of the image cache. Story files can change while an
+    export runs (background image resolution), so each file is read whole
+    and written as it was at that moment.
+
+    Args:
+        project_dirs: Folders returned by ``get_project_dir``; ones without a project file are left out
+        fmt: One of ``ARCHIVE_FORMATS``
+        include_images: Also pack the cached originals of the stories' proxied images
+
+    Raises:
+        ValueError: For an unknown format (before anything is yielded)
+    """
+    stream = _open_stream(fmt)
+    project_dirs = [d for d in project_dirs if any(Path(d).glob("project_type*.json"))]
+    return _export(stream, project_dirs, include_images)
+
+
+def _export(stream, project_dirs: List[Path], include_images: bool) -> Iterator[bytes]:
+    now = time.time()
+    image_hashes: Set[str] = set()
+    blob_hashes: Set[str] = set()
+    sent = 0
+
+    def emit(pieces: Iterable[bytes]) -> Iterator[bytes]:
+        nonlocal sent
+        for piece in pieces:
+            if piece:
+                sent += len(piece)
+                PROJECT_ARCHIVE_BYTES.inc(len(piece), direction="export")
+                yield piece
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "created_at": now,
+        "projects": [project_id_of(d) for d in project_dirs],
+        "images": include_images,
+    }
+    yield from emit(stream.add_bytes(MANIFEST_NAME, json.dumps(manifest, indent=2).encode("utf-8"), now))
+
+    for project_dir in project_dirs:
+        prefix = f"projects/{project_id_of(project_dir)}/"
+        for name, data, mtime in _project_entries(project_dir, image_hashes, blob_hashes):
+            yield from emit(stream.add_bytes(prefix + name, data, mtime))
+
+    blobs_root = get_data_dir() / BLOBS_DIRNAME
+    for digest in sorted(blob_hashes):
+        path = blobs_root / digest[:2] / f"{digest}.json"
+        if path.exists():
+            data, mtime = _read_small(path)
+            yield from emit(stream.add_bytes(f"blobs/{digest[:2]}/{digest}.json", data, mtime))
+
+    if include_images:
+        proxy = get_image_proxy()
+        for image_hash in sorted(image_hashes):
+            record = proxy.get_record(image_hash)
+            if record is None:
+                continue
+            path = proxy.original_path(image_hash)
+            stat = path.stat()
+            yield from emit(stream.add_file(f"images/{image_hash[:2]}/{image_hash}", path, stat.st_size, stat.st_mtime))
+            yield from emit(stream.add_bytes(f"images/{image_hash[:2]}/{image_hash}.json",
+                                             record.model_dump_json().encode("utf-8"), stat.st_mtime))
+
+    yield from emit(stream.close())
+    logger.info("Exported %d projects (%d bytes)", len(project_dirs), sent)
+
+
+# --- import ------------------------------------------------------------------
+
+
+def _iter_members(archive_path: Path) -> Iterator[Tuple[str, int, BinaryIO]]:
+    """(name, size, open file) for each regular file in a tar or zip archive"""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                mode = info.external_attr >> 16
+                if mode and (mode & 0o170000) not in (0, 0o100000):
+                    raise ArchiveError(f"{info.filename}: only regular files can be imported")
+                with archive.open(info) as f:
+                    yield info.filename, info.file_size, f
+        return
+
+    try:
+        archive = tarfile.open(archive_path, "r:*")
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Not a tar or zip archive: {e}")
+    with archive:
+        for member in archive:
+            if member.isdir():
+                continue
+            if not member.isfile():
+                raise ArchiveError(f"{member.name}: only regular files can be imported")
+            with archive.extractfile(member) as f:
+                yield member.name, member.size, f
+
+
+def _read_limited(name: str, size: int, f: BinaryIO) -> bytes:
+    if size > MAX_JSON_BYTES:
+        raise ArchiveError(f"{name}: {size} bytes is more than the {MAX_JSON_BYTES} allowed for a JSON file")
+    return f.read(MAX_JSON_BYTES + 1)
+
+
+def _parse_json(name: str, data: bytes):
+    try:
+        return json.loads(data)
+    except ValueError as e:
+        raise ArchiveError(f"{name}: invalid JSON ({e})")
+
+
+def _validate(name: str, model, data: bytes):
+    try:
+        return model.model_validate(_parse_json(name, data))
+    except ValidationError as e:
+        raise ArchiveError(f"{name}: {e.errors()[0]['loc']} {e.errors()[0]['msg']}")
+
+
+def _copy_hashed(f: BinaryIO, target: Path, limit: int) -> Tuple[str, int]:
+    """Copy a member to disk in chunks, returning the SHA-256 and size of what was written"""
+    digest = hashlib.sha256()
+    size = 0
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(target, "wb") as out:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > limit:
+                raise ArchiveError(f"{target.name}: larger than the {limit} bytes allowed for an image")
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest(), size
+
+
+class _Staging:
+    """Checked archive contents waiting to be moved into the data directory"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.manifest: Optional[dict] = None
+        self.projects: Dict[str, Dict[str, object]] = {}
+        self.blobs: Set[str] = set()
+        self.images: Dict[str, Optional[ImageRecord]] = {}
+        self.ignored = 0
+
+    def project_dir(self, project_id: str) -> Path:
+        return self.root / "projects" / f"project_{project_id}"
+
+    def add(self, name: str, size: int, f: BinaryIO):
+        parts = name.split("/")
+        if name.startswith("/") or "\\" in name or any(part in ("", ".", "..") for part in parts):
+            raise ArchiveError(f"{name}: unsafe path")
+
+        if parts == [MANIFEST_NAME]:
+            manifest = _parse_json(name, _read_limited(name, size, f))
+            if not isinstance(manifest, dict) or not isinstance(manifest.get("projects"), list):
+                raise ArchiveError(f"{name}: not a project archive manifest")
+            if not isinstance(manifest.get("format"), int) or manifest["format"] > FORMAT_VERSION:
+                raise ArchiveError(f"{name}: unsupported archive format {manifest.get('format')!r}")
+            self.manifest = manifest
+        elif len(parts) == 3 and parts[0] == "projects":
+            self._add_project_file(parts[1], parts[2], size, f)
+        elif len(parts) == 3 and parts[0] == "blobs" and parts[2].endswith(".json"):
+            digest = parts[2][:-len(".json")]
+            if not HASH_PATTERN.match(digest) or parts[1] != digest[:2]:
+                raise ArchiveError(f"{name}: not a story blob")
+            data = _read_limited(name, size, f)
+            _validate(name, StoredStory, data)
+            story = _parse_json(name, data)
+            if blob_hash(story) != digest:
+                raise ArchiveError(f"{name}: content does not match its hash")
+            (self.root / name).parent.mkdir(parents=True, exist_ok=True)
+            (self.root / name).write_text(json.dumps(story, sort_keys=True, separators=(",", ":")))
+            self.blobs.add(digest)
+        elif len(parts) == 3 and parts[0] == "images":
+            self._add_image(name, parts, size, f)
+        else:
+            self.ignored += 1
+
+    def _add_project_file(self, project_id: str, filename: str, size: int, f: BinaryIO):
+        name = f"projects/{project_id}/{filename}"
+        if not PROJECT_ID_PATTERN.match(project_id):
+            raise ArchiveError(f"{name}: invalid project id")
+        files = self.projects.setdefault(project_id, {"project": None, "stories": set()})
+        target = self.project_dir(project_id) / filename
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        if filename == REVISIONS_FILENAME:
+            # validated and copied a line at a time; it can be the largest file in a project
+            with open(target, "wb") as out:
+                for number, line in enumerate(io.TextIOWrapper(f, encoding="utf-8"), start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        revision = Revision.model_validate_json(line)
+                    except ValidationError as e:
+                        raise ArchiveError(f"{name}:{number}: {e.errors()[0]['msg']}")
+                    files.setdefault("blobs", set()).update(entry.blob for entry in revision.stories)
+                    out.write(line.rstrip("\n").encode("utf-8") + b"\n")
+            return
+
+        data = _read_limited(name, size, f)
+        if PROJECT_FILE_PATTERN.match(filename):
+            if files["project"] is not None:
+                raise ArchiveError(f"{name}: project {project_id} has more than one project file")
+            project = _validate(name, StoredProject, data)
+            if project.id != project_id:
+                raise ArchiveError(f"{name}: id {project.id!r} does not match its folder")
+            files["project"] = project
+        elif STORY_FILE_PATTERN.match(filename):
+            _validate(name, StoredStory, data)
+            files["stories"].add(filename[:-len(".json")])
+        elif filename == CHAT_FILENAME:
+            _validate(name, StoredChatHistory, data)
+        else:
+            self.ignored += 1
+            return
+        target.write_bytes(data)
+
+    def _add_image(self, name: str, parts: List[str], size: int, f: BinaryIO):
+        filename = parts[2]
+        image_hash = filename[:-len(".json")] if filename.endswith(".json") else filename
+        if not HASH_PATTERN.match(image_hash) or parts[1] != image_hash[:2]:
+            raise ArchiveError(f"{name}: not a cached image")
+        target = self.root / "images" / filename
+        if filename.endswith(".json"):
+            record = _validate(name, ImageRecord, _read_limited(name, size, f))
+            if record.hash != image_hash:
+                raise ArchiveError(f"{name}: record is for another image")
+            self.images[image_hash] = record
+            return
+        digest, written = _copy_hashed(f, target, get_image_proxy().settings.max_bytes)
+        if digest != image_hash:
+            raise ArchiveError(f"{name}: content does not match its hash")
+        self.images.setdefault(image_hash, None)
+
+    def check(self, blobs_root: Path):
+        """Cross-file checks once every entry has been unpacked"""
+        if self.manifest is None:
+            raise ArchiveError(f"Missing {MANIFEST_NAME}; not a project archive")
+        missing = [p for p in self.manifest["projects"] if p not in self.projects]
+        if missing:
+            raise ArchiveError(f"Archive is incomplete; missing projects: {', '.join(map(str, missing))}")
+        for project_id, files in self.projects.items():
+            project = files["project"]
+            if project is None:
+                raise ArchiveError(f"projects/{project_id}: no project file")
+            absent = [s for s in project.stories if s not in files["stories"]]
+            if absent:
+                raise ArchiveError(f"projects/{project_id}: listed stories are missing: {', '.join(absent[:5])}")
+            for digest in files.get("blobs", ()):
+                if digest not in self.blobs and not (blobs_root / digest[:2] / f"{digest}.json").exists():
+                    raise ArchiveError(f"projects/{project_id}/{REVISIONS_FILENAME}: blob {digest} is missing")
+        for image_hash, record in self.images.items():
+            if record is None or not (self.root / "images" / image_hash).exists():
+                raise ArchiveError(f"images/{image_hash[:2]}/{image_hash}: image and record must both be present")
+
+
+def _move_into_place(staged: Path, target: Path, trash: Path) -> bool:
+    """Swap a staged project folder in; returns whether an existing folder was replaced"""
+    replaced = target.exists()
+    if replaced:
+        os.rename(target, trash)
+    try:
+        os.rename(staged, target)
+    except OSError:
+        if replaced:
+            os.rename(trash, target)
+        raise
+    return replaced
+
+
+def import_archive(archive_path: Path, on_conflict: str = "fail") -> ImportResult:
+    """
+    Import the projects in an exported archive
+
+    Args:
+        archive_path: A tar (plain or compressed) or zip file written by ``export_projects``
+        on_conflict: What to do with projects that already exist: ``fail``
+            (import nothing), ``skip`` them or ``replace`` them
+
+    Raises:
+        ArchiveError: If any entry is malformed; nothing is imported
+        ArchiveConflict: If a project exists and ``on_conflict`` is ``fail``
+    """
+    if on_conflict not in ON_CONFLICT:
+        raise ValueError(f"on_conflict must be one of {', '.join(ON_CONFLICT)}")
+    data_dir = get_data_dir()
+    data_dir.mkdir(parents=True, exist_ok=True)
+    staging = _Staging(data_dir / f".import-{uuid.uuid4().hex}")
+    result = ImportResult()
+    try:
+        try:
+            for name, size, f in _iter_members(Path(archive_path)):
+                PROJECT_ARCHIVE_BYTES.inc(size, direction="import")
+                staging.add(name, size, f)
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError, zlib.error, UnicodeDecodeError) as e:
+            raise ArchiveError(f"Corrupt archive: {e}")
+        blobs_root = data_dir / BLOBS_DIRNAME
+        staging.check(blobs_root)
+
+        existing = [p for p in staging.projects if (data_dir / f"project_{p}").exists()]
+        if existing and on_conflict == "fail":
+            raise ArchiveConflict(f"Projects already exist: {', '.join(existing)}")
+
+        # shared content first, so revisions and proxied image URLs resolve as soon as a project appears
+        for digest in staging.blobs:
+            target = blobs_root / digest[:2] / f"{digest}.json"
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(staging.root / "blobs" / digest[:2] / f"{digest}.json", target)
+            result.blobs += 1
+        if staging.images:
+            proxy = get_image_proxy()
+            for image_hash, record in staging.images.items():
+                proxy.adopt(record, staging.root / "images" / image_hash)
+                result.images += 1
+
+        for project_id in staging.projects:
+            target = data_dir / f"project_{project_id}"
+            if project_id in existing and on_conflict == "skip":
+                result.skipped.append(project_id)
+                continue
+            with project_lock(target):
+                replaced = _move_into_place(staging.project_dir(project_id), target, staging.root / f"replaced_{project_id}")
+            if replaced:
+                result.replaced.append(project_id)
+            else:
+                result.imported.append(project_id)
+            index_project(project_id)
+        result.ignored_entries = staging.ignored
+        logger.info("Imported projects %s (replaced %s, skipped %s)", result.imported, result.replaced, result.skipped)
+        return result
+    finally:
+        shutil.rmtree(staging.root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import storyboard projects")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="Write projects to an archive")
+    export_cmd.add_argument("output", help="Archive path, or - for stdout")
+    export_cmd.add_argument("--project", action="append", help="Project id to export (default: all projects)")
+    export_cmd.add_argument("--format", choices=list(ARCHIVE_FORMATS), default="tar.gz")
+    export_cmd.add_argument("--images", action="store_true", help="Include cached images")
+    import_cmd = commands.add_parser("import", help="Import projects from an archive")
+    import_cmd.add_argument("archive")
+    import_cmd.add_argument("--on-conflict", choices=ON_CONFLICT, default="fail")
+    args = parser.parse_args()
+
+    data_dir = get_data_dir()
+    if args.command == "export":
+        project_dirs = (
+            [data_dir / f"project_{project_id}" for project_id in args.project] if args.project
+            else sorted(p for p in data_dir.glob("project_*") if p.is_dir())
+        )
+        out = os.fdopen(os.dup(1), "wb") if args.output == "-" else open(args.output, "wb")
+        with out:
+            for chunk in export_projects(project_dirs, args.format, args.images):
+                out.write(chunk)
+    else:
+        try:
+            print(import_archive(Path(args.archive), args.on_conflict).model_dump_json(indent=2))
+        except ArchiveError as e:
+            raise SystemExit(f"Import failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
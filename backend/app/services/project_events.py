@@ -0,0 +1,158 @@
+"""
+Per-project change events for connected editors
+
+Write paths publish small events (a story added or updated, an image
+resolved, chat messages appended) and every WebSocket connected to
+``/ws/project/{project_id}`` receives them, so editors apply deltas instead
+of refetching the whole project. Publishing is thread-safe: the story writer
+and the image resolver publish from worker threads, and each event is
+serialized once and handed to the subscribers' event loops.
+
+Each subscriber has a bounded queue. A client too slow to keep up loses the
+events it could not take and is sent a ``resync`` event telling it to refetch
+the project instead.
+
+In multi-worker mode an editor may be connected to a different worker than
+the one handling a save, so every event is also published on the shared
+cache's ``project_event`` channel and the other workers deliver it to their
+own subscribers. ``seq`` is then only ordered per worker.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from app.services.shared_cache import get_shared_cache, subscribe
+from app.utils.metrics import PROJECT_EVENT_SUBSCRIBERS, PROJECT_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per connection before it is asked to resync
+QUEUE_SIZE = 256
+# Seconds between pings on an otherwise idle connection
+HEARTBEAT_INTERVAL = 25.0
+
+SHARED_CHANNEL = "project_event"
+
+STORY_ADDED = "story.added"
+STORY_UPDATED = "story.updated"
+STORYBOARD_UPDATED = "storyboard.updated"
+IMAGE_RESOLVED = "image.resolved"
+CHAT_MESSAGE = "chat.message"
+RESYNC = "resync"
+PING = "ping"
+
+
+class Subscription:
+    """One connection's queue of serialized events"""
+
+    def __init__(self, project_id: str, loop: asyncio.AbstractEventLoop, queue_size: int = QUEUE_SIZE):
+        self.project_id = project_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, message: str):
+        """Queue a message; runs on the subscriber's loop"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            PROJECT_EVENTS.inc(result="dropped")
+
+    async def next(self, timeout: float = HEARTBEAT_INTERVAL) -> Optional[str]:
+        """The next message to send, a resync notice after an overflow, or None after ``timeout`` idle seconds"""
+        if self.overflowed:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.overflowed = False
+            return json.dumps({"type": RESYNC, "project_id": self.project_id, "ts": time.time()})
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ProjectEventBus:
+    """Fans project events out to the subscribers of each project"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def subscribe(self, project_id: str) -> Subscription:
+        """Register a connection; must be called from its event loop"""
+        subscription = Subscription(project_id, asyncio.get_running_loop())
+        # starts the shared cache poller, so events saved on other workers reach this connection
+        get_shared_cache()
+        with self._lock:
+            self._subscribers.setdefault(project_id, set()).add(subscription)
+        PROJECT_EVENT_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.project_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.project_id]
+        PROJECT_EVENT_SUBSCRIBERS.dec()
+
+    def has_subscribers(self, project_id: str) -> bool:
+        """Whether anyone may be watching the project (always, when other workers' subscribers are unknown)"""
+        return project_id in self._subscribers or get_shared_cache() is not None
+
+    def publish(self, project_id: str, event: str, data: dict):
+        """Send an event to everyone watching the project; a no-op when nobody is"""
+        shared = get_shared_cache()
+        with self._lock:
+            subscribers = list(self._subscribers.get(project_id, ()))
+            if not subscribers and shared is None:
+                return
+            self._seq += 1
+            seq = self._seq
+        message = json.dumps({"type": event, "project_id": project_id, "seq": seq, "ts": time.time(), "data": data})
+        if shared is not None:
+            try:
+                shared.publish(SHARED_CHANNEL, project_id, message)
+            except sqlite3.Error as e:
+                logger.warning("Could not forward %s event for project %s to other workers: %s", event, project_id, e)
+        self.deliver(project_id, message, subscribers)
+
+    def deliver(self, project_id: str, message: str, subscribers: Optional[List[Subscription]] = None):
+        """Hand a serialized event to this process's subscribers of the project"""
+        if subscribers is None:
+            with self._lock:
+                subscribers = list(self._subscribers.get(project_id, ()))
+        if not subscribers:
+            return
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                # the connection's loop has closed; it unsubscribes on its way out
+                continue
+        PROJECT_EVENTS.inc(len(subscribers), result="delivered")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "projects": len(self._subscribers),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                "published": self._seq,
+            }
+
+
+project_events = ProjectEventBus()
+
+# events published by other workers
+subscribe(SHARED_CHANNEL, lambda project_id, message: project_events.deliver(project_id, message))
@@ -0,0 +1,240 @@
+"""
+Cache entries and messages shared by worker processes
+
+With several uvicorn or gunicorn workers (``STORYBOARD_MULTI_WORKER=true``)
+each process keeps its own in-memory caches, so a search indexed or a
+Langflow session replaced in one worker would stay invisible to the others.
+This module keeps both kinds of shared state in one SQLite database in WAL
+mode, which any number of local processes can read while one writes:
+
+- ``entries``: namespaced key/value rows that caches use as their store
+  (the image query index keeps its searches here instead of its JSONL file)
+- ``messages``: an append-only log of invalidations and events. Every
+  worker polls it every ``SHARED_CACHE_POLL_INTERVAL`` seconds and hands
+  messages from other workers to the handler registered for their channel
+  (a cache dropping or reloading a key, the project event bus forwarding an
+  event to its WebSocket subscribers)
+
+Handlers are registered per channel at import time with ``subscribe`` and run
+on the poller thread. Messages older than the retention are pruned.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.utils.storage import get_data_dir
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    key TEXT,
+    payload TEXT,
+    origin TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_created_at ON messages (created_at);
+"""
+
+# Seconds between prunes of old messages
+PRUNE_INTERVAL = 60.0
+
+Handler = Callable[[Optional[str], Optional[str]], None]
+
+_handlers: Dict[str, Handler] = {}
+
+
+def subscribe(channel: str, handler: Handler):
+    """
+    Call ``handler(key, payload)`` for each message other workers publish on ``channel``
+
+    One handler per channel; it runs on the poller thread, so it must be
+    thread-safe and quick.
+    """
+    _handlers[channel] = handler
+
+
+class SharedCache:
+    """Shared key/value entries and cross-worker messages in one SQLite database"""
+
+    def __init__(self, path: Path, poll_interval: float = 0.25, retention: float = 600.0):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        # tells this process's own messages apart from the other workers'
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self.stats = {"published": 0, "received": 0, "handler_errors": 0}
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        # only messages published from now on concern this worker
+        self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM messages").fetchone()[0]
+        self._last_prune = 0.0
+        self._stop = threading.Event()
+        self._poller = threading.Thread(target=self._poll_loop, name="shared-cache-poller", daemon=True)
+        self._poller.start()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _message(self, conn: sqlite3.Connection, channel: str, key: Optional[str], payload: Optional[str]):
+        conn.execute("INSERT INTO messages (channel, key, payload, origin, created_at) VALUES (?, ?, ?, ?, ?)",
+                     (channel, key, payload, self.origin, time.time()))
+        self.stats["published"] += 1
+
+    # --- entries -----------------------------------------------------------
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return row[0] if row else None
+
+    def items(self, namespace: str) -> List[Tuple[str, str]]:
+        return self._connection().execute(
+            "SELECT key, value FROM entries WHERE namespace = ? ORDER BY updated_at", (namespace,)).fetchall()
+
+    def set(self, namespace: str, key: str, value: str, notify: bool = True):
+        """Store an entry and, unless ``notify`` is off, tell the other workers it changed"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR REPLACE INTO entries (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                         (namespace, key, value, time.time()))
+            if notify:
+                self._message(conn, namespace, key, None)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def setdefault(self, namespace: str, key: str, value: str) -> Optional[str]:
+        """Store an entry unless one exists; returns the existing value, or None if this call stored it"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            if row is None:
+                conn.execute("INSERT INTO entries (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                             (namespace, key, value, time.time()))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return row[0] if row else None
+
+    def delete(self, namespace: str, keys: List[str], notify: bool = True):
+        if not keys:
+            return
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key in keys:
+                conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+                if notify:
+                    self._message(conn, namespace, key, None)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # --- messages ----------------------------------------------------------
+
+    def publish(self, channel: str, key: Optional[str] = None, payload: Optional[str] = None):
+        """Send a message to every other worker's handler for ``channel``"""
+        self._message(self._connection(), channel, key, payload)
+
+    def poll(self) -> int:
+        """Dispatch messages other workers published since the last poll; returns how many"""
+        conn = self._connection()
+        rows = conn.execute("SELECT seq, channel, key, payload, origin FROM messages WHERE seq > ? ORDER BY seq",
+                            (self._last_seq,)).fetchall()
+        received = 0
+        for seq, channel, key, payload, origin in rows:
+            self._last_seq = seq
+            if origin == self.origin:
+                continue
+            received += 1
+            handler = _handlers.get(channel)
+            if handler is None:
+                continue
+            try:
+                handler(key, payload)
+            except Exception as e:
+                self.stats["handler_errors"] += 1
+                logger.warning("Shared cache handler for %s failed: %s", channel, e)
+        self.stats["received"] += received
+
+        now = time.time()
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._last_prune = now
+            conn.execute("DELETE FROM messages WHERE created_at < ?", (now - self.retention,))
+        return received
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except sqlite3.Error as e:
+                logger.warning("Shared cache poll failed: %s", e)
+
+    def get_stats(self) -> dict:
+        conn = self._connection()
+        namespaces = dict(conn.execute("SELECT namespace, COUNT(*) FROM entries GROUP BY namespace").fetchall())
+        latest = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM messages").fetchone()[0]
+        return {
+            "path": str(self.path),
+            "origin": self.origin,
+            "entries": namespaces,
+            "last_seq": latest,
+            "behind": latest - self._last_seq,
+            **self.stats,
+        }
+
+    def close(self):
+        self._stop.set()
+        self._poller.join(timeout=5)
+
+
+_cache: Optional[SharedCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """The shared cache in multi-worker mode, or None; rebuilt when its path changes"""
+    global _cache
+    settings = get_settings().deployment
+    if not settings.multi_worker:
+        return None
+    path = Path(settings.shared_cache_path or get_data_dir() / ".shared-cache.sqlite3")
+    cache = _cache
+    if cache is None or cache.path != path:
+        with _cache_lock:
+            if _cache is None or _cache.path != path:
+                if _cache is not None:
+                    _cache.close()
+                _cache = SharedCache(path, settings.poll_interval, settings.message_retention)
+            cache = _cache
+    return cache
@@ -0,0 +1,340 @@
+"""
+Garbage collection and compaction of the data directory
+
+Older versions of the write paths appended story files to a project without
+ever deleting the ones they replaced, and projects abandoned before they got
+a storyboard (often after a first chat turn that failed) keep their folder
+forever. Collection runs in two phases:
+
+1. Mark: every project folder is read once. Listed story files, the blobs
+   its revisions reference and every ``/api/images/<hash>`` mentioned by a
+   live story or blob are live.
+2. Sweep: story files the project does not list, repeated entries of the same
+   screen with identical content, projects with neither stories nor chat,
+   projects whose chat never produced a storyboard or revision, unreferenced
+   blobs and cached images, and leftover temporary files are
+   reported, and removed unless this is a dry run. Projects whose list had duplicates are compacted
+   by rewriting the list in place.
+
+Nothing younger than ``gc_min_age`` is touched, and a project edited within
+that time is only marked, never swept, so a save in progress cannot race the
+collector. Blobs and images that are referenced again get their modification
+time refreshed (see ``BlobStore.put`` and ``ImageProxy.lookup_url``) for the
+same reason.
+"""
+
+import argparse
+import json
+import logging
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from pydantic import BaseModel
+
+from app.services.image_proxy import get_image_proxy
+from app.services.project_events import project_events, STORYBOARD_UPDATED
+from app.services.story_search import get_story_search, index_storyboard
+from app.services.story_versions import BLOBS_DIRNAME, REVISIONS_FILENAME, blob_hash, get_story_versions, screen_key
+from app.utils.file_lock import named_lock, project_lock
+from app.utils.metrics import STORAGE_GC_RECLAIMED_BYTES
+from app.utils.storage import get_data_dir, project_id_of
+from app.utils.storage_io import read_json, write_json
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+UNREFERENCED_STORY = "unreferenced_story"
+DUPLICATE_STORY = "duplicate_story"
+EMPTY_PROJECT = "empty_project"
+CHAT_ONLY_PROJECT = "chat_only_project"
+UNREFERENCED_BLOB = "unreferenced_blob"
+UNREFERENCED_IMAGE = "unreferenced_image"
+TEMP_FILE = "temp_file"
+KINDS = (UNREFERENCED_STORY, DUPLICATE_STORY, EMPTY_PROJECT, CHAT_ONLY_PROJECT, UNREFERENCED_BLOB, UNREFERENCED_IMAGE, TEMP_FILE)
+
+# Paths listed in a report; counts and bytes always cover everything
+MAX_LISTED = 500
+
+IMAGE_REF_PATTERN = re.compile(r"/api/images/([0-9a-f]{64})")
+
+class GCInProgress(RuntimeError):
+    """Raised when a collection is started while another one is running"""
+
+
+class GCItem(BaseModel):
+    kind: str
+    path: str
+    bytes: int
+
+
+class GCReport(BaseModel):
+    """What a collection found (and removed, unless ``dry_run``)"""
+    dry_run: bool
+    projects_scanned: int = 0
+    counts: Dict[str, int] = {kind: 0 for kind in KINDS}
+    bytes: Dict[str, int] = {kind: 0 for kind in KINDS}
+    reclaimable_bytes: int = 0
+    compacted_projects: List[str] = []
+    items: List[GCItem] = []
+    truncated: bool = False
+    duration_ms: float = 0.0
+
+
+def _size(path: Path) -> int:
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    return path.stat().st_size
+
+
+def _age(path: Path, now: float) -> float:
+    try:
+        return now - path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+class GarbageCollector:
+    """One mark-and-sweep pass over a data directory"""
+
+    def __init__(self, data_dir: Path, dry_run: bool = True, min_age: Optional[float] = None,
+                 empty_project_age: Optional[float] = None, images: bool = True):
+        settings = get_settings().storage
+        self.data_dir = Path(data_dir)
+        self.dry_run = dry_run
+        self.min_age = settings.gc_min_age if min_age is None else min_age
+        self.empty_project_age = settings.gc_empty_project_age if empty_project_age is None else empty_project_age
+        self.images = images
+        self.now = time.time()
+        self.report = GCReport(dry_run=dry_run)
+        self.live_blobs: Set[str] = set()
+        self.live_images: Set[str] = set()
+
+    def _collect(self, kind: str, path: Path):
+        """Record garbage and, on a real run, remove it"""
+        try:
+            size = _size(path)
+        except FileNotFoundError:
+            return
+        self.report.counts[kind] += 1
+        self.report.bytes[kind] += size
+        self.report.reclaimable_bytes += size
+        if len(self.report.items) < MAX_LISTED:
+            self.report.items.append(GCItem(kind=kind, path=str(path.relative_to(self.data_dir)), bytes=size))
+        else:
+            self.report.truncated = True
+        if self.dry_run:
+            return
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+        STORAGE_GC_RECLAIMED_BYTES.inc(size, kind=kind)
+
+    def _mark_images(self, text: str):
+        if self.images:
+            self.live_images.update(IMAGE_REF_PATTERN.findall(text))
+
+    # --- projects ----------------------------------------------------------
+
+    def _project(self, project_dir: Path):
+        entries = list(project_dir.iterdir())
+        newest = max((p.stat().st_mtime for p in entries), default=project_dir.stat().st_mtime)
+        idle = self.now - newest
+
+        revisions_file = project_dir / REVISIONS_FILENAME
+        if revisions_file.exists():
+            with open(revisions_file, "r") as f:
+                for line in f:
+                    if line.strip():
+                        self.live_blobs.update(e["blob"] for e in json.loads(line).get("stories", []))
+
+        project_files = [p for p in entries if p.name.startswith("project_type") and p.suffix == ".json"]
+        story_files = {p.name[:-len(".json")]: p for p in entries if p.name.startswith("story_") and p.suffix == ".json"}
+        listed: List[str] = []
+        if project_files:
+            project_data = read_json(project_files[0])
+            listed = list(project_data.get("stories") or [])
+
+        if not listed and not story_files and not revisions_file.exists():
+            if idle >= self.empty_project_age:
+                self._collect(CHAT_ONLY_PROJECT if self._has_chat(project_dir) else EMPTY_PROJECT, project_dir)
+                if not self.dry_run:
+                    search = get_story_search()
+                    if search is not None:
+                        search.remove_project(project_id_of(project_dir))
+            return
+
+        stories: Dict[str, dict] = {}
+        for name, path in story_files.items():
+            text = path.read_text()
+            if name in listed or idle < self.min_age:
+                self._mark_images(text)
+            if name in listed:
+                try:
+                    stories[name] = json.loads(text)
+                except ValueError:
+                    continue
+
+        if idle < self.min_age:
+            return  # being edited; leave everything as it is
+
+        for path in entries:
+            if path.suffix == ".tmp":
+                self._collect(TEMP_FILE, path)
+        listed_set = set(listed)
+        for name, path in story_files.items():
+            if name not in listed_set:
+                self._collect(UNREFERENCED_STORY, path)
+        if project_files:
+            self._compact(project_dir, project_files[0], project_data, listed, stories)
+
+    @staticmethod
+    def _has_chat(project_dir: Path) -> bool:
+        """Whether a story-less project got as far as a conversation, reported as its own kind"""
+        try:
+            return bool(read_json(project_dir / "chat_history.json").get("messages"))
+        except FileNotFoundError:
+            return False
+
+    def _compact(self, project_dir: Path, project_file: Path, project_data: dict, listed: List[str], stories: Dict[str, dict]):
+        """Drop repeated list entries and earlier copies of identical screens, keeping the last of each"""
+        seen = set()
+        kept: List[str] = []
+        duplicates: List[str] = []
+        for position in range(len(listed) - 1, -1, -1):
+            name = listed[position]
+            story = stories.get(name)
+            key = (screen_key(story, position), blob_hash(story)) if isinstance(story, dict) else name
+            if name not in seen and key in seen:
+                duplicates.append(name)
+            elif name not in seen:
+                kept.append(name)
+            seen.update((name, key))
+        kept.reverse()
+        if kept == listed:
+            return
+
+        project_id = project_id_of(project_dir)
+        self.report.compacted_projects.append(project_id)
+        if not self.dry_run:
+            # the list no longer names the duplicates before any of them is deleted
+            project_data["stories"] = kept
+            write_json(project_file, project_data)
+        for name in duplicates:
+            self._collect(DUPLICATE_STORY, project_dir / f"{name}.json")
+        if self.dry_run:
+            return
+
+        storyboard = [(name, stories[name]) for name in kept if name in stories]
+        revision = None
+        if get_settings().storage.revisions:
+            revision = get_story_versions(project_dir).snapshot(storyboard, source="gc").revision
+        index_storyboard(project_id, storyboard)
+        project_events.publish(project_id, STORYBOARD_UPDATED, {"stories": kept, "removed": duplicates, "revision": revision})
+
+    # --- shared stores -----------------------------------------------------
+
+    def _blobs(self):
+        blobs_root = self.data_dir / BLOBS_DIRNAME
+        if not blobs_root.exists():
+            return
+        for path in blobs_root.glob("*/*"):
+            digest = path.name.split(".", 1)[0]
+            if path.suffix == ".tmp":
+                if _age(path, self.now) >= self.min_age:
+                    self._collect(TEMP_FILE, path)
+            elif digest in self.live_blobs:
+                self._mark_images(path.read_text())
+            elif _age(path, self.now) >= self.min_age:
+                self._collect(UNREFERENCED_BLOB, path)
+
+    def _image_cache(self):
+        cache_dir = get_image_proxy().cache_dir
+        objects = cache_dir / "objects"
+        if not objects.exists():
+            return
+        dead: Set[str] = set()
+        for path in objects.glob("*/*"):
+            if path.suffix in (".json", ".tmp"):
+                continue
+            if path.name not in self.live_images and _age(path, self.now) >= self.min_age:
+                dead.add(path.name)
+                self._collect(UNREFERENCED_IMAGE, path)
+                self._collect(UNREFERENCED_IMAGE, path.with_name(f"{path.name}.json"))
+        if not dead:
+            return
+        if not self.dry_run:
+            get_image_proxy().forget(sorted(dead))
+        for path in (cache_dir / "variants").glob("*/*"):
+            if path.name.split("_w", 1)[0] in dead:
+                self._collect(UNREFERENCED_IMAGE, path)
+        for path in (cache_dir / "urls").glob("*/*"):
+            if path.read_text().strip() in dead:
+                self._collect(UNREFERENCED_IMAGE, path)
+
+    def run(self) -> GCReport:
+        start = time.perf_counter()
+        for path in sorted(self.data_dir.iterdir()) if self.data_dir.exists() else []:
+            if path.is_dir() and path.name.startswith("project_"):
+                self.report.projects_scanned += 1
+                try:
+                    # a worker saving the project meanwhile would otherwise lose stories to the compaction
+                    with project_lock(path):
+                        self._project(path)
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping %s during garbage collection: %s", path.name, e)
+            elif path.name.startswith((".import-", ".upload-")) and _age(path, self.now) >= self.min_age:
+                self._collect(TEMP_FILE, path)
+        self._blobs()
+        if self.images:
+            self._image_cache()
+        self.report.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info("Garbage collection %s: %d bytes in %s", "dry run" if self.dry_run else "run",
+                    self.report.reclaimable_bytes, {k: v for k, v in self.report.counts.items() if v})
+        return self.report
+
+
+def collect_garbage(dry_run: bool = True, min_age: Optional[float] = None,
+                    empty_project_age: Optional[float] = None, images: bool = True) -> GCReport:
+    """
+    Find (and unless ``dry_run``, remove) unreferenced data in the data directory
+
+    Raises:
+        GCInProgress: If another collection is running
+    """
+    # one collection per data directory, whichever worker or CLI process started it
+    run_lock = named_lock("gc")
+    if not run_lock.acquire(blocking=False):
+        raise GCInProgress("A garbage collection is already running")
+    try:
+        return GarbageCollector(get_data_dir(), dry_run, min_age, empty_project_age, images).run()
+    finally:
+        run_lock.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and remove unreferenced story files, blobs, images and empty projects")
+    parser.add_argument("--apply", action="store_true", help="Remove what is found (default: report only)")
+    parser.add_argument("--min-age", type=float, help="Seconds a file must be untouched before it is collected")
+    parser.add_argument("--empty-project-age", type=float, help="Seconds a story-less project must be untouched")
+    parser.add_argument("--no-images", action="store_true", help="Leave the image cache alone")
+    parser.add_argument("--list", action="store_true", help="Print every path found")
+    args = parser.parse_args()
+
+    report = collect_garbage(not args.apply, args.min_age, args.empty_project_age, not args.no_images)
+    if args.list:
+        for item in report.items:
+            print(f"{item.kind:20} {item.bytes:>12} {item.path}")
+    for kind in KINDS:
+        if report.counts[kind]:
+            print(f"{kind:20} {report.counts[kind]:>6} files {report.bytes[kind] / 1e6:>10.2f} MB")
+    verb = "Would reclaim" if report.dry_run else "Reclaimed"
+    print(f"{verb} {report.reclaimable_bytes / 1e6:.2f} MB from {report.projects_scanned} projects in {report.duration_ms} ms"
+          + (f"; compacted {len(report.compacted_projects)} story lists" if report.compacted_projects else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""
+Full-text search over story screens and chat messages
+
+Story text (``voiceover_text``, ``action_notes``,
+``on_screen_visual_keywords``) and chat message content are kept in a SQLite
+FTS5 index (``search.sqlite3`` in the data directory), ranked with BM25.
+The write paths update it as they go: the story writer and revision restores
+replace a project's indexed screens, chat saves its messages, and imports
+re-read the projects they brought in. Each document carries a digest of its
+indexed text, so re-saving an unchanged storyboard or chat history touches
+nothing.
+
+Projects that existed before the index (or were copied in by hand) are
+indexed by a background pass over the data directory when the index is first
+opened; searches made meanwhile return what has been indexed so far and say
+so. ``python -m app.services.story_search --rebuild`` starts from scratch.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from app.services.story_versions import screen_key
+from app.utils.metrics import STORY_SEARCH_DURATION
+from app.utils.storage import get_data_dir
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "search.sqlite3"
+STORY = "story"
+CHAT = "chat"
+MAX_LIMIT = 100
+
+# BM25 weight per indexed column: voiceover_text, action_notes, keywords, content
+COLUMN_WEIGHTS = (2.0, 1.0, 1.5, 1.0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    project_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    ref TEXT NOT NULL,
+    screen INTEGER,
+    role TEXT,
+    digest TEXT NOT NULL,
+    UNIQUE (project_id, kind, ref)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    voiceover_text, action_notes, keywords, content,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS indexed_projects (
+    project_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    indexed_at REAL NOT NULL,
+    PRIMARY KEY (project_id, kind)
+);
+"""
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return ", ".join(_text(v) for v in value)
+    return str(value)
+
+
+def _story_fields(story: dict) -> Tuple[str, str, str, str]:
+    return (_text(story.get("voiceover_text")), _text(story.get("action_notes")),
+            _text(story.get("on_screen_visual_keywords")), "")
+
+
+def _story_documents(storyboard: Iterable[Tuple[str, dict]]) -> list:
+    return [(name, screen_key(story, position), None, _story_fields(story))
+            for position, (name, story) in enumerate(storyboard) if isinstance(story, dict)]
+
+
+def _chat_documents(messages: Iterable[dict]) -> list:
+    return [(str(msg.get("id")), None, msg.get("role"), ("", "", "", _text(msg.get("content"))))
+            for msg in messages if isinstance(msg, dict) and msg.get("id") is not None]
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def build_match_query(query: str, any_term: bool = False) -> Optional[str]:
+    """
+    FTS5 query for free text typed by a user
+
+    Every word must match (or any word, with ``any_term``) and the last one
+    also matches as a prefix, so results follow the user while they type.
+    Returns None when the text has no searchable words.
+    """
+    terms = [t.lower() for t in TOKEN_PATTERN.findall(query or "")]
+    if not terms:
+        return None
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return (" OR " if any_term else " ").join(quoted)
+
+
+class StorySearch:
+    """SQLite FTS5 index of story screens and chat messages"""
+
+    def __init__(self, index_path: Path, data_dir: Path):
+        self.index_path = Path(index_path)
+        self.data_dir = Path(data_dir)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        # one writer at a time; readers use their own connections and see the last commit (WAL)
+        self._write_lock = threading.Lock()
+        self._backfill_thread: Optional[threading.Thread] = None
+        with self._write_lock:
+            conn = self._connection()
+            conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- writes ------------------------------------------------------------
+
+    def _replace_documents(self, conn: sqlite3.Connection, project_id: str, kind: str,
+                           documents: List[Tuple[str, Optional[int], Optional[str], Tuple[str, str, str, str]]]) -> int:
+        """Make the indexed documents of one kind match ``documents``; returns how many rows changed"""
+        existing = {ref: (doc_id, digest) for doc_id, ref, digest in conn.execute(
+            "SELECT id, ref, digest FROM documents WHERE project_id = ? AND kind = ?", (project_id, kind))}
+        changed = 0
+        seen = set()
+        for ref, screen, role, fields in documents:
+            if ref in seen:
+                continue
+            seen.add(ref)
+            digest = _digest(screen, role, *fields)
+            current = existing.get(ref)
+            if current is not None and current[1] == digest:
+                continue
+            if current is None:
+                doc_id = conn.execute(
+                    "INSERT INTO documents (project_id, kind, ref, screen, role, digest) VALUES (?, ?, ?, ?, ?, ?)",
+                    (project_id, kind, ref, screen, role, digest)).lastrowid
+            else:
+                doc_id = current[0]
+                conn.execute("UPDATE documents SET screen = ?, role = ?, digest = ? WHERE id = ?", (screen, role, digest, doc_id))
+                conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+            conn.execute("INSERT INTO documents_fts (rowid, voiceover_text, action_notes, keywords, content) VALUES (?, ?, ?, ?, ?)",
+                         (doc_id, *fields))
+            changed += 1
+        for ref, (doc_id, _) in existing.items():
+            if ref not in seen:
+                conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+                conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+                changed += 1
+        conn.execute("INSERT OR REPLACE INTO indexed_projects (project_id, kind, indexed_at) VALUES (?, ?, ?)",
+                     (project_id, kind, time.time()))
+        return changed
+
+    def _write(self, project_id: str, kind: str, documents) -> int:
+        with self._write_lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                changed = self._replace_documents(conn, project_id, kind, documents)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return changed
+
+    def index_storyboard(self, project_id: str, storyboard: Iterable[Tuple[str, dict]]) -> int:
+        """Index a project's current screens as (story file name, story) pairs, dropping screens no longer in it"""
+        return self._write(project_id, STORY, _story_documents(storyboard))
+
+    def index_chat(self, project_id: str, messages: Iterable[dict]) -> int:
+        """Index a project's chat history (the whole list, as saved)"""
+        return self._write(project_id, CHAT, _chat_documents(messages))
+
+    def remove_project(self, project_id: str):
+        with self._write_lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM documents_fts WHERE rowid IN (SELECT id FROM documents WHERE project_id = ?)", (project_id,))
+            conn.execute("DELETE FROM documents WHERE project_id = ?", (project_id,))
+            conn.execute("DELETE FROM indexed_projects WHERE project_id = ?", (project_id,))
+            conn.execute("COMMIT")
+
+    # --- reading projects from disk ----------------------------------------
+
+    def _read_storyboard(self, project_dir: Path) -> List[Tuple[str, dict]]:
+        project_files = list(project_dir.glob("project_type*.json"))
+        if not project_files:
+            return []
+        with open(project_files[0], "r") as f:
+            names = json.load(f).get("stories") or []
+        storyboard = []
+        for name in dict.fromkeys(names):
+            try:
+                with open(project_dir / f"{name}.json", "r") as f:
+                    storyboard.append((name, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return storyboard
+
+    def _read_chat(self, project_dir: Path) -> List[dict]:
+        chat_file = project_dir / "chat_history.json"
+        if not chat_file.exists():
+            return []
+        with open(chat_file, "r") as f:
+            return json.load(f).get("messages", [])
+
+    def index_project(self, project_id: str, only_missing: bool = False):
+        """
+        Index a project from its files on disk
+
+        With ``only_missing`` (the background pass), kinds already indexed by
+        a write path are left alone. The files are read while holding the
+        write lock so a concurrent save cannot be overwritten by older text.
+        """
+        project_dir = self.data_dir / f"project_{project_id}"
+        with self._write_lock:
+            conn = self._connection()
+            done = {kind for (kind,) in conn.execute("SELECT kind FROM indexed_projects WHERE project_id = ?", (project_id,))} \
+                if only_missing else set()
+            if not project_dir.is_dir():
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if STORY not in done:
+                    self._replace_documents(conn, project_id, STORY, _story_documents(self._read_storyboard(project_dir)))
+                if CHAT not in done:
+                    self._replace_documents(conn, project_id, CHAT, _chat_documents(self._read_chat(project_dir)))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def backfill(self) -> int:
+        """Index every project folder the index has not seen yet; returns how many were read"""
+        count = 0
+        for project_dir in sorted(self.data_dir.glob("project_*")):
+            if not project_dir.is_dir():
+                continue
+            try:
+                self.index_project(project_dir.name[len("project_"):], only_missing=True)
+                count += 1
+            except (OSError, ValueError, sqlite3.Error) as e:
+                logger.warning("Could not index %s: %s", project_dir.name, e)
+        logger.info("Search backfill read %d projects", count)
+        return count
+
+    def start_backfill(self):
+        if self._backfill_thread is None:
+            self._backfill_thread = threading.Thread(target=self.backfill, name="story-search-backfill", daemon=True)
+            self._backfill_thread.start()
+
+    @property
+    def backfilling(self) -> bool:
+        return self._backfill_thread is not None and self._backfill_thread.is_alive()
+
+    def wait_for_backfill(self, timeout: Optional[float] = None):
+        if self._backfill_thread is not None:
+            self._backfill_thread.join(timeout)
+
+    def rebuild(self) -> int:
+        with self._write_lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM documents_fts")
+            conn.execute("DELETE FROM documents")
+            conn.execute("DELETE FROM indexed_projects")
+            conn.execute("COMMIT")
+        count = self.backfill()
+        with self._write_lock:
+            self._connection().execute("INSERT INTO documents_fts (documents_fts) VALUES ('optimize')")
+        return count
+
+    # --- queries -----------------------------------------------------------
+
+    def _query(self, match: str, project_id: Optional[str], kind: Optional[str], limit: int) -> List[dict]:
+        sql = [
+            "SELECT d.project_id, d.kind, d.ref, d.screen, d.role,",
+            f"       bm25(documents_fts, {', '.join(map(str, COLUMN_WEIGHTS))}) AS score,",
+            "       snippet(documents_fts, -1, '<mark>', '</mark>', '…', 16) AS snippet",
+            "FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid",
+            "WHERE documents_fts MATCH ?",
+        ]
+        params: list = [match]
+        if project_id:
+            sql.append("AND d.project_id = ?")
+            params.append(project_id)
+        if kind:
+            sql.append("AND d.kind = ?")
+            params.append(kind)
+        sql.append("ORDER BY score LIMIT ?")
+        params.append(limit)
+        hits = []
+        for pid, doc_kind, ref, screen, role, score, snippet in self._connection().execute(" ".join(sql), params):
+            hit = {"project_id": pid, "kind": doc_kind, "score": round(-score, 4), "snippet": snippet}
+            if doc_kind == STORY:
+                hit.update(story_id=ref, screen_number=screen)
+            else:
+                hit.update(message_id=ref, role=role)
+            hits.append(hit)
+        return hits
+
+    def search(self, query: str, project_id: Optional[str] = None, kind: Optional[str] = None, limit: int = 20) -> dict:
+        """
+        Ranked matches for free text, best first
+
+        Raises:
+            ValueError: If the query has no searchable words or ``kind`` is unknown
+        """
+        if kind not in (None, STORY, CHAT):
+            raise ValueError(f"kind must be {STORY!r} or {CHAT!r}")
+        match = build_match_query(query)
+        if match is None:
+            raise ValueError("Query has no searchable words")
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        start = time.perf_counter()
+        hits = self._query(match, project_id, kind, limit)
+        matched = "all"
+        if not hits and " " in match:
+            # nothing has every word; fall back to screens that have some of them
+            hits = self._query(build_match_query(query, any_term=True), project_id, kind, limit)
+            matched = "any"
+        took = time.perf_counter() - start
+        STORY_SEARCH_DURATION.observe(took)
+        return {"hits": hits, "matched": matched, "took_ms": round(took * 1000, 2), "indexing": self.backfilling}
+
+    def get_stats(self) -> dict:
+        conn = self._connection()
+        counts = dict(conn.execute("SELECT kind, COUNT(*) FROM documents GROUP BY kind").fetchall())
+        projects = conn.execute("SELECT COUNT(DISTINCT project_id) FROM indexed_projects").fetchone()[0]
+        return {
+            "projects": projects,
+            "stories": counts.get(STORY, 0),
+            "messages": counts.get(CHAT, 0),
+            "index_bytes": self.index_path.stat().st_size if self.index_path.exists() else 0,
+            "indexing": self.backfilling,
+        }
+
+
+_search: Optional[StorySearch] = None
+_search_lock = threading.Lock()
+
+
+def get_story_search() -> Optional[StorySearch]:
+    """The index for the current data directory, or None when search indexing is turned off"""
+    global _search
+    settings = get_settings().storage
+    if not settings.search_index:
+        return None
+    data_dir = get_data_dir()
+    index_path = Path(settings.search_index_path or (data_dir / INDEX_FILENAME))
+    search = _search
+    if search is None or search.index_path != index_path or search.data_dir != data_dir:
+        with _search_lock:
+            if _search is None or _search.index_path != index_path or _search.data_dir != data_dir:
+                _search = StorySearch(index_path, data_dir)
+                _search.start_backfill()
+            search = _search
+    return search
+
+
+def _update(method: str, project_id: str, *args):
+    search = get_story_search()
+    if search is None:
+        return
+    try:
+        getattr(search, method)(project_id, *args)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        # the index can always be rebuilt; a save must not fail because of it
+        logger.warning("Search index not updated for project %s: %s", project_id, e)
+
+
+def index_storyboard(project_id: str, storyboard: Iterable[Tuple[str, dict]]):
+    """Write-path hook: the project's storyboard is now ``storyboard``"""
+    _update("index_storyboard", project_id, list(storyboard))
+
+
+def index_chat(project_id: str, messages: Iterable[dict]):
+    """Write-path hook: the project's chat history is now ``messages``"""
+    _update("index_chat", project_id, list(messages))
+
+
+def index_project(project_id: str):
+    """Write-path hook for changes made directly on disk (imports)"""
+    _update("index_project", project_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the story and chat search index")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the index and read every project again")
+    parser.add_argument("--query", help="Run a search and print the hits")
+    args = parser.parse_args()
+
+    search = get_story_search()
+    if search is None:
+        raise SystemExit("Search indexing is turned off (STORY_SEARCH_INDEX=false)")
+    if args.rebuild:
+        search.wait_for_backfill()
+        print(f"Indexed {search.rebuild()} projects")
+    else:
+        search.wait_for_backfill()
+    if args.query:
+        print(json.dumps(search.search(args.query), indent=2, ensure_ascii=False))
+    print(json.dumps(search.get_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
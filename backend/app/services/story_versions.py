@@ -0,0 +1,237 @@
+"""
+Content-addressed story versions
+
+Every saved storyboard is recorded as a revision: a small manifest listing,
+for each screen, its story file name and the SHA-256 of the story body. The
+bodies themselves live once in a blob store under ``data/blobs/`` keyed by
+that hash, so a screen that did not change between revisions (or is shared
+between projects) is stored a single time and a new revision only adds blobs
+for the screens that changed.
+
+Revisions are appended to ``revisions.jsonl`` in the project folder.
+Restoring one points the project's ``stories`` list back at its screens and
+rewrites only the story files whose current body differs from the blob.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.utils.file_lock import project_lock
+from app.utils.storage_io import read_json, write_bytes, write_json
+from app.utils.storage import get_data_dir
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIRNAME = "blobs"
+REVISIONS_FILENAME = "revisions.jsonl"
+
+
+def screen_key(story: dict, position: int) -> int:
+    """Screen number of a story, or its 1-based position when it has none"""
+    try:
+        return int(story.get("screen_number"))
+    except (TypeError, ValueError):
+        return position + 1
+
+
+def _canonical(story: dict) -> bytes:
+    return json.dumps(story, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def blob_hash(story: dict) -> str:
+    """Address of a story body in the blob store"""
+    return hashlib.sha256(_canonical(story)).hexdigest()
+
+
+class BlobStore:
+    """Immutable story bodies stored once per distinct content"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.json"
+
+    def put(self, story: dict) -> str:
+        data = _canonical(story)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        try:
+            # a blob referenced again is young again, so the garbage collector leaves it alone
+            os.utime(path)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_bytes(path, data)
+        return digest
+
+    def get(self, digest: str) -> dict:
+        return read_json(self._path(digest))
+
+    def exists(self, digest: str) -> bool:
+        return self._path(digest).exists()
+
+
+class RevisionEntry(BaseModel):
+    """One screen of a revision"""
+    name: str
+    screen: int
+    blob: str
+
+
+class Revision(BaseModel):
+    """One saved state of a project's storyboard"""
+    revision: int
+    created_at: float
+    source: str
+    parent: Optional[int] = None
+    restored_from: Optional[int] = None
+    stories: List[RevisionEntry]
+
+
+class StoryVersions:
+    """Revision history of one project's storyboard"""
+
+    def __init__(self, project_dir: Path, blobs: BlobStore, max_revisions: int = 200):
+        self.project_dir = Path(project_dir)
+        self.blobs = blobs
+        self.max_revisions = max_revisions
+        self._lock = project_lock(self.project_dir)
+
+    @property
+    def revisions_file(self) -> Path:
+        return self.project_dir / REVISIONS_FILENAME
+
+    def list(self) -> List[Revision]:
+        """Revisions oldest first"""
+        if not self.revisions_file.exists():
+            return []
+        revisions = []
+        with open(self.revisions_file, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    revisions.append(Revision.model_validate_json(line))
+                except ValueError as e:
+                    logger.warning(f"Skipping unreadable revision in {self.revisions_file}: {e}")
+        return revisions
+
+    def get(self, revision: int) -> Optional[Revision]:
+        return next((r for r in self.list() if r.revision == revision), None)
+
+    def latest(self) -> Optional[Revision]:
+        revisions = self.list()
+        return revisions[-1] if revisions else None
+
+    def snapshot(self, storyboard: List[Tuple[str, dict]], source: str, restored_from: Optional[int] = None) -> Revision:
+        """
+        Record the storyboard as a new revision
+
+        Only bodies not already in the blob store are written. Saving the same
+        storyboard as the latest revision returns that revision instead of
+        adding an identical one.
+        """
+        entries = [RevisionEntry(name=name, screen=screen_key(story, i), blob=self.blobs.put(story))
+                   for i, (name, story) in enumerate(storyboard)]
+        with self._lock:
+            revisions = self.list()
+            latest = revisions[-1] if revisions else None
+            if latest is not None and latest.stories == entries and restored_from is None:
+                return latest
+            revision = Revision(
+                revision=latest.revision + 1 if latest else 1,
+                created_at=time.time(),
+                source=source,
+                parent=latest.revision if latest else None,
+                restored_from=restored_from,
+                stories=entries,
+            )
+            revisions.append(revision)
+            if len(revisions) > self.max_revisions:
+                self._rewrite(revisions[-self.max_revisions:])
+            else:
+                with open(self.revisions_file, "a") as f:
+                    f.write(revision.model_dump_json() + "\n")
+        return revision
+
+    def _rewrite(self, revisions: List[Revision]):
+        write_bytes(self.revisions_file, "".join(revision.model_dump_json() + "\n" for revision in revisions).encode("utf-8"))
+
+    def stories(self, revision: Revision) -> List[dict]:
+        return [self.blobs.get(entry.blob) for entry in revision.stories]
+
+    def diff(self, old: Revision, new: Revision) -> dict:
+        """Screen-by-screen comparison of two revisions, with the fields that changed"""
+        before = {entry.screen: entry for entry in old.stories}
+        after = {entry.screen: entry for entry in new.stories}
+        screens = []
+        summary = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+        for screen in sorted(set(before) | set(after)):
+            a, b = before.get(screen), after.get(screen)
+            item = {"screen": screen, "from": a.model_dump() if a else None, "to": b.model_dump() if b else None}
+            if a is None:
+                item["status"] = "added"
+            elif b is None:
+                item["status"] = "removed"
+            elif a.blob == b.blob:
+                item["status"] = "unchanged"
+            else:
+                item["status"] = "changed"
+                old_story, new_story = self.blobs.get(a.blob), self.blobs.get(b.blob)
+                item["fields"] = sorted(k for k in set(old_story) | set(new_story) if old_story.get(k) != new_story.get(k))
+            summary[item["status"]] += 1
+            screens.append(item)
+        return {"from": old.revision, "to": new.revision, "summary": summary, "screens": screens}
+
+    def restore(self, revision: Revision) -> Revision:
+        """
+        Make a revision the project's current storyboard
+
+        Story files already holding the right body are left alone; files that
+        are not part of the restored storyboard are removed. The restore is
+        itself recorded as a new revision.
+        """
+        with self._lock:
+            return self._restore(revision)
+
+    def _restore(self, revision: Revision) -> Revision:
+        project_files = list(self.project_dir.glob("project_type*.json"))
+        if not project_files:
+            raise FileNotFoundError(f"No project file in {self.project_dir}")
+
+        storyboard = []
+        for entry in revision.stories:
+            story = self.blobs.get(entry.blob)
+            story_file = self.project_dir / f"{entry.name}.json"
+            try:
+                current = blob_hash(read_json(story_file))
+            except (OSError, ValueError):
+                current = None
+            if current != entry.blob:
+                write_json(story_file, story)
+            storyboard.append((entry.name, story))
+
+        names = [entry.name for entry in revision.stories]
+        project_data = read_json(project_files[0])
+        removed = [name for name in dict.fromkeys(project_data.get("stories") or []) if name not in names]
+        project_data["stories"] = names
+        project_data["lastUpdated"] = time.time()
+        write_json(project_files[0], project_data)
+        for name in removed:
+            (self.project_dir / f"{name}.json").unlink(missing_ok=True)
+
+        return self.snapshot(storyboard, source="restore", restored_from=revision.revision)
+
+
+def get_story_versions(project_dir: Path) -> StoryVersions:
+    """Revision history for a project, backed by the shared blob store in the data directory"""
+    settings = get_settings().storage
+    return StoryVersions(project_dir, BlobStore(get_data_dir() / BLOBS_DIRNAME), settings.max_revisions)
@@ -0,0 +1,354 @@
+"""
+Writes the screens of a generated storyboard to story files
+
+Screens can be added one at a time while the model is still producing the
+rest (see ``StreamingJSONScanner``): each one is handed to a small thread
+pool that looks up its image and writes its story file straight away, so
+by the time the response ends only the last screen's lookup is left. With
+deferred image resolution the story is written as ``pending`` and its image
+job is queued at once instead.
+
+Incoming screens are matched to the project's current storyboard by screen
+number and compared by a hash of their content. Unchanged screens are not
+rewritten, changed ones overwrite their existing file (keeping their image
+when the visual keywords did not change) and only new or re-keyworded
+screens get an image lookup. The project's ``stories`` list is then replaced
+rather than extended (or, for a chat request that names the screens to edit
+and a reply holding only those, merged), and story files that drop out of it
+are deleted; the
+resulting storyboard is recorded as a revision (see ``story_versions``) and
+its text indexed for search (see ``story_search``).
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from app.utils.file_lock import project_lock
+from app.utils.image_search import attach_image_candidates
+from app.utils.json_extractor import StreamingJSONScanner
+from app.utils.metrics import STORIES_PER_GENERATION, STORY_WRITES
+from app.utils.storage import project_id_of
+from app.utils.storage_io import read_json, write_json
+from app.utils.tracing import tracer
+from app.services.image_proxy import get_image_proxy
+from app.services.image_query_index import get_image_query_index
+from app.services.image_resolver import get_image_resolver, PENDING, READY, MISSING
+from app.services.project_events import project_events, STORY_ADDED, STORY_UPDATED, STORYBOARD_UPDATED
+from app.services.story_search import index_storyboard
+from app.services.story_versions import get_story_versions, screen_key
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Per-screen image lookups and writes for in-progress generations
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="story-writer")
+
+UNCHANGED = "unchanged"
+CHANGED = "changed"
+ADDED = "added"
+REMOVED = "removed"
+
+# "screen 2", "screens 2 and 3", "scenes 4-6"
+_NAMED_SCREENS = re.compile(r"\b(?:screen|scene)s?\s*#?\s*(\d+(?:\s*(?:,|and|&|-|to)\s*#?\s*\d+)*)", re.IGNORECASE)
+_SCREEN_RANGE = re.compile(r"(\d+)\s*(?:-|to)\s*#?\s*(\d+)|(\d+)")
+
+
+def _image_fields(story: dict) -> dict:
+    return {k: v for k, v in story.items() if k.startswith("image_")}
+
+
+def story_content_hash(story: dict) -> str:
+    """Hash of a screen's content, leaving out the image fields filled in after generation"""
+    content = {k: v for k, v in story.items() if not k.startswith("image_")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def named_screens(message: str) -> Set[int]:
+    """Screen numbers a chat request asks to change, e.g. {2, 3} for "shorten screens 2 and 3" """
+    numbers = set()
+    for match in _NAMED_SCREENS.finditer(message or ""):
+        for first, last, single in _SCREEN_RANGE.findall(match.group(1)):
+            if single:
+                numbers.add(int(single))
+            elif int(last) - int(first) < 100:
+                numbers.update(range(int(first), int(last) + 1))
+    return numbers
+
+
+class StoryWriter:
+    """Saves one storyboard's screens as they arrive and links them into the project at the end"""
+
+    def __init__(self, project_dir: Path, deferred: bool = True, executor: Optional[ThreadPoolExecutor] = None,
+                 on_saved: Optional[Callable[[int, str, dict], None]] = None, search_images: bool = True,
+                 source: str = "chat"):
+        self.project_dir = Path(project_dir)
+        self.project_id = project_id_of(self.project_dir)
+        self.deferred = deferred
+        # Called from the pool with (index, story file name, story) once each story is on disk
+        self.on_saved = on_saved
+        # Saves from the editor keep the images they come with instead of searching
+        self.search_images = search_images
+        # Recorded on the revision this save creates
+        self.source = source
+        self.revision: Optional[int] = None
+        self.timestamp = int(time.time())
+        self._executor = executor or _executor
+        self._futures: Dict[int, Future] = {}
+        self._keys: List[int] = []
+        self._outcomes: Dict[int, Tuple[str, str, Optional[dict]]] = {}
+        self._saved: Dict[str, dict] = {}
+        self._claimed: set = set()
+        self._lock = threading.Lock()
+        self.stats = {UNCHANGED: 0, CHANGED: 0, ADDED: 0, REMOVED: 0}
+        self._load_current()
+
+    def __len__(self) -> int:
+        return len(self._futures)
+
+    def _project_file(self) -> Optional[Path]:
+        project_files = list(self.project_dir.glob("project_type*.json"))
+        return project_files[0] if project_files else None
+
+    def _load_current(self):
+        """Index the project's current storyboard by screen number; later entries win over older duplicates"""
+        self._current: Dict[int, Tuple[str, dict]] = {}
+        self._listed: List[str] = []
+        project_file = self._project_file()
+        if project_file is None:
+            return
+        self._listed = list(read_json(project_file).get("stories") or [])
+        for position, name in enumerate(self._listed):
+            try:
+                story = read_json(self.project_dir / f"{name}.json")
+            except (OSError, ValueError):
+                continue
+            if isinstance(story, dict):
+                self._current[screen_key(story, position)] = (name, story)
+
+    def _new_name(self) -> str:
+        """Pick a free story file name; call with the project lock held and write the file before releasing it"""
+        offset = 0
+        with self._lock:
+            while True:
+                name = f"story_{self.timestamp + offset}"
+                if name not in self._claimed and name not in self._listed and not (self.project_dir / f"{name}.json").exists():
+                    self._claimed.add(name)
+                    return name
+                offset += 1
+
+    def add(self, story_data: dict) -> Future:
+        """Queue one screen; returns a future for its story file name"""
+        with self._lock:
+            index = len(self._futures)
+            key = screen_key(story_data, index)
+            name, current = self._current.get(key, (None, None))
+            if name is None or name in self._claimed:
+                # named when it is written, so no other writer can take the same name
+                name, current = None, None
+            else:
+                self._claimed.add(name)
+            self._keys.append(key)
+            # copy the context so per-screen spans stay in the request's trace
+            future = self._executor.submit(contextvars.copy_context().run, self._write, index, name, story_data, current)
+            self._futures[index] = future
+        return future
+
+    def _write(self, index: int, story_filename: Optional[str], story_data: dict, current: Optional[dict]) -> str:
+        incoming_images = _image_fields(story_data)
+
+        if current is not None and story_content_hash(story_data) == story_content_hash(current) \
+                and incoming_images in ({}, _image_fields(current)):
+            self._outcomes[index] = (UNCHANGED, story_filename, current)
+            self._saved[story_filename] = current
+            if self.on_saved is not None:
+                self.on_saved(index, story_filename, current)
+            return story_filename
+
+        keywords = story_data.get("on_screen_visual_keywords", "")
+        keep_images = current is not None and not incoming_images and keywords == current.get("on_screen_visual_keywords", "")
+        if keep_images:
+            # Same visual keywords: the screen keeps the image it already had
+            story_data.update(_image_fields(current))
+        elif not self.search_images:
+            # Point images that are already cached at the local proxy (no fetching on save)
+            image_proxy = get_image_proxy()
+            if image_proxy.settings.enabled:
+                image_proxy.rewrite_story(story_data, fetch=False)
+        elif self.deferred:
+            # Images are filled in by the background resolver once the story is on disk
+            story_data["image_url"] = None
+            story_data["image_status"] = PENDING
+        else:
+            # Keep every usable result so "next image" never needs another search;
+            # keywords close to an earlier search reuse its results
+            with tracer.span("image.search", screen=index + 1):
+                candidates = get_image_query_index().lookup_or_search(keywords)
+                attach_image_candidates(story_data, candidates)
+
+            # Serve the chosen image from the local cache instead of the third-party original
+            image_proxy = get_image_proxy()
+            if image_proxy.settings.enabled:
+                image_proxy.rewrite_story(story_data)
+            story_data["image_status"] = READY if story_data.get("image_url") else MISSING
+
+        # the image resolver patches story files under the same lock
+        with tracer.span("story.write", screen=index + 1), project_lock(self.project_dir):
+            if story_filename is None:
+                story_filename = self._new_name()
+            story_file = self.project_dir / f"{story_filename}.json"
+            if keep_images:
+                # the resolver may have found the image since the storyboard was read
+                try:
+                    on_disk = read_json(story_file)
+                except (OSError, ValueError):
+                    on_disk = None
+                if isinstance(on_disk, dict) and on_disk.get("on_screen_visual_keywords", "") == keywords:
+                    story_data.update(_image_fields(on_disk))
+            write_json(story_file, story_data)
+        self._outcomes[index] = (ADDED if current is None else CHANGED, story_filename, current)
+        self._saved[story_filename] = story_data
+        logger.debug(f"Saved story file: {story_filename}.json")
+
+        if story_data.get("image_status") == PENDING:
+            get_image_resolver().submit([story_file])
+        project_events.publish(self.project_id, STORY_ADDED if current is None else STORY_UPDATED,
+                               {"story_id": story_filename, "story": story_data})
+        if self.on_saved is not None:
+            self.on_saved(index, story_filename, story_data)
+        return story_filename
+
+    def finish(self, edited: Optional[Set[int]] = None) -> List[str]:
+        """
+        Wait for every queued screen, then point the project at the new storyboard
+
+        Args:
+            edited: Screen numbers the request asked to change (see
+                ``named_screens``). A reply holding only those screens is
+                merged into the storyboard; anything else, including every
+                reply to a request that named no screens, replaces it.
+
+        Returns:
+            The project's story list after the update
+        """
+        story_files = [self._futures[index].result() for index in sorted(self._futures)]
+        STORIES_PER_GENERATION.observe(len(story_files))
+        if not (edited and set(self._keys) <= edited):
+            stories = story_files
+        else:
+            merged = {key: name for key, (name, _) in self._current.items()}
+            merged.update(zip(self._keys, story_files))
+            stories = [merged[key] for key in sorted(merged)]
+
+        for kind, _, _ in self._outcomes.values():
+            self.stats[kind] += 1
+
+        with tracer.span("project.update"):
+            # Update project file with story references
+            project_file = self._project_file()
+            if project_file is not None:
+                saved = {**{name: story for name, story in self._current.values()}, **self._saved}
+                storyboard = [(name, saved[name]) for name in stories]
+                # other workers may be saving or restoring this project
+                with project_lock(self.project_dir):
+                    self._record_revision(storyboard)
+                    project_data = read_json(project_file)
+
+                    # Screens that are no longer in the storyboard, and older copies of ones that are
+                    removed = [name for name in dict.fromkeys(project_data.get("stories") or []) if name not in stories]
+                    project_data["stories"] = stories
+                    project_data["lastUpdated"] = time.time()
+
+                    # Save updated project file
+                    write_json(project_file, project_data)
+
+                    for name in removed:
+                        (self.project_dir / f"{name}.json").unlink(missing_ok=True)
+                self.stats[REMOVED] = len(removed)
+                project_events.publish(self.project_id, STORYBOARD_UPDATED,
+                                       {"stories": stories, "removed": removed, "revision": self.revision})
+                index_storyboard(self.project_id, storyboard)
+
+                logger.info(f"Updated project file: {self.stats[ADDED]} added, {self.stats[CHANGED]} changed, "
+                            f"{self.stats[UNCHANGED]} unchanged, {len(removed)} removed stories")
+            else:
+                logger.warning(f"No project file found to update in {self.project_dir}")
+
+        for kind, count in self.stats.items():
+            if count:
+                STORY_WRITES.inc(count, result=kind)
+        return stories
+
+    def _record_revision(self, storyboard: List[Tuple[str, dict]]):
+        if not get_settings().storage.revisions:
+            return
+        versions = get_story_versions(self.project_dir)
+        if versions.latest() is None and self._current:
+            # keep the storyboard from before revisions were recorded so this save can be undone
+            versions.snapshot([self._current[key] for key in sorted(self._current)], source="baseline")
+        self.revision = versions.snapshot(storyboard, source=self.source).revision
+
+    def discard(self):
+        """Undo the story writes made so far, for a response that is being thrown away"""
+        for future in list(self._futures.values()):
+            try:
+                future.result()
+            except Exception:
+                continue
+        with project_lock(self.project_dir):
+            for kind, story_filename, current in self._outcomes.values():
+                story_file = self.project_dir / f"{story_filename}.json"
+                if kind == ADDED:
+                    story_file.unlink(missing_ok=True)
+                elif kind == CHANGED:
+                    write_json(story_file, current)
+        self._futures.clear()
+        self._outcomes.clear()
+        self._saved.clear()
+        self._keys.clear()
+        self._claimed.clear()
+
+
+class ScreenStream:
+    """
+    Turns streamed model text into story files while the response is still arriving
+
+    Call it with each text chunk; screens are written as soon as their JSON
+    object closes. ``finish`` links them into the project, or returns None
+    when no screen could be picked out of the stream so the caller can fall
+    back to extracting JSON from the full text.
+    """
+
+    def __init__(self, project_dir: Path, deferred: bool = True, on_saved: Optional[Callable[[int, str, dict], None]] = None):
+        self.project_dir = Path(project_dir)
+        self.deferred = deferred
+        self.on_saved = on_saved
+        self.reset()
+
+    def reset(self):
+        """Start over, undoing anything written from an abandoned response"""
+        self.discard()
+        self.scanner = StreamingJSONScanner()
+        self.writer = StoryWriter(self.project_dir, self.deferred, on_saved=self.on_saved)
+
+    def discard(self):
+        """Undo the screens written so far, for a response that failed or is being thrown away"""
+        writer = getattr(self, "writer", None)
+        if writer is not None:
+            writer.discard()
+
+    def __call__(self, chunk: str):
+        for screen in self.scanner.feed(chunk):
+            self.writer.add(screen)
+
+    def finish(self, edited: Optional[Set[int]] = None) -> Optional[List[str]]:
+        if not len(self.writer):
+            return None
+        return self.writer.finish(edited)
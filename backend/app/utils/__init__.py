@@ -1,5 +1,19 @@
 """Utility modules for the storyboard backend application"""
 
-from .image_search import GoogleImageSearch, search_image, get_longest_title_image_link
+from .image_search import (
+    GoogleImageSearch,
+    search_image,
+    search_image_candidates,
+    rank_image_candidates,
+    next_image_candidate,
+    get_longest_title_image_link,
+)
 
-__all__ = ["GoogleImageSearch", "search_image", "get_longest_title_image_link"]
\ No newline at end of file
+__all__ = [
+    "GoogleImageSearch",
+    "search_image",
+    "search_image_candidates",
+    "rank_image_candidates",
+    "next_image_candidate",
+    "get_longest_title_image_link",
+]
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Locks that hold across threads and, in multi-worker mode, across processes
+
+Every uvicorn or gunicorn worker is a separate process with its own
+``threading`` locks, so two workers saving the same project would interleave
+their read-modify-write of ``project_type*.json``. ``project_lock`` returns a
+reentrant lock per project that, when ``STORYBOARD_MULTI_WORKER`` is on, also
+takes an exclusive ``flock`` on ``data/.locks/<project>.lock``:
+
+    with project_lock(project_dir):
+        data = read_json(project_file)
+        ...
+        write_json(project_file, data)
+
+Lock files live outside the project folders so exports and the garbage
+collector never see them. ``fcntl`` is POSIX-only; without it the locks only
+cover threads of one process and multi-worker mode logs a warning.
+"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict
+
+from app.utils.storage import get_data_dir
+from config.settings import get_settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCKS_DIRNAME = ".locks"
+
+_warned = False
+
+
+def cross_process_locking() -> bool:
+    """Whether locks also exclude other processes (multi-worker mode on a POSIX system)"""
+    global _warned
+    if not get_settings().deployment.multi_worker:
+        return False
+    if fcntl is None:
+        if not _warned:
+            logger.warning("STORYBOARD_MULTI_WORKER is on but fcntl is unavailable; project writes are only locked per process")
+            _warned = True
+        return False
+    return True
+
+
+class FileLock:
+    """
+    Reentrant lock backed by ``flock`` on a lock file
+
+    The same thread may enter it again (a restore records a snapshot while
+    holding the project lock); the file is only locked by the outermost entry.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._rlock.acquire(blocking=blocking):
+            return False
+        if self._depth == 0 and cross_process_locking():
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    self._rlock.release()
+                    return False
+                self._fd = fd
+            except BaseException:
+                self._rlock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fd, self._fd = self._fd, None
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._rlock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+_locks: Dict[Path, FileLock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(path: Path) -> FileLock:
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = FileLock(path)
+        return lock
+
+
+def named_lock(name: str) -> FileLock:
+    """Process-shared lock for one named resource of the data directory"""
+    return _lock_for(get_data_dir() / LOCKS_DIRNAME / f"{name}.lock")
+
+
+def project_lock(project_dir: Path) -> FileLock:
+    """Lock held while a project's files are read and rewritten"""
+    project_dir = Path(project_dir)
+    return _lock_for(project_dir.parent / LOCKS_DIRNAME / f"{project_dir.name}.lock")
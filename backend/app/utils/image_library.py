@@ -0,0 +1,187 @@
+"""
+Offline stock image library
+
+A directory of image files plus a ``manifest.json`` describing them::
+
+    {"images": [
+        {"file": "office/desk.jpg", "tags": ["office", "desk", "laptop"],
+         "caption": "Tidy office desk with a laptop", "width": 1920, "height": 1080}
+    ]}
+
+Tags and captions are normalized with the same keyword rules as search
+queries and held in an in-memory inverted index scored with BM25, so common
+keywords resolve locally without touching the Custom Search quota. Files are
+served from ``/api/library/{file}``. The manifest is re-read when it changes.
+"""
+
+import heapq
+import json
+import logging
+import math
+import mimetypes
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.image_search import ImageSearchProvider
+from app.utils.keywords import keyword_terms
+from app.utils.storage import get_data_dir
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+LIBRARY_PREFIX = "/api/library/"
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Tags are counted this many times against once for caption words
+TAG_WEIGHT = 2
+
+
+class LocalImageLibrary(ImageSearchProvider):
+    """Searches a local image directory by its tag and caption manifest"""
+
+    name = "library"
+
+    def __init__(self, library_dir: Path, min_match: float = 0.5):
+        self.library_dir = Path(library_dir)
+        self.min_match = min_match
+        self.manifest_mtime: Optional[float] = None
+        self._images: List[dict] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._norms: List[float] = []
+        self._files: Dict[str, Path] = {}
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.library_dir / MANIFEST_FILENAME
+
+    def load(self):
+        """(Re)build the index from the manifest; a missing manifest means an empty library"""
+        images, postings, lengths, files = [], {}, [], {}
+        mtime = self.manifest_path.stat().st_mtime if self.manifest_path.exists() else None
+
+        if mtime is not None:
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            entries = manifest.get("images", []) if isinstance(manifest, dict) else manifest
+            root = self.library_dir.resolve()
+
+            for entry in entries:
+                path = (self.library_dir / str(entry.get("file", ""))).resolve()
+                if not entry.get("file") or root not in path.parents or not path.is_file():
+                    logger.warning(f"Skipping library entry without a file inside {root}: {entry.get('file')}")
+                    continue
+
+                terms = keyword_terms(" ".join(entry.get("tags", []))) * TAG_WEIGHT + keyword_terms(entry.get("caption", ""))
+                if not terms:
+                    continue
+                doc_id = len(images)
+                counts: Dict[str, int] = {}
+                for term in terms:
+                    counts[term] = counts.get(term, 0) + 1
+                for term, count in counts.items():
+                    postings.setdefault(term, []).append((doc_id, count))
+                lengths.append(len(terms))
+
+                relative = path.relative_to(root).as_posix()
+                files[relative] = path
+                mime = mimetypes.guess_type(path.name)[0] or ""
+                images.append({
+                    "title": entry.get("caption") or ", ".join(entry.get("tags", [])),
+                    "link": LIBRARY_PREFIX + relative,
+                    "displayLink": "library",
+                    "mime": mime,
+                    "fileFormat": mime,
+                    "image": {
+                        "contextLink": "",
+                        "width": int(entry.get("width") or 0),
+                        "height": int(entry.get("height") or 0),
+                        "byteSize": path.stat().st_size,
+                        "thumbnailLink": LIBRARY_PREFIX + relative,
+                    },
+                })
+
+        # BM25 length normalization only depends on the document, so it is computed once here
+        avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length) for length in lengths]
+        # swap in the new index in one step so concurrent searches see either version whole
+        self._images, self._postings, self._norms, self._files = images, postings, norms, files
+        self.manifest_mtime = mtime
+        logger.info(f"Indexed {len(images)} library images from {self.library_dir}")
+
+    def search_images(
+        self,
+        query: str,
+        num_results: int = 3,
+        image_size: Optional[str] = None,
+        image_type: Optional[str] = None,
+        safe_search: str = "medium"
+    ) -> List[Dict[str, any]]:
+        """
+        Best matching library images by BM25 score
+
+        Images matching fewer than ``min_match`` of the query's terms are left
+        out so a single shared word does not count as a hit.
+        """
+        images, postings, norms = self._images, self._postings, self._norms
+        terms = set(keyword_terms(query))
+        if not terms or not images:
+            return []
+
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        for term in terms:
+            term_postings = postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (len(images) - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for doc_id, tf in term_postings:
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norms[doc_id])
+                matched[doc_id] = matched.get(doc_id, 0) + 1
+
+        needed = math.ceil(self.min_match * len(terms))
+        ranked = heapq.nlargest(num_results, (d for d in scores if matched[d] >= needed), key=scores.__getitem__)
+        return [images[d] for d in ranked]
+
+    def resolve(self, relative: str) -> Optional[Path]:
+        """File for a ``/api/library/`` path, or None if it is not a library image"""
+        return self._files.get(relative)
+
+    def get_stats(self) -> dict:
+        return {
+            "library_dir": str(self.library_dir),
+            "images": len(self._images),
+            "terms": len(self._postings),
+        }
+
+
+_library: Optional[LocalImageLibrary] = None
+_library_lock = threading.Lock()
+
+
+def get_image_library() -> LocalImageLibrary:
+    """Shared library for the current settings; re-indexed when the directory or manifest changes"""
+    global _library
+    settings = get_settings().image_search
+    library_dir = Path(settings.library_dir or (get_data_dir() / "library"))
+    manifest = library_dir / MANIFEST_FILENAME
+    mtime = manifest.stat().st_mtime if manifest.exists() else None
+
+    library = _library
+    if library is None or library.library_dir != library_dir or library.min_match != settings.library_min_match:
+        with _library_lock:
+            if _library is None or _library.library_dir != library_dir or _library.min_match != settings.library_min_match:
+                _library = LocalImageLibrary(library_dir, settings.library_min_match)
+            library = _library
+    elif library.manifest_mtime != mtime:
+        with _library_lock:
+            if library.manifest_mtime != mtime:
+                library.load()
+    return library
@@ -1,16 +1,57 @@
-import os
+import math
+from abc import ABC, abstractmethod
+import re
 import requests
 from typing import List, Dict, Optional
-from dotenv import load_dotenv
 
-load_dotenv()
+from app.utils.metrics import UPSTREAM_DURATION, UPSTREAM_PAYLOAD_BYTES, IMAGE_SEARCH_QUERIES
+from config.settings import get_settings
+
+# Storyboard panels are 16:9 frames
+TARGET_ASPECT = 16 / 9
+# Smallest width that still fills a panel without visible upscaling
+MIN_WIDTH = 400
+# Pixel count that earns the full resolution score (720p)
+FULL_RESOLUTION = 1280 * 720
+# Formats we keep, with their relative preference; GIFs, SVGs and the rest are dropped
+FORMAT_WEIGHTS = {"image/jpeg": 1.0, "image/webp": 0.9, "image/png": 0.8}
+# How much each signal contributes to a candidate's score
+RANK_WEIGHTS = {"aspect": 0.4, "resolution": 0.3, "bytes": 0.15, "format": 0.15}
+
+class ImageSearchProvider(ABC):
+    """
+    A source of image search results
+
+    Providers return results in the Google Custom Search shape (``title``,
+    ``link``, ``mime``, ``fileFormat`` and an ``image`` dict with ``width``,
+    ``height``, ``byteSize`` and ``thumbnailLink``) so they can be ranked
+    together.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def search_images(
+        self,
+        query: str,
+        num_results: int = 3,
+        image_size: Optional[str] = None,
+        image_type: Optional[str] = None,
+        safe_search: str = "medium"
+    ) -> List[Dict[str, any]]:
+        """Return up to ``num_results`` results for ``query``"""
 
-class GoogleImageSearch:
+
+class GoogleImageSearch(ImageSearchProvider):
     """Utility class for searching images using Google Custom Search API"""
 
+    name = "google_cse"
+
     def __init__(self):
-        self.api_key = os.getenv("GOOGLE_CSE_API_KEY")
-        self.search_engine_id = os.getenv("SEARCH_ENGINE_ID")
+        settings = get_settings().image_search
+        self.api_key = settings.api_key
+        self.search_engine_id = settings.search_engine_id
+        self.timeout = settings.timeout
 
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
@@ -48,8 +89,8 @@ class GoogleImageSearch:
                 - size: File size
         """
 
-        if num_results > 3:
-            num_results = 3  # Google API limit per request
+        if num_results > 10:
+            num_results = 10  # Google API limit per request
 
         print("api key", self.api_key)
         print("search engine id", self.search_engine_id)
@@ -69,7 +110,10 @@ class GoogleImageSearch:
             params["imgType"] = image_type
 
         try:
-            response = requests.get(self.base_url, params=params, timeout=10)
+            with UPSTREAM_DURATION.time(upstream="google_cse", status="error") as labels:
+                response = requests.get(self.base_url, params=params, timeout=self.timeout)
+                labels["status"] = response.status_code
+            UPSTREAM_PAYLOAD_BYTES.observe(len(response.content), upstream="google_cse", direction="received")
 
             # Check for specific error codes
             if response.status_code == 403:
@@ -182,26 +226,199 @@ def get_longest_title_image_link(images: List[Dict[str, any]]) -> Optional[str]:
     return longest_title_image.get('link')
 
 
+def _image_format(image: Dict[str, any]) -> str:
+    fmt = (image.get("mime") or image.get("fileFormat") or "").lower()
+    if fmt and "/" not in fmt:
+        fmt = f"image/{fmt}"
+    return "image/jpeg" if fmt == "image/jpg" else fmt
+
+
+def score_image(image: Dict[str, any], target_aspect: float = TARGET_ASPECT) -> float:
+    """
+    Score a search result between 0 and 1 for use as a storyboard panel image
+
+    Combines how close the aspect ratio is to the panel's, the pixel count,
+    whether ``byteSize`` looks like a real photo rather than a thumbnail or a
+    huge original, and the format preference. Missing dimensions score as
+    middling rather than zero.
+    """
+    info = image.get("image", {})
+    width, height = info.get("width") or 0, info.get("height") or 0
+    byte_size = info.get("byteSize") or 0
+
+    if width and height:
+        # 1.0 at the exact ratio, 0 once it is off by a factor of two
+        aspect = max(0.0, 1 - abs(math.log((width / height) / target_aspect)) / math.log(2))
+        resolution = min(1.0, width * height / FULL_RESOLUTION)
+    else:
+        aspect, resolution = 0.5, 0.3
+
+    if not byte_size:
+        size = 0.5
+    elif byte_size < 20 * 1024:
+        size = 0.2
+    elif byte_size > 8 * 1024 * 1024:
+        size = 0.3
+    else:
+        size = 1.0
+
+    fmt = FORMAT_WEIGHTS.get(_image_format(image), 0.0)
+    return (RANK_WEIGHTS["aspect"] * aspect + RANK_WEIGHTS["resolution"] * resolution
+            + RANK_WEIGHTS["bytes"] * size + RANK_WEIGHTS["format"] * fmt)
+
+
+def rank_image_candidates(images: List[Dict[str, any]], min_width: int = MIN_WIDTH, target_aspect: float = TARGET_ASPECT) -> List[Dict[str, any]]:
+    """
+    Keep the usable results of an image search, best first
+
+    Results without a link, in an unsupported format or narrower than
+    ``min_width`` are dropped. Ties are broken by the longer title, as the
+    old single-pick heuristic did.
+
+    Returns:
+        Compact candidate dictionaries (link, title, mime, width, height,
+        byteSize, thumbnailLink, score) suitable for storing on a story
+    """
+    candidates = []
+    for image in images or []:
+        info = image.get("image", {})
+        fmt = _image_format(image)
+        if not image.get("link") or fmt not in FORMAT_WEIGHTS:
+            continue
+        if info.get("width") and info["width"] < min_width:
+            continue
+        candidates.append({
+            "link": image["link"],
+            "title": image.get("title", ""),
+            "mime": fmt,
+            "width": info.get("width", 0),
+            "height": info.get("height", 0),
+            "byteSize": info.get("byteSize", 0),
+            "thumbnailLink": info.get("thumbnailLink", ""),
+            "score": round(score_image(image, target_aspect), 4),
+        })
+    candidates.sort(key=lambda c: (c["score"], len(c["title"])), reverse=True)
+    return candidates
+
+
+def query_ladder(query: str, max_queries: int = 3) -> List[str]:
+    """
+    Queries to try in turn when a search finds nothing usable
+
+    Starts with the full visual keywords, then the first two keyword phrases,
+    the first phrase, and finally its first two words.
+    """
+    query = (query or "").strip()
+    parts = [p.strip() for p in re.split(r"[,;|/]", query) if p.strip()]
+    rungs = [query]
+    if len(parts) > 2:
+        rungs.append(" ".join(parts[:2]))
+    if len(parts) > 1:
+        rungs.append(parts[0])
+    words = parts[0].split() if parts else []
+    if len(words) > 2:
+        rungs.append(" ".join(words[:2]))
+
+    ladder = []
+    for rung in rungs:
+        if rung and rung not in ladder:
+            ladder.append(rung)
+    return ladder[:max(1, max_queries)]
+
+
+def get_image_providers() -> List[ImageSearchProvider]:
+    """
+    Image search providers in the order they should be asked
+
+    ``IMAGE_LIBRARY_MODE`` puts the local image library before Google
+    (``first``), after it (``fallback``) or leaves it out (``off``). Providers
+    that are not configured are skipped.
+    """
+    from app.utils.image_library import get_image_library
+
+    mode = get_settings().image_search.library_mode
+    providers: List[ImageSearchProvider] = []
+    try:
+        providers.append(GoogleImageSearch())
+    except ValueError as e:
+        print(f"Error initializing image search: {e}")
+
+    library = get_image_library() if mode != "off" else None
+    if library is not None and len(library):
+        if mode == "first":
+            providers.insert(0, library)
+        else:
+            providers.append(library)
+    return providers
+
+
+def search_image_candidates(query: str, num_results: Optional[int] = None, max_queries: Optional[int] = None) -> List[Dict[str, any]]:
+    """
+    Ranked image candidates for a screen's visual keywords
+
+    Asks each provider in turn, walking the query ladder with each, and stops
+    at the first query that returns a usable image, so a screen normally
+    costs at most one search. Each candidate records the provider and query
+    that found it.
+
+    Returns:
+        Ranked candidates, or an empty list if nothing qualified or search is unavailable
+    """
+    settings = get_settings().image_search
+    num_results = num_results or settings.num_results
+    max_queries = max_queries or settings.max_queries
+
+    for provider in get_image_providers():
+        for rung, rung_query in enumerate(query_ladder(query, max_queries)):
+            candidates = rank_image_candidates(provider.search_images(rung_query, num_results=num_results))
+            IMAGE_SEARCH_QUERIES.inc(provider=provider.name, rung=rung, result="found" if candidates else "empty")
+            if candidates:
+                for candidate in candidates:
+                    candidate["provider"] = provider.name
+                    candidate["query"] = rung_query
+                return candidates
+    return []
+
+
+def attach_image_candidates(story: Dict[str, any], candidates: List[Dict[str, any]]) -> Optional[str]:
+    """Store ranked candidates on a story and point ``image_url`` at the best one"""
+    story["image_candidates"] = candidates
+    story["image_candidate_index"] = 0
+    story["image_url"] = candidates[0]["link"] if candidates else None
+    story.pop("image_source_url", None)
+    return story["image_url"]
+
+
+def next_image_candidate(story: Dict[str, any]) -> Optional[Dict[str, any]]:
+    """
+    Switch a story to its next stored candidate, wrapping around at the end
+
+    No search is made; returns None if the story has no stored candidates.
+    """
+    candidates = story.get("image_candidates") or []
+    if not candidates:
+        return None
+    index = (int(story.get("image_candidate_index", 0)) + 1) % len(candidates)
+    story["image_candidate_index"] = index
+    story["image_url"] = candidates[index]["link"]
+    story.pop("image_source_url", None)
+    return candidates[index]
+
+
 # Example usage function
-def search_image(query: str, num_results: int = 5) -> str:
+def search_image(query: str, num_results: Optional[int] = None) -> Optional[str]:
     """
     Simple function to search for images
 
     Args:
         query: Search query
-        num_results: Number of results to return
+        num_results: Number of results to rank
 
     Returns:
-        List of image results
+        Link of the best ranked image, or None if nothing usable was found
     """
-    try:
-        searcher = GoogleImageSearch()
-        search_images = searcher.search_images(query, num_results=num_results)
-        result = get_longest_title_image_link(search_images)
-        return result
-    except Exception as e:
-        print(f"Error initializing image search: {e}")
-        return []
+    candidates = search_image_candidates(query, num_results=num_results)
+    return candidates[0]["link"] if candidates else None
 
 
 if __name__ == "__main__":
@@ -4,6 +4,8 @@ import logging
 from typing import List, Dict, Any, Optional, Union, Tuple
 from pydantic import BaseModel, ValidationError, Field
 
+from app.utils.metrics import EXTRACTION_DURATION
+
 logger = logging.getLogger(__name__)
 
 
@@ -145,7 +147,8 @@ def extract_json_from_text(text: str, validate: bool = True) -> ExtractionResult
     """
     try:
         # Extract JSON blocks
-        json_blocks = extract_json_blocks(text)
+        with EXTRACTION_DURATION.time(stage="extract"):
+            json_blocks = extract_json_blocks(text)
 
         if not json_blocks:
             return ExtractionResult(
@@ -157,8 +160,10 @@ def extract_json_from_text(text: str, validate: bool = True) -> ExtractionResult
         parsed_data = []
         successful_blocks = []
 
-        for block in json_blocks:
-            success, data, error = parse_json_safely(block)
+        with EXTRACTION_DURATION.time(stage="parse"):
+            parsed_blocks = [(block, parse_json_safely(block)) for block in json_blocks]
+
+        for block, (success, data, error) in parsed_blocks:
             if success and data:
                 if isinstance(data, list):
                     parsed_data.extend(data)
@@ -177,7 +182,8 @@ def extract_json_from_text(text: str, validate: bool = True) -> ExtractionResult
         # Validate if requested
         validated_data = None
         if validate and parsed_data:
-            validation_success, validated_data, validation_error = validate_storyboard_data(parsed_data)
+            with EXTRACTION_DURATION.time(stage="validate"):
+                validation_success, validated_data, validation_error = validate_storyboard_data(parsed_data)
             if not validation_success:
                 logger.warning(f"Validation failed: {validation_error}")
                 # Still return the raw data even if validation fails
@@ -197,6 +203,92 @@ def extract_json_from_text(text: str, validate: bool = True) -> ExtractionResult
         )
 
 
+class StreamingJSONScanner:
+    """
+    Emits the objects of a JSON array as soon as each one closes
+
+    Text is fed in chunks as it streams from the model. The scanner skips
+    prose until it sees an array that opens with an object (``[`` followed by
+    ``{``), then tracks strings, escapes and brace depth so every element can
+    be parsed the moment its closing brace arrives. Elements that do not
+    parse are skipped; the full-text extractor remains the fallback for
+    responses the scanner cannot follow.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._state = "seek"  # seek -> array -> done
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = -1
+        self.objects_emitted = 0
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Add streamed text and return the array elements completed by it"""
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+        i = self._pos
+
+        while i < len(buffer) and self._state != "done":
+            if self._state == "seek":
+                bracket = buffer.find("[", i)
+                if bracket == -1:
+                    i = len(buffer)
+                    break
+                j = bracket + 1
+                while j < len(buffer) and buffer[j].isspace():
+                    j += 1
+                if j == len(buffer):
+                    # cannot tell yet whether this array holds objects
+                    i = bracket
+                    break
+                i = j if buffer[j] == "{" else bracket + 1
+                if buffer[j] == "{":
+                    self._state = "array"
+                continue
+
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._start >= 0:
+                    success, parsed, _ = parse_json_safely(buffer[self._start:i + 1])
+                    if success and isinstance(parsed, dict):
+                        completed.append(parsed)
+                        self.objects_emitted += 1
+                    self._start = -1
+            elif char == "]" and self._depth == 0:
+                self._state = "done"
+            i += 1
+
+        # drop text that can no longer be part of an element
+        keep_from = self._start if self._depth > 0 else i
+        self._buffer = buffer[keep_from:]
+        if self._depth > 0:
+            self._start = 0
+        self._pos = i - keep_from
+        return completed
+
+
 def convert_to_story_format(validated_data: List[StoryboardScreen]) -> List[Dict[str, Any]]:
     """Convert validated storyboard data to the format expected by frontend Story interface"""
     stories = []
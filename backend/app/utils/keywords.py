@@ -0,0 +1,53 @@
+"""
+Keyword normalization shared by image search, the query index and the image library
+
+Visual keywords are compared on their content terms only: lowercased, with
+stop words dropped and plurals folded to the singular, so "Upward arrows and
+a brand logo" and "brand logos, upward arrow" share the same terms.
+"""
+
+import re
+from typing import List
+
+# function words plus words that describe every image search rather than its subject
+STOP_WORDS = frozenset("""
+a an and are as at be by for from in into is it its of on or over the their this that to under up with
+showing shows image images picture photo photos shot view scene
+""".split())
+
+# irregular plurals that the suffix rules below would get wrong
+IRREGULAR_PLURALS = {
+    "people": "person", "men": "man", "women": "woman", "children": "child",
+    "mice": "mouse", "feet": "foot", "teeth": "tooth", "geese": "goose",
+}
+
+
+def singularize(word: str) -> str:
+    """Fold a plural noun to its singular with a few suffix rules"""
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "zes", "sses")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def keyword_terms(text: str) -> List[str]:
+    """Content terms of a text in order, repeats kept"""
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    return [singularize(w) for w in words if len(w) > 1 and w not in STOP_WORDS]
+
+
+def canonical_terms(query: str) -> List[str]:
+    """Sorted, de-duplicated content terms of a query"""
+    return sorted(set(keyword_terms(query)))
+
+
+def canonicalize(query: str) -> str:
+    """Canonical form of a visual keyword string; equal forms are treated as the same search"""
+    return " ".join(canonical_terms(query))
@@ -0,0 +1,363 @@
+"""
+Lightweight Prometheus-style metrics
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format by ``/metrics``. Every update is a dictionary lookup and a
+short critical section, so instrumentation can stay on under load.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 240.0, 360.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (1, 2, 4, 6, 8, 10, 15, 20, 30, 50)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels) -> Iterator[None]:
+        """Increment for the duration of a block"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # one slot per bucket plus +Inf, then sum and count
+                series = self._series[key] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[Dict[str, str]]:
+        """
+        Observe the duration of a block in seconds
+
+        Yields the label dictionary so the block can fill in labels that are
+        only known at the end, such as a status code.
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return int(series[-1]) if series else 0
+
+    def get_sum(self, **labels) -> float:
+        series = self._series.get(self._key(labels))
+        return series[-2] if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics by name and renders them together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "storyboard_http_request_duration_seconds", "Backend request latency by route",
+    labels=("method", "route", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "storyboard_http_requests_in_flight", "Requests currently being handled by route",
+    labels=("method", "route"),
+)
+HTTP_PAYLOAD_BYTES = REGISTRY.histogram(
+    "storyboard_http_payload_bytes", "Request and response body sizes by route",
+    labels=("route", "direction"), buckets=SIZE_BUCKETS,
+)
+UPSTREAM_DURATION = REGISTRY.histogram(
+    "storyboard_upstream_request_duration_seconds", "Latency of calls to Langflow and Google CSE",
+    labels=("upstream", "status"), buckets=UPSTREAM_BUCKETS,
+)
+UPSTREAM_PAYLOAD_BYTES = REGISTRY.histogram(
+    "storyboard_upstream_payload_bytes", "Bytes sent to and received from upstreams",
+    labels=("upstream", "direction"), buckets=SIZE_BUCKETS,
+)
+EXTRACTION_DURATION = REGISTRY.histogram(
+    "storyboard_extraction_duration_seconds", "Time spent extracting and validating storyboard JSON",
+    labels=("stage",),
+)
+CHAT_STREAM_FIRST_TOKEN = REGISTRY.histogram(
+    "storyboard_chat_stream_first_token_seconds", "Time from a /api/chat/stream request to its first answer token",
+    buckets=UPSTREAM_BUCKETS,
+)
+STORIES_PER_GENERATION = REGISTRY.histogram(
+    "storyboard_stories_per_generation", "Story screens saved per generated storyboard",
+    buckets=COUNT_BUCKETS,
+)
+STORY_WRITES = REGISTRY.counter(
+    "storyboard_story_writes_total", "Story screens by outcome when a storyboard is saved (unchanged screens are not rewritten)",
+    labels=("result",),
+)
+PROJECT_EVENT_SUBSCRIBERS = REGISTRY.gauge(
+    "storyboard_project_event_subscribers", "Open project event WebSocket connections",
+)
+PROJECT_EVENTS = REGISTRY.counter(
+    "storyboard_project_events_total", "Project events handed to WebSocket subscribers, or dropped for slow ones",
+    labels=("result",),
+)
+STORY_SEARCH_DURATION = REGISTRY.histogram(
+    "storyboard_story_search_duration_seconds", "Time spent answering full-text story and chat searches",
+)
+PROJECT_ARCHIVE_BYTES = REGISTRY.counter(
+    "storyboard_project_archive_bytes_total", "Bytes of project archives streamed out or unpacked on import",
+    labels=("direction",),
+)
+STORAGE_GC_RECLAIMED_BYTES = REGISTRY.counter(
+    "storyboard_storage_gc_reclaimed_bytes_total", "Bytes removed by the storage garbage collector by kind of garbage",
+    labels=("kind",),
+)
+STORAGE_IO_IN_FLIGHT = REGISTRY.gauge(
+    "storyboard_storage_io_in_flight", "Blocking file operations running or queued per storage pool",
+    labels=("pool",),
+)
+STORAGE_IO_WAIT = REGISTRY.histogram(
+    "storyboard_storage_io_wait_seconds", "Time file operations waited for a storage pool thread",
+    labels=("pool",),
+)
+CHAT_ADMISSION_RUNNING = REGISTRY.gauge(
+    "storyboard_chat_admission_running", "Chat turns admitted and running per upstream",
+    labels=("upstream",),
+)
+CHAT_ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "storyboard_chat_admission_queue_depth", "Chat turns waiting for an upstream slot",
+    labels=("upstream",),
+)
+CHAT_ADMISSION_WAIT = REGISTRY.histogram(
+    "storyboard_chat_admission_wait_seconds", "Time admitted chat turns waited for an upstream slot",
+    labels=("upstream",),
+)
+CHAT_ADMISSION_REJECTED = REGISTRY.counter(
+    "storyboard_chat_admission_rejected_total", "Chat turns turned away by reason (project_limit, queue_full, queue_timeout)",
+    labels=("upstream", "reason"),
+)
+IDEMPOTENT_REQUESTS = REGISTRY.counter(
+    "storyboard_idempotent_requests_total", "Requests with an Idempotency-Key by route and outcome (new, attached, replayed, conflict)",
+    labels=("route", "result"),
+)
+LANGFLOW_HOST_OUTSTANDING = REGISTRY.gauge(
+    "storyboard_langflow_host_outstanding", "Requests in flight per Langflow host",
+    labels=("host",),
+)
+LANGFLOW_CIRCUIT_STATE = REGISTRY.gauge(
+    "storyboard_langflow_circuit_state", "Circuit breaker state per Langflow host (0=closed, 1=half open, 2=open)",
+    labels=("host",),
+)
+LANGFLOW_HEDGED_REQUESTS = REGISTRY.counter(
+    "storyboard_langflow_hedged_requests_total", "Langflow requests duplicated on a second host",
+)
+LLM_ROUTED_REQUESTS = REGISTRY.counter(
+    "storyboard_llm_routed_requests_total", "LLM router attempts by provider, request kind and result",
+    labels=("provider", "kind", "result"),
+)
+LLM_PROVIDER_IN_FLIGHT = REGISTRY.gauge(
+    "storyboard_llm_provider_in_flight", "Requests in flight per LLM provider",
+    labels=("provider",),
+)
+IMAGE_SEARCH_QUERIES = REGISTRY.counter(
+    "storyboard_image_search_queries_total", "Image searches by provider, query ladder rung and whether a usable image came back",
+    labels=("provider", "rung", "result"),
+)
+IMAGE_SEARCHES_AVOIDED = REGISTRY.counter(
+    "storyboard_image_searches_avoided_total", "Image searches answered from an earlier exact or similar query",
+    labels=("match",),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "storyboard_cache_requests_total", "Cache lookups by cache and result",
+    labels=("cache", "result"),
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """Count one cache lookup"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def route_template(scope) -> str:
+    """Resolve the templated route path (``/api/project/{project_id}``) so labels stay low-cardinality"""
+    from starlette.routing import Match
+
+    app = scope.get("app")
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and body sizes per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        state = {"status": 500, "request_bytes": 0, "response_bytes": 0}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["request_bytes"] += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["response_bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.inc(method=method, route=route)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec(method=method, route=route)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, method=method, route=route, status=state["status"])
+            if state["request_bytes"]:
+                HTTP_PAYLOAD_BYTES.observe(state["request_bytes"], route=route, direction="request")
+            HTTP_PAYLOAD_BYTES.observe(state["response_bytes"], route=route, direction="response")
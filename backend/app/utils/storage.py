@@ -0,0 +1,28 @@
+"""Locations of project data on disk"""
+
+from pathlib import Path
+
+from config.settings import get_settings
+
+DEFAULT_DATA_DIR = Path(__file__).parent.parent.parent.parent / "data"
+
+
+def get_data_dir() -> Path:
+    """
+    Return the root directory that holds all project folders
+
+    Defaults to the repository's ``data/`` folder and can be pointed elsewhere
+    with ``STORYBOARD_DATA_DIR`` (load tests and benchmarks use scratch trees).
+    Read from the settings snapshot, so it costs no environment lookup.
+    """
+    return get_settings().storage.data_dir or DEFAULT_DATA_DIR
+
+
+def get_project_dir(project_id: str) -> Path:
+    """Return the folder for one project"""
+    return get_data_dir() / f"project_{project_id}"
+
+
+def project_id_of(project_dir: Path) -> str:
+    """Project id for a folder returned by ``get_project_dir``"""
+    return Path(project_dir).name[len("project_"):]
@@ -0,0 +1,145 @@
+"""
+Blocking filesystem work for async endpoints
+
+Handlers in ``app/main.py`` run on the event loop thread, so an ``open`` or
+``json.load`` there on a slow disk or a large chat file stalls every other
+request. ``read`` and ``write`` hand a blocking callable to one of two
+bounded thread pools and await it:
+
+    project = await storage_io.read(load_project, project_dir)
+    await storage_io.write(write_json, chat_file, data)
+
+Reads and writes have separate limits (``STORAGE_IO_READ_WORKERS``,
+``STORAGE_IO_WRITE_WORKERS``) so a burst of saves cannot starve project
+loads, and neither can take over the default executor that chat turns and
+image rendering use. Work beyond the limit waits in the pool's queue. A
+limit of 0 runs that kind of work inline on the event loop, as before.
+
+Writes from different pool threads may now overlap with reads of the same
+file, so files are replaced atomically with ``write_json``.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from app.utils.metrics import STORAGE_IO_IN_FLIGHT, STORAGE_IO_WAIT
+from config.settings import get_settings
+
+T = TypeVar("T")
+
+READ = "read"
+WRITE = "write"
+
+
+def read_json(path: Path) -> Any:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_bytes(path: Path, data: bytes):
+    """Replace a file so concurrent readers see the old or the new content, never a partial one"""
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_json(path: Path, data: Any, indent: Optional[int] = 2):
+    """Write JSON atomically (see ``write_bytes``)"""
+    write_bytes(path, json.dumps(data, indent=indent).encode("utf-8"))
+
+
+class StorageIO:
+    """Separate bounded thread pools for file reads and writes"""
+
+    def __init__(self, read_workers: int, write_workers: int):
+        self.limits = {READ: read_workers, WRITE: write_workers}
+        self._executors = {
+            kind: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"storage-{kind}")
+            for kind, workers in self.limits.items() if workers > 0
+        }
+        self._lock = threading.Lock()
+        self._submitted = {READ: 0, WRITE: 0}
+        self._running = {READ: 0, WRITE: 0}
+
+    async def run(self, kind: str, func: Callable[..., T], *args, **kwargs) -> T:
+        executor = self._executors.get(kind)
+        if executor is None:
+            return func(*args, **kwargs)
+        call = partial(func, *args, **kwargs)
+        queued_at = time.perf_counter()
+
+        def run_in_pool():
+            STORAGE_IO_WAIT.observe(time.perf_counter() - queued_at, pool=kind)
+            with self._lock:
+                self._running[kind] += 1
+            try:
+                return call()
+            finally:
+                with self._lock:
+                    self._running[kind] -= 1
+
+        with self._lock:
+            self._submitted[kind] += 1
+        STORAGE_IO_IN_FLIGHT.inc(pool=kind)
+        try:
+            # the copied context carries the request's trace span into the pool thread
+            return await asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, run_in_pool)
+        finally:
+            with self._lock:
+                self._submitted[kind] -= 1
+            STORAGE_IO_IN_FLIGHT.dec(pool=kind)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                kind: {
+                    "workers": self.limits[kind],
+                    "running": self._running[kind],
+                    "queued": self._submitted[kind] - self._running[kind],
+                }
+                for kind in (READ, WRITE)
+            }
+
+    def shutdown(self, wait: bool = True):
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
+
+
+_storage_io: Optional[StorageIO] = None
+_storage_io_lock = threading.Lock()
+
+
+def get_storage_io() -> StorageIO:
+    """Shared pools; rebuilt when a worker limit changes"""
+    global _storage_io
+    settings = get_settings().storage
+    limits = {READ: settings.io_read_workers, WRITE: settings.io_write_workers}
+    storage_io = _storage_io
+    if storage_io is None or storage_io.limits != limits:
+        with _storage_io_lock:
+            if _storage_io is None or _storage_io.limits != limits:
+                if _storage_io is not None:
+                    _storage_io.shutdown(wait=False)
+                _storage_io = StorageIO(limits[READ], limits[WRITE])
+            storage_io = _storage_io
+    return storage_io
+
+
+async def read(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run blocking filesystem reads in the read pool"""
+    return await get_storage_io().run(READ, func, *args, **kwargs)
+
+
+async def write(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run blocking filesystem writes (and read-modify-write sequences) in the write pool"""
+    return await get_storage_io().run(WRITE, func, *args, **kwargs)
@@ -0,0 +1,261 @@
+"""
+Lightweight request tracing
+
+Spans are opened with ``tracer.span(name)`` and nest through a context
+variable, so every stage of a request shares one trace id. Finished spans go
+to an in-memory ring buffer (served by ``/api/traces``) and optionally to a
+JSONL file for offline per-stage latency breakdowns. Trace ids are taken from
+and passed on in W3C ``traceparent`` headers.
+"""
+
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.utils.metrics import route_template
+from config.settings import config_service, get_settings
+
+
+def _new_id(num_bytes: int) -> str:
+    return secrets.token_hex(num_bytes)
+
+
+class Span:
+    """One timed stage of a trace"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_time", "end_time", "attributes", "status", "_start")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Dict[str, Any] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.end_time is None:
+            self.end_time = self.start_time + (time.perf_counter() - self._start)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_time if self.end_time is not None else time.time()
+        return (end - self.start_time) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class RingBufferExporter:
+    """Keeps the most recent finished spans in memory"""
+
+    def __init__(self, capacity: int = 4096):
+        self._spans = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self._spans.append(span.to_dict())
+
+    def spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class JsonlExporter:
+    """Appends finished spans to a JSONL file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Creates nested spans and hands finished ones to the exporters"""
+
+    def __init__(self, exporters: List[Any] = None, enabled: bool = True):
+        self.exporters = list(exporters or [])
+        self.enabled = enabled
+
+    @contextmanager
+    def span(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+        """
+        Time a block as a child of the current span
+
+        Args:
+            name: Stage name, such as ``langflow.post``
+            trace_id: Start or join this trace instead of the current one
+            parent_id: Remote parent span id (from an incoming traceparent)
+            **attributes: Initial span attributes
+        """
+        parent = _current_span.get()
+        if trace_id is None:
+            trace_id = parent.trace_id if parent else _new_id(16)
+        if parent_id is None and parent is not None:
+            parent_id = parent.span_id
+
+        span = Span(name, trace_id, parent_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = repr(e)
+            raise
+        finally:
+            span.end()
+            _current_span.reset(token)
+            if self.enabled:
+                for exporter in self.exporters:
+                    exporter.export(span)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def trace_headers() -> Dict[str, str]:
+    """Headers that carry the current trace to an upstream call"""
+    span = _current_span.get()
+    if span is None:
+        return {}
+    return {"traceparent": f"00-{span.trace_id}-{span.span_id}-01"}
+
+
+def parse_traceparent(header: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Return (trace_id, parent_span_id) from a W3C traceparent header, or (None, None)"""
+    if not header:
+        return None, None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None, None
+    return parts[1], parts[2]
+
+
+def group_traces(spans: List[Dict[str, Any]], limit: int = 20) -> List[Dict[str, Any]]:
+    """Summarize the most recent traces, newest first"""
+    traces: Dict[str, Dict[str, Any]] = {}
+    for span in spans:
+        trace = traces.setdefault(span["trace_id"], {"trace_id": span["trace_id"], "spans": 0, "root": None})
+        trace["spans"] += 1
+        if trace["root"] is None or span["start_time"] < trace["root"]["start_time"]:
+            trace["root"] = span
+
+    summaries = [
+        {
+            "trace_id": trace_id,
+            "name": trace["root"]["name"],
+            "start_time": trace["root"]["start_time"],
+            "duration_ms": trace["root"]["duration_ms"],
+            "status": trace["root"]["status"],
+            "spans": trace["spans"],
+        }
+        for trace_id, trace in traces.items()
+    ]
+    summaries.sort(key=lambda t: t["start_time"], reverse=True)
+    return summaries[:limit]
+
+
+def stage_breakdown(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Count, mean, p50, p95 and max duration per span name"""
+    durations: Dict[str, List[float]] = {}
+    for span in spans:
+        durations.setdefault(span["name"], []).append(span["duration_ms"])
+
+    breakdown = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        breakdown[name] = {
+            "count": len(values),
+            "mean_ms": round(sum(values) / len(values), 3),
+            "p50_ms": values[(len(values) - 1) // 2],
+            "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max_ms": values[-1],
+        }
+    return breakdown
+
+
+_tracing_settings = get_settings().tracing
+ring_buffer = RingBufferExporter(_tracing_settings.buffer_size)
+_exporters: List[Any] = [ring_buffer]
+if _tracing_settings.jsonl_path:
+    _exporters.append(JsonlExporter(_tracing_settings.jsonl_path))
+
+tracer = Tracer(_exporters, enabled=_tracing_settings.enabled)
+
+
+def _apply_tracing_settings(settings):
+    # buffer size and JSONL path take effect on restart; the on/off switch applies immediately
+    tracer.enabled = settings.tracing.enabled
+
+
+config_service.subscribe(_apply_tracing_settings)
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a root span per request and returning its trace id"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+
+        name = f"{scope['method']} {route_template(scope)}"
+        with tracer.span(name, trace_id=trace_id, parent_id=parent_id, **{"http.path": scope["path"]}) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status", message["status"])
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-trace-id", span.trace_id.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -1,16 +1,17 @@
 import os
 import json
 from pathlib import Path
-from typing import Dict, Any, List
-from dotenv import load_dotenv
-
-load_dotenv()
+from typing import Dict, Any, List, Mapping
 
 class ConfigLoader:
-    def __init__(self, config_path: str = None):
+    def __init__(self, config_path: str = None, env: Mapping[str, str] = None, strict: bool = True):
         if config_path is None:
             config_path = Path(__file__).parent / "llm_config.json"
         self.config_path = config_path
+        # Variables for ENV: references; the settings service passes os.environ merged with .env
+        self.env = env if env is not None else os.environ
+        # Non-strict loading leaves missing variables as None instead of failing the whole file
+        self.strict = strict
         self.config = self.load_config()
 
     def load_config(self) -> Dict[str, Any]:
@@ -27,8 +28,8 @@ class ConfigLoader:
             return [self._replace_env_variables(item) for item in obj]
         elif isinstance(obj, str) and obj.startswith("ENV:"):
             env_var_name = obj[4:]
-            env_value = os.getenv(env_var_name)
-            if env_value is None:
+            env_value = self.env.get(env_var_name)
+            if env_value is None and self.strict:
                 raise ValueError(f"Environment variable {env_var_name} not found. Please set it in your .env file.")
             return env_value
         else:
@@ -60,5 +61,7 @@ class ConfigLoader:
 
 
 def get_llm_config():
-    loader = ConfigLoader()
-    return loader.get_llm_config()
\ No newline at end of file
+    """LLM config from the cached settings snapshot, without re-reading the file"""
+    from config.settings import get_settings
+
+    return get_settings().llm.as_llm_config()
\ No newline at end of file
@@ -0,0 +1,442 @@
+"""
+Typed configuration snapshot for the backend
+
+Settings are assembled once from built-in defaults, the tunable sections of
+``llm_config.json`` and the environment (``backend/.env`` overlaid by the
+process environment, which wins). The result is an immutable ``Settings``
+object that hot paths read with ``get_settings()`` - a plain attribute read,
+no file or environment access.
+
+``config_service.reload()`` (called by the file watcher or the admin endpoint)
+builds a new snapshot and swaps it in atomically; components that hold
+derived state, such as the Langflow pool, subscribe to be told about the swap.
+"""
+
+import inspect
+import logging
+import os
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Literal, Mapping, Optional, Tuple
+
+from dotenv import dotenv_values
+from pydantic import BaseModel, ConfigDict, Field
+
+from config.config_loader import ConfigLoader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = Path(__file__).parent / "llm_config.json"
+DEFAULT_ENV_FILE = Path(__file__).parent.parent / ".env"
+
+# Fields whose values are never returned by describe()
+SECRET_FIELDS = ("api_key", "search_engine_id")
+
+
+class _Section(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+
+class LangflowSettings(_Section):
+    api_key: Optional[str] = None
+    hosts: Tuple[str, ...] = ("localhost:7860",)
+    flow_id: str = "6bc20709-5eac-463b-b5e7-28388dd6e560"
+    timeout: float = 360.0
+    reuse_sessions: bool = True
+    session_ttl: float = 6 * 3600
+    breaker_failures: int = 3
+    breaker_reset: float = 30.0
+    hedge: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_delay: float = 5.0
+    # Stream run output (?stream=true) so screens are saved while the rest is still generating
+    stream: bool = False
+    # Seconds between SSE heartbeat comments on /api/chat/stream
+    stream_heartbeat: float = 15.0
+
+
+class ImageSearchSettings(_Section):
+    api_key: Optional[str] = None
+    search_engine_id: Optional[str] = None
+    timeout: float = 10.0
+    # Results requested per search (Custom Search returns at most 10 and bills per query)
+    num_results: int = 10
+    # Queries tried per screen, broadest keywords last, before giving up
+    max_queries: int = 3
+    # Reuse results of a past search whose canonical keywords are this similar (TF-IDF cosine)
+    reuse_similar: bool = True
+    reuse_threshold: float = 0.8
+    query_index_size: int = 5000
+    # Result links go stale, so indexed searches expire after this many seconds
+    query_index_ttl: float = 30 * 24 * 3600
+    # Local stock library: asked before Google ("first"), after it ("fallback") or not at all ("off")
+    library_mode: Literal["first", "fallback", "off"] = "first"
+    # None means a library/ folder inside the data directory
+    library_dir: Optional[Path] = None
+    # Share of the query's terms a library image must match to be returned
+    library_min_match: float = 0.5
+    # Save stories straight away and resolve their images in the background
+    deferred: bool = True
+    resolver_workers: int = 4
+
+
+class ImageProxySettings(_Section):
+    enabled: bool = True
+    # None means an images/ folder inside the data directory
+    cache_dir: Optional[Path] = None
+    max_bytes: int = 15 * 1024 * 1024
+    fetch_timeout: float = 10.0
+    widths: Tuple[int, ...] = (320, 640, 1280)
+    default_width: int = 640
+    webp_quality: int = 80
+    jpeg_quality: int = 82
+    workers: int = 2
+    cache_max_age: int = 365 * 24 * 3600
+
+
+class StorageSettings(_Section):
+    # None means the repository's data/ folder
+    data_dir: Optional[Path] = None
+    # Record each saved storyboard as a revision of content-addressed story blobs
+    revisions: bool = True
+    max_revisions: int = 200
+    # Full-text index of story and chat text for /api/search/stories
+    search_index: bool = True
+    # None means search.sqlite3 inside the data directory
+    search_index_path: Optional[Path] = None
+    # Garbage collection leaves files younger than this (seconds) and projects edited more recently alone
+    gc_min_age: float = 3600.0
+    # Projects without stories or chat messages are removed once untouched for this long
+    gc_empty_project_age: float = 7 * 24 * 3600.0
+    # Threads for blocking file reads and writes from async endpoints (0 runs them on the event loop)
+    io_read_workers: int = 8
+    io_write_workers: int = 4
+
+
+class DeploymentSettings(_Section):
+    # Several uvicorn/gunicorn worker processes share one data directory: project writes take
+    # file locks and caches are kept consistent through the shared cache database
+    multi_worker: bool = False
+    # None means .shared-cache.sqlite3 inside the data directory
+    shared_cache_path: Optional[Path] = None
+    # Seconds between checks for invalidations and events published by other workers
+    poll_interval: float = 0.25
+    # Seconds cross-worker messages are kept before they are pruned
+    message_retention: float = 600.0
+
+
+class AdmissionSettings(_Section):
+    # Admission control for /api/chat and /api/chat/stream turns
+    enabled: bool = True
+    # Turns running at once per Langflow host (the LLM router uses its providers' max_concurrency)
+    upstream_concurrency: int = 4
+    # Turns running or waiting at once per project (0 = no limit)
+    project_concurrency: int = 1
+    # Turns waiting for an upstream slot before new ones are turned away with 503
+    queue_size: int = 32
+    # Seconds a turn may wait for a slot before it is turned away with 503
+    max_queue_time: float = 20.0
+
+
+class IdempotencySettings(_Section):
+    # Idempotency-Key handling for /api/chat, /api/create-project and save-stories
+    enabled: bool = True
+    # Seconds a finished request's response is replayed for retries with the same key
+    ttl: float = 24 * 3600.0
+    # Finished keys kept per worker; the oldest are forgotten first
+    max_keys: int = 10000
+    # Seconds after which a run another worker claimed is presumed lost and started again
+    in_flight_timeout: float = 900.0
+
+
+class TracingSettings(_Section):
+    enabled: bool = True
+    buffer_size: int = 4096
+    jsonl_path: Optional[str] = None
+
+
+class RoutingSettings(_Section):
+    large_prompt_chars: int = 4000
+    queue_timeout: float = 10.0
+
+
+class LLMSettings(_Section):
+    chat_backend: str = "langflow"
+    config_list: Tuple[Dict[str, Any], ...] = ()
+    temperature: float = 0.1
+    cache_seed: int = 42
+    routing: RoutingSettings = RoutingSettings()
+
+    def as_llm_config(self) -> Dict[str, Any]:
+        """The ``get_llm_config()`` dictionary shape"""
+        return {
+            "config_list": [dict(entry) for entry in self.config_list],
+            "temperature": self.temperature,
+            "cache_seed": self.cache_seed,
+        }
+
+
+class Settings(_Section):
+    """One immutable configuration snapshot"""
+    version: int = 0
+    loaded_at: float = 0.0
+    config_path: str = ""
+    langflow: LangflowSettings = LangflowSettings()
+    image_search: ImageSearchSettings = ImageSearchSettings()
+    image_proxy: ImageProxySettings = ImageProxySettings()
+    storage: StorageSettings = StorageSettings()
+    deployment: DeploymentSettings = DeploymentSettings()
+    admission: AdmissionSettings = AdmissionSettings()
+    idempotency: IdempotencySettings = IdempotencySettings()
+    tracing: TracingSettings = TracingSettings()
+    llm: LLMSettings = LLMSettings()
+    watch_interval: float = Field(5.0, description="Seconds between config file checks; 0 disables the watcher")
+
+
+# Environment variable -> (section, field). Environment values override the config file.
+ENV_VARS = {
+    "LANGFLOW_API_KEY": ("langflow", "api_key"),
+    "LANGFLOW_FLOW_ID": ("langflow", "flow_id"),
+    "LANGFLOW_TIMEOUT": ("langflow", "timeout"),
+    "LANGFLOW_REUSE_SESSIONS": ("langflow", "reuse_sessions"),
+    "LANGFLOW_SESSION_TTL": ("langflow", "session_ttl"),
+    "LANGFLOW_BREAKER_FAILURES": ("langflow", "breaker_failures"),
+    "LANGFLOW_BREAKER_RESET": ("langflow", "breaker_reset"),
+    "LANGFLOW_HEDGE": ("langflow", "hedge"),
+    "LANGFLOW_HEDGE_PERCENTILE": ("langflow", "hedge_percentile"),
+    "LANGFLOW_HEDGE_MIN_DELAY": ("langflow", "hedge_min_delay"),
+    "LANGFLOW_STREAM": ("langflow", "stream"),
+    "LANGFLOW_STREAM_HEARTBEAT": ("langflow", "stream_heartbeat"),
+    "GOOGLE_CSE_API_KEY": ("image_search", "api_key"),
+    "SEARCH_ENGINE_ID": ("image_search", "search_engine_id"),
+    "IMAGE_SEARCH_TIMEOUT": ("image_search", "timeout"),
+    "IMAGE_SEARCH_RESULTS": ("image_search", "num_results"),
+    "IMAGE_SEARCH_MAX_QUERIES": ("image_search", "max_queries"),
+    "IMAGE_QUERY_REUSE": ("image_search", "reuse_similar"),
+    "IMAGE_QUERY_THRESHOLD": ("image_search", "reuse_threshold"),
+    "IMAGE_LIBRARY_MODE": ("image_search", "library_mode"),
+    "IMAGE_LIBRARY_DIR": ("image_search", "library_dir"),
+    "IMAGE_SEARCH_DEFERRED": ("image_search", "deferred"),
+    "IMAGE_RESOLVER_WORKERS": ("image_search", "resolver_workers"),
+    "IMAGE_PROXY_ENABLED": ("image_proxy", "enabled"),
+    "IMAGE_CACHE_DIR": ("image_proxy", "cache_dir"),
+    "IMAGE_PROXY_WORKERS": ("image_proxy", "workers"),
+    "STORYBOARD_DATA_DIR": ("storage", "data_dir"),
+    "STORY_REVISIONS": ("storage", "revisions"),
+    "STORY_MAX_REVISIONS": ("storage", "max_revisions"),
+    "STORY_SEARCH_INDEX": ("storage", "search_index"),
+    "STORY_SEARCH_INDEX_PATH": ("storage", "search_index_path"),
+    "STORAGE_GC_MIN_AGE": ("storage", "gc_min_age"),
+    "STORAGE_GC_EMPTY_PROJECT_AGE": ("storage", "gc_empty_project_age"),
+    "STORAGE_IO_READ_WORKERS": ("storage", "io_read_workers"),
+    "STORAGE_IO_WRITE_WORKERS": ("storage", "io_write_workers"),
+    "STORYBOARD_MULTI_WORKER": ("deployment", "multi_worker"),
+    "SHARED_CACHE_PATH": ("deployment", "shared_cache_path"),
+    "SHARED_CACHE_POLL_INTERVAL": ("deployment", "poll_interval"),
+    "CHAT_ADMISSION": ("admission", "enabled"),
+    "CHAT_UPSTREAM_CONCURRENCY": ("admission", "upstream_concurrency"),
+    "CHAT_PROJECT_CONCURRENCY": ("admission", "project_concurrency"),
+    "CHAT_QUEUE_SIZE": ("admission", "queue_size"),
+    "CHAT_MAX_QUEUE_TIME": ("admission", "max_queue_time"),
+    "IDEMPOTENCY_KEYS": ("idempotency", "enabled"),
+    "IDEMPOTENCY_TTL": ("idempotency", "ttl"),
+    "IDEMPOTENCY_MAX_KEYS": ("idempotency", "max_keys"),
+    "TRACING_ENABLED": ("tracing", "enabled"),
+    "TRACE_BUFFER_SIZE": ("tracing", "buffer_size"),
+    "TRACE_JSONL_PATH": ("tracing", "jsonl_path"),
+    "CHAT_BACKEND": ("llm", "chat_backend"),
+    "CONFIG_WATCH_INTERVAL": (None, "watch_interval"),
+}
+
+
+def read_env(env_file: Optional[Path] = None) -> Dict[str, str]:
+    """``.env`` values overlaid by the process environment"""
+    env_file = Path(env_file) if env_file else DEFAULT_ENV_FILE
+    values = {k: v for k, v in dotenv_values(env_file).items() if v is not None} if env_file.exists() else {}
+    values.update(os.environ)
+    return values
+
+
+def load_settings(config_path: Optional[str] = None, env: Optional[Mapping[str, str]] = None, version: int = 0) -> Settings:
+    """
+    Build a settings snapshot
+
+    Args:
+        config_path: LLM config file (default: LLM_CONFIG_PATH or config/llm_config.json)
+        env: Environment to read (default: backend/.env overlaid by os.environ)
+        version: Version number stamped on the snapshot
+
+    Raises:
+        ValueError: If the config file or a value is invalid
+    """
+    env = read_env() if env is None else env
+    config_path = config_path or env.get("LLM_CONFIG_PATH") or str(DEFAULT_CONFIG_PATH)
+    raw = ConfigLoader(config_path, env=env, strict=False).config
+
+    # Tunable sections in the config file come first, the environment overrides them
+    data: Dict[str, Any] = {section: dict(raw.get(section, {})) for section in ("langflow", "image_search", "image_proxy", "storage", "deployment", "admission", "idempotency", "tracing")}
+    data["llm"] = {
+        "chat_backend": raw.get("chat_backend", "langflow"),
+        "config_list": raw.get("config_list", []),
+        "temperature": raw.get("temperature", 0.1),
+        "cache_seed": raw.get("cache_seed", 42),
+        "routing": raw.get("routing", {}),
+    }
+    if "watch_interval" in raw:
+        data["watch_interval"] = raw["watch_interval"]
+
+    hosts = env.get("LANGFLOW_HOSTS") or env.get("LANGFLOW_HOST")
+    if hosts:
+        data["langflow"]["hosts"] = [h.strip() for h in hosts.split(",") if h.strip()]
+    for name, (section, field) in ENV_VARS.items():
+        if env.get(name) not in (None, ""):
+            (data[section] if section else data)[field] = env[name]
+
+    return Settings(version=version, loaded_at=time.time(), config_path=str(config_path), **data)
+
+
+def _redact(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: ("***" if v and (k in SECRET_FIELDS) else _redact(v)) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_redact(item) for item in obj]
+    return obj
+
+
+def _flatten(obj: Any, prefix: str = "") -> Dict[str, Any]:
+    if isinstance(obj, dict):
+        flat = {}
+        for key, value in obj.items():
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        return flat
+    return {prefix[:-1]: obj}
+
+
+class ConfigService:
+    """Holds the current settings snapshot and replaces it on reload"""
+
+    def __init__(self, config_path: Optional[str] = None, env_file: Optional[Path] = None):
+        self.config_path = config_path
+        self.env_file = env_file
+        self._snapshot: Optional[Settings] = None
+        self._lock = threading.Lock()
+        self._subscribers: List[Any] = []
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._mtimes: Dict[str, float] = {}
+
+    def get(self) -> Settings:
+        """Current snapshot; loaded on first use"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = load_settings(self.config_path, read_env(self.env_file), version=1)
+                    self._mtimes = self._watched_mtimes(self._snapshot)
+                snapshot = self._snapshot
+        return snapshot
+
+    def reload(self) -> Tuple[Settings, List[str]]:
+        """
+        Re-read the config file and environment and swap in a new snapshot
+
+        Returns:
+            The current snapshot and the dotted names of settings that changed
+
+        Raises:
+            ValueError: If the new configuration is invalid (the old snapshot stays)
+            OSError: If the config file cannot be read, e.g. while an editor
+                replaces it (the old snapshot stays)
+        """
+        with self._lock:
+            old = self._snapshot
+            new = load_settings(self.config_path, read_env(self.env_file), version=(old.version + 1) if old else 1)
+            self._mtimes = self._watched_mtimes(new)
+            changed = self._diff(old, new)
+            if old is not None and not changed:
+                return old, []
+            self._snapshot = new
+
+        logger.info(f"Loaded configuration v{new.version}; changed: {', '.join(changed) or 'none'}")
+        for callback in self._callbacks():
+            try:
+                callback(new)
+            except Exception as e:
+                logger.error(f"Config subscriber {callback} failed to apply v{new.version}: {e}")
+        return new, changed
+
+    def subscribe(self, callback: Callable[[Settings], None]):
+        """Call ``callback(settings)`` after each swap; bound methods are held weakly"""
+        ref = weakref.WeakMethod(callback) if inspect.ismethod(callback) else (lambda cb=callback: cb)
+        with self._lock:
+            self._subscribers.append(ref)
+
+    def _callbacks(self) -> List[Callable[[Settings], None]]:
+        with self._lock:
+            live = [(ref, ref()) for ref in self._subscribers]
+            self._subscribers = [ref for ref, callback in live if callback is not None]
+        return [callback for _, callback in live if callback is not None]
+
+    @staticmethod
+    def _diff(old: Optional[Settings], new: Settings) -> List[str]:
+        ignore = ("version", "loaded_at")
+        before = _flatten(old.model_dump(exclude=set(ignore))) if old else {}
+        after = _flatten(new.model_dump(exclude=set(ignore)))
+        return sorted(key for key in set(before) | set(after) if before.get(key) != after.get(key))
+
+    def _watched_mtimes(self, settings: Settings) -> Dict[str, float]:
+        paths = [settings.config_path, str(self.env_file or DEFAULT_ENV_FILE)]
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = 0.0
+        return mtimes
+
+    def check_for_changes(self) -> bool:
+        """Reload if a watched file changed since the last load"""
+        current = self.get()
+        if self._watched_mtimes(current) == self._mtimes:
+            return False
+        try:
+            self.reload()
+        except (ValueError, OSError) as e:
+            logger.error(f"Ignoring invalid configuration change: {e}")
+            self._mtimes = self._watched_mtimes(current)
+        return True
+
+    def start_watcher(self):
+        """Poll the config file and .env every ``watch_interval`` seconds in a daemon thread"""
+        if self._watcher is not None or self.get().watch_interval <= 0:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.get().watch_interval or 5.0):
+                try:
+                    self.check_for_changes()
+                except Exception:
+                    # a failed check must not stop later changes from being picked up
+                    logger.exception("Configuration check failed")
+
+        self._watcher = threading.Thread(target=run, name="config-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        self._watcher = None
+
+    def describe(self) -> Dict[str, Any]:
+        """Current snapshot with secrets redacted"""
+        return _redact(self.get().model_dump(mode="json"))
+
+
+config_service = ConfigService()
+
+
+def get_settings() -> Settings:
+    """Current configuration snapshot"""
+    return config_service.get()
@@ -0,0 +1,43 @@
+"""
+Shared fixtures for the backend test suite
+"""
+import importlib
+from pathlib import Path
+from typing import Optional
+import pytest
+from fastapi.testclient import TestClient
+from config.settings import config_service, load_settings
+
+
+@pytest.fixture
+def configure(monkeypatch, tmp_path):
+    """
+    Load a settings snapshot for a scratch data directory (``tmp_path`` unless
+    given) with the image proxy off; keyword arguments set further environment
+    variables. Returns the data directory; call it again to change settings.
+    """
+    def configure(data_dir: Optional[Path] = None, **env: str) -> Path:
+        data_dir = data_dir or tmp_path
+        env = {"STORYBOARD_DATA_DIR": str(data_dir), "LANGFLOW_API_KEY": "test-key", "IMAGE_PROXY_ENABLED": "false", **env}
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setattr(config_service, "_snapshot", load_settings())
+        return data_dir
+
+    return configure
+
+
+@pytest.fixture
+def make_client():
+    """Create a client for the app; call it once the settings are configured"""
+    def make_client() -> TestClient:
+        return TestClient(importlib.import_module("app.main").app)
+
+    return make_client
+
+
+@pytest.fixture
+def app_env(configure, make_client):
+    """The default configuration and a client for it, as (data_dir, client)"""
+    data_dir = configure()
+    return data_dir, make_client()
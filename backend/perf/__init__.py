@@ -0,0 +1 @@
+"""Performance tooling: a local Langflow stand-in, load tests and benchmarks"""
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+In-process benchmarks for every endpoint in ``app/main.py``
+
+Builds (or reuses) a synthetic data tree, points the app at it with
+``STORYBOARD_DATA_DIR``, answers Langflow and Google CSE calls locally and
+times each endpoint through FastAPI's test client. Results can be saved as a
+JSON baseline and compared against a previous one; regressions beyond the
+threshold make the script exit non-zero.
+
+Usage:
+    python -m perf.bench_endpoints --scale small --save perf/baselines/small.json
+    python -m perf.bench_endpoints --scale small --compare perf/baselines/small.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from unittest.mock import patch
+
+import requests
+
+from perf.langflow_stub import SAMPLE_TEXT, build_response
+from perf.report import summarize_latencies, format_table
+from perf.synthetic_data import SCALES, generate_data_tree
+
+CSE_ITEMS = [
+    {
+        "title": f"Stock image {i} with a reasonably long descriptive title",
+        "link": f"https://images.example.com/{i}.jpg",
+        "displayLink": "images.example.com",
+        "mime": "image/jpeg",
+        "fileFormat": "image/jpeg",
+        "image": {"contextLink": "https://example.com", "height": 720, "width": 1280, "byteSize": 150000,
+                  "thumbnailLink": f"https://images.example.com/{i}_thumb.jpg", "thumbnailHeight": 90, "thumbnailWidth": 160},
+    }
+    for i in range(3)
+]
+
+
+def _json_response(data: dict, status_code: int = 200) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(data).encode("utf-8")
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def solid_png(width: int = 1280, height: int = 720, rgb=(40, 90, 160)) -> bytes:
+    """A single-colour PNG, built without Pillow, standing in for origin images"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes(rgb) * width
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(row * height)) + chunk(b"IEND", b"")
+
+
+def _image_response(data: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response._content = data
+    response._content_consumed = True
+    response.headers["Content-Type"] = "image/png"
+    return response
+
+
+@contextmanager
+def stubbed_upstreams():
+    """Answer Langflow and Google Custom Search calls in-process"""
+    def fake_post(url, data=None, **kwargs):
+        payload = kwargs.get("json") or (json.loads(data) if data else {})
+        session_id = payload.get("session_id") or "bench"
+        return _json_response(build_response(SAMPLE_TEXT, session_id, payload.get("input_value", "")))
+
+    origin_image = solid_png()
+
+    def fake_get(url, params=None, timeout=None, **kwargs):
+        if url.startswith("https://images.example.com/"):
+            return _image_response(origin_image)
+        return _json_response({"items": CSE_ITEMS})
+
+    with patch("app.services.chatbot.requests.post", fake_post), \
+            patch("app.utils.image_search.requests.get", fake_get):
+        yield
+
+
+def load_app(data_dir: Path):
+    """Import the FastAPI app configured for a scratch data directory"""
+    os.environ["STORYBOARD_DATA_DIR"] = str(data_dir)
+    os.environ.setdefault("LANGFLOW_API_KEY", "bench")
+    os.environ.setdefault("GOOGLE_CSE_API_KEY", "bench")
+    os.environ.setdefault("SEARCH_ENGINE_ID", "bench")
+    from config.settings import config_service
+    config_service.reload()
+    if "app.main" in sys.modules:
+        return importlib.reload(sys.modules["app.main"]).app
+    return importlib.import_module("app.main").app
+
+
+class EndpointBenchmark:
+    """Times each endpoint against a data tree"""
+
+    def __init__(self, client, data_dir: Path, seed: int = 42):
+        self.client = client
+        self.data_dir = Path(data_dir)
+        self.rng = random.Random(seed)
+        self.project_ids = sorted(p.name[len("project_"):] for p in self.data_dir.glob("project_*"))
+        if not self.project_ids:
+            raise ValueError(f"No projects found in {self.data_dir}")
+        self.chat_messages = self._load_chat(self.project_ids[0])
+        self.stories = self._load_stories()
+        self._counter = 0
+
+    def _load_chat(self, project_id: str) -> List[dict]:
+        chat_file = self.data_dir / f"project_{project_id}" / "chat_history.json"
+        if not chat_file.exists():
+            return []
+        with open(chat_file, "r") as f:
+            return json.load(f).get("messages", [])
+
+    def _load_stories(self) -> List[dict]:
+        for project_id in self.project_ids:
+            data = self.client.get(f"/api/project/{project_id}").json()
+            if data.get("stories"):
+                return data["stories"]
+        return []
+
+    def _unique_id(self) -> str:
+        self._counter += 1
+        return f"bench_{int(time.time() * 1000)}_{self._counter}"
+
+    def _scratch_project(self) -> str:
+        project_id = self._unique_id()
+        self.client.post("/api/create-project", json={
+            "projectId": project_id, "typeId": 1, "typeName": "Product Release Video", "userInput": "Benchmark brief",
+        })
+        return project_id
+
+    def cases(self) -> Dict[str, Callable[[], object]]:
+        """Map of endpoint name to a callable that issues one request"""
+        from app.services.image_proxy import get_image_proxy
+        from app.services.story_search import get_story_search
+
+        chat_project = self._scratch_project()
+        stories_project = self._scratch_project()
+        pick = lambda: self.rng.choice(self.project_ids)
+        image_hash = get_image_proxy().fetch(CSE_ITEMS[0]["link"]).hash
+        # render the panel variants now so worker start-up is not timed against other endpoints
+        for fmt in ("webp", "jpeg"):
+            get_image_proxy().variant(image_hash, None, fmt)
+        # index every project before timing searches
+        search = get_story_search()
+        if search is not None:
+            search.wait_for_backfill()
+        search_terms = [w for s in self.stories for w in str(s.get("voiceover_text", "")).split() if len(w) > 5] or ["brand"]
+
+        return {
+            "GET /": lambda: self.client.get("/"),
+            "GET /health": lambda: self.client.get("/health"),
+            "GET /api/test": lambda: self.client.get("/api/test"),
+            "POST /api/create-project": lambda: self.client.post("/api/create-project", json={
+                "projectId": self._unique_id(), "typeId": 1, "typeName": "Product Release Video", "userInput": "Brief",
+            }),
+            "GET /api/project/{id}": lambda: self.client.get(f"/api/project/{pick()}"),
+            "POST /api/chat": lambda: self.client.post("/api/chat", json={
+                "message": "Give me the storyboard as json",
+                "conversation_history": [{"role": m["role"], "content": m["content"]} for m in self.chat_messages[-5:]],
+                "project_id": chat_project,
+            }),
+            "GET /api/chat/langflow-stats": lambda: self.client.get("/api/chat/langflow-stats"),
+            "POST /api/chat/save": lambda: self.client.post("/api/chat/save", json={
+                "projectId": pick(), "messages": self.chat_messages,
+            }),
+            "GET /api/chat/history/{id}": lambda: self.client.get(f"/api/chat/history/{pick()}"),
+            "POST /api/search/images": lambda: self.client.post("/api/search/images", json={"query": "brand logos"}),
+            "GET /api/search/image": lambda: self.client.get("/api/search/image", params={"query": "brand logos"}),
+            "GET /api/search/stories": lambda: self.client.get("/api/search/stories", params={
+                "q": " ".join(self.rng.sample(search_terms, min(2, len(search_terms)))),
+            }),
+            "GET /api/images/{hash}": lambda: self.client.get(f"/api/images/{image_hash}", headers={"accept": "image/webp"}),
+            "POST /api/extract-json": lambda: self.client.post("/api/extract-json", json={"text": SAMPLE_TEXT}),
+            "POST /api/project/{id}/save-stories": lambda: self.client.post(
+                f"/api/project/{stories_project}/save-stories",
+                json={"project_id": stories_project, "stories": self.stories},
+            ),
+        }
+
+    def run(self, iterations: int = 50, warmup: int = 5, only: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+        from app.services.image_resolver import get_image_resolver
+
+        results = {}
+        for name, call in self.cases().items():
+            if only and not any(o in name for o in only):
+                continue
+            for _ in range(warmup):
+                call()
+            latencies, errors = [], 0
+            for _ in range(iterations):
+                start = time.perf_counter()
+                response = call()
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+                # background image resolution is not part of the request; keep it out of the next sample
+                get_image_resolver().drain()
+            results[name] = summarize_latencies(latencies, errors=errors)
+        return results
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                        threshold: float = 0.25, min_delta_ms: float = 0.5) -> List[str]:
+    """
+    List endpoints whose p50 or p95 regressed against a baseline
+
+    A regression needs to exceed both the relative threshold and an absolute
+    floor, so sub-millisecond noise on trivial endpoints does not trip it.
+    """
+    regressions = []
+    for name, row in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            old, new = base.get(metric, 0.0), row.get(metric, 0.0)
+            if new > old * (1 + threshold) and new - old > min_delta_ms:
+                regressions.append(f"{name} {metric}: {old:.3f} -> {new:.3f} ms (+{(new / old - 1) * 100 if old else 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend endpoints in-process")
+    parser.add_argument("--data-dir", help="Existing data tree to benchmark (default: generate one)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--projects", type=int)
+    parser.add_argument("--stories", type=int)
+    parser.add_argument("--chat-length", type=int)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="Substrings of endpoint names to run")
+    parser.add_argument("--save", help="Write results as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    spec = SCALES[args.scale].model_copy()
+    for field in ("projects", "stories", "chat_length"):
+        if getattr(args, field) is not None:
+            setattr(spec, field, getattr(args, field))
+
+    if args.data_dir:
+        data_dir = Path(args.data_dir)
+    else:
+        data_dir = Path(tempfile.mkdtemp(prefix="storyboard-bench-"))
+        summary = generate_data_tree(data_dir, spec)
+        print(f"Generated {summary['files']} files ({summary['bytes'] / 1e6:.1f} MB) in {data_dir}")
+
+    from fastapi.testclient import TestClient
+
+    with stubbed_upstreams():
+        client = TestClient(load_app(data_dir))
+        results = EndpointBenchmark(client, data_dir).run(args.iterations, args.warmup, args.only)
+
+    print()
+    print(format_table(results))
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "spec": spec.model_dump() if not args.data_dir else {"data_dir": str(data_dir)},
+                "iterations": args.iterations,
+                "results": results,
+            }, f, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
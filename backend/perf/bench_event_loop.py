@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Event loop lag under concurrent project loads
+
+Fires concurrent ``GET /api/project/{id}`` (and optionally chat saves) at the
+app in-process over ASGI while a ticker coroutine measures how late the event
+loop wakes it up. With file I/O on the loop (``STORAGE_IO_READ_WORKERS=0``)
+every load blocks the loop for its whole read, so loads serialize and the lag
+grows with the slowest file; with the storage pools the loop stays free and
+only the pools' limits bound concurrency. ``--disk-latency`` adds a blocking
+sleep to every ``open`` to stand in for a slow or network disk.
+
+Usage:
+    python -m perf.bench_event_loop --scale medium --concurrency 32 --requests 400
+    python -m perf.bench_event_loop --disk-latency 5 --modes inline pool
+"""
+
+import argparse
+import asyncio
+import builtins
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+from unittest.mock import patch
+
+import httpx
+
+from perf.bench_endpoints import load_app
+from perf.report import summarize_latencies, format_table
+from perf.synthetic_data import SCALES, generate_data_tree
+
+TICK = 0.005
+
+# mode name -> (read workers, write workers); 0 runs file work on the event loop
+MODES = {"inline": (0, 0), "pool": (8, 4)}
+
+
+@contextmanager
+def slow_disk(latency: float):
+    """Make every open() block for ``latency`` seconds before it returns"""
+    if latency <= 0:
+        yield
+        return
+    real_open = builtins.open
+
+    def slow_open(*args, **kwargs):
+        time.sleep(latency)
+        return real_open(*args, **kwargs)
+
+    with patch("builtins.open", slow_open):
+        yield
+
+
+async def measure_lag(stop: asyncio.Event, lags: List[float]):
+    """Record how much later than asked the loop resumes a short sleep"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, loop.time() - start - TICK))
+
+
+async def drive(app, project_ids: List[str], requests: int, concurrency: int, save_fraction: float, seed: int = 42) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(seed)
+    latencies: Dict[str, List[float]] = {"GET /api/project/{id}": [], "POST /api/chat/save": []}
+    errors = {name: 0 for name in latencies}
+    lags: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            project_id = rng.choice(project_ids)
+            async with semaphore:
+                start = time.perf_counter()
+                if rng.random() < save_fraction:
+                    name = "POST /api/chat/save"
+                    response = await client.post("/api/chat/save", json={"projectId": project_id, "messages": [
+                        {"id": f"bench-{i}", "role": "user", "content": "Shorter intro please", "createdAt": "2025-01-01T00:00:00"}]})
+                else:
+                    name = "GET /api/project/{id}"
+                    response = await client.get(f"/api/project/{project_id}")
+                latencies[name].append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors[name] += 1
+
+        stop = asyncio.Event()
+        ticker = asyncio.create_task(measure_lag(stop, lags))
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticker
+
+    results = {name: summarize_latencies(values, elapsed, errors[name]) for name, values in latencies.items() if values}
+    results["event loop lag"] = summarize_latencies(lags)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure event loop lag while projects load concurrently")
+    parser.add_argument("--data-dir", help="Existing data tree (default: generate one)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="medium")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--save-fraction", type=float, default=0.0, help="Share of requests that are chat saves")
+    parser.add_argument("--disk-latency", type=float, default=0.0, help="Milliseconds added to every open()")
+    parser.add_argument("--modes", nargs="*", choices=sorted(MODES), default=["inline", "pool"])
+    args = parser.parse_args()
+
+    if args.data_dir:
+        data_dir = Path(args.data_dir)
+    else:
+        data_dir = Path(tempfile.mkdtemp(prefix="storyboard-loop-"))
+        summary = generate_data_tree(data_dir, SCALES[args.scale])
+        print(f"Generated {summary['files']} files ({summary['bytes'] / 1e6:.1f} MB) in {data_dir}")
+    project_ids = sorted(p.name[len("project_"):] for p in data_dir.glob("project_*"))
+
+    os.environ["STORY_SEARCH_INDEX"] = "false"
+    os.environ["IMAGE_PROXY_ENABLED"] = "false"
+    results = {}
+    for mode in args.modes:
+        os.environ["STORAGE_IO_READ_WORKERS"], os.environ["STORAGE_IO_WRITE_WORKERS"] = map(str, MODES[mode])
+        app = load_app(data_dir)
+        with slow_disk(args.disk_latency / 1000):
+            for name, row in asyncio.run(drive(app, project_ids, args.requests, args.concurrency, args.save_fraction)).items():
+                results[f"{mode}: {name}"] = row
+
+    print()
+    print(format_table(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Langflow run API
+
+Serves ``POST /api/v1/run/{flow_id}`` with the same response shape as a real
+Langflow instance, so ``/api/chat`` can be exercised without network access or
+API keys. Responses are replayed from captured payloads (such as ``test.json``)
+or from a built-in storyboard, with configurable latency, error rate and
+token streaming (``?stream=true``). The same server also answers the OpenAI
+``/v1/chat/completions`` and Gemini ``generateContent`` routes so the LLM router
+can be pointed at it through ``base_url`` in an LLM config file.
+
+Usage:
+    python -m perf.langflow_stub --port 7861 --latency lognormal:1.5:0.4 --error-rate 0.02
+    LANGFLOW_HOST=localhost:7861 LANGFLOW_API_KEY=stub uvicorn app.main:app --port 8001
+"""
+
+import argparse
+import ast
+import asyncio
+import copy
+import itertools
+import json
+import random
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+
+SAMPLE_SCREENS = [
+    {
+        "screen_number": i + 1,
+        "voiceover_text": text,
+        "target_duration_sec": 8,
+        "screen_type": screen_type,
+        "on_screen_visual_keywords": keywords,
+        "action_notes": notes,
+    }
+    for i, (text, screen_type, keywords, notes) in enumerate([
+        ("Brands just got a powerful new tool to boost engagement.", "slides/text overlay",
+         "brand logos, upward arrow, dynamic background", "Bold text animation, energetic intro"),
+        ("Every business is fighting for attention, and plain SMS is not enough.", "stock video",
+         "busy city, people on phones, sms notifications", "Quick cuts, muted color palette"),
+        ("Verified senders put your brand right on the lock screen.", "screencast",
+         "phone lock screen, verified badge, branded message", "Zoom in on the badge"),
+        ("Rich cards, carousels and quick replies drive action.", "screencast",
+         "product carousel, quick reply buttons, smartphone", "Tap through the carousel"),
+        ("Customers respond four times more often than with SMS.", "slides/text overlay",
+         "bar chart, growth arrow, percentage", "Animate the chart"),
+        ("Start building today with zero code changes.", "cta",
+         "call to action button, brand logo, website url", "End card with CTA"),
+    ])
+]
+
+SAMPLE_TEXT = "Here's your storyboard:\n\n```json\n" + json.dumps(SAMPLE_SCREENS, indent=2) + "\n```\n\n" \
+    f"**Total screens:** {len(SAMPLE_SCREENS)}"
+
+
+class LatencyDistribution:
+    """
+    Samples simulated upstream latency in seconds
+
+    Specs look like ``const:0.5``, ``uniform:0.2:1.0``, ``normal:1.0:0.3`` or
+    ``lognormal:1.5:0.4`` (median and sigma). A bare number means constant.
+    """
+
+    def __init__(self, spec: str = "const:0"):
+        parts = spec.split(":")
+        if len(parts) == 1:
+            parts = ["const", parts[0]]
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        if self.kind not in ("const", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {self.kind}")
+        self.spec = spec
+
+    def sample(self) -> float:
+        if self.kind == "const":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = random.uniform(self.params[0], self.params[1])
+        elif self.kind == "normal":
+            value = random.gauss(self.params[0], self.params[1])
+        else:
+            value = random.lognormvariate(0, self.params[1]) * self.params[0]
+        return max(0.0, value)
+
+
+class StubConfig(BaseModel):
+    """Behaviour of the stub server"""
+    latency: str = "const:0"
+    error_rate: float = 0.0
+    error_status: int = 500
+    token_interval: float = 0.01
+    chunk_size: int = 40
+    replay: Optional[str] = None
+
+
+def build_response(text: str, session_id: str, input_value: str = "") -> Dict[str, Any]:
+    """Build a run response in the nested shape Langflow returns"""
+    message = {
+        "text_key": "text",
+        "text": text,
+        "sender": "Machine",
+        "sender_name": "AI",
+        "session_id": session_id,
+        "files": [],
+        "error": False,
+    }
+    return {
+        "session_id": session_id,
+        "outputs": [{
+            "inputs": {"input_value": input_value},
+            "outputs": [{
+                "results": {"message": message},
+                "artifacts": {"message": text, "sender": "Machine", "sender_name": "AI", "type": "object"},
+                "messages": [{"message": text, "sender": "Machine", "sender_name": "AI", "session_id": session_id}],
+                "component_display_name": "Chat Output",
+            }],
+        }],
+    }
+
+
+def load_replay_payloads(path: str) -> List[Dict[str, Any]]:
+    """
+    Load captured Langflow responses
+
+    Accepts a JSON file (one response or a list of them) or a log capture like
+    ``test.json`` where responses are printed as Python dict reprs, optionally
+    prefixed with ``Langflow response:``.
+    """
+    raw = Path(path).read_text()
+    try:
+        data = json.loads(raw)
+        return data if isinstance(data, list) else [data]
+    except json.JSONDecodeError:
+        pass
+
+    payloads = []
+    for line in raw.splitlines():
+        line = line.strip()
+        if line.startswith("Langflow response:"):
+            line = line[len("Langflow response:"):].strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            parsed = ast.literal_eval(line)
+        except (ValueError, SyntaxError):
+            continue
+        if isinstance(parsed, dict) and "outputs" in parsed:
+            payloads.append(parsed)
+    return payloads
+
+
+def response_text(payload: Dict[str, Any]) -> str:
+    """Pull the chat text out of a captured response for streaming"""
+    try:
+        return payload["outputs"][0]["outputs"][0]["results"]["message"]["text"]
+    except (KeyError, IndexError, TypeError):
+        return payload.get("text", "")
+
+
+def _with_session(obj: Any, session_id: str) -> Any:
+    """Rewrite every session_id in a captured payload to the caller's session"""
+    if isinstance(obj, dict):
+        return {k: session_id if k == "session_id" else _with_session(v, session_id) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_with_session(item, session_id) for item in obj]
+    return obj
+
+
+def create_app(config: StubConfig = None) -> FastAPI:
+    """Create the stub Langflow app"""
+    config = config or StubConfig()
+    latency = LatencyDistribution(config.latency)
+    payloads = load_replay_payloads(config.replay) if config.replay else []
+    replay_cycle = itertools.cycle(payloads) if payloads else None
+    stats = {"requests": 0, "errors": 0, "streams": 0, "bytes_received": 0}
+
+    app = FastAPI(title="Langflow stub")
+
+    def next_payload(session_id: str, input_value: str) -> Dict[str, Any]:
+        if replay_cycle is None:
+            return build_response(SAMPLE_TEXT, session_id, input_value)
+        return _with_session(copy.deepcopy(next(replay_cycle)), session_id)
+
+    @app.post("/api/v1/run/{flow_id}")
+    async def run_flow(flow_id: str, request: Request, stream: bool = False):
+        body = await request.body()
+        stats["requests"] += 1
+        stats["bytes_received"] += len(body)
+        payload = json.loads(body or b"{}")
+        session_id = payload.get("session_id") or flow_id
+        input_value = payload.get("input_value", "")
+
+        await asyncio.sleep(latency.sample())
+
+        if random.random() < config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(status_code=config.error_status, content={"detail": "stub injected error"})
+
+        result = next_payload(session_id, input_value)
+        if not stream:
+            return result
+
+        stats["streams"] += 1
+        text = response_text(result)
+        message_id = str(uuid.uuid4())
+
+        async def events():
+            yield json.dumps({"event": "add_message", "data": {"sender": "User", "text": input_value, "session_id": session_id}}) + "\n\n"
+            for i in range(0, len(text), config.chunk_size):
+                chunk = text[i:i + config.chunk_size]
+                yield json.dumps({"event": "token", "data": {"chunk": chunk, "id": message_id, "timestamp": time.time()}}) + "\n\n"
+                await asyncio.sleep(config.token_interval)
+            yield json.dumps({"event": "end", "data": {"result": result}}) + "\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def llm_reply(request: Request):
+        body = await request.body()
+        stats["requests"] += 1
+        stats["bytes_received"] += len(body)
+        await asyncio.sleep(latency.sample())
+        if random.random() < config.error_rate:
+            stats["errors"] += 1
+            return None
+        return response_text(next_payload("llm", ""))
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        text = await llm_reply(request)
+        if text is None:
+            return JSONResponse(status_code=config.error_status, content={"error": {"message": "stub injected error"}})
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]}
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini_generate(model_action: str, request: Request):
+        text = await llm_reply(request)
+        if text is None:
+            return JSONResponse(status_code=config.error_status, content={"error": {"message": "stub injected error"}})
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stub/stats")
+    async def get_stats():
+        return {"config": config.model_dump(), "replay_payloads": len(payloads), **stats}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Langflow stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--latency", default="const:0", help="const:S | uniform:LO:HI | normal:MEAN:SD | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--token-interval", type=float, default=0.01, help="Seconds between streamed chunks")
+    parser.add_argument("--chunk-size", type=int, default=40, help="Characters per streamed chunk")
+    parser.add_argument("--replay", help="Captured Langflow responses to replay (JSON or test.json-style log)")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = StubConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        token_interval=args.token_interval,
+        chunk_size=args.chunk_size,
+        replay=args.replay,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Load test for the storyboard backend
+
+Drives concurrent chat, project-load and chat-save traffic against a running
+backend and reports p50/p95/p99 latency and throughput per endpoint. With
+``--spawn`` it starts the Langflow stub and a backend on a scratch data
+directory itself, so runs need no network or real API keys.
+
+Usage:
+    python -m perf.load_test --spawn --concurrency 16 --duration 30
+    python -m perf.load_test --base-url http://localhost:8001 --mix chat=1,project=6,save=3
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+import requests
+
+from perf.report import summarize_latencies, format_table
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse an operation mix such as ``chat=1,project=6,save=3``"""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"chat", "project", "save"}
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def wait_for(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).ok:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+@contextmanager
+def spawn_stack(stub_port: int, backend_port: int, stub_args: List[str], workers: int = 1):
+    """Start the Langflow stub and a backend on a scratch data directory"""
+    data_dir = tempfile.mkdtemp(prefix="storyboard-loadtest-")
+    env = dict(os.environ)
+    env.update({
+        "LANGFLOW_HOST": f"127.0.0.1:{stub_port}",
+        "LANGFLOW_API_KEY": "stub",
+        "STORYBOARD_DATA_DIR": data_dir,
+    })
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "perf.langflow_stub", "--port", str(stub_port)] + stub_args,
+        cwd=BACKEND_DIR, env=env,
+    )
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(backend_port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{stub_port}/health")
+        wait_for(f"http://127.0.0.1:{backend_port}/health")
+        print(f"Spawned stub on :{stub_port} and backend on :{backend_port} (data dir {data_dir})")
+        yield f"http://127.0.0.1:{backend_port}"
+    finally:
+        for proc in (backend, stub):
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+class LoadTest:
+    """Runs a weighted mix of operations from a pool of worker threads"""
+
+    def __init__(self, base_url: str, mix: Dict[str, float], num_projects: int = 5, chat_length: int = 20):
+        self.base_url = base_url.rstrip("/")
+        self.mix = mix
+        self.num_projects = num_projects
+        self.chat_length = chat_length
+        self.project_ids: List[str] = []
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def setup(self):
+        """Create the projects the traffic is spread over"""
+        run_id = int(time.time() * 1000)
+        for i in range(self.num_projects):
+            project_id = f"loadtest_{run_id}_{i}"
+            response = self.session.post(f"{self.base_url}/api/create-project", json={
+                "projectId": project_id,
+                "typeId": 1,
+                "typeName": "Product Release Video",
+                "userInput": "Load test brief " * 200,
+            }, timeout=30)
+            response.raise_for_status()
+            self.project_ids.append(project_id)
+
+    def _messages(self, project_id: str) -> List[dict]:
+        return [
+            {
+                "id": f"msg-{i}",
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"Message {i} about the storyboard " * 20,
+                "createdAt": "2025-09-21T12:00:00",
+                "projectId": project_id,
+            }
+            for i in range(self.chat_length)
+        ]
+
+    def chat(self, project_id: str) -> requests.Response:
+        history = [{"role": m["role"], "content": m["content"]} for m in self._messages(project_id)[-5:]]
+        return self.session.post(f"{self.base_url}/api/chat", json={
+            "message": "Please give me the storyboard as json",
+            "conversation_history": history,
+            "project_id": project_id,
+        }, timeout=400)
+
+    def project(self, project_id: str) -> requests.Response:
+        return self.session.get(f"{self.base_url}/api/project/{project_id}", timeout=60)
+
+    def save(self, project_id: str) -> requests.Response:
+        return self.session.post(f"{self.base_url}/api/chat/save", json={
+            "projectId": project_id,
+            "messages": self._messages(project_id),
+        }, timeout=60)
+
+    def _record(self, operation: str, latency: float, ok: bool):
+        with self._lock:
+            self.latencies[operation].append(latency)
+            if not ok:
+                self.errors[operation] += 1
+
+    def _worker(self, deadline: float):
+        operations = list(self.mix)
+        weights = [self.mix[op] for op in operations]
+        while time.time() < deadline:
+            operation = random.choices(operations, weights)[0]
+            project_id = random.choice(self.project_ids)
+            start = time.perf_counter()
+            try:
+                ok = getattr(self, operation)(project_id).ok
+            except requests.exceptions.RequestException:
+                ok = False
+            self._record(operation, time.perf_counter() - start, ok)
+
+    def run(self, concurrency: int, duration: float) -> Dict[str, Dict[str, float]]:
+        """Run the mix for `duration` seconds and return per-endpoint summaries"""
+        if not self.project_ids:
+            self.setup()
+
+        start = time.perf_counter()
+        deadline = time.time() + duration
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(self._worker, deadline)
+        elapsed = time.perf_counter() - start
+
+        results = {
+            operation: summarize_latencies(self.latencies[operation], elapsed, self.errors[operation])
+            for operation in self.mix
+        }
+        all_latencies = [latency for values in self.latencies.values() for latency in values]
+        results["total"] = summarize_latencies(all_latencies, elapsed, sum(self.errors.values()))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the storyboard backend")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--spawn", action="store_true", help="Start the Langflow stub and a scratch backend")
+    parser.add_argument("--stub-port", type=int, default=7861)
+    parser.add_argument("--backend-port", type=int, default=8011)
+    parser.add_argument("--workers", type=int, default=1, help="Backend worker processes when spawning")
+    parser.add_argument("--stub-latency", default="lognormal:0.5:0.3", help="Latency spec passed to the stub")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of traffic")
+    parser.add_argument("--mix", default="chat=1,project=6,save=3")
+    parser.add_argument("--projects", type=int, default=5)
+    parser.add_argument("--chat-length", type=int, default=20, help="Messages per saved chat history")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    def run(base_url: str) -> Dict[str, Dict[str, float]]:
+        test = LoadTest(base_url, parse_mix(args.mix), num_projects=args.projects, chat_length=args.chat_length)
+        return test.run(args.concurrency, args.duration)
+
+    if args.spawn:
+        stub_args = ["--latency", args.stub_latency, "--error-rate", str(args.stub_error_rate)]
+        with spawn_stack(args.stub_port, args.backend_port, stub_args, workers=args.workers) as base_url:
+            results = run(base_url)
+    else:
+        results = run(args.base_url)
+
+    print(f"\nconcurrency={args.concurrency} duration={args.duration}s mix={args.mix}\n")
+    print(format_table(results))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Latency summaries shared by the load test and benchmark scripts"""
+
+import math
+from typing import Dict, List
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list
+
+    Args:
+        sorted_values: Values sorted in ascending order
+        pct: Percentile between 0 and 100
+
+    Returns:
+        The percentile value, or 0.0 for an empty list
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize_latencies(latencies: List[float], elapsed_sec: float = None, errors: int = 0) -> Dict[str, float]:
+    """
+    Summarize a list of latencies in seconds
+
+    Returns:
+        Dictionary with count, errors, mean/p50/p95/p99/max in milliseconds and,
+        when elapsed_sec is given, throughput in requests per second
+    """
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+    if elapsed_sec:
+        summary["throughput_rps"] = round(len(values) / elapsed_sec, 2)
+    return summary
+
+
+def format_table(results: Dict[str, Dict[str, float]]) -> str:
+    """Render per-endpoint summaries as a fixed-width text table"""
+    columns = ["count", "errors", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", "throughput_rps"]
+    columns = [c for c in columns if any(c in row for row in results.values())]
+    name_width = max([len("endpoint")] + [len(name) for name in results])
+
+    lines = ["endpoint".ljust(name_width) + "".join(c.rjust(16) for c in columns)]
+    for name, row in results.items():
+        lines.append(name.ljust(name_width) + "".join(str(row.get(c, "")).rjust(16) for c in columns))
+    return "\n".join(lines)
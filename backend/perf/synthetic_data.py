@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Synthetic ``data/`` trees for benchmarks
+
+Generates project folders with the same file layout and record shapes as the
+real ones (``project_type{n}.json``, ``story_{id}.json``, ``chat_history.json``),
+using the briefs, stories and chat turns found in the repository's ``data/``
+folder as templates and ``data/example`` for the video types.
+
+Usage:
+    python -m perf.synthetic_data --out /tmp/storyboard-data --projects 200 --stories 30 --chat-length 100
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+from app.utils.storage import DEFAULT_DATA_DIR
+from perf.langflow_stub import SAMPLE_SCREENS
+
+TYPE_NAMES = {1: "Product Release Video", 2: "How-to Demo", 3: "Knowledge Sharing"}
+
+
+class SyntheticDataSpec(BaseModel):
+    """Scale of a synthetic data tree"""
+    projects: int = 20
+    stories: int = 10
+    chat_length: int = 20
+    abandoned_fraction: float = 0.1  # projects with only a brief and chat, like several real ones
+    seed: int = 42
+
+
+SCALES = {
+    "small": SyntheticDataSpec(projects=20, stories=10, chat_length=20),
+    "medium": SyntheticDataSpec(projects=200, stories=30, chat_length=100),
+    "large": SyntheticDataSpec(projects=1000, stories=60, chat_length=400),
+}
+
+
+class Templates(BaseModel):
+    """Real records that synthetic ones are sampled from"""
+    briefs: List[str]
+    stories: List[dict]
+    chat_turns: List[dict]
+    type_ids: List[int]
+
+
+def load_templates(source_dir: Path = DEFAULT_DATA_DIR) -> Templates:
+    """Collect briefs, stories and chat turns from an existing data directory"""
+    briefs, stories, chat_turns = [], [], []
+
+    for project_dir in sorted(Path(source_dir).glob("project_*")):
+        for project_file in project_dir.glob("project_type*.json"):
+            with open(project_file, "r") as f:
+                user_input = json.load(f).get("userInput")
+            if user_input:
+                briefs.append(user_input)
+        for story_file in project_dir.glob("story_*.json"):
+            with open(story_file, "r") as f:
+                stories.append(json.load(f))
+        chat_file = project_dir / "chat_history.json"
+        if chat_file.exists():
+            with open(chat_file, "r") as f:
+                chat_turns.extend(json.load(f).get("messages", []))
+
+    type_ids = []
+    for example_file in sorted((Path(source_dir) / "example").glob("*.json")):
+        with open(example_file, "r") as f:
+            requirements = json.load(f).get("requirements", {})
+        if "type" in requirements:
+            type_ids.append(requirements["type"])
+            briefs.append(requirements.get("main_problem", ""))
+
+    return Templates(
+        briefs=[b for b in briefs if b] or ["Describe the product launch."],
+        stories=stories or [dict(s) for s in SAMPLE_SCREENS],
+        chat_turns=chat_turns or [{"role": "user", "content": "Make it shorter"}, {"role": "assistant", "content": "Done"}],
+        type_ids=type_ids or [1],
+    )
+
+
+def generate_data_tree(out_dir: Path, spec: SyntheticDataSpec, templates: Templates = None) -> Dict[str, int]:
+    """
+    Write a synthetic data tree
+
+    Args:
+        out_dir: Directory to create project folders in
+        spec: How many projects, stories per project and chat messages to write
+        templates: Records to sample from; loaded from the real data folder if omitted
+
+    Returns:
+        Summary with the number of projects, files and bytes written
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    templates = templates or load_templates()
+    rng = random.Random(spec.seed)
+    base_time = datetime(2025, 9, 21, 12, 0, 0)
+    files, total_bytes = 0, 0
+
+    def write(path: Path, data: dict):
+        nonlocal files, total_bytes
+        text = json.dumps(data, indent=2)
+        path.write_text(text)
+        files += 1
+        total_bytes += len(text)
+
+    for p in range(spec.projects):
+        project_id = str(1758482841697 + p * 1000)
+        project_dir = out_dir / f"project_{project_id}"
+        project_dir.mkdir(exist_ok=True)
+        type_id = rng.choice(templates.type_ids)
+        created = base_time + timedelta(minutes=p)
+
+        abandoned = rng.random() < spec.abandoned_fraction
+        story_names = []
+        if not abandoned:
+            first_story_id = int(created.timestamp())
+            for s in range(spec.stories):
+                story = dict(rng.choice(templates.stories))
+                story["screen_number"] = s + 1
+                story_name = f"story_{first_story_id + s}"
+                write(project_dir / f"{story_name}.json", story)
+                story_names.append(story_name)
+
+        project_data = {
+            "id": project_id,
+            "type": type_id,
+            "typeName": TYPE_NAMES.get(type_id, TYPE_NAMES[1]),
+            "userInput": rng.choice(templates.briefs),
+            "createdAt": created.isoformat(),
+            "storyboard": None,
+        }
+        if story_names:
+            project_data["stories"] = story_names
+            project_data["lastUpdated"] = created.timestamp() + 60
+        write(project_dir / f"project_type{type_id}.json", project_data)
+
+        messages = []
+        for m in range(spec.chat_length):
+            turn = rng.choice(templates.chat_turns)
+            messages.append({
+                "id": f"msg-{m}",
+                "role": "user" if m % 2 == 0 else "assistant",
+                "content": turn.get("content", ""),
+                "createdAt": (created + timedelta(seconds=m * 30)).isoformat(),
+            })
+        write(project_dir / "chat_history.json", {
+            "projectId": project_id,
+            "messages": messages,
+            "lastUpdated": (created + timedelta(seconds=spec.chat_length * 30)).isoformat(),
+        })
+
+    return {"projects": spec.projects, "files": files, "bytes": total_bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic data directory")
+    parser.add_argument("--out", required=True, help="Directory to write project folders to")
+    parser.add_argument("--scale", choices=sorted(SCALES), help="Preset scale (overridden by explicit counts)")
+    parser.add_argument("--projects", type=int)
+    parser.add_argument("--stories", type=int)
+    parser.add_argument("--chat-length", type=int)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    spec = SCALES[args.scale].model_copy() if args.scale else SyntheticDataSpec()
+    for field in ("projects", "stories", "chat_length", "seed"):
+        value = getattr(args, field)
+        if value is not None:
+            setattr(spec, field, value)
+
+    summary = generate_data_tree(Path(args.out), spec)
+    print(f"Wrote {summary['projects']} projects, {summary['files']} files, {summary['bytes'] / 1e6:.1f} MB to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
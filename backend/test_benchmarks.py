@@ -0,0 +1,58 @@
+"""
+Test suite for the synthetic data generator and benchmark helpers
+"""
+import json
+from perf.synthetic_data import SyntheticDataSpec, generate_data_tree, load_templates
+from perf.bench_endpoints import compare_to_baseline
+
+
+class TestSyntheticData:
+    """Test synthetic data trees"""
+
+    def test_layout_matches_real_projects(self, tmp_path):
+        spec = SyntheticDataSpec(projects=5, stories=4, chat_length=6, abandoned_fraction=0.0)
+        summary = generate_data_tree(tmp_path, spec)
+
+        projects = sorted(tmp_path.glob("project_*"))
+        assert len(projects) == 5
+        assert summary["files"] == 5 * (4 + 2)
+
+        project_dir = projects[0]
+        project_file = next(project_dir.glob("project_type*.json"))
+        project_data = json.loads(project_file.read_text())
+        assert len(project_data["stories"]) == 4
+        for story_name in project_data["stories"]:
+            story = json.loads((project_dir / f"{story_name}.json").read_text())
+            assert "voiceover_text" in story
+
+        chat = json.loads((project_dir / "chat_history.json").read_text())
+        assert len(chat["messages"]) == 6
+
+    def test_abandoned_projects_have_no_stories(self, tmp_path):
+        spec = SyntheticDataSpec(projects=3, stories=4, chat_length=2, abandoned_fraction=1.0)
+        generate_data_tree(tmp_path, spec)
+        assert not list(tmp_path.glob("project_*/story_*.json"))
+
+    def test_deterministic_for_seed(self, tmp_path):
+        templates = load_templates()
+        spec = SyntheticDataSpec(projects=2, stories=2, chat_length=2)
+        generate_data_tree(tmp_path / "a", spec, templates)
+        generate_data_tree(tmp_path / "b", spec, templates)
+        for path in (tmp_path / "a").rglob("*.json"):
+            assert path.read_text() == (tmp_path / "b" / path.relative_to(tmp_path / "a")).read_text()
+
+
+class TestCompareToBaseline:
+    """Test regression detection"""
+
+    def test_flags_slowdown(self):
+        baseline = {"GET /api/project/{id}": {"p50_ms": 2.0, "p95_ms": 4.0}}
+        results = {"GET /api/project/{id}": {"p50_ms": 5.0, "p95_ms": 4.1}}
+        regressions = compare_to_baseline(results, baseline)
+        assert len(regressions) == 1
+        assert "p50_ms" in regressions[0]
+
+    def test_ignores_sub_millisecond_noise(self):
+        baseline = {"GET /health": {"p50_ms": 0.2, "p95_ms": 0.3}}
+        results = {"GET /health": {"p50_ms": 0.5, "p95_ms": 0.6}}
+        assert compare_to_baseline(results, baseline) == []
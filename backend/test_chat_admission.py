@@ -0,0 +1,128 @@
+"""
+Test suite for chat admission control
+"""
+import asyncio
+import importlib
+import threading
+import pytest
+from fastapi.testclient import TestClient
+from app.services.chat_admission import AdmissionController, AdmissionRejected, PROJECT_LIMIT, QUEUE_FULL, QUEUE_TIMEOUT
+
+
+@pytest.fixture
+def admission_env(monkeypatch, configure):
+    configure(CHAT_QUEUE_SIZE="2", CHAT_MAX_QUEUE_TIME="0.2")
+    return monkeypatch
+
+
+async def rejection(awaitable) -> AdmissionRejected:
+    with pytest.raises(AdmissionRejected) as e:
+        await awaitable
+    return e.value
+
+
+class TestChatAdmission:
+    """Test slot limits, the bounded queue and the HTTP answers for refused turns"""
+
+    def test_waiting_turns_get_slots_in_arrival_order(self, admission_env):
+        async def scenario():
+            controller = AdmissionController()
+            first = await controller.admit("langflow", 1, "p1")
+            order = []
+
+            async def wait(project_id):
+                ticket = await controller.admit("langflow", 1, project_id)
+                order.append(project_id)
+                ticket.release()
+
+            waiting = [asyncio.create_task(wait("p2")), asyncio.create_task(wait("p3"))]
+            await asyncio.sleep(0.01)
+            stats = controller.get_stats()["upstreams"]["langflow"]
+            assert (stats["running"], stats["queued"]) == (1, 2)
+            first.release()
+            await asyncio.gather(*waiting)
+            return order, controller.get_stats()["upstreams"]["langflow"]
+
+        order, stats = asyncio.run(scenario())
+        assert order == ["p2", "p3"]
+        assert (stats["running"], stats["queued"], stats["admitted"]) == (0, 0, 3)
+
+    def test_full_queue_and_queue_timeout_are_refused(self, admission_env):
+        async def scenario():
+            controller = AdmissionController()
+            await controller.admit("langflow", 1, "p1")
+            waiting = [asyncio.create_task(controller.admit("langflow", 1, f"w{i}")) for i in range(2)]
+            await asyncio.sleep(0.01)
+            full = await rejection(controller.admit("langflow", 1, "late"))
+            timed_out = [await rejection(task) for task in waiting]
+            return full, timed_out, controller.get_stats()["upstreams"]["langflow"]
+
+        full, timed_out, stats = asyncio.run(scenario())
+        assert (full.reason, full.status_code) == (QUEUE_FULL, 503)
+        assert full.retry_after >= 1
+        assert [(e.reason, e.status_code) for e in timed_out] == [(QUEUE_TIMEOUT, 503)] * 2
+        assert stats["rejected"] == {PROJECT_LIMIT: 0, QUEUE_FULL: 1, QUEUE_TIMEOUT: 2}
+        assert (stats["running"], stats["queued"]) == (1, 0)
+
+    def test_second_turn_for_a_project_is_refused(self, admission_env):
+        async def scenario():
+            controller = AdmissionController()
+            ticket = await controller.admit("langflow", 4, "p1")
+            refused = await rejection(controller.admit("langflow", 4, "p1"))
+            other = await controller.admit("langflow", 4, "p2")
+            ticket.release()
+            again = await controller.admit("langflow", 4, "p1")
+            return refused, other, again
+
+        refused, other, again = asyncio.run(scenario())
+        assert (refused.reason, refused.status_code) == (PROJECT_LIMIT, 429)
+        assert not other.released and not again.released
+
+    def test_slot_is_held_until_the_turn_thread_finishes(self, admission_env):
+        finish = threading.Event()
+
+        async def scenario():
+            controller = AdmissionController()
+            ticket = await controller.admit("langflow", 1, "p1")
+            turn = asyncio.create_task(ticket.run(finish.wait, 5))
+            await asyncio.sleep(0.05)
+            # the client went away, but the upstream is still working on the turn
+            turn.cancel()
+            await asyncio.sleep(0.01)
+            held = controller.get_stats()["upstreams"]["langflow"]["running"]
+            finish.set()
+            for _ in range(50):
+                if ticket.released:
+                    break
+                await asyncio.sleep(0.01)
+            return held, controller.get_stats()["upstreams"]["langflow"]["running"]
+
+        assert asyncio.run(scenario()) == (1, 0)
+
+    def test_chat_endpoint_answers_429_with_retry_after(self, admission_env):
+        main = importlib.import_module("app.main")
+        admission_env.setattr(main, "chat_admission", AdmissionController())
+        started, finish = threading.Event(), threading.Event()
+
+        def generate_response(user_message, conversation_history=None, project_id=None, on_event=None, raise_errors=False):
+            started.set()
+            finish.wait(5)
+            return "Done"
+
+        admission_env.setattr(main.chatbot_service, "generate_response", generate_response)
+        client = TestClient(main.app)
+        first = {}
+        request = threading.Thread(target=lambda: first.update(response=client.post("/api/chat", json={"message": "hi", "project_id": "p1"})))
+        request.start()
+        assert started.wait(5)
+
+        refused = client.post("/api/chat", json={"message": "again", "project_id": "p1"})
+        stats = client.get("/api/chat/admission-stats").json()
+        finish.set()
+        request.join(5)
+
+        assert refused.status_code == 429
+        assert int(refused.headers["Retry-After"]) >= 1
+        assert stats["upstreams"]["langflow"]["running"] == 1
+        assert first["response"].json() == {"message": "Done", "success": True}
+        assert client.post("/api/chat", json={"message": "", "project_id": "p1"}).status_code == 400
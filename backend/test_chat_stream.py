@@ -0,0 +1,128 @@
+"""
+Test suite for the server-sent events chat endpoint
+"""
+import importlib
+import json
+import time
+import pytest
+import requests
+from app.services import image_query_index as index_module
+from app.services import langflow_pool
+from app.services.chatbot import StoryboardChatbot
+
+SCREENS = [
+    {"screen_number": 1, "voiceover_text": "Hello", "on_screen_visual_keywords": "office desk"},
+    {"screen_number": 2, "voiceover_text": "Bye", "on_screen_visual_keywords": "city skyline"},
+]
+TEXT = "Here you go:\n```json\n" + json.dumps(SCREENS) + "\n```\n"
+
+
+class StreamedResponse(requests.Response):
+    """A 200 response whose body lines come from a generator"""
+
+    def __init__(self, lines):
+        super().__init__()
+        self.status_code = 200
+        self._lines = lines
+
+    def iter_lines(self, *args, **kwargs):
+        for line in self._lines:
+            yield line.encode("utf-8")
+
+    def close(self):
+        pass
+
+
+def langflow_lines(text, delay=0.0):
+    time.sleep(delay)
+    for i in range(0, len(text), 25):
+        yield json.dumps({"event": "token", "data": {"chunk": text[i:i + 25]}})
+    yield json.dumps({"event": "end", "data": {"result": {"text": text}}})
+
+
+@pytest.fixture
+def stream_client(monkeypatch, tmp_path, configure, make_client):
+    configure(LANGFLOW_REUSE_SESSIONS="false", IMAGE_SEARCH_DEFERRED="false")
+    monkeypatch.setattr(index_module, "search_image_candidates", lambda query: [])
+    project_dir = tmp_path / "project_p1"
+    project_dir.mkdir()
+    (project_dir / "project_type1.json").write_text(json.dumps({"id": "p1", "stories": []}))
+
+    main = importlib.import_module("app.main")
+    monkeypatch.setattr(main, "chatbot_service", StoryboardChatbot())
+    return make_client(), project_dir
+
+
+def read_events(response):
+    """Parse an SSE body into (event, data) pairs, with heartbeats as ("heartbeat", None)"""
+    events, event = [], None
+    for line in response.iter_lines():
+        if line.startswith(":"):
+            events.append(("heartbeat", None))
+        elif line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+class TestChatStream:
+    """Test relaying a chat turn as server-sent events"""
+
+    def test_streams_tokens_screens_and_result(self, monkeypatch, stream_client):
+        client, project_dir = stream_client
+        calls = []
+
+        def fake_post(url, params=None, stream=False, **kwargs):
+            calls.append(params)
+            return StreamedResponse(langflow_lines(TEXT))
+
+        monkeypatch.setattr(langflow_pool.requests, "post", fake_post)
+
+        with client.stream("POST", "/api/chat/stream", json={"message": "storyboard json", "project_id": "p1"}) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = read_events(response)
+
+        names = [name for name, _ in events]
+        assert names[0] == "start" and names[-1] == "done"
+        assert calls == [{"stream": "true"}]  # streamed even though LANGFLOW_STREAM is off
+        assert "".join(data["chunk"] for name, data in events if name == "token") == TEXT
+        screens = [data for name, data in events if name == "screen"]
+        assert sorted(s["story"]["screen_number"] for s in screens) == [1, 2]
+        saved = next(data for name, data in events if name == "saved")
+        assert saved["stories"] == json.loads((project_dir / "project_type1.json").read_text())["stories"]
+        assert names.index("saved") > max(names.index("screen"), names.index("token"))
+        assert events[-1][1] == {"message": TEXT, "success": True}
+
+    def test_heartbeats_while_waiting(self, monkeypatch, stream_client, configure):
+        client, _ = stream_client
+        configure(LANGFLOW_STREAM_HEARTBEAT="0.05")
+        monkeypatch.setattr(langflow_pool.requests, "post",
+                            lambda url, **kwargs: StreamedResponse(langflow_lines("Just a short answer.", delay=0.3)))
+
+        with client.stream("POST", "/api/chat/stream", json={"message": "hello"}) as response:
+            events = read_events(response)
+
+        names = [name for name, _ in events]
+        assert names[0] == "start"
+        assert "heartbeat" in names[1:names.index("token")]
+        assert events[-1] == ("done", {"message": "Just a short answer.", "success": True})
+
+    def test_ai_failure_is_an_error_event(self, monkeypatch, stream_client):
+        client, _ = stream_client
+
+        def fake_post(url, **kwargs):
+            raise requests.exceptions.Timeout("read timed out")
+
+        monkeypatch.setattr(langflow_pool.requests, "post", fake_post)
+
+        with client.stream("POST", "/api/chat/stream", json={"message": "hello", "project_id": "p1"}) as response:
+            events = read_events(response)
+
+        assert [name for name, _ in events] == ["start", "error"]
+        assert events[-1][1]["status"] == 504
+        assert events[-1][1]["success"] is False
+
+    def test_rejects_empty_message(self, stream_client):
+        client, _ = stream_client
+        assert client.post("/api/chat/stream", json={"message": "  "}).status_code == 400
@@ -0,0 +1,207 @@
+"""
+Test suite for Idempotency-Key handling
+"""
+import asyncio
+import importlib
+import json
+import threading
+import time
+import pytest
+import requests
+from app.services import idempotency
+from app.services.idempotency import IdempotencyStore, IdempotencyConflict, NEW, ATTACHED, REPLAYED
+from app.services.shared_cache import SharedCache
+from config.settings import IdempotencySettings
+
+
+@pytest.fixture
+def idempotency_env(monkeypatch, configure, make_client):
+    configure()
+    monkeypatch.setattr(idempotency, "_store", None)
+    main = importlib.import_module("app.main")
+    with make_client() as client:
+        yield main, client, monkeypatch
+
+
+class FakeResponse:
+    status_code = 200
+    content = b'{"text": "Storyboard ready"}'
+
+    def json(self):
+        return {"text": "Storyboard ready"}
+
+    def raise_for_status(self):
+        pass
+
+
+def fake_turns(monkeypatch, main):
+    """Replace the chatbot with one that blocks until ``finish`` is set and counts its runs"""
+    calls, started, finish = [], threading.Event(), threading.Event()
+
+    def generate_response(user_message, conversation_history=None, project_id=None, on_event=None, raise_errors=False):
+        calls.append(user_message)
+        started.set()
+        finish.wait(5)
+        return f"Reply {len(calls)}"
+
+    monkeypatch.setattr(main.chatbot_service, "generate_response", generate_response)
+    return calls, started, finish
+
+
+def chat(client, key, message="Make a launch video", project_id="p1"):
+    return client.post("/api/chat", json={"message": message, "project_id": project_id}, headers={"Idempotency-Key": key})
+
+
+class TestIdempotency:
+    """Test that retries with the same key attach to or replay the first run"""
+
+    def test_retry_attaches_to_running_turn_and_replays_it_later(self, idempotency_env):
+        main, client, monkeypatch = idempotency_env
+        calls, started, finish = fake_turns(monkeypatch, main)
+        responses = {}
+        first = threading.Thread(target=lambda: responses.update(first=chat(client, "k1")))
+        first.start()
+        assert started.wait(5)
+        retry = threading.Thread(target=lambda: responses.update(retry=chat(client, "k1")))
+        retry.start()
+        time.sleep(0.1)
+        finish.set()
+        first.join(5)
+        retry.join(5)
+
+        later = chat(client, "k1")
+
+        assert calls == ["Make a launch video"]
+        assert responses["first"].json() == responses["retry"].json() == later.json() == {"message": "Reply 1", "success": True}
+        assert "Idempotent-Replayed" not in responses["first"].headers
+        assert responses["retry"].headers["Idempotent-Replayed"] == "true"
+        stats = client.get("/api/idempotency-stats").json()
+        assert (stats[NEW], stats[ATTACHED], stats[REPLAYED]) == (1, 1, 1)
+        assert chat(client, "k2").json()["message"] == "Reply 2"
+
+    def test_key_reused_for_another_request_is_rejected(self, idempotency_env):
+        main, client, monkeypatch = idempotency_env
+        _, _, finish = fake_turns(monkeypatch, main)
+        finish.set()
+        chat(client, "k1")
+
+        response = chat(client, "k1", message="Something else")
+
+        assert response.status_code == 422
+        assert chat(client, "x" * 300).status_code == 400
+
+    def test_upstream_failure_is_not_stored(self, idempotency_env):
+        main, client, monkeypatch = idempotency_env
+        calls = []
+
+        def post(body, headers, timeout, affinity_key=None, stream=False, pinned=False):
+            calls.append(body)
+            if len(calls) == 1:
+                raise requests.exceptions.Timeout("read timed out")
+            return FakeResponse()
+
+        monkeypatch.setattr(main.chatbot_service, "stream", False)
+        monkeypatch.setattr(main.chatbot_service.pool, "post", post)
+
+        failed = chat(client, "k1")
+        retried = chat(client, "k1")
+
+        assert failed.status_code == 504
+        assert "taking too long" in failed.json()["detail"]
+        assert retried.json() == {"message": "Storyboard ready", "success": True}
+        assert "Idempotent-Replayed" not in retried.headers
+        assert len(calls) == 2
+        # without a key the apology stays the reply
+        calls.clear()
+        assert "taking too long" in client.post("/api/chat", json={"message": "hi"}).json()["message"]
+
+    def test_stream_retry_attaches_to_running_turn(self, idempotency_env):
+        main, client, monkeypatch = idempotency_env
+        calls, started, finish = fake_turns(monkeypatch, main)
+        done = {}
+
+        def stream(name):
+            with client.stream("POST", "/api/chat/stream", json={"message": "Make a launch video", "project_id": "p1"},
+                               headers={"Idempotency-Key": "s1"}) as response:
+                lines = [line for line in response.iter_lines() if line.startswith("data: ")]
+            done[name] = json.loads(lines[-1][len("data: "):])
+
+        first = threading.Thread(target=stream, args=("first",))
+        first.start()
+        assert started.wait(5)
+        retry = threading.Thread(target=stream, args=("retry",))
+        retry.start()
+        time.sleep(0.1)
+        finish.set()
+        first.join(5)
+        retry.join(5)
+
+        assert calls == ["Make a launch video"]
+        assert done["first"] == {"message": "Reply 1", "success": True}
+        assert done["retry"] == {"message": "Reply 1", "success": True, "replayed": True}
+
+    def test_create_project_and_save_stories_run_once(self, idempotency_env):
+        _, client, _ = idempotency_env
+        project = {"projectId": "p1", "typeId": 1, "typeName": "Product Release Video", "userInput": "Launch"}
+        created = [client.post("/api/create-project", json=project, headers={"Idempotency-Key": "c1"}) for _ in range(2)]
+        stories = {"project_id": "p1", "stories": [{"screen_number": 1, "voiceover_text": "Intro"}]}
+        saved = [client.post("/api/project/p1/save-stories", json=stories, headers={"Idempotency-Key": "s1"}) for _ in range(2)]
+
+        assert created[0].json() == created[1].json()
+        assert saved[0].json() == saved[1].json()
+        assert saved[1].headers["Idempotent-Replayed"] == "true"
+        assert len(client.get("/api/project/p1/revisions").json()["revisions"]) == 1
+        # the same key on another project's save is a different request
+        client.post("/api/create-project", json={**project, "projectId": "p2"})
+        other = client.post("/api/project/p2/save-stories", json={**stories, "project_id": "p2"}, headers={"Idempotency-Key": "s1"})
+        assert "Idempotent-Replayed" not in other.headers
+
+    def test_keys_expire(self):
+        store = IdempotencyStore(IdempotencySettings(ttl=0.05))
+        runs = []
+
+        async def work():
+            runs.append(1)
+            return {"run": len(runs)}
+
+        async def scenario():
+            first = await store.run("chat", "k1", "f", work)
+            replayed = await store.run("chat", "k1", "f", work)
+            await asyncio.sleep(0.1)
+            return first, replayed, await store.run("chat", "k1", "f", work)
+
+        first, replayed, expired = asyncio.run(scenario())
+        assert (first, replayed, expired) == (({"run": 1}, NEW), ({"run": 1}, REPLAYED), ({"run": 2}, NEW))
+
+    def test_retry_on_another_worker_waits_for_the_first(self, tmp_path):
+        path = tmp_path / "shared.sqlite3"
+        caches = [SharedCache(path, poll_interval=3600), SharedCache(path, poll_interval=3600)]
+        first_worker, second_worker = (IdempotencyStore(IdempotencySettings(), cache) for cache in caches)
+        runs = []
+
+        async def work(worker):
+            runs.append(worker)
+            await asyncio.sleep(0.3)
+            return {"worker": worker}
+
+        async def scenario():
+            first = asyncio.create_task(first_worker.run("chat", "k1", "f", lambda: work("first")))
+            await asyncio.sleep(0.05)
+            retry = await second_worker.run("chat", "k1", "f", lambda: work("second"))
+            conflict = None
+            try:
+                await second_worker.run("chat", "k2", "f", lambda: work("second"))
+                await first_worker.run("chat", "k2", "other", lambda: work("first"))
+            except IdempotencyConflict as e:
+                conflict = e
+            return await first, retry, conflict
+
+        try:
+            first, retry, conflict = asyncio.run(scenario())
+        finally:
+            for cache in caches:
+                cache.close()
+        assert first == ({"worker": "first"}, NEW)
+        assert retry == ({"worker": "first"}, ATTACHED)
+        assert runs == ["first", "second"]
+        assert conflict is not None
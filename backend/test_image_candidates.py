@@ -0,0 +1,131 @@
+"""
+Test suite for ranked image candidates and the "next image" action
+"""
+import json
+import pytest
+import requests
+from app.utils import image_search
+from app.utils.image_search import (
+    rank_image_candidates,
+    query_ladder,
+    search_image_candidates,
+    attach_image_candidates,
+    next_image_candidate,
+)
+
+
+def cse_item(name, width=1280, height=720, mime="image/jpeg", byte_size=200000, title=None):
+    return {
+        "title": title or f"Image {name}",
+        "link": f"https://images.example.com/{name}",
+        "mime": mime,
+        "fileFormat": mime,
+        "image": {"width": width, "height": height, "byteSize": byte_size, "thumbnailLink": ""},
+    }
+
+
+def install_search(monkeypatch, results_by_query):
+    """Answer Custom Search queries from a dict of query -> items, recording each query"""
+    queries = []
+
+    def fake_get(url, params=None, timeout=None, **kwargs):
+        queries.append(params["q"])
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"items": results_by_query.get(params["q"], [])}).encode("utf-8")
+        return response
+
+    monkeypatch.setattr(image_search.requests, "get", fake_get)
+    return queries
+
+
+@pytest.fixture
+def search_env(configure):
+    return configure(GOOGLE_CSE_API_KEY="test-key", SEARCH_ENGINE_ID="test-cx")
+
+
+class TestRanking:
+    """Test candidate ranking"""
+
+    def test_prefers_wide_large_jpeg(self):
+        ranked = rank_image_candidates([
+            cse_item("square.jpg", 800, 800),
+            cse_item("wide.jpg", 1920, 1080),
+            cse_item("wide.png", 1920, 1080, mime="image/png"),
+            cse_item("tiny.jpg", 1280, 720, byte_size=4000),
+        ])
+        assert [c["link"].rsplit("/", 1)[1] for c in ranked] == ["wide.jpg", "wide.png", "tiny.jpg", "square.jpg"]
+        assert ranked[0]["score"] > ranked[1]["score"]
+
+    def test_drops_unusable_results(self):
+        ranked = rank_image_candidates([
+            cse_item("anim.gif", mime="image/gif"),
+            cse_item("icon.jpg", 120, 68),
+            {"title": "no link", "mime": "image/jpeg", "image": {}},
+            cse_item("ok.jpg"),
+        ])
+        assert [c["link"] for c in ranked] == ["https://images.example.com/ok.jpg"]
+
+    def test_ties_go_to_longer_title(self):
+        ranked = rank_image_candidates([cse_item("a.jpg", title="short"), cse_item("b.jpg", title="a much longer title")])
+        assert ranked[0]["link"].endswith("b.jpg")
+
+
+class TestQueryLadder:
+    """Test fallback queries"""
+
+    def test_ladder_broadens(self):
+        assert query_ladder("busy open office, laptop dashboard, coffee", max_queries=4) == [
+            "busy open office, laptop dashboard, coffee",
+            "busy open office laptop dashboard",
+            "busy open office",
+            "busy open",
+        ]
+        assert query_ladder("sunset", max_queries=3) == ["sunset"]
+
+    def test_stops_at_first_usable_rung(self, monkeypatch, search_env):
+        queries = install_search(monkeypatch, {
+            "team meeting, whiteboard, sticky notes": [cse_item("anim.gif", mime="image/gif")],
+            "team meeting whiteboard": [cse_item("1.jpg"), cse_item("2.jpg", 1024, 768)],
+            "team meeting": [cse_item("3.jpg")],
+        })
+
+        candidates = search_image_candidates("team meeting, whiteboard, sticky notes")
+
+        assert queries == ["team meeting, whiteboard, sticky notes", "team meeting whiteboard"]
+        assert [c["link"].rsplit("/", 1)[1] for c in candidates] == ["1.jpg", "2.jpg"]
+        assert candidates[0]["query"] == "team meeting whiteboard"
+
+
+class TestNextImage:
+    """Test cycling through stored candidates"""
+
+    def test_next_image_cycles(self):
+        story = {"image_url": "old"}
+        attach_image_candidates(story, rank_image_candidates([cse_item("1.jpg"), cse_item("2.jpg", 1024, 768)]))
+        assert story["image_url"].endswith("1.jpg")
+
+        assert next_image_candidate(story)["link"].endswith("2.jpg")
+        assert next_image_candidate(story)["link"].endswith("1.jpg")
+        assert next_image_candidate({"image_url": None}) is None
+
+    def test_endpoint_serves_alternates_without_searching(self, monkeypatch, search_env, make_client):
+        project_dir = search_env / "project_p1"
+        project_dir.mkdir()
+        story = {"screen_number": 1}
+        attach_image_candidates(story, rank_image_candidates([cse_item("1.jpg"), cse_item("2.jpg", 1024, 768)]))
+        (project_dir / "story_1.json").write_text(json.dumps(story))
+        (project_dir / "story_2.json").write_text(json.dumps({"screen_number": 2}))
+        queries = install_search(monkeypatch, {})
+        client = make_client()
+
+        response = client.post("/api/project/p1/stories/story_1/next-image")
+        assert response.status_code == 200
+        assert response.json()["story"]["image_url"].endswith("2.jpg")
+        assert response.json()["candidate_count"] == 2
+        assert json.loads((project_dir / "story_1.json").read_text())["image_candidate_index"] == 1
+
+        assert client.post("/api/project/p1/stories/story_2/next-image").status_code == 409
+        assert client.post("/api/project/p1/stories/story_9/next-image").status_code == 404
+        assert client.post("/api/project/p1/stories/project_type1/next-image").status_code == 404
+        assert queries == []
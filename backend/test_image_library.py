@@ -0,0 +1,118 @@
+"""
+Test suite for the offline stock image library
+"""
+import json
+import os
+import pytest
+import requests
+from app.utils import image_search
+from app.utils.image_library import LocalImageLibrary, get_image_library
+from app.utils.image_search import search_image_candidates
+from perf.bench_endpoints import solid_png
+
+PNG = solid_png(1600, 900)
+
+
+def write_library(library_dir, entries):
+    library_dir.mkdir(parents=True, exist_ok=True)
+    for entry in entries:
+        path = library_dir / entry["file"]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(PNG)
+    (library_dir / "manifest.json").write_text(json.dumps({"images": entries}))
+
+
+ENTRIES = [
+    {"file": "office/desk.png", "tags": ["office", "desk", "laptop"], "caption": "Tidy office desk with a laptop", "width": 1600, "height": 900},
+    {"file": "office/meeting.png", "tags": ["office", "meeting", "team"], "caption": "Team meeting around a whiteboard", "width": 1600, "height": 900},
+    {"file": "nature/forest.png", "tags": ["forest", "trail"], "caption": "Forest trail in the morning", "width": 1600, "height": 900},
+]
+
+
+@pytest.fixture
+def library_env(monkeypatch, tmp_path, configure):
+    """Settings pointing at a scratch library, with Google answering nothing and counting calls"""
+    write_library(tmp_path / "library", ENTRIES)
+    configure(GOOGLE_CSE_API_KEY="test-key", SEARCH_ENGINE_ID="test-cx")
+    calls = []
+
+    def fake_get(url, params=None, timeout=None, **kwargs):
+        calls.append(params["q"])
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"items": []}'
+        return response
+
+    monkeypatch.setattr(image_search.requests, "get", fake_get)
+    return tmp_path, calls
+
+
+class TestLibraryIndex:
+    """Test manifest indexing and BM25 search"""
+
+    def test_bm25_ranks_by_matching_terms(self, tmp_path):
+        write_library(tmp_path, ENTRIES)
+        library = LocalImageLibrary(tmp_path)
+
+        assert len(library) == 3
+        results = library.search_images("office laptops", num_results=3)
+        assert [r["link"] for r in results] == ["/api/library/office/desk.png", "/api/library/office/meeting.png"]
+        assert results[0]["mime"] == "image/png"
+        assert results[0]["image"]["byteSize"] == len(PNG)
+
+        assert len(library.search_images("office laptops", num_results=1)) == 1
+        assert library.search_images("city skyline at night") == []
+
+    def test_min_match_and_unsafe_entries(self, tmp_path):
+        write_library(tmp_path / "lib", ENTRIES)
+        manifest = json.loads((tmp_path / "lib" / "manifest.json").read_text())
+        (tmp_path / "secret.png").write_bytes(PNG)
+        manifest["images"].append({"file": "../secret.png", "tags": ["secret"]})
+        (tmp_path / "lib" / "manifest.json").write_text(json.dumps(manifest))
+
+        library = LocalImageLibrary(tmp_path / "lib", min_match=1.0)
+        assert len(library) == 3
+        assert library.search_images("forest trail") != []
+        assert library.search_images("forest lake") == []
+        assert library.resolve("../secret.png") is None
+
+    def test_reloads_changed_manifest(self, library_env):
+        data_dir, _ = library_env
+        assert len(get_image_library()) == 3
+
+        write_library(data_dir / "library", ENTRIES[:1])
+        os.utime(data_dir / "library" / "manifest.json", (1, 1))
+        assert len(get_image_library()) == 1
+
+
+class TestProviders:
+    """Test the library as a provider next to Google"""
+
+    def test_library_first_skips_google(self, library_env, configure):
+        _, calls = library_env
+        configure(IMAGE_LIBRARY_MODE="first")
+
+        candidates = search_image_candidates("team meeting, whiteboard")
+        assert candidates[0]["link"] == "/api/library/office/meeting.png"
+        assert candidates[0]["provider"] == "library"
+        assert calls == []
+
+    def test_library_as_fallback(self, library_env, configure):
+        _, calls = library_env
+        configure(IMAGE_LIBRARY_MODE="fallback", IMAGE_SEARCH_MAX_QUERIES="1")
+
+        candidates = search_image_candidates("forest trail")
+        assert calls == ["forest trail"]
+        assert candidates[0]["link"] == "/api/library/nature/forest.png"
+
+        configure(IMAGE_LIBRARY_MODE="off")
+        assert search_image_candidates("forest trail") == []
+
+    def test_serves_library_files(self, library_env, make_client):
+        client = make_client()
+
+        response = client.get("/api/library/office/desk.png")
+        assert response.status_code == 200
+        assert response.content == PNG
+        assert client.get("/api/library/office/missing.png").status_code == 404
+        assert client.get("/api/library/manifest.json").status_code == 404
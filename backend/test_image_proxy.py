@@ -0,0 +1,160 @@
+"""
+Test suite for the local image proxy
+"""
+import json
+import pytest
+import requests
+from app.services import image_proxy as proxy_module
+from app.services.image_proxy import ImageProxy, ImageFetchError, PROXY_PREFIX, rewrite_project_stories, get_image_proxy
+from config.settings import ImageProxySettings
+from perf.bench_endpoints import solid_png
+
+ORIGIN = "https://cdn.example.com/"
+
+
+def install_origin(monkeypatch, files):
+    """Serve origin URLs from a dict of path -> (bytes, content type), counting requests"""
+    calls = []
+
+    def fake_get(url, timeout=None, stream=False, headers=None, **kwargs):
+        calls.append(url)
+        path = url[len(ORIGIN):]
+        response = requests.Response()
+        response.url = url
+        if path not in files:
+            response.status_code = 404
+            response._content = b"missing"
+        else:
+            data, content_type = files[path]
+            response.status_code = 200
+            response._content = data
+            response.headers["Content-Type"] = content_type
+        response._content_consumed = True
+        return response
+
+    monkeypatch.setattr(proxy_module.requests, "get", fake_get)
+    return calls
+
+
+@pytest.fixture
+def proxy(tmp_path):
+    proxy = ImageProxy(tmp_path / "images", ImageProxySettings(workers=1))
+    yield proxy
+    proxy.shutdown()
+
+
+PNG = solid_png(1600, 900)
+
+
+class TestFetch:
+    """Test fetching and content addressing"""
+
+    def test_fetch_once_per_url_and_dedupe_by_content(self, monkeypatch, proxy):
+        calls = install_origin(monkeypatch, {"a.png": (PNG, "image/png"), "b.png": (PNG, "application/octet-stream")})
+
+        first = proxy.fetch(ORIGIN + "a.png")
+        again = proxy.fetch(ORIGIN + "a.png")
+        mirror = proxy.fetch(ORIGIN + "b.png")
+
+        assert calls == [ORIGIN + "a.png", ORIGIN + "b.png"]
+        assert first.hash == again.hash == mirror.hash
+        assert mirror.content_type == "image/png"  # sniffed, not the declared type
+        assert proxy.original_path(first.hash).read_bytes() == PNG
+
+    def test_url_index_survives_restart(self, monkeypatch, proxy, tmp_path):
+        calls = install_origin(monkeypatch, {"a.png": (PNG, "image/png")})
+        image_hash = proxy.fetch(ORIGIN + "a.png").hash
+
+        restarted = ImageProxy(tmp_path / "images")
+        assert restarted.lookup_url(ORIGIN + "a.png") == image_hash
+        assert restarted.fetch(ORIGIN + "a.png").hash == image_hash
+        assert len(calls) == 1
+
+    def test_rejects_non_images_and_oversized(self, monkeypatch, tmp_path):
+        install_origin(monkeypatch, {"page.html": (b"<html></html>", "text/html"), "big.png": (PNG, "image/png")})
+        proxy = ImageProxy(tmp_path / "images", ImageProxySettings(max_bytes=100))
+
+        with pytest.raises(ImageFetchError):
+            proxy.fetch(ORIGIN + "page.html")
+        with pytest.raises(ImageFetchError):
+            proxy.fetch(ORIGIN + "big.png")
+        with pytest.raises(ImageFetchError):
+            proxy.fetch(ORIGIN + "gone.png")
+
+
+class TestRewrite:
+    """Test rewriting story records"""
+
+    def test_rewrite_story_keeps_source(self, monkeypatch, proxy):
+        install_origin(monkeypatch, {"a.png": (PNG, "image/png")})
+        story = {"screen_number": 1, "image_url": ORIGIN + "a.png"}
+
+        assert proxy.rewrite_story(story)
+        assert story["image_url"].startswith(PROXY_PREFIX)
+        assert story["image_source_url"] == ORIGIN + "a.png"
+        assert not proxy.rewrite_story(story)  # already proxied
+
+    def test_failed_fetch_keeps_origin_url(self, monkeypatch, proxy):
+        install_origin(monkeypatch, {})
+        story = {"image_url": ORIGIN + "dead.jpg"}
+        assert not proxy.rewrite_story(story)
+        assert story["image_url"] == ORIGIN + "dead.jpg"
+
+    def test_rewrite_project_stories(self, monkeypatch, proxy, tmp_path):
+        install_origin(monkeypatch, {"a.png": (PNG, "image/png")})
+        project_dir = tmp_path / "project_1"
+        project_dir.mkdir()
+        (project_dir / "story_1.json").write_text(json.dumps({"image_url": ORIGIN + "a.png"}))
+        (project_dir / "story_2.json").write_text(json.dumps({"image_url": ""}))
+
+        assert rewrite_project_stories(project_dir, proxy) == 1
+        assert json.loads((project_dir / "story_1.json").read_text())["image_url"].startswith(PROXY_PREFIX)
+
+
+class TestVariants:
+    """Test thumbnail rendering"""
+
+    def test_variant_is_resized_to_configured_width(self, monkeypatch, proxy):
+        pil = pytest.importorskip("PIL.Image")
+        install_origin(monkeypatch, {"a.png": (PNG, "image/png")})
+        image_hash = proxy.fetch(ORIGIN + "a.png").hash
+
+        path, content_type = proxy.variant(image_hash, 500, "webp")
+        assert content_type == "image/webp"
+        with pil.open(path) as img:
+            assert img.size == (640, 360)  # 500 snaps up to the 640 panel width
+        assert path.stat().st_size < len(PNG)
+
+    def test_pick_width(self, proxy):
+        assert proxy.pick_width(None) == 640
+        assert proxy.pick_width(100) == 320
+        assert proxy.pick_width(5000) == 1280
+
+
+class TestEndpoint:
+    """Test serving /api/images/{hash}"""
+
+    def test_serves_with_cache_headers(self, monkeypatch, configure, make_client):
+        pytest.importorskip("PIL.Image")
+        configure(IMAGE_PROXY_ENABLED="true")
+        install_origin(monkeypatch, {"a.png": (PNG, "image/png")})
+        image_hash = get_image_proxy().fetch(ORIGIN + "a.png").hash
+        client = make_client()
+
+        try:
+            response = client.get(f"/api/images/{image_hash}", headers={"accept": "image/webp,*/*"})
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "image/webp"
+            assert "immutable" in response.headers["cache-control"]
+            assert "Accept" in response.headers["vary"]
+
+            cached = client.get(f"/api/images/{image_hash}", headers={"accept": "image/webp", "if-none-match": response.headers["etag"]})
+            assert cached.status_code == 304
+
+            original = client.get(f"/api/images/{image_hash}?format=original")
+            assert original.content == PNG
+
+            assert client.get(f"/api/images/{'0' * 64}").status_code == 404
+            assert client.get("/api/images/not-a-hash").status_code == 404
+        finally:
+            get_image_proxy().shutdown()
@@ -0,0 +1,82 @@
+"""
+Test suite for visual-keyword canonicalization and image query reuse
+"""
+from app.services import image_query_index as index_module
+from app.services.image_query_index import ImageQueryIndex
+from app.utils.keywords import canonicalize, singularize
+from config.settings import ImageSearchSettings
+
+CANDIDATES = [{"link": "https://images.example.com/1.jpg", "score": 0.9}]
+
+
+def install_search(monkeypatch):
+    """Replace the upstream search, recording each query"""
+    queries = []
+
+    def fake_search(query):
+        queries.append(query)
+        return [dict(candidate, query=query) for candidate in CANDIDATES]
+
+    monkeypatch.setattr(index_module, "search_image_candidates", fake_search)
+    return queries
+
+
+class TestCanonicalize:
+    """Test keyword canonicalization"""
+
+    def test_order_case_stop_words_and_plurals(self):
+        assert canonicalize("brand logos, upward arrow, dynamic background") == "arrow background brand dynamic logo upward"
+        assert canonicalize("Dynamic background with upward arrows and brand logos") == canonicalize("brand logos, upward arrow, dynamic background")
+        assert canonicalize("") == ""
+
+    def test_singularize(self):
+        assert [singularize(w) for w in ["cities", "boxes", "glasses", "people", "bus", "analysis", "laptops"]] == \
+            ["city", "box", "glass", "person", "bus", "analysis", "laptop"]
+
+
+class TestReuse:
+    """Test answering queries from the index"""
+
+    def test_exact_and_similar_queries_skip_search(self, monkeypatch, tmp_path):
+        queries = install_search(monkeypatch)
+        index = ImageQueryIndex(tmp_path / "image_queries.jsonl", ImageSearchSettings(reuse_threshold=0.8))
+        index.add("team meeting, whiteboard", [dict(c) for c in CANDIDATES])
+        index.add("city skyline at night", [dict(c) for c in CANDIDATES])
+
+        index.lookup_or_search("brand logos, upward arrow, dynamic background")
+        index.lookup_or_search("Upward arrows, brand logo, dynamic backgrounds")
+        index.lookup_or_search("brand logos, upward arrow, dynamic background, confetti")
+        index.lookup_or_search("mountain lake at sunrise")
+
+        assert queries == ["brand logos, upward arrow, dynamic background", "mountain lake at sunrise"]
+        stats = index.get_stats()
+        assert (stats["exact_hits"], stats["similar_hits"], stats["misses"]) == (1, 1, 2)
+        assert stats["searches_avoided"] == 2
+
+    def test_dissimilar_and_disabled(self, monkeypatch, tmp_path):
+        queries = install_search(monkeypatch)
+        index = ImageQueryIndex(tmp_path / "image_queries.jsonl", ImageSearchSettings(reuse_similar=False))
+        index.lookup_or_search("brand logos, upward arrow, dynamic background")
+        index.lookup_or_search("brand logos, upward arrow, dynamic background, confetti")
+        index.lookup_or_search("brand logo")
+
+        assert len(queries) == 3
+        assert index.find("logos brand upward arrows dynamic background")[1] == 1.0
+
+    def test_empty_results_are_not_indexed(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(index_module, "search_image_candidates", lambda query: [])
+        index = ImageQueryIndex(tmp_path / "image_queries.jsonl")
+        assert index.lookup_or_search("nothing matches this") == []
+        assert index.get_stats()["entries"] == 0
+
+    def test_index_survives_restart_and_compacts(self, tmp_path):
+        index_file = tmp_path / "image_queries.jsonl"
+        index = ImageQueryIndex(index_file, ImageSearchSettings(query_index_size=2))
+        for query in ["office desk", "office desk", "office desk", "forest trail", "ocean waves"]:
+            index.add(query, [dict(c) for c in CANDIDATES])
+
+        restarted = ImageQueryIndex(index_file, ImageSearchSettings(query_index_size=2))
+        assert restarted.get_stats()["entries"] == 2
+        assert restarted.find("ocean wave")[0].query == "ocean waves"
+        assert restarted.find("office desks")[0] is None
+        assert len(index_file.read_text().splitlines()) == 2
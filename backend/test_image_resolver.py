@@ -0,0 +1,115 @@
+"""
+Test suite for deferred image resolution
+"""
+import json
+import threading
+import pytest
+from app.services import image_query_index as index_module
+from app.services.chatbot import StoryboardChatbot
+from app.services.image_resolver import ImageResolver, image_progress, get_image_resolver
+
+STORYBOARD = json.dumps([
+    {"screen_number": 1, "voiceover_text": "Hello", "on_screen_visual_keywords": "office desk"},
+    {"screen_number": 2, "voiceover_text": "Bye", "on_screen_visual_keywords": "nothing to find"},
+])
+
+
+@pytest.fixture
+def resolver_env(monkeypatch, tmp_path, configure):
+    """Scratch data dir, proxy off, and a fake search that only knows "office desk" and can be held"""
+    configure()
+    release = threading.Event()
+    release.set()
+    queries = []
+
+    def fake_search(query):
+        release.wait(5)
+        queries.append(query)
+        if query == "office desk":
+            return [{"link": "https://images.example.com/desk.jpg", "score": 0.9}]
+        return []
+
+    monkeypatch.setattr(index_module, "search_image_candidates", fake_search)
+    project_dir = tmp_path / "project_p1"
+    project_dir.mkdir()
+    (project_dir / "project_type1.json").write_text(json.dumps({"id": "p1", "stories": []}))
+    return project_dir, release, queries
+
+
+def read(path):
+    return json.loads(path.read_text())
+
+
+class TestResolver:
+    """Test patching story files in the background"""
+
+    def test_resolves_and_patches_files(self, resolver_env):
+        project_dir, _, _ = resolver_env
+        for name, keywords in [("story_1", "office desk"), ("story_2", "nothing to find")]:
+            (project_dir / f"{name}.json").write_text(json.dumps({"on_screen_visual_keywords": keywords, "image_status": "pending", "image_url": None}))
+        resolver = ImageResolver(workers=2)
+
+        for future in resolver.submit([project_dir / "story_1.json", project_dir / "story_2.json"]):
+            future.result(timeout=5)
+
+        first, second = read(project_dir / "story_1.json"), read(project_dir / "story_2.json")
+        assert first["image_status"] == "ready"
+        assert first["image_url"] == "https://images.example.com/desk.jpg"
+        assert first["image_candidates"][0]["link"] == first["image_url"]
+        assert second["image_status"] == "missing"
+        assert resolver.get_stats()["ready"] == 1
+        resolver.shutdown()
+
+    def test_does_not_clobber_a_story_saved_meanwhile(self, resolver_env):
+        project_dir, release, _ = resolver_env
+        story_file = project_dir / "story_1.json"
+        story_file.write_text(json.dumps({"on_screen_visual_keywords": "office desk", "image_status": "pending"}))
+        resolver = ImageResolver(workers=1)
+
+        release.clear()
+        future = resolver.submit([story_file])[0]
+        assert resolver.submit([story_file])[0] is future  # queued once
+        story_file.write_text(json.dumps({"on_screen_visual_keywords": "edited by the user", "image_url": "mine.jpg"}))
+        release.set()
+        future.result(timeout=5)
+
+        assert read(story_file) == {"on_screen_visual_keywords": "edited by the user", "image_url": "mine.jpg"}
+        resolver.shutdown()
+
+    def test_progress_counts(self):
+        assert image_progress([{"image_status": "pending"}, {"image_status": "ready"}, {}, {"image_status": "missing"}]) == \
+            {"total": 4, "pending": 1, "ready": 2, "missing": 1, "error": 0}
+
+
+class TestDeferredGeneration:
+    """Test that generation saves stories before any image search"""
+
+    def test_stories_saved_pending_then_resolved(self, resolver_env, make_client):
+        project_dir, release, queries = resolver_env
+        bot = StoryboardChatbot()
+
+        release.clear()
+        bot._extract_and_save_json(STORYBOARD, "p1")
+        project = read(project_dir / "project_type1.json")
+        stories = [read(project_dir / f"{name}.json") for name in project["stories"]]
+        assert [s["image_status"] for s in stories] == ["pending", "pending"]
+        assert queries == []
+
+        client = make_client()
+        assert client.get("/api/project/p1").json()["images"]["pending"] == 2
+
+        release.set()
+        get_image_resolver().drain(timeout=5)
+        images = client.get("/api/project/p1").json()["images"]
+        assert (images["ready"], images["missing"], images["pending"]) == (1, 1, 0)
+
+    def test_pending_stories_are_requeued_after_restart(self, resolver_env, make_client):
+        project_dir, _, queries = resolver_env
+        (project_dir / "story_1.json").write_text(json.dumps({"on_screen_visual_keywords": "office desk", "image_status": "pending"}))
+        (project_dir / "project_type1.json").write_text(json.dumps({"id": "p1", "stories": ["story_1"]}))
+        client = make_client()
+
+        assert client.get("/api/project/p1").json()["images"]["pending"] == 1
+        get_image_resolver().drain(timeout=5)
+        assert read(project_dir / "story_1.json")["image_status"] == "ready"
+        assert queries == ["office desk"]
@@ -10,7 +10,8 @@ from app.utils.json_extractor import (
     validate_storyboard_data,
     convert_to_story_format,
     StoryboardScreen,
-    ExtractionResult
+    ExtractionResult,
+    StreamingJSONScanner
 )
 
 class TestExtractJsonBlocks:
@@ -272,6 +273,34 @@ class TestConvertToStoryFormat:
         assert title.endswith("...")
 
 
+class TestStreamingJSONScanner:
+    """Test picking screens out of streamed text"""
+
+    TEXT = 'Plan for [Screen 1] below:\n```json\n[\n  {"screen_number": 1, "voiceover_text": "Say \\"hi\\" {now}"},\n' \
+           '  {"screen_number": 2, "voiceover_text": "]}"}\n]\n```\nDone [x]'
+
+    def test_emits_each_object_at_any_chunk_size(self):
+        for size in (1, 3, 17, len(self.TEXT)):
+            scanner = StreamingJSONScanner()
+            screens = []
+            for i in range(0, len(self.TEXT), size):
+                screens.extend(scanner.feed(self.TEXT[i:i + size]))
+            assert [s["screen_number"] for s in screens] == [1, 2]
+            assert screens[0]["voiceover_text"] == 'Say "hi" {now}'
+            assert scanner.done
+
+    def test_emits_before_the_array_closes(self):
+        scanner = StreamingJSONScanner()
+        assert scanner.feed('[{"screen_number": 1}, {"screen_') == [{"screen_number": 1}]
+        assert scanner.feed('number": 2}]') == [{"screen_number": 2}]
+        assert scanner.objects_emitted == 2
+
+    def test_prose_only(self):
+        scanner = StreamingJSONScanner()
+        assert scanner.feed("No storyboard [yet], sorry.") == []
+        assert not scanner.done
+
+
 def run_all_tests():
     """Run all tests manually"""
     print("Running JSON Extractor Tests...")
@@ -282,7 +311,8 @@ def run_all_tests():
         TestParseJsonSafely,
         TestValidateStoryboardData,
         TestExtractJsonFromText,
-        TestConvertToStoryFormat
+        TestConvertToStoryFormat,
+        TestStreamingJSONScanner
     ]
 
     total_tests = 0
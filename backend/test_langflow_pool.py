@@ -0,0 +1,225 @@
+"""
+Test suite for the Langflow host pool
+"""
+import io
+import json
+import threading
+import time
+import pytest
+import requests
+from app.services import langflow_pool as pool_module
+from app.services.langflow_pool import LangflowPool, CircuitBreaker, NoHealthyLangflowHost, SessionHostUnavailable
+
+
+def make_response(status_code=200, data=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(json.dumps(data or {"text": "ok"}).encode("utf-8"))
+    return response
+
+
+def make_stream(lines, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO("".join(line + "\n" for line in lines).encode("utf-8"))
+    return response
+
+
+def install_hosts(monkeypatch, behaviours):
+    """Route requests.post by host to behaviour(host) callables and record the hosts hit"""
+    calls = []
+    lock = threading.Lock()
+
+    def fake_post(url, data=None, headers=None, timeout=None, **kwargs):
+        host = url.split("/")[2]
+        with lock:
+            calls.append(host)
+        return behaviours[host](host)
+
+    monkeypatch.setattr(pool_module.requests, "post", fake_post)
+    return calls
+
+
+def ok(host):
+    return make_response(data={"host": host})
+
+
+def down(host):
+    raise requests.exceptions.ConnectionError(f"{host} refused")
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions"""
+
+    def test_opens_after_threshold_and_half_opens_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+        time.sleep(0.06)
+        assert breaker.allow()
+        assert breaker.state == "half_open"
+        assert not breaker.allow()  # only one trial at a time
+
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+
+class TestBalancing:
+    """Test host selection and failover"""
+
+    def test_least_outstanding(self, monkeypatch):
+        install_hosts(monkeypatch, {"a:1": ok, "b:1": ok})
+        pool = LangflowPool(["a:1", "b:1"], "flow")
+        pool.endpoints[0].outstanding = 3
+        response = pool.post(b"{}", {}, timeout=1)
+        assert response.json()["host"] == "b:1"
+
+    def test_fails_over_on_connection_error_and_ejects(self, monkeypatch):
+        calls = install_hosts(monkeypatch, {"a:1": down, "b:1": ok})
+        pool = LangflowPool(["a:1", "b:1"], "flow", failure_threshold=2, reset_timeout=60)
+        pool.endpoints[1].outstanding = 5  # make a:1 the first choice until it is ejected
+
+        for _ in range(4):
+            assert pool.post(b"{}", {}, timeout=1).json()["host"] == "b:1"
+
+        stats = {s["host"]: s for s in pool.get_stats()}
+        assert stats["a:1"]["state"] == "open"
+        assert calls.count("a:1") == 2
+
+    def test_fails_over_on_5xx(self, monkeypatch):
+        install_hosts(monkeypatch, {"a:1": lambda h: make_response(502), "b:1": ok})
+        pool = LangflowPool(["a:1", "b:1"], "flow")
+        pool.endpoints[1].outstanding = 5  # make a:1 the first choice
+        assert pool.post(b"{}", {}, timeout=1).json()["host"] == "b:1"
+
+    def test_all_hosts_down(self, monkeypatch):
+        install_hosts(monkeypatch, {"a:1": down})
+        pool = LangflowPool(["a:1"], "flow", failure_threshold=1, reset_timeout=60)
+        try:
+            pool.post(b"{}", {}, timeout=1)
+        except requests.exceptions.ConnectionError:
+            pass
+        try:
+            pool.post(b"{}", {}, timeout=1)
+            assert False, "Expected NoHealthyLangflowHost"
+        except NoHealthyLangflowHost:
+            pass
+
+    def test_session_goes_to_its_home_host(self, monkeypatch):
+        install_hosts(monkeypatch, {"a:1": ok, "b:1": ok})
+        pool = LangflowPool(["a:1", "b:1"], "flow")
+        home = pool.home("s1")
+        home.outstanding = 5
+        response = pool.post(b"{}", {}, timeout=1, affinity_key="s1")
+        assert response.json()["host"] == home.host
+        assert response.session_moved is False
+        # another worker, or this one after a restart, agrees
+        assert LangflowPool(["a:1", "b:1"], "flow").home("s1").host == home.host
+
+    def test_session_is_not_failed_over(self, monkeypatch):
+        pool = LangflowPool(["a:1", "b:1"], "flow")
+        home = pool.home("s1")
+        calls = install_hosts(monkeypatch, {home.host: lambda h: make_response(502),
+                                            next(e.host for e in pool.endpoints if e is not home): ok})
+        assert pool.post(b"{}", {}, timeout=1, affinity_key="s1").status_code == 502
+        assert calls == [home.host]
+
+    def test_pinned_session_needs_its_home_host(self, monkeypatch):
+        calls = install_hosts(monkeypatch, {"a:1": ok, "b:1": ok})
+        pool = LangflowPool(["a:1", "b:1"], "flow", failure_threshold=1, reset_timeout=60)
+        home = pool.home("s1")
+        home.breaker.record_failure()
+
+        with pytest.raises(SessionHostUnavailable):
+            pool.post(b"{}", {}, timeout=1, affinity_key="s1", pinned=True)
+        assert calls == []
+
+        response = pool.post(b"{}", {}, timeout=1, affinity_key="s1")
+        assert response.json()["host"] != home.host
+        assert response.session_moved is True
+
+
+class TestHedging:
+    """Test hedged requests"""
+
+    def test_slow_host_is_hedged(self, monkeypatch):
+        def slow(host):
+            time.sleep(0.5)
+            return make_response(data={"host": host})
+
+        install_hosts(monkeypatch, {"a:1": slow, "b:1": ok})
+        pool = LangflowPool(["a:1", "b:1"], "flow", hedge=True, hedge_min_delay=0.05, hedge_min_samples=1)
+        pool.endpoints[0].latencies.append(0.01)
+        pool.endpoints[1].outstanding = 1  # make a:1 the first choice
+
+        start = time.perf_counter()
+        response = pool.post(b"{}", {}, timeout=1)
+        assert response.json()["host"] == "b:1"
+        assert time.perf_counter() - start < 0.4
+
+    def test_shut_down_pool_sends_unhedged(self, monkeypatch):
+        install_hosts(monkeypatch, {"a:1": ok, "b:1": ok})
+        pool = LangflowPool(["a:1", "b:1"], "flow", hedge=True, hedge_min_delay=0.05, hedge_min_samples=1)
+        pool.endpoints[0].latencies.append(0.01)
+        pool.shutdown()
+        assert pool.post(b"{}", {}, timeout=1).status_code == 200
+
+    def test_no_hedge_without_samples(self, monkeypatch):
+        install_hosts(monkeypatch, {"a:1": ok, "b:1": ok})
+        pool = LangflowPool(["a:1", "b:1"], "flow", hedge=True, hedge_min_samples=20)
+        assert pool.hedge_delay() is None
+
+
+class TestStreaming:
+    """Test that streamed requests count against their host until the body is read"""
+
+    def test_stream_is_outstanding_until_read(self, monkeypatch):
+        install_hosts(monkeypatch, {"a:1": lambda h: make_stream(['{"event": "token"}', '{"event": "end"}'])})
+        pool = LangflowPool(["a:1"], "flow")
+        endpoint = pool.endpoints[0]
+
+        response = pool.post(b"{}", {}, timeout=1, stream=True)
+        assert (endpoint.outstanding, len(endpoint.latencies)) == (1, 0)
+        lines = list(response.iter_lines())
+        response.close()
+
+        assert len(lines) == 2
+        assert (endpoint.outstanding, len(endpoint.latencies)) == (0, 1)
+        assert endpoint.breaker.state == "closed"
+
+    def test_closed_stream_releases_host(self, monkeypatch):
+        install_hosts(monkeypatch, {"a:1": lambda h: make_stream(['{"event": "token"}'])})
+        pool = LangflowPool(["a:1"], "flow")
+
+        pool.post(b"{}", {}, timeout=1, stream=True).close()
+
+        assert (pool.endpoints[0].outstanding, len(pool.endpoints[0].latencies)) == (0, 0)
+
+    def test_discarded_5xx_responses_are_closed(self, monkeypatch):
+        failed = []
+
+        def error(host):
+            failed.append(make_stream([], status_code=502))
+            return failed[-1]
+
+        install_hosts(monkeypatch, {"a:1": error, "b:1": error, "c:1": ok})
+        pool = LangflowPool(["a:1", "b:1", "c:1"], "flow")
+        pool.endpoints[2].outstanding = 5  # try the failing hosts first
+
+        response = pool.post(b"{}", {}, timeout=1, stream=True)
+
+        assert response.json()["host"] == "c:1"
+        assert len(failed) == 2 and all(r.raw.closed for r in failed)
+        assert [e.outstanding for e in pool.endpoints[:2]] == [0, 0]
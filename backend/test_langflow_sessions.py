@@ -0,0 +1,146 @@
+"""
+Test suite for Langflow session reuse
+"""
+import json
+import time
+import requests
+from app.services import chatbot as chatbot_module
+from app.services.chatbot import StoryboardChatbot, ChatMessage
+from app.services.langflow_sessions import LangflowSessionStore, SESSION_FILENAME
+from config.settings import config_service, load_settings
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+        self.content = json.dumps(data).encode("utf-8")
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error", response=self)
+
+
+def make_chatbot(monkeypatch, tmp_path, responder):
+    """Build a chatbot that writes to tmp_path and answers through responder(payload)"""
+    monkeypatch.setenv("LANGFLOW_API_KEY", "test-key")
+    monkeypatch.setattr(config_service, "_snapshot", load_settings())
+    sent = []
+
+    def fake_post(url, data=None, headers=None, timeout=None):
+        payload = json.loads(data)
+        sent.append(payload)
+        return responder(payload)
+
+    monkeypatch.setattr(chatbot_module.requests, "post", fake_post)
+    bot = StoryboardChatbot()
+    bot.data_dir = tmp_path
+    bot.sessions = LangflowSessionStore(tmp_path)
+    (tmp_path / "project_1").mkdir()
+    return bot, sent
+
+
+def echo_session(payload):
+    return FakeResponse({"session_id": payload.get("session_id"), "text": "ok"})
+
+
+HISTORY = [
+    ChatMessage(role="user", content="A very long project brief " * 50),
+    ChatMessage(role="assistant", content="Here is a draft"),
+]
+
+
+class TestSessionReuse:
+    """Test that turns after the first only send the new message"""
+
+    def test_first_turn_sends_full_context_and_opens_session(self, monkeypatch, tmp_path):
+        bot, sent = make_chatbot(monkeypatch, tmp_path, echo_session)
+        bot.generate_response("make it shorter", HISTORY, project_id="1")
+
+        assert len(sent) == 1
+        assert "A very long project brief" in sent[0]["input_value"]
+        assert sent[0]["session_id"].startswith("project_1_")
+        assert (tmp_path / "project_1" / SESSION_FILENAME).exists()
+
+    def test_second_turn_sends_only_delta(self, monkeypatch, tmp_path):
+        bot, sent = make_chatbot(monkeypatch, tmp_path, echo_session)
+        bot.generate_response("make it shorter", HISTORY, project_id="1")
+        bot.generate_response("now add a CTA", HISTORY, project_id="1")
+
+        assert sent[1]["input_value"] == "now add a CTA"
+        assert sent[1]["session_id"] == sent[0]["session_id"]
+
+        stats = bot.sessions.get_stats()
+        assert stats["full"]["calls"] == 1
+        assert stats["session"]["calls"] == 1
+        assert stats["session"]["bytes_sent"] < stats["full"]["bytes_sent"]
+
+    def test_no_project_sends_full_context_without_session(self, monkeypatch, tmp_path):
+        bot, sent = make_chatbot(monkeypatch, tmp_path, echo_session)
+        bot.generate_response("hello", HISTORY)
+        bot.generate_response("hello again", HISTORY)
+
+        assert all("session_id" not in payload for payload in sent)
+        assert "A very long project brief" in sent[1]["input_value"]
+
+
+class TestSessionFallback:
+    """Test falling back to full-context mode when a session is no longer usable"""
+
+    def test_expired_session_resends_full_context(self, monkeypatch, tmp_path):
+        bot, sent = make_chatbot(monkeypatch, tmp_path, echo_session)
+        bot.generate_response("first", HISTORY, project_id="1")
+
+        session = bot.sessions.get("1")
+        session.last_used = time.time() - bot.sessions.ttl_seconds - 1
+
+        bot.generate_response("second", HISTORY, project_id="1")
+        assert "A very long project brief" in sent[1]["input_value"]
+        assert sent[1]["session_id"] != sent[0]["session_id"]
+
+    def test_rejected_session_retries_with_full_context(self, monkeypatch, tmp_path):
+        def responder(payload):
+            if payload["input_value"] == "second":
+                return FakeResponse({"detail": "session not found"}, status_code=404)
+            return echo_session(payload)
+
+        bot, sent = make_chatbot(monkeypatch, tmp_path, responder)
+        bot.generate_response("first", HISTORY, project_id="1")
+        response = bot.generate_response("second", HISTORY, project_id="1")
+
+        assert response == "ok"
+        assert len(sent) == 3
+        assert "A very long project brief" in sent[2]["input_value"]
+
+    def test_ejected_session_host_resends_full_context(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("LANGFLOW_HOSTS", "a:1,b:1")
+        bot, sent = make_chatbot(monkeypatch, tmp_path, echo_session)
+        hosts = []
+        post = chatbot_module.requests.post
+
+        def record_host(url, **kwargs):
+            hosts.append(url.split("/")[2])
+            return post(url, **kwargs)
+
+        monkeypatch.setattr(chatbot_module.requests, "post", record_host)
+        bot.generate_response("first", HISTORY, project_id="1")
+        home = bot.pool.home(sent[0]["session_id"])
+        assert hosts == [home.host]
+        for _ in range(home.breaker.failure_threshold):
+            home.breaker.record_failure()
+
+        assert bot.generate_response("second", HISTORY, project_id="1") == "ok"
+        assert "A very long project brief" in sent[1]["input_value"]
+        assert hosts[1] != home.host
+        kept = bot.sessions.get("1")
+        assert kept is None or bot.pool.home(kept.session_id).host == hosts[1]
+
+    def test_session_survives_restart(self, monkeypatch, tmp_path):
+        bot, sent = make_chatbot(monkeypatch, tmp_path, echo_session)
+        bot.generate_response("first", HISTORY, project_id="1")
+
+        restarted = LangflowSessionStore(tmp_path)
+        assert restarted.get("1").session_id == sent[0]["session_id"]
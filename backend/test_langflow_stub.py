@@ -0,0 +1,88 @@
+"""
+Test suite for the local Langflow stand-in server
+"""
+import json
+from pathlib import Path
+from fastapi.testclient import TestClient
+from app.services.chatbot import StoryboardChatbot
+from app.utils.json_extractor import extract_json_from_text
+from perf.langflow_stub import create_app, StubConfig, LatencyDistribution, load_replay_payloads
+from perf.report import percentile, summarize_latencies
+
+TEST_CAPTURE = Path(__file__).parent.parent / "test.json"
+
+
+def extract_text(response_data):
+    return StoryboardChatbot._extract_response_text(None, response_data)
+
+
+class TestStubResponses:
+    """Test that the stub answers in the shape the chatbot parses"""
+
+    def test_default_response_contains_storyboard(self):
+        client = TestClient(create_app())
+        response = client.post("/api/v1/run/flow", json={"input_value": "hi", "session_id": "s1"})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["session_id"] == "s1"
+        result = extract_json_from_text(extract_text(data))
+        assert result.success
+        assert len(result.data) == 6
+
+    def test_replay_rewrites_session_id(self):
+        payloads = load_replay_payloads(str(TEST_CAPTURE))
+        assert len(payloads) >= 2
+
+        client = TestClient(create_app(StubConfig(replay=str(TEST_CAPTURE))))
+        data = client.post("/api/v1/run/flow", json={"input_value": "hi", "session_id": "mine"}).json()
+        assert data["session_id"] == "mine"
+        assert "ClearVu-IQ" in extract_text(data)
+
+    def test_error_rate(self):
+        client = TestClient(create_app(StubConfig(error_rate=1.0, error_status=503)))
+        response = client.post("/api/v1/run/flow", json={"input_value": "hi"})
+        assert response.status_code == 503
+
+    def test_streaming_events(self):
+        client = TestClient(create_app(StubConfig(token_interval=0)))
+        response = client.post("/api/v1/run/flow?stream=true", json={"input_value": "hi"})
+
+        events = [json.loads(chunk) for chunk in response.text.split("\n\n") if chunk.strip()]
+        assert events[0]["event"] == "add_message"
+        assert events[-1]["event"] == "end"
+        streamed = "".join(e["data"]["chunk"] for e in events if e["event"] == "token")
+        assert streamed == extract_text(events[-1]["data"]["result"])
+
+
+class TestLatencyDistribution:
+    """Test latency spec parsing"""
+
+    def test_constant(self):
+        assert LatencyDistribution("0.25").sample() == 0.25
+
+    def test_uniform_bounds(self):
+        dist = LatencyDistribution("uniform:0.1:0.2")
+        assert all(0.1 <= dist.sample() <= 0.2 for _ in range(100))
+
+    def test_unknown_kind(self):
+        try:
+            LatencyDistribution("pareto:1")
+            assert False, "Expected ValueError"
+        except ValueError:
+            pass
+
+
+class TestReport:
+    """Test latency summaries"""
+
+    def test_percentiles(self):
+        values = [i / 1000 for i in range(1, 101)]
+        assert percentile(values, 50) == 0.05
+        assert percentile(values, 99) == 0.099
+        summary = summarize_latencies(values, elapsed_sec=2.0)
+        assert summary["p95_ms"] == 95.0
+        assert summary["throughput_rps"] == 50.0
+
+    def test_empty(self):
+        assert summarize_latencies([])["p50_ms"] == 0.0
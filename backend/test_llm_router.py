@@ -0,0 +1,152 @@
+"""
+Test suite for the multi-provider LLM router
+"""
+import json
+import requests
+from fastapi.testclient import TestClient
+from app.services import llm_router as router_module
+from app.services.llm_router import (
+    LLMRouter, OpenAIProvider, GeminiProvider, AllProvidersFailed, EDIT, GENERATE, FAST, STRONG,
+)
+from perf.langflow_stub import create_app, StubConfig
+from config.settings import config_service, load_settings
+
+STRONG_URL = "http://strong.local"
+FAST_URL = "http://fast.local"
+
+
+def install_stubs(monkeypatch, apps):
+    """Send requests.post to in-process stub apps keyed by base URL (None times out), recording which were hit"""
+    clients = {base: TestClient(app) if app is not None else None for base, app in apps.items()}
+    calls = []
+
+    def fake_post(url, json=None, headers=None, timeout=None, **kwargs):
+        base = next(b for b in clients if url.startswith(b))
+        calls.append(base)
+        if clients[base] is None:
+            raise requests.exceptions.Timeout(f"{base} timed out")
+        reply = clients[base].post(url[len(base):], json=json, headers=headers)
+        response = requests.Response()
+        response.status_code = reply.status_code
+        response._content = reply.content
+        return response
+
+    monkeypatch.setattr(router_module.requests, "post", fake_post)
+    return calls
+
+
+def make_router(**kwargs):
+    return LLMRouter([
+        OpenAIProvider("gpt-4o", "k1", tier=STRONG, base_url=STRONG_URL),
+        GeminiProvider("gemini-1.5-flash", "k2", tier=FAST, base_url=FAST_URL),
+    ], **kwargs)
+
+
+MESSAGES = [{"role": "system", "content": "sys"}, {"role": "user", "content": "brief"},
+            {"role": "assistant", "content": "draft"}, {"role": "user", "content": "shorten screen 2"}]
+
+
+class TestRouting:
+    """Test that request kinds reach the right tier"""
+
+    def test_classify(self):
+        router = make_router(large_prompt_chars=100)
+        assert router.classify("shorten screen 2", MESSAGES) == EDIT
+        assert router.classify("give me the storyboard as json", MESSAGES) == GENERATE
+        assert router.classify("brief", MESSAGES[:2]) == GENERATE  # first turn
+        long_messages = MESSAGES + [{"role": "user", "content": "x" * 200}]
+        assert router.classify("shorten screen 2", long_messages) == GENERATE
+
+    def test_edit_goes_to_fast_and_generation_to_strong(self, monkeypatch):
+        calls = install_stubs(monkeypatch, {STRONG_URL: create_app(), FAST_URL: create_app()})
+        router = make_router()
+
+        assert "screen_number" in router.complete(MESSAGES, kind=EDIT)
+        assert "screen_number" in router.complete(MESSAGES, kind=GENERATE)
+        assert calls == [FAST_URL, STRONG_URL]
+
+    def test_faster_provider_first_within_tier(self):
+        slow = OpenAIProvider("a", "k", tier=FAST, base_url="http://a")
+        quick = OpenAIProvider("b", "k", tier=FAST, base_url="http://b")
+        slow.latencies.extend([2.0, 2.5])
+        quick.latencies.extend([0.2, 0.3])
+        router = LLMRouter([slow, quick])
+        assert router.candidates(EDIT)[0] is quick
+
+
+class TestFallback:
+    """Test falling back across providers"""
+
+    def test_error_falls_back_to_other_tier(self, monkeypatch):
+        failing = create_app(StubConfig(error_rate=1.0, error_status=503))
+        calls = install_stubs(monkeypatch, {STRONG_URL: create_app(), FAST_URL: failing})
+        router = make_router()
+
+        assert "screen_number" in router.complete(MESSAGES, kind=EDIT)
+        assert calls == [FAST_URL, STRONG_URL]
+        stats = {s["provider"]: s for s in router.get_stats()}
+        assert stats["google:gemini-1.5-flash"]["failures"] == 1
+
+    def test_timeout_falls_back(self, monkeypatch):
+        calls = install_stubs(monkeypatch, {STRONG_URL: None, FAST_URL: create_app()})
+        assert "screen_number" in make_router().complete(MESSAGES, kind=GENERATE)
+        assert calls == [STRONG_URL, FAST_URL]
+
+    def test_saturated_provider_is_skipped(self, monkeypatch):
+        calls = install_stubs(monkeypatch, {STRONG_URL: create_app(), FAST_URL: create_app()})
+        router = make_router()
+        strong = router.providers[0]
+        for _ in range(strong.max_concurrency):
+            assert strong.acquire()
+
+        router.complete(MESSAGES, kind=GENERATE)
+        assert calls == [FAST_URL]
+
+    def test_all_providers_failed(self, monkeypatch):
+        install_stubs(monkeypatch, {STRONG_URL: None, FAST_URL: None})
+        try:
+            make_router().complete(MESSAGES)
+            assert False, "Expected AllProvidersFailed"
+        except AllProvidersFailed as e:
+            assert "timed out" in str(e)
+
+
+class TestConfig:
+    """Test building the router from llm_config.json"""
+
+    def test_from_config(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("STUB_KEY", "secret")
+        config_file = tmp_path / "llm_config.json"
+        config_file.write_text(json.dumps({
+            "config_list": [
+                {"model": "gpt-4o", "api_key": "ENV:STUB_KEY", "api_type": "openai", "tier": "strong", "base_url": STRONG_URL},
+                {"model": "gemini-1.5-flash", "api_key": "ENV:STUB_KEY", "api_type": "google", "tier": "fast", "max_concurrency": 2},
+            ],
+            "routing": {"large_prompt_chars": 500},
+            "temperature": 0.3,
+        }))
+
+        router = LLMRouter.from_config(str(config_file))
+        strong, fast = router.providers
+        assert (strong.tier, strong.base_url, strong.api_key) == (STRONG, STRONG_URL, "secret")
+        assert (fast.tier, fast.max_concurrency, fast.temperature) == (FAST, 2, 0.3)
+        assert router.large_prompt_chars == 500
+
+    def test_chatbot_uses_router_backend(self, monkeypatch, tmp_path):
+        from app.services.chatbot import StoryboardChatbot, ChatMessage
+
+        config_file = tmp_path / "llm_config.json"
+        config_file.write_text(json.dumps({"config_list": [
+            {"model": "gpt-4o", "api_key": "k", "api_type": "openai", "tier": "strong", "base_url": STRONG_URL},
+            {"model": "gemini-1.5-flash", "api_key": "k", "api_type": "google", "tier": "fast", "base_url": FAST_URL},
+        ]}))
+        monkeypatch.setenv("LANGFLOW_API_KEY", "test-key")
+        monkeypatch.setenv("CHAT_BACKEND", "router")
+        monkeypatch.setenv("LLM_CONFIG_PATH", str(config_file))
+        monkeypatch.setattr(config_service, "_snapshot", load_settings())
+        calls = install_stubs(monkeypatch, {STRONG_URL: create_app(), FAST_URL: create_app()})
+
+        bot = StoryboardChatbot()
+        history = [ChatMessage(role="user", content="brief"), ChatMessage(role="assistant", content="draft")]
+        assert "screen_number" in bot.generate_response("shorten screen 2", history)
+        assert calls == [FAST_URL]
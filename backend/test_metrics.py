@@ -0,0 +1,75 @@
+"""
+Test suite for the metrics registry and middleware
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.metrics import MetricsRegistry, MetricsMiddleware, HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT
+
+
+class TestRegistry:
+    """Test metric types and text rendering"""
+
+    def test_counter_renders_with_labels(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "A counter", labels=("kind",))
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+
+        text = registry.render()
+        assert "# TYPE test_total counter" in text
+        assert 'test_total{kind="a"} 3' in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "A histogram", buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5.0)
+
+        text = registry.render()
+        assert 'test_seconds_bucket{le="0.1"} 1' in text
+        assert 'test_seconds_bucket{le="1"} 2' in text
+        assert 'test_seconds_bucket{le="+Inf"} 3' in text
+        assert "test_seconds_count 3" in text
+        assert histogram.get_sum() == 5.55
+
+    def test_histogram_time_accepts_late_labels(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("call_seconds", "Calls", labels=("status",))
+        with histogram.time(status="error") as labels:
+            labels["status"] = 200
+        assert histogram.get_count(status="200") == 1
+        assert histogram.get_count(status="error") == 0
+
+    def test_gauge_track(self):
+        registry = MetricsRegistry()
+        gauge = registry.gauge("busy", "In flight")
+        with gauge.track():
+            assert gauge.get() == 1
+        assert gauge.get() == 0
+
+    def test_register_is_idempotent(self):
+        registry = MetricsRegistry()
+        assert registry.counter("same", "x") is registry.counter("same", "x")
+
+
+class TestMiddleware:
+    """Test per-route request metrics"""
+
+    def test_records_templated_route(self):
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/items/{item_id}")
+        async def get_item(item_id: str):
+            return {"id": item_id}
+
+        client = TestClient(app)
+        before = HTTP_REQUEST_DURATION.get_count(method="GET", route="/items/{item_id}", status="200")
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/nowhere")
+
+        assert HTTP_REQUEST_DURATION.get_count(method="GET", route="/items/{item_id}", status="200") == before + 2
+        assert HTTP_REQUEST_DURATION.get_count(method="GET", route="unmatched", status="404") >= 1
+        assert HTTP_REQUESTS_IN_FLIGHT.get(method="GET", route="/items/{item_id}") == 0
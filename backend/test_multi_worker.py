@@ -0,0 +1,136 @@
+"""
+Test suite for multi-worker mode: cross-process locks and the shared cache
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+import pytest
+from app.services import shared_cache
+from app.services.image_query_index import ImageQueryIndex, get_image_query_index
+from app.services.langflow_sessions import LangflowSessionStore, SHARED_CHANNEL as SESSION_CHANNEL
+from app.services.project_events import SHARED_CHANNEL as EVENT_CHANNEL
+from app.services.shared_cache import SharedCache, get_shared_cache
+from app.utils.file_lock import named_lock, project_lock
+from config.settings import get_settings
+
+BACKEND_DIR = Path(__file__).parent
+
+HOLD_LOCK = """
+import sys
+from pathlib import Path
+from app.utils.file_lock import named_lock, project_lock
+lock = project_lock(Path(sys.argv[2])) if sys.argv[1] == "project" else named_lock(sys.argv[2])
+lock.acquire()
+print("locked", flush=True)
+sys.stdin.read()
+"""
+
+
+@pytest.fixture
+def workers(monkeypatch, tmp_path, configure, make_client):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    configure(data_dir, STORYBOARD_MULTI_WORKER="true", SHARED_CACHE_POLL_INTERVAL="0.02")
+    monkeypatch.setattr(shared_cache, "_cache", None)
+    client = make_client()
+    this_worker = get_shared_cache()
+    # a second cache on the same database stands in for another worker process; it is polled by hand
+    other_worker = SharedCache(this_worker.path, poll_interval=3600)
+    yield data_dir, client, other_worker
+    other_worker.close()
+    this_worker.close()
+
+
+@pytest.fixture
+def hold_lock():
+    """Take a lock in a separate Python process until the test ends"""
+    processes = []
+
+    def hold(kind: str, name: str):
+        process = subprocess.Popen([sys.executable, "-c", HOLD_LOCK, kind, name], cwd=BACKEND_DIR, env=dict(os.environ),
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        processes.append(process)
+        assert process.stdout.readline().strip() == "locked"
+        return process
+
+    yield hold
+    for process in processes:
+        process.stdin.close()
+        process.wait(timeout=10)
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestMultiWorker:
+    """Test that locks and cache changes reach other worker processes"""
+
+    def test_project_lock_excludes_other_processes(self, workers, hold_lock):
+        data_dir, _, _ = workers
+        lock = project_lock(data_dir / "project_p1")
+
+        holder = hold_lock("project", str(data_dir / "project_p1"))
+
+        assert not lock.acquire(blocking=False)
+        holder.stdin.close()
+        holder.wait(timeout=10)
+        with lock:
+            # reentrant within a thread, as restore snapshots while holding it
+            with lock:
+                assert (data_dir / ".locks" / "project_p1.lock").exists()
+
+    def test_one_garbage_collection_across_workers(self, workers, hold_lock):
+        _, client, _ = workers
+        hold_lock("named", "gc")
+
+        response = client.post("/api/admin/gc")
+
+        assert response.status_code == 409
+        assert named_lock("gc").acquire(blocking=False) is False
+
+    def test_image_searches_are_shared(self, workers):
+        data_dir, client, other_worker = workers
+        local = get_image_query_index()
+        other = ImageQueryIndex(local.index_file, get_settings().image_search, other_worker)
+
+        other.add("red sports car on a coastal road", [{"link": "https://images.example.com/car.jpg"}])
+
+        assert wait_for(lambda: local.find("red sports car on a coastal road")[0] is not None)
+        assert client.get("/api/shared-cache-stats").json()["stats"]["entries"] == {"image_query": 1}
+        # a worker started later loads the shared entries instead of the JSONL file
+        assert ImageQueryIndex(local.index_file, get_settings().image_search, other_worker).get_stats()["entries"] == 1
+
+    def test_langflow_session_replaced_by_another_worker(self, workers):
+        data_dir, _, other_worker = workers
+        (data_dir / "project_p1").mkdir()
+        store = LangflowSessionStore(data_dir)
+        first = store.open("p1")
+        assert store.get("p1").session_id == first.session_id
+
+        replaced = LangflowSessionStore(data_dir).open("p1")
+        other_worker.publish(SESSION_CHANNEL, "p1")
+
+        assert wait_for(lambda: store.get("p1").session_id == replaced.session_id)
+
+    def test_project_events_cross_workers(self, workers):
+        _, client, other_worker = workers
+        client.post("/api/create-project", json={"projectId": "p1", "typeId": 1, "typeName": "Product Release Video", "userInput": "Launch"})
+
+        with client.websocket_connect("/ws/project/p1") as websocket:
+            assert websocket.receive_json()["type"] == "subscribed"
+            other_worker.publish(EVENT_CHANNEL, "p1", json.dumps({"type": "story.updated", "project_id": "p1", "seq": 1, "data": {"story_id": "story_1"}}))
+            assert websocket.receive_json()["data"] == {"story_id": "story_1"}
+
+        client.post("/api/chat/save", json={"projectId": "p1", "messages": [
+            {"id": "m1", "role": "user", "content": "Hello", "createdAt": "2025-01-01T00:00:00"}]})
+        channels = [row[0] for row in other_worker._connection().execute("SELECT channel FROM messages WHERE key = 'p1'")]
+        assert EVENT_CHANNEL in channels
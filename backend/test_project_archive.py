@@ -0,0 +1,173 @@
+"""
+Test suite for streaming project export and import
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import zipfile
+import pytest
+from app.services.image_proxy import ImageRecord, get_image_proxy
+from app.services.langflow_sessions import SESSION_FILENAME
+from app.services.project_archive import CHUNK_SIZE, export_projects
+
+
+@pytest.fixture
+def archive_env(tmp_path, configure, make_client):
+    data_dir = configure(tmp_path / "data")
+    client = make_client()
+    for project_id in ("p1", "p2"):
+        client.post("/api/create-project", json={"projectId": project_id, "typeId": 1, "typeName": "Product Release Video", "userInput": "Launch"})
+    return data_dir, client
+
+
+def cache_image(tmp_path, data: bytes) -> str:
+    image_hash = hashlib.sha256(data).hexdigest()
+    source = tmp_path / "download"
+    source.write_bytes(data)
+    get_image_proxy().adopt(ImageRecord(hash=image_hash, content_type="image/jpeg", bytes=len(data),
+                                        source_url="https://images.example.com/a.jpg", fetched_at=0), source)
+    return image_hash
+
+
+def fill_project(client, project_id, image_url=None):
+    stories = [{"screen_number": 1, "voiceover_text": "Intro", "image_url": image_url},
+               {"screen_number": 2, "voiceover_text": "Outro", "image_url": image_url}]
+    client.post(f"/api/project/{project_id}/save-stories", json={"project_id": project_id, "stories": stories})
+    client.post("/api/chat/save", json={"projectId": project_id, "messages": [
+        {"id": "m1", "role": "user", "content": "hi", "createdAt": "2025-01-01T00:00:00"}]})
+
+
+def make_archive(entries, fmt="tar"):
+    buffer = io.BytesIO()
+    if fmt == "zip":
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name, data in entries.items():
+                archive.writestr(name, data)
+    else:
+        with tarfile.open(fileobj=buffer, mode="w") as archive:
+            for name, data in entries.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def valid_entries():
+    return {
+        "manifest.json": json.dumps({"format": 1, "projects": ["p9"]}).encode(),
+        "projects/p9/project_type1.json": json.dumps({"id": "p9", "type": 1, "stories": ["story_1"]}).encode(),
+        "projects/p9/story_1.json": json.dumps({"screen_number": 1, "voiceover_text": "Intro"}).encode(),
+    }
+
+
+class TestExportImport:
+    """Test round trips through the export and import endpoints"""
+
+    @pytest.mark.parametrize("fmt", ["tar", "tar.gz", "zip"])
+    def test_round_trip_restores_projects(self, archive_env, tmp_path, fmt):
+        data_dir, client = archive_env
+        image_hash = cache_image(tmp_path, b"\xff\xd8\xff" + os.urandom(200_000))
+        fill_project(client, "p1", image_url=f"/api/images/{image_hash}")
+        fill_project(client, "p2")
+        before = client.get("/api/project/p1").json()
+
+        response = client.get(f"/api/projects/export?format={fmt}&images=true")
+        assert response.status_code == 200
+        assert response.headers["content-disposition"].endswith(f'.{fmt}"')
+
+        shutil.rmtree(data_dir)
+        imported = client.post("/api/projects/import", content=response.content).json()
+
+        assert sorted(imported["imported"]) == ["p1", "p2"]
+        assert imported["images"] == 1
+        after = client.get("/api/project/p1").json()
+        assert after["stories"] == before["stories"]
+        assert after["story_ids"] == before["story_ids"]
+        assert client.get("/api/chat/history/p1").json()["messages"][0]["id"] == "m1"
+        assert client.get("/api/project/p1/revisions/1").status_code == 200
+        assert client.get(f"/api/images/{image_hash}?format=original").status_code == 200
+
+    def test_conflicting_projects(self, archive_env):
+        data_dir, client = archive_env
+        fill_project(client, "p1")
+        archive = client.get("/api/project/p1/export?format=zip").content
+        client.post("/api/project/p1/save-stories", json={"project_id": "p1", "stories": [{"screen_number": 1, "voiceover_text": "Edited"}]})
+
+        assert client.post("/api/projects/import", content=archive).status_code == 409
+        assert client.post("/api/projects/import?on_conflict=skip", content=archive).json()["skipped"] == ["p1"]
+        assert client.get("/api/project/p1").json()["stories"][0]["voiceover_text"] == "Edited"
+
+        replaced = client.post("/api/projects/import?on_conflict=replace", content=archive).json()
+        assert replaced["replaced"] == ["p1"]
+        assert [s["voiceover_text"] for s in client.get("/api/project/p1").json()["stories"]] == ["Intro", "Outro"]
+        assert not [p for p in data_dir.iterdir() if p.name.startswith((".import-", ".upload-"))]
+
+    def test_export_streams_in_bounded_chunks(self, archive_env, tmp_path):
+        data_dir, client = archive_env
+        image_hash = cache_image(tmp_path, os.urandom(20 * CHUNK_SIZE))
+        fill_project(client, "p1", image_url=f"/api/images/{image_hash}")
+
+        for fmt in ("tar", "zip"):
+            chunks = list(export_projects([data_dir / "project_p1"], fmt, include_images=True))
+            assert len(chunks) > 20
+            assert max(len(c) for c in chunks) <= CHUNK_SIZE + 1024
+
+    def test_langflow_session_is_not_exported(self, archive_env):
+        data_dir, client = archive_env
+        fill_project(client, "p1")
+        (data_dir / "project_p1" / SESSION_FILENAME).write_text(json.dumps({"session_id": "p1-abc"}))
+
+        archive = client.get("/api/project/p1/export?format=tar").content
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            names = tar.getnames()
+        assert "projects/p1/chat_history.json" in names
+        assert not [name for name in names if name.endswith(SESSION_FILENAME)]
+
+    def test_unknown_project_or_format(self, archive_env):
+        _, client = archive_env
+        assert client.get("/api/project/missing/export").status_code == 404
+        assert client.get("/api/project/p1/export?format=rar").status_code == 400
+
+
+class TestImportValidation:
+    """Test that invalid archives are rejected without writing anything"""
+
+    @pytest.mark.parametrize("change", [
+        lambda e: e.pop("manifest.json"),
+        lambda e: e.pop("projects/p9/story_1.json"),
+        lambda e: e.update({"projects/p9/story_1.json": b'{"image_candidates": "nope"}'}),
+        lambda e: e.update({"projects/p9/project_type1.json": json.dumps({"id": "other"}).encode()}),
+        lambda e: e.update({"projects/../escape.json": b"{}"}),
+        lambda e: e.update({"manifest.json": json.dumps({"format": 1, "projects": ["p9", "p10"]}).encode()}),
+        lambda e: e.update({"images/ab/" + "ab" * 32: b"not matching"}),
+    ])
+    def test_invalid_archive_is_rejected(self, archive_env, change):
+        data_dir, client = archive_env
+        entries = valid_entries()
+        change(entries)
+
+        response = client.post("/api/projects/import", content=make_archive(entries))
+
+        assert response.status_code == 400
+        assert not (data_dir / "project_p9").exists()
+        assert not [p for p in data_dir.iterdir() if p.name.startswith((".import-", ".upload-"))]
+
+    def test_handmade_archive_is_accepted(self, archive_env):
+        data_dir, client = archive_env
+        response = client.post("/api/projects/import", content=make_archive(valid_entries(), "zip"))
+        assert response.json()["imported"] == ["p9"]
+        assert client.get("/api/project/p9").json()["stories"][0]["voiceover_text"] == "Intro"
+
+    def test_truncated_archive_is_rejected(self, archive_env):
+        data_dir, client = archive_env
+        fill_project(client, "p1")
+        archive = client.get("/api/projects/export?format=tar.gz").content
+        shutil.rmtree(data_dir / "project_p2")
+
+        response = client.post("/api/projects/import", content=archive[:len(archive) // 2])
+
+        assert response.status_code == 400
+        assert not (data_dir / "project_p2").exists()
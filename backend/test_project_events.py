@@ -0,0 +1,117 @@
+"""
+Test suite for per-project WebSocket events
+"""
+import asyncio
+import json
+import pytest
+from starlette.websockets import WebSocketDisconnect
+from app.services import image_query_index as index_module
+from app.services.image_resolver import ImageResolver
+from app.services.project_events import ProjectEventBus, project_events
+
+
+@pytest.fixture
+def events_env(monkeypatch, tmp_path, configure, make_client):
+    configure()
+    monkeypatch.setattr(index_module, "search_image_candidates",
+                        lambda query: [{"link": "https://images.example.com/desk.jpg", "score": 0.9}])
+    project_dir = tmp_path / "project_p1"
+    project_dir.mkdir()
+    (project_dir / "project_type1.json").write_text(json.dumps({"id": "p1", "stories": []}))
+    return project_dir, make_client()
+
+
+def receive_until(ws, event_type):
+    events = []
+    while not events or events[-1]["type"] != event_type:
+        events.append(ws.receive_json())
+    return events
+
+
+class TestProjectSocket:
+    """Test events pushed from the write paths"""
+
+    def test_saved_stories_are_pushed(self, events_env):
+        _, client = events_env
+        stories = [{"screen_number": 1, "voiceover_text": "Intro"}, {"screen_number": 2, "voiceover_text": "Outro"}]
+
+        with client.websocket_connect("/ws/project/p1") as ws:
+            assert ws.receive_json()["type"] == "subscribed"
+            saved = client.post("/api/project/p1/save-stories", json={"project_id": "p1", "stories": stories}).json()
+            events = receive_until(ws, "storyboard.updated")
+
+        added = [e for e in events if e["type"] == "story.added"]
+        assert sorted(e["data"]["story"]["voiceover_text"] for e in added) == ["Intro", "Outro"]
+        assert events[-1]["data"]["stories"] == saved["story_files"]
+        assert events[-1]["data"]["revision"] == saved["revision"]
+        assert [e["seq"] for e in events] == sorted(e["seq"] for e in events)
+
+    def test_resolved_images_are_pushed(self, events_env):
+        project_dir, client = events_env
+        story_file = project_dir / "story_1.json"
+        story_file.write_text(json.dumps({"on_screen_visual_keywords": "office desk", "image_status": "pending"}))
+        resolver = ImageResolver(workers=1)
+
+        with client.websocket_connect("/ws/project/p1") as ws:
+            ws.receive_json()
+            resolver.submit([story_file])[0].result(timeout=5)
+            event = ws.receive_json()
+        resolver.shutdown()
+
+        assert event["type"] == "image.resolved"
+        assert event["data"]["story_id"] == "story_1"
+        assert event["data"]["image_status"] == "ready"
+        assert "image_candidates" not in event["data"]
+
+    def test_only_new_chat_messages_are_pushed(self, events_env):
+        _, client = events_env
+        first = {"id": "m1", "role": "user", "content": "hi", "createdAt": "2025-01-01T00:00:00"}
+        second = {"id": "m2", "role": "assistant", "content": "hello", "createdAt": "2025-01-01T00:00:01"}
+        client.post("/api/chat/save", json={"projectId": "p1", "messages": [first]})
+
+        with client.websocket_connect("/ws/project/p1") as ws:
+            ws.receive_json()
+            client.post("/api/chat/save", json={"projectId": "p1", "messages": [first, second]})
+            event = ws.receive_json()
+
+        assert event["type"] == "chat.message"
+        assert event["data"]["message"]["id"] == "m2"
+
+    def test_unknown_project_is_refused(self, events_env):
+        _, client = events_env
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            with client.websocket_connect("/ws/project/missing") as ws:
+                ws.receive_json()
+        assert excinfo.value.code == 4404
+        assert project_events.get_stats()["subscribers"] == 0
+
+
+class TestEventBus:
+    """Test fan-out and slow subscribers"""
+
+    def test_slow_subscriber_is_asked_to_resync(self):
+        async def scenario():
+            bus = ProjectEventBus()
+            subscription = bus.subscribe("p1")
+            subscription.queue = asyncio.Queue(maxsize=2)
+            for i in range(5):
+                bus.publish("p1", "story.updated", {"i": i})
+            await asyncio.sleep(0)  # let the queued offers run
+            resync = json.loads(await subscription.next(timeout=0.1))
+            idle = await subscription.next(timeout=0.01)  # what was buffered is superseded by the resync
+            bus.publish("p1", "story.updated", {"i": 5})
+            await asyncio.sleep(0)
+            after = json.loads(await subscription.next(timeout=0.1))
+            bus.unsubscribe(subscription)
+            return resync, idle, after, bus
+
+        resync, idle, after, bus = asyncio.run(scenario())
+        assert resync["type"] == "resync"
+        assert idle is None
+        assert after["data"] == {"i": 5}
+        assert bus.get_stats() == {"projects": 0, "subscribers": 0, "published": 6}
+
+    def test_publish_without_subscribers_is_a_no_op(self):
+        bus = ProjectEventBus()
+        bus.publish("p1", "story.updated", {})
+        assert bus.get_stats()["published"] == 0
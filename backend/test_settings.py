@@ -0,0 +1,163 @@
+"""
+Test suite for the cached configuration service
+"""
+import json
+import os
+import threading
+import pytest
+from config.settings import ConfigService, load_settings
+
+
+def write_config(path, **sections):
+    config = {"config_list": [{"model": "gpt-4o", "api_key": "ENV:TEST_OPENAI_KEY", "api_type": "openai"}]}
+    config.update(sections)
+    path.write_text(json.dumps(config))
+    # make sure the watcher sees a new mtime even on coarse filesystems
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "llm_config.json"
+    write_config(path, langflow={"timeout": 120, "hosts": ["a:7860"]})
+    return path
+
+
+def make_service(tmp_path, config_file):
+    return ConfigService(config_path=str(config_file), env_file=tmp_path / "missing.env")
+
+
+class TestLoadSettings:
+    """Test how a snapshot is assembled"""
+
+    def test_file_tunables_and_env_overrides(self, config_file):
+        settings = load_settings(str(config_file), env={"LANGFLOW_HOSTS": "x:1, y:2", "LANGFLOW_HEDGE": "true"})
+        assert settings.langflow.timeout == 120
+        assert settings.langflow.hosts == ("x:1", "y:2")
+        assert settings.langflow.hedge is True
+
+    def test_missing_env_key_does_not_fail(self, config_file):
+        settings = load_settings(str(config_file), env={})
+        assert settings.llm.config_list[0]["api_key"] is None
+
+    def test_env_file_is_read(self, tmp_path, config_file, monkeypatch):
+        monkeypatch.delenv("LANGFLOW_API_KEY", raising=False)
+        env_file = tmp_path / ".env"
+        env_file.write_text("LANGFLOW_API_KEY=from-dotenv\n")
+        settings = ConfigService(str(config_file), env_file).get()
+        assert settings.langflow.api_key == "from-dotenv"
+        assert "LANGFLOW_API_KEY" not in os.environ
+
+
+class TestReload:
+    """Test swapping snapshots"""
+
+    def test_get_is_cached(self, tmp_path, config_file):
+        service = make_service(tmp_path, config_file)
+        assert service.get() is service.get()
+
+    def test_reload_swaps_and_reports_changes(self, tmp_path, config_file):
+        service = make_service(tmp_path, config_file)
+        first = service.get()
+        seen = []
+        service.subscribe(seen.append)
+
+        write_config(config_file, langflow={"timeout": 30, "hosts": ["a:7860"]})
+        settings, changed = service.reload()
+
+        assert settings.version == first.version + 1
+        assert changed == ["langflow.timeout"]
+        assert service.get().langflow.timeout == 30
+        assert first.langflow.timeout == 120  # old snapshot is untouched
+        assert seen == [settings]
+
+    def test_unchanged_reload_keeps_snapshot(self, tmp_path, config_file):
+        service = make_service(tmp_path, config_file)
+        first = service.get()
+        assert service.reload() == (first, [])
+
+    def test_invalid_config_keeps_old_snapshot(self, tmp_path, config_file):
+        service = make_service(tmp_path, config_file)
+        first = service.get()
+        write_config(config_file, langflow={"timeout": "soon"})
+
+        assert service.check_for_changes()
+        assert service.get() is first
+        with pytest.raises(ValueError):
+            service.reload()
+
+    def test_watcher_check_picks_up_file_change(self, tmp_path, config_file):
+        service = make_service(tmp_path, config_file)
+        service.get()
+        assert not service.check_for_changes()
+
+        write_config(config_file, langflow={"timeout": 45, "hosts": ["a:7860"]})
+        assert service.check_for_changes()
+        assert service.get().langflow.timeout == 45
+
+    def test_missing_config_file_keeps_old_snapshot(self, tmp_path, config_file):
+        service = make_service(tmp_path, config_file)
+        first = service.get()
+        config_file.unlink()  # an editor saving by rename
+
+        assert service.check_for_changes()
+        assert service.get() is first
+        write_config(config_file, langflow={"timeout": 45, "hosts": ["a:7860"]})
+        assert service.check_for_changes()
+        assert service.get().langflow.timeout == 45
+
+    def test_watcher_survives_a_failed_check(self, tmp_path, config_file, monkeypatch):
+        write_config(config_file, watch_interval=0.01)
+        service = make_service(tmp_path, config_file)
+        checks = []
+        checked_again = threading.Event()
+
+        def check_for_changes():
+            checks.append(1)
+            if len(checks) == 1:
+                raise RuntimeError("boom")
+            checked_again.set()
+
+        monkeypatch.setattr(service, "check_for_changes", check_for_changes)
+        service.start_watcher()
+        try:
+            assert checked_again.wait(5)
+        finally:
+            service.stop_watcher()
+
+    def test_describe_redacts_secrets(self, tmp_path, config_file, monkeypatch):
+        monkeypatch.setenv("TEST_OPENAI_KEY", "sk-secret")
+        monkeypatch.setenv("LANGFLOW_API_KEY", "lf-secret")
+        described = json.dumps(make_service(tmp_path, config_file).describe())
+        assert "sk-secret" not in described
+        assert "lf-secret" not in described
+
+
+class TestChatbotReload:
+    """Test that the chatbot follows configuration swaps"""
+
+    def test_reload_updates_timeout_and_hosts(self, tmp_path, config_file, monkeypatch):
+        from app.services import chatbot as chatbot_module
+
+        monkeypatch.setenv("LANGFLOW_API_KEY", "test-key")
+        monkeypatch.delenv("LANGFLOW_HOSTS", raising=False)
+        monkeypatch.delenv("LANGFLOW_HOST", raising=False)
+        service = make_service(tmp_path, config_file)
+        monkeypatch.setattr(chatbot_module, "config_service", service)
+        monkeypatch.setattr(chatbot_module, "get_settings", service.get)
+
+        bot = chatbot_module.StoryboardChatbot()
+        pool, sessions = bot.pool, bot.sessions
+        assert bot.timeout == 120
+
+        write_config(config_file, langflow={"timeout": 60, "hosts": ["a:7860"], "hedge": True})
+        service.reload()
+        assert bot.timeout == 60
+        assert bot.pool is pool and pool.hedge is True
+        assert bot.sessions is sessions
+
+        write_config(config_file, langflow={"timeout": 60, "hosts": ["a:7860", "b:7860"]})
+        service.reload()
+        assert [e.host for e in bot.pool.endpoints] == ["a:7860", "b:7860"]
+        assert pool._executor._shutdown
@@ -0,0 +1,148 @@
+"""
+Test suite for storage garbage collection
+"""
+import hashlib
+import json
+import os
+import time
+import pytest
+from app.services.image_proxy import ImageRecord, get_image_proxy
+from app.services.storage_gc import collect_garbage, EMPTY_PROJECT, CHAT_ONLY_PROJECT, DUPLICATE_STORY, UNREFERENCED_STORY, UNREFERENCED_BLOB, UNREFERENCED_IMAGE, TEMP_FILE
+
+OLD = time.time() - 30 * 24 * 3600
+
+
+@pytest.fixture
+def gc_env(tmp_path, configure, make_client):
+    # image downloads are staged in tmp_path, outside the data directory
+    return configure(tmp_path / "data"), make_client()
+
+
+def age(path, mtime=OLD):
+    """Make a file, or a folder and everything in it, look untouched for a month"""
+    for p in [path, *path.rglob("*")] if path.is_dir() else [path]:
+        os.utime(p, (mtime, mtime))
+
+
+def cache_image(tmp_path, data: bytes) -> str:
+    image_hash = hashlib.sha256(data).hexdigest()
+    source = tmp_path / f"download-{image_hash[:8]}"
+    source.write_bytes(data)
+    get_image_proxy().adopt(ImageRecord(hash=image_hash, content_type="image/jpeg", bytes=len(data),
+                                        source_url=f"https://images.example.com/{image_hash[:8]}.jpg", fetched_at=0), source)
+    return image_hash
+
+
+def legacy_project(data_dir, project_id, listed, files):
+    """A project written by the old save path, which left replaced story files behind"""
+    project_dir = data_dir / f"project_{project_id}"
+    project_dir.mkdir(parents=True)
+    (project_dir / "project_type1.json").write_text(json.dumps({"id": project_id, "type": 1, "stories": listed}))
+    for name, story in files.items():
+        (project_dir / f"{name}.json").write_text(json.dumps(story))
+    age(project_dir)
+    return project_dir
+
+
+def screen(number, text, image_url=None):
+    return {"screen_number": number, "voiceover_text": text, "image_url": image_url}
+
+
+class TestStorageGC:
+    """Test what the collector finds and what it leaves alone"""
+
+    def test_dry_run_reports_without_removing(self, gc_env):
+        data_dir, client = gc_env
+        project_dir = legacy_project(data_dir, "old", ["story_2"], {"story_1": screen(1, "Replaced"), "story_2": screen(1, "Current")})
+
+        report = client.post("/api/admin/gc").json()
+
+        assert report["dry_run"] is True
+        assert report["counts"][UNREFERENCED_STORY] == 1
+        assert report["reclaimable_bytes"] == (project_dir / "story_1.json").stat().st_size
+        assert [item["path"] for item in report["items"]] == [os.path.join("project_old", "story_1.json")]
+        assert (project_dir / "story_1.json").exists()
+
+    def test_apply_removes_orphans_and_compacts_duplicates(self, gc_env):
+        data_dir, client = gc_env
+        project_dir = legacy_project(data_dir, "old", ["story_1", "story_2", "story_3", "story_3"], {
+            "story_1": screen(1, "Intro"),
+            "story_2": screen(1, "Intro"),
+            "story_3": screen(2, "Outro"),
+            "story_9": screen(3, "Dropped long ago"),
+        })
+        (project_dir / "project_type1.json.123.tmp").write_text("{")
+        age(project_dir)
+
+        report = client.post("/api/admin/gc?dry_run=false").json()
+
+        assert report["counts"][UNREFERENCED_STORY] == 1
+        assert report["counts"][DUPLICATE_STORY] == 1
+        assert report["counts"][TEMP_FILE] == 1
+        assert report["compacted_projects"] == ["old"]
+        assert sorted(p.name for p in project_dir.glob("story_*")) == ["story_2.json", "story_3.json"]
+        project = client.get("/api/project/old").json()
+        assert project["story_ids"] == ["story_2", "story_3"]
+        assert collect_garbage(dry_run=True).reclaimable_bytes == 0
+
+    def test_recently_edited_projects_are_left_alone(self, gc_env):
+        data_dir, client = gc_env
+        project_dir = legacy_project(data_dir, "busy", ["story_2", "story_2"], {"story_1": screen(1, "A"), "story_2": screen(1, "B")})
+        (project_dir / "project_type1.json").touch()
+
+        report = client.post("/api/admin/gc?dry_run=false").json()
+
+        assert report["reclaimable_bytes"] == 0
+        assert (project_dir / "story_1.json").exists()
+
+    def test_empty_projects_after_their_grace_period(self, gc_env):
+        data_dir, client = gc_env
+        client.post("/api/create-project", json={"projectId": "fresh", "typeId": 1, "typeName": "Product Release Video", "userInput": "Launch"})
+        abandoned = legacy_project(data_dir, "abandoned", [], {})
+        (abandoned / "chat_history.json").write_text(json.dumps({"messages": []}))
+        age(abandoned)
+        talked = legacy_project(data_dir, "talked", [], {})
+        (talked / "chat_history.json").write_text(json.dumps({"messages": [
+            {"id": "m1", "role": "user", "content": "hi", "createdAt": "2025-01-01T00:00:00"}]}))
+        age(talked)
+
+        recent = legacy_project(data_dir, "recent", [], {})
+        (recent / "chat_history.json").write_text((talked / "chat_history.json").read_text())
+
+        report = client.post("/api/admin/gc?dry_run=false").json()
+
+        assert report["counts"][EMPTY_PROJECT] == 1
+        # a conversation that never produced a storyboard is reported on its own
+        assert report["counts"][CHAT_ONLY_PROJECT] == 1
+        assert not abandoned.exists() and not talked.exists()
+        assert (data_dir / "project_fresh").exists()
+        assert recent.exists()
+
+    def test_unreferenced_blobs_and_images(self, gc_env, tmp_path):
+        data_dir, client = gc_env
+        kept = cache_image(tmp_path, b"\xff\xd8\xff" + os.urandom(1000))
+        dropped = cache_image(tmp_path, b"\xff\xd8\xff" + os.urandom(1000))
+        client.post("/api/create-project", json={"projectId": "p1", "typeId": 1, "typeName": "Product Release Video", "userInput": "Launch"})
+        client.post("/api/project/p1/save-stories", json={"project_id": "p1", "stories": [screen(1, "Intro", f"/api/images/{dropped}")]})
+        client.post("/api/project/p1/save-stories", json={"project_id": "p1", "stories": [screen(1, "Intro", f"/api/images/{kept}")]})
+        age(data_dir)
+        # a blob nothing refers to, as left by an interrupted snapshot
+        orphan = data_dir / "blobs" / "ab" / ("ab" * 32 + ".json")
+        orphan.parent.mkdir(exist_ok=True)
+        orphan.write_text("{}")
+        age(orphan)
+
+        report = collect_garbage(dry_run=False)
+
+        # both revisions are history, so their blobs and the images they show stay
+        assert report.counts[UNREFERENCED_BLOB] == 1
+        assert report.counts[UNREFERENCED_IMAGE] == 0
+        assert not orphan.exists()
+
+        (data_dir / "project_p1" / "revisions.jsonl").unlink()
+        age(data_dir / "project_p1")
+        report = collect_garbage(dry_run=False)
+
+        assert report.counts[UNREFERENCED_IMAGE] == 3  # original, metadata and source url entry
+        assert client.get(f"/api/images/{kept}?format=original").status_code == 200
+        assert client.get(f"/api/images/{dropped}?format=original").status_code == 404
@@ -0,0 +1,129 @@
+"""
+Test suite for the storage I/O pools
+"""
+import asyncio
+import json
+import threading
+import importlib
+import time
+from app.utils import storage_io
+from app.utils.image_search import GoogleImageSearch
+from app.utils.storage_io import StorageIO, READ, WRITE, read_json, write_json
+
+
+async def loop_lag_during(work) -> float:
+    """Longest delay of a 5 ms ticker while the awaitable returned by ``work()`` runs"""
+    loop = asyncio.get_running_loop()
+    done = asyncio.Event()
+    worst = 0.0
+
+    async def tick():
+        nonlocal worst
+        while not done.is_set():
+            start = loop.time()
+            await asyncio.sleep(0.005)
+            worst = max(worst, loop.time() - start - 0.005)
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0)
+    await work()
+    done.set()
+    await ticker
+    return worst
+
+
+class TestStorageIO:
+    """Test that file work leaves the event loop and respects pool limits"""
+
+    def test_pool_keeps_loop_responsive(self):
+        pools = StorageIO(read_workers=4, write_workers=1)
+        try:
+            lag = asyncio.run(loop_lag_during(lambda: asyncio.gather(*(pools.run(READ, time.sleep, 0.1) for _ in range(4)))))
+        finally:
+            pools.shutdown()
+        assert lag < 0.05
+
+    def test_zero_workers_run_inline(self):
+        pools = StorageIO(read_workers=0, write_workers=0)
+        lag = asyncio.run(loop_lag_during(lambda: pools.run(READ, time.sleep, 0.1)))
+        assert lag >= 0.09
+
+    def test_limits_are_separate_per_kind(self):
+        pools = StorageIO(read_workers=3, write_workers=1)
+        running = {READ: 0, WRITE: 0}
+        peak = {READ: 0, WRITE: 0}
+        lock = threading.Lock()
+
+        def job(kind):
+            with lock:
+                running[kind] += 1
+                peak[kind] = max(peak[kind], running[kind])
+            time.sleep(0.02)
+            with lock:
+                running[kind] -= 1
+
+        async def burst():
+            await asyncio.gather(*(pools.run(kind, job, kind) for kind in (READ, WRITE) for _ in range(8)))
+
+        try:
+            asyncio.run(burst())
+        finally:
+            pools.shutdown()
+        assert peak == {READ: 3, WRITE: 1}
+        assert pools.get_stats()[READ] == {"workers": 3, "running": 0, "queued": 0}
+
+    def test_write_json_replaces_whole_file(self, tmp_path):
+        path = tmp_path / "chat_history.json"
+        write_json(path, {"messages": [1]})
+        write_json(path, {"messages": [1, 2]})
+        assert read_json(path) == {"messages": [1, 2]}
+        assert [p.name for p in tmp_path.iterdir()] == ["chat_history.json"]
+
+    def test_endpoints_use_configured_pools(self, app_env, configure):
+        data_dir, client = app_env
+        configure(STORAGE_IO_READ_WORKERS="2")
+        client.post("/api/create-project", json={"projectId": "p1", "typeId": 1, "typeName": "Product Release Video", "userInput": "Launch"})
+        client.post("/api/chat/save", json={"projectId": "p1", "messages": [
+            {"id": "m1", "role": "user", "content": "hi", "createdAt": "2025-01-01T00:00:00"}]})
+
+        assert client.get("/api/project/p1").json()["project"]["id"] == "p1"
+        assert client.get("/api/chat/history/p1").json()["messages"][0]["id"] == "m1"
+        assert json.loads((data_dir / "project_p1" / "chat_history.json").read_text())["projectId"] == "p1"
+        pools = client.get("/api/storage-io-stats").json()["pools"]
+        assert pools["read"]["workers"] == 2
+        assert storage_io.get_storage_io().limits[READ] == 2
+
+    def test_image_search_endpoint_leaves_the_loop(self, configure, monkeypatch):
+        configure(GOOGLE_CSE_API_KEY="test-key", SEARCH_ENGINE_ID="test-cx")
+        main = importlib.import_module("app.main")
+
+        def slow_search(self, query, num_results=3, image_size=None, image_type=None, safe_search="medium"):
+            time.sleep(0.1)
+            return [{"link": "https://images.example.com/desk.jpg"}][:num_results]
+
+        monkeypatch.setattr(GoogleImageSearch, "search_images", slow_search)
+        answers = []
+
+        async def search():
+            answers.append(await main.get_first_image("office desk"))
+
+        assert asyncio.run(loop_lag_during(search)) < 0.05
+        assert answers[0]["image"] == {"link": "https://images.example.com/desk.jpg"}
+
+    def test_library_endpoints_leave_the_loop(self, configure, monkeypatch):
+        configure()
+        main = importlib.import_module("app.main")
+        library = main.get_image_library()
+
+        def slow_library():
+            time.sleep(0.1)  # a manifest change re-indexes the whole library
+            return library
+
+        monkeypatch.setattr(main, "get_image_library", slow_library)
+        answers = []
+
+        async def stats():
+            answers.append(await main.get_library_stats())
+
+        assert asyncio.run(loop_lag_during(stats)) < 0.05
+        assert answers[0]["success"]
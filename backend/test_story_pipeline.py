@@ -0,0 +1,147 @@
+"""
+Test suite for pipelined story generation from streamed Langflow output
+"""
+import json
+import threading
+import pytest
+import requests
+from app.services import image_query_index as index_module
+from app.services import langflow_pool
+from app.services.chatbot import StoryboardChatbot
+from app.services.image_resolver import get_image_resolver
+
+SCREENS = [
+    {"screen_number": 1, "voiceover_text": "Hello", "on_screen_visual_keywords": "office desk"},
+    {"screen_number": 2, "voiceover_text": "Bye", "on_screen_visual_keywords": "city skyline"},
+]
+TEXT = "Here you go:\n```json\n" + json.dumps(SCREENS, indent=2) + "\n```\n"
+
+
+class StreamedResponse(requests.Response):
+    """A 200 response whose body lines come from a generator"""
+
+    def __init__(self, lines):
+        super().__init__()
+        self.status_code = 200
+        self._lines = lines
+
+    def iter_lines(self, *args, **kwargs):
+        for line in self._lines:
+            yield line.encode("utf-8")
+
+    def close(self):
+        pass
+
+
+def token_events(text, chunk_size=20):
+    for i in range(0, len(text), chunk_size):
+        yield json.dumps({"event": "token", "data": {"chunk": text[i:i + chunk_size]}})
+        yield ""
+
+
+@pytest.fixture
+def pipeline_env(monkeypatch, tmp_path, configure):
+    """Streaming on, images searched inline, a fake search that records when it is called"""
+    configure(LANGFLOW_STREAM="true", LANGFLOW_REUSE_SESSIONS="false", IMAGE_SEARCH_DEFERRED="false")
+    searched = threading.Event()
+    queries = []
+
+    def fake_search(query):
+        queries.append(query)
+        searched.set()
+        return [{"link": f"https://images.example.com/{query.replace(' ', '-')}.jpg", "score": 0.9}]
+
+    monkeypatch.setattr(index_module, "search_image_candidates", fake_search)
+    project_dir = tmp_path / "project_p1"
+    project_dir.mkdir()
+    (project_dir / "project_type1.json").write_text(json.dumps({"id": "p1", "stories": []}))
+    return project_dir, searched, queries
+
+
+def install_langflow(monkeypatch, make_lines):
+    calls = []
+
+    def fake_post(url, data=None, headers=None, timeout=None, params=None, stream=False, **kwargs):
+        calls.append({"params": params, "stream": stream})
+        return StreamedResponse(make_lines())
+
+    monkeypatch.setattr(langflow_pool.requests, "post", fake_post)
+    return calls
+
+
+def read_stories(project_dir):
+    project = json.loads((project_dir / "project_type1.json").read_text())
+    return [json.loads((project_dir / f"{name}.json").read_text()) for name in project["stories"]]
+
+
+class TestPipelinedGeneration:
+    """Test saving screens while the response is still streaming"""
+
+    def test_image_lookup_starts_before_stream_ends(self, monkeypatch, pipeline_env):
+        project_dir, searched, queries = pipeline_env
+        seen_mid_stream = []
+        first_screen_end = TEXT.index("},") + 2
+
+        def lines():
+            yield from token_events(TEXT[:first_screen_end])
+            # hold the rest of the stream until the first screen's lookup has begun
+            seen_mid_stream.append(searched.wait(5))
+            yield from token_events(TEXT[first_screen_end:])
+            yield json.dumps({"event": "end", "data": {"result": {"text": TEXT}}})
+
+        calls = install_langflow(monkeypatch, lines)
+
+        reply = StoryboardChatbot().generate_response("storyboard as json please", project_id="p1")
+
+        assert reply == TEXT
+        assert calls[0]["stream"] and calls[0]["params"] == {"stream": "true"}
+        assert seen_mid_stream == [True]
+        stories = read_stories(project_dir)
+        assert [s["screen_number"] for s in stories] == [1, 2]
+        assert [s["image_status"] for s in stories] == ["ready", "ready"]
+        assert stories[1]["image_url"] == "https://images.example.com/city-skyline.jpg"
+        assert sorted(queries) == ["city skyline", "office desk"]
+
+    def test_deferred_stories_are_queued_as_they_arrive(self, monkeypatch, pipeline_env, configure):
+        project_dir, _, _ = pipeline_env
+        configure(IMAGE_SEARCH_DEFERRED="true")
+        install_langflow(monkeypatch, lambda: token_events(TEXT))
+
+        reply = StoryboardChatbot().generate_response("storyboard as json please", project_id="p1")
+        get_image_resolver().drain(timeout=5)
+
+        assert reply == TEXT  # joined from tokens when there is no end event
+        assert [s["image_status"] for s in read_stories(project_dir)] == ["ready", "ready"]
+
+    def test_failed_stream_leaves_the_storyboard_alone(self, monkeypatch, pipeline_env):
+        project_dir, _, _ = pipeline_env
+        (project_dir / "story_1.json").write_text(json.dumps(SCREENS[0]))
+        (project_dir / "project_type1.json").write_text(json.dumps({"id": "p1", "stories": ["story_1"]}))
+        changed = [{**SCREENS[0], "voiceover_text": "CHANGED"}, SCREENS[1]]
+        text = "```json\n" + json.dumps(changed, indent=2)
+        first_screen_end = text.index("},") + 2
+
+        def lines():
+            yield from token_events(text[:first_screen_end])
+            yield json.dumps({"event": "error", "data": {"error": "flow crashed"}})
+
+        install_langflow(monkeypatch, lines)
+
+        reply = StoryboardChatbot().generate_response("storyboard as json please", project_id="p1")
+
+        assert "unexpected response format" in reply
+        assert read_stories(project_dir) == [SCREENS[0]]
+        assert sorted(p.name for p in project_dir.glob("story_*.json")) == ["story_1.json"]
+
+    def test_falls_back_to_full_text_when_nothing_streams(self, monkeypatch, pipeline_env):
+        project_dir, _, _ = pipeline_env
+
+        def lines():
+            yield json.dumps({"event": "add_message", "data": {"text": "storyboard"}})
+            yield json.dumps({"event": "end", "data": {"result": {"text": TEXT}}})
+
+        install_langflow(monkeypatch, lines)
+
+        StoryboardChatbot().generate_response("storyboard as json please", project_id="p1")
+
+        assert [s["screen_number"] for s in read_stories(project_dir)] == [1, 2]
@@ -0,0 +1,125 @@
+"""
+Test suite for full-text story and chat search
+"""
+import json
+import pytest
+from app.services.story_search import build_match_query, get_story_search
+
+
+@pytest.fixture
+def search_env(tmp_path, configure, make_client):
+    configure()
+    for project_id in ("p1", "p2"):
+        project_dir = tmp_path / f"project_{project_id}"
+        project_dir.mkdir()
+        (project_dir / "project_type1.json").write_text(json.dumps({"id": project_id, "stories": []}))
+    client = make_client()
+    get_story_search().wait_for_backfill()
+    return tmp_path, client
+
+
+def screen(number, voiceover, keywords="", notes=""):
+    return {"screen_number": number, "voiceover_text": voiceover, "on_screen_visual_keywords": keywords, "action_notes": notes}
+
+
+def save(client, project_id, stories):
+    response = client.post(f"/api/project/{project_id}/save-stories", json={"project_id": project_id, "stories": stories})
+    assert response.status_code == 200
+    return response.json()
+
+
+def search(client, q, **params):
+    response = client.get("/api/search/stories", params={"q": q, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestStorySearch:
+    """Test that write paths keep the index current"""
+
+    def test_saved_screens_are_found_with_references(self, search_env):
+        _, client = search_env
+        saved = save(client, "p1", [
+            screen(1, "Meet the new messaging channel"),
+            screen(2, "Customers see a verified sender badge", keywords="RCS verified sender, phone lock screen"),
+        ])
+        save(client, "p2", [screen(1, "Senders of newsletters", keywords="mailbox")])
+
+        hits = search(client, "RCS verified sender")["hits"]
+
+        assert hits[0]["project_id"] == "p1"
+        assert hits[0]["story_id"] == saved["story_files"][1]
+        assert hits[0]["screen_number"] == 2
+        assert "<mark>" in hits[0]["snippet"]
+        assert all(h["project_id"] == "p1" for h in hits)
+
+    def test_resave_replaces_indexed_screens(self, search_env):
+        _, client = search_env
+        save(client, "p1", [screen(1, "Intro about pricing"), screen(2, "Outro about support")])
+        save(client, "p1", [screen(1, "Intro about onboarding")])
+
+        assert search(client, "pricing")["hits"] == []
+        assert search(client, "support")["hits"] == []
+        assert len(search(client, "onboarding")["hits"]) == 1
+        assert get_story_search().get_stats()["stories"] == 1
+
+    def test_chat_messages_and_filters(self, search_env):
+        _, client = search_env
+        save(client, "p1", [screen(1, "Dashboards for analytics")])
+        client.post("/api/chat/save", json={"projectId": "p1", "messages": [
+            {"id": "m1", "role": "user", "content": "Make the analytics screen shorter", "createdAt": "2025-01-01T00:00:00"}]})
+        client.post("/api/chat/save", json={"projectId": "p2", "messages": [
+            {"id": "m9", "role": "assistant", "content": "Analytics are covered", "createdAt": "2025-01-01T00:00:00"}]})
+
+        assert {h["kind"] for h in search(client, "analytics")["hits"]} == {"story", "chat"}
+        chat_hits = search(client, "analytics", kind="chat", project_id="p1")["hits"]
+        assert [(h["message_id"], h["role"]) for h in chat_hits] == [("m1", "user")]
+        assert client.get("/api/search/stories", params={"q": "analytics", "kind": "other"}).status_code == 400
+        assert client.get("/api/search/stories", params={"q": "  !! "}).status_code == 400
+
+    def test_restore_reindexes_storyboard(self, search_env):
+        _, client = search_env
+        save(client, "p1", [screen(1, "Original wording")])
+        save(client, "p1", [screen(1, "Rewritten wording")])
+
+        client.post("/api/project/p1/revisions/1/restore")
+
+        assert len(search(client, "original")["hits"]) == 1
+        assert search(client, "rewritten")["hits"] == []
+
+    def test_existing_projects_are_backfilled(self, search_env, configure, tmp_path):
+        data_dir, _ = search_env
+        project_dir = data_dir / "project_legacy"
+        project_dir.mkdir()
+        (project_dir / "project_type1.json").write_text(json.dumps({"id": "legacy", "stories": ["story_1"]}))
+        (project_dir / "story_1.json").write_text(json.dumps(screen(1, "Handwritten screen about warehouses")))
+        # a fresh index for the same data directory, as after a restart without one
+        configure(STORY_SEARCH_INDEX_PATH=str(tmp_path / "fresh.sqlite3"))
+
+        index = get_story_search()
+        index.wait_for_backfill()
+
+        hits = index.search("warehouse")["hits"]
+        assert [(h["project_id"], h["story_id"]) for h in hits] == [("legacy", "story_1")]
+
+    def test_search_can_be_turned_off(self, search_env, configure):
+        _, client = search_env
+        configure(STORY_SEARCH_INDEX="false")
+        assert client.get("/api/search/stories", params={"q": "anything"}).status_code == 503
+        save(client, "p1", [screen(1, "Still saved")])
+
+
+class TestMatchQuery:
+    """Test turning typed text into FTS5 queries"""
+
+    def test_terms_are_quoted_and_last_is_a_prefix(self):
+        assert build_match_query('RCS "verified" send') == '"rcs" "verified" "send"*'
+        assert build_match_query("a b", any_term=True) == '"a" OR "b"*'
+        assert build_match_query("-- ()") is None
+
+    def test_falls_back_to_any_term(self, search_env):
+        _, client = search_env
+        save(client, "p1", [screen(1, "Quarterly revenue chart")])
+        result = search(client, "revenue unicorn")
+        assert result["matched"] == "any"
+        assert len(result["hits"]) == 1
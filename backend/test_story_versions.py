@@ -0,0 +1,105 @@
+"""
+Test suite for content-addressed story revisions
+"""
+import json
+import pytest
+from app.services.story_versions import BlobStore, blob_hash, get_story_versions
+
+
+def screen(number, text, image="https://images.example.com/a.jpg"):
+    return {"screen_number": number, "voiceover_text": text, "image_url": image}
+
+
+@pytest.fixture
+def versions_env(tmp_path, configure, make_client):
+    configure()
+    for project_id in ("p1", "p2"):
+        project_dir = tmp_path / f"project_{project_id}"
+        project_dir.mkdir()
+        (project_dir / "project_type1.json").write_text(json.dumps({"id": project_id, "stories": []}))
+    return tmp_path, make_client()
+
+
+def save(client, project_id, stories):
+    response = client.post(f"/api/project/{project_id}/save-stories", json={"project_id": project_id, "stories": stories})
+    assert response.status_code == 200
+    return response.json()
+
+
+def blob_count(data_dir):
+    return len(list((data_dir / "blobs").glob("*/*.json")))
+
+
+class TestRevisions:
+    """Test recording, diffing and restoring storyboard revisions"""
+
+    def test_revisions_share_unchanged_blobs(self, versions_env):
+        data_dir, client = versions_env
+        first = save(client, "p1", [screen(1, "Intro"), screen(2, "Middle"), screen(3, "Outro")])
+        assert first["revision"] == 1
+        assert blob_count(data_dir) == 3
+
+        second = save(client, "p1", [screen(1, "Intro"), screen(2, "New middle"), screen(3, "Outro")])
+        assert second["revision"] == 2
+        assert blob_count(data_dir) == 4  # only the changed screen was stored
+
+        save(client, "p2", [screen(1, "Intro")])
+        assert blob_count(data_dir) == 4  # shared across projects
+
+        revisions = client.get("/api/project/p1/revisions").json()["revisions"]
+        assert [(r["revision"], r["source"], r["parent"]) for r in revisions] == [(2, "save", 1), (1, "save", None)]
+
+    def test_identical_save_adds_no_revision(self, versions_env):
+        _, client = versions_env
+        save(client, "p1", [screen(1, "Intro")])
+        assert save(client, "p1", [screen(1, "Intro")])["revision"] == 1
+
+    def test_diff_lists_changed_fields(self, versions_env):
+        _, client = versions_env
+        save(client, "p1", [screen(1, "Intro"), screen(2, "Middle")])
+        save(client, "p1", [screen(1, "Intro", image="https://images.example.com/b.jpg"), screen(3, "Extra")])
+
+        diff = client.get("/api/project/p1/revisions/2/diff").json()
+        assert diff["summary"] == {"added": 1, "removed": 1, "changed": 1, "unchanged": 0}
+        assert diff["screens"][0]["fields"] == ["image_url"]
+        assert [s["status"] for s in diff["screens"]] == ["changed", "removed", "added"]
+        assert client.get("/api/project/p1/revisions/1/diff").status_code == 400
+
+    def test_restore_rewrites_only_differing_files(self, versions_env):
+        data_dir, client = versions_env
+        project_dir = data_dir / "project_p1"
+        first = save(client, "p1", [screen(1, "Intro"), screen(2, "Middle"), screen(3, "Outro")])
+        unchanged = project_dir / f"{first['story_files'][0]}.json"
+        mtime = unchanged.stat().st_mtime_ns
+        save(client, "p1", [screen(1, "Intro"), screen(2, "New middle")])
+        assert not (project_dir / f"{first['story_files'][2]}.json").exists()
+
+        response = client.post("/api/project/p1/revisions/1/restore")
+
+        assert response.status_code == 200
+        assert response.json()["revision"] == 3
+        stories = client.get("/api/project/p1").json()["stories"]
+        assert [s["voiceover_text"] for s in stories] == ["Intro", "Middle", "Outro"]
+        assert unchanged.stat().st_mtime_ns == mtime
+        assert client.get("/api/project/p1/revisions").json()["revisions"][0]["restored_from"] == 1
+        assert client.post("/api/project/p1/revisions/9/restore").status_code == 404
+
+    def test_first_save_keeps_earlier_storyboard_as_baseline(self, versions_env):
+        data_dir, client = versions_env
+        project_dir = data_dir / "project_p1"
+        (project_dir / "story_1.json").write_text(json.dumps(screen(1, "Legacy")))
+        (project_dir / "project_type1.json").write_text(json.dumps({"id": "p1", "stories": ["story_1"]}))
+
+        save(client, "p1", [screen(1, "Rewritten")])
+
+        revisions = get_story_versions(project_dir).list()
+        assert [r.source for r in revisions] == ["baseline", "save"]
+        assert get_story_versions(project_dir).stories(revisions[0]) == [screen(1, "Legacy")]
+
+    def test_blob_store_is_content_addressed(self, tmp_path):
+        blobs = BlobStore(tmp_path)
+        story = screen(1, "Intro")
+        digest = blobs.put(story)
+        assert digest == blob_hash({"voiceover_text": "Intro", "image_url": story["image_url"], "screen_number": 1})
+        assert blobs.put(dict(story)) == digest
+        assert blobs.get(digest) == story
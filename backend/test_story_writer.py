@@ -0,0 +1,170 @@
+"""
+Test suite for diff-based story persistence
+"""
+import json
+import pytest
+from app.services import image_query_index as index_module
+from app.services.story_writer import StoryWriter, named_screens, story_content_hash
+
+
+def screen(number, text, keywords):
+    return {"screen_number": number, "voiceover_text": text, "on_screen_visual_keywords": keywords}
+
+
+@pytest.fixture
+def project(monkeypatch, tmp_path, configure):
+    """Project with a three-screen storyboard whose images were already found"""
+    configure()
+    queries = []
+
+    def fake_search(query):
+        queries.append(query)
+        return [{"link": f"https://images.example.com/{query.replace(' ', '-')}.jpg", "score": 0.9}]
+
+    monkeypatch.setattr(index_module, "search_image_candidates", fake_search)
+    project_dir = tmp_path / "project_p1"
+    project_dir.mkdir()
+    (project_dir / "project_type1.json").write_text(json.dumps({"id": "p1", "stories": []}))
+    writer = StoryWriter(project_dir, deferred=False)
+    for story in [screen(1, "Intro", "office desk"), screen(2, "Middle", "city skyline"), screen(3, "Outro", "sunset")]:
+        writer.add(story)
+    writer.finish()
+    queries.clear()
+    return project_dir, queries
+
+
+def listed(project_dir):
+    return json.loads((project_dir / "project_type1.json").read_text())["stories"]
+
+
+def read(project_dir, name):
+    return json.loads((project_dir / f"{name}.json").read_text())
+
+
+class TestStoryDiff:
+    """Test rewriting only the screens that changed"""
+
+    def test_only_changed_screens_are_rewritten(self, project):
+        project_dir, queries = project
+        before = listed(project_dir)
+        mtimes = {name: (project_dir / f"{name}.json").stat().st_mtime_ns for name in before}
+
+        writer = StoryWriter(project_dir, deferred=False)
+        for story in [screen(1, "Intro", "office desk"), screen(2, "New middle", "city skyline"), screen(3, "Outro", "beach")]:
+            writer.add(story)
+        stories = writer.finish()
+
+        assert stories == before == listed(project_dir)
+        assert writer.stats == {"unchanged": 1, "changed": 2, "added": 0, "removed": 0}
+        assert (project_dir / f"{before[0]}.json").stat().st_mtime_ns == mtimes[before[0]]
+        assert queries == ["beach"]  # screen 2 kept its image, its keywords did not change
+        assert read(project_dir, before[1])["image_url"] == "https://images.example.com/city-skyline.jpg"
+        assert read(project_dir, before[2])["image_url"] == "https://images.example.com/beach.jpg"
+
+    def test_reply_to_named_screens_is_merged(self, project):
+        project_dir, _ = project
+        before = listed(project_dir)
+
+        writer = StoryWriter(project_dir, deferred=False)
+        writer.add(screen(2, "Shorter middle", "city skyline"))
+        writer.finish(edited=named_screens("Please shorten screen 2"))
+
+        assert listed(project_dir) == before
+        assert read(project_dir, before[1])["voiceover_text"] == "Shorter middle"
+        assert read(project_dir, before[0])["voiceover_text"] == "Intro"
+
+    def test_shorter_regeneration_replaces_the_storyboard(self, project):
+        project_dir, _ = project
+        before = listed(project_dir)
+
+        writer = StoryWriter(project_dir, deferred=False)
+        for story in [screen(1, "New intro", "office desk"), screen(2, "New outro", "sunset")]:
+            writer.add(story)
+        stories = writer.finish(edited=named_screens("Make the whole video shorter"))
+
+        assert listed(project_dir) == stories == before[:2]
+        assert not (project_dir / f"{before[2]}.json").exists()
+
+    def test_named_screens(self):
+        assert named_screens("shorten screen 2") == {2}
+        assert named_screens("Screens 1, 3 and #5 need a CTA; also scene 7") == {1, 3, 5, 7}
+        assert named_screens("redo screens 2-4") == {2, 3, 4}
+        assert named_screens("Create a storyboard with 6 screens") == set()
+
+    def test_full_reply_replaces_and_removes_stale_files(self, project):
+        project_dir, _ = project
+        before = listed(project_dir)
+        # an older generation left in the list by the append-only writer
+        (project_dir / "story_1.json").write_text(json.dumps(screen(1, "Ancient intro", "old")))
+        project_file = project_dir / "project_type1.json"
+        project_file.write_text(json.dumps({"id": "p1", "stories": ["story_1"] + before}))
+
+        writer = StoryWriter(project_dir, deferred=False)
+        for story in [screen(1, "Intro", "office desk"), screen(2, "Middle", "city skyline"), screen(3, "Outro", "sunset"), screen(4, "Extra", "crowd")]:
+            writer.add(story)
+        stories = writer.finish()
+
+        assert stories[:3] == before and len(stories) == 4
+        assert writer.stats == {"unchanged": 3, "changed": 0, "added": 1, "removed": 1}
+        assert not (project_dir / "story_1.json").exists()
+        assert sorted(p.stem for p in project_dir.glob("story_*.json")) == sorted(stories)
+
+    def test_discard_restores_rewritten_screens(self, project):
+        project_dir, _ = project
+        before = listed(project_dir)
+        original = read(project_dir, before[0])
+
+        writer = StoryWriter(project_dir, deferred=False)
+        writer.add(screen(1, "Changed intro", "office desk"))
+        writer.add(screen(5, "Brand new", "crowd"))
+        writer.discard()
+
+        assert read(project_dir, before[0]) == original
+        assert len(list(project_dir.glob("story_*.json"))) == 3
+
+    def test_concurrent_writers_pick_distinct_names(self, project):
+        project_dir, _ = project
+        first, second = StoryWriter(project_dir, deferred=False), StoryWriter(project_dir, deferred=False)
+        second.timestamp = first.timestamp
+
+        names = [first.add(screen(4, "First", "forest")).result(), second.add(screen(4, "Second", "desert")).result()]
+
+        assert names[0] != names[1]
+        assert [read(project_dir, name)["voiceover_text"] for name in names] == ["First", "Second"]
+
+    def test_image_resolved_meanwhile_is_kept(self, project):
+        project_dir, _ = project
+        name = listed(project_dir)[1]
+        writer = StoryWriter(project_dir, deferred=False)
+        # the resolver patches the story after the writer read the storyboard
+        (project_dir / f"{name}.json").write_text(json.dumps({**read(project_dir, name), "image_url": "https://images.example.com/resolved.jpg"}))
+
+        writer.add(screen(2, "New middle", "city skyline")).result()
+
+        assert read(project_dir, name)["voiceover_text"] == "New middle"
+        assert read(project_dir, name)["image_url"] == "https://images.example.com/resolved.jpg"
+
+    def test_hash_ignores_image_fields(self):
+        story = screen(1, "Intro", "office desk")
+        assert story_content_hash(story) == story_content_hash({**story, "image_url": "x.jpg", "image_status": "ready"})
+        assert story_content_hash(story) != story_content_hash({**story, "voiceover_text": "Outro"})
+
+
+class TestSaveStories:
+    """Test the save-stories endpoint"""
+
+    def test_save_replaces_list_and_removes_dropped_screens(self, project, make_client):
+        project_dir, queries = project
+        before = listed(project_dir)
+        stories = [read(project_dir, name) for name in before]
+        stories[1]["image_url"] = "https://images.example.com/picked.jpg"
+        client = make_client()
+
+        response = client.post("/api/project/p1/save-stories", json={"project_id": "p1", "stories": stories[:2]})
+
+        assert response.status_code == 200
+        assert response.json()["changes"] == {"unchanged": 1, "changed": 1, "added": 0, "removed": 1}
+        assert listed(project_dir) == before[:2]
+        assert read(project_dir, before[1])["image_url"] == "https://images.example.com/picked.jpg"
+        assert not (project_dir / f"{before[2]}.json").exists()
+        assert queries == []
@@ -0,0 +1,117 @@
+"""
+Test suite for request tracing
+"""
+import json
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.tracing import (
+    Tracer,
+    TracingMiddleware,
+    RingBufferExporter,
+    JsonlExporter,
+    parse_traceparent,
+    trace_headers,
+    group_traces,
+    stage_breakdown,
+    tracer as global_tracer,
+    ring_buffer,
+)
+
+
+class TestSpans:
+    """Test span nesting and export"""
+
+    def test_children_share_trace_and_point_at_parent(self):
+        buffer = RingBufferExporter()
+        tracer = Tracer([buffer])
+        with tracer.span("root") as root:
+            with tracer.span("child", screen=1) as child:
+                pass
+
+        spans = {s["name"]: s for s in buffer.spans()}
+        assert spans["child"]["trace_id"] == root.trace_id
+        assert spans["child"]["parent_id"] == root.span_id
+        assert spans["child"]["attributes"] == {"screen": 1}
+        assert spans["root"]["parent_id"] is None
+        assert child.duration_ms <= root.duration_ms
+
+    def test_error_marks_span(self):
+        buffer = RingBufferExporter()
+        tracer = Tracer([buffer])
+        try:
+            with tracer.span("boom"):
+                raise RuntimeError("bad")
+        except RuntimeError:
+            pass
+        assert buffer.spans()[0]["status"] == "error"
+
+    def test_ring_buffer_is_bounded(self):
+        buffer = RingBufferExporter(capacity=3)
+        tracer = Tracer([buffer])
+        for i in range(5):
+            with tracer.span(f"s{i}"):
+                pass
+        assert [s["name"] for s in buffer.spans()] == ["s2", "s3", "s4"]
+
+    def test_jsonl_exporter(self, tmp_path):
+        path = tmp_path / "spans.jsonl"
+        tracer = Tracer([JsonlExporter(str(path))])
+        with tracer.span("a"):
+            with tracer.span("b"):
+                pass
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line["name"] for line in lines] == ["b", "a"]
+
+
+class TestPropagation:
+    """Test traceparent handling"""
+
+    def test_parse_valid(self):
+        trace_id, parent_id = parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01")
+        assert trace_id == "a" * 32
+        assert parent_id == "b" * 16
+
+    def test_parse_invalid(self):
+        assert parse_traceparent("garbage") == (None, None)
+        assert parse_traceparent(None) == (None, None)
+
+    def test_outgoing_headers_follow_current_span(self):
+        assert trace_headers() == {}
+        with global_tracer.span("outer") as span:
+            assert trace_headers()["traceparent"] == f"00-{span.trace_id}-{span.span_id}-01"
+
+    def test_middleware_joins_incoming_trace(self):
+        app = FastAPI()
+        app.add_middleware(TracingMiddleware)
+
+        @app.get("/things/{thing_id}")
+        async def get_thing(thing_id: str):
+            with global_tracer.span("inner"):
+                return {"id": thing_id}
+
+        incoming = "c" * 32
+        response = TestClient(app).get("/things/7", headers={"traceparent": f"00-{incoming}-{'d' * 16}-01"})
+        assert response.headers["x-trace-id"] == incoming
+
+        spans = [s for s in ring_buffer.spans() if s["trace_id"] == incoming]
+        names = {s["name"] for s in spans}
+        assert names == {"GET /things/{thing_id}", "inner"}
+
+
+class TestSummaries:
+    """Test trace grouping and per-stage breakdowns"""
+
+    def test_group_and_breakdown(self):
+        buffer = RingBufferExporter()
+        tracer = Tracer([buffer])
+        for _ in range(3):
+            with tracer.span("POST /api/chat"):
+                with tracer.span("langflow.post"):
+                    pass
+
+        traces = group_traces(buffer.spans())
+        assert len(traces) == 3
+        assert all(t["name"] == "POST /api/chat" and t["spans"] == 2 for t in traces)
+
+        stages = stage_breakdown(buffer.spans())
+        assert stages["langflow.post"]["count"] == 3
@@ -12,6 +12,71 @@ interface EnhancedChatbotProps {
   className?: string;
 }
 
+interface ChatStreamHandlers {
+  onToken: (chunk: string) => void;
+  onReset: () => void;
+}
+
+// The turn itself failed (an `error` event); retrying the same key would not help
+class ChatTurnError extends Error {}
+
+// Read the /api/chat/stream server-sent events and resolve with the final message
+const streamChat = async (
+  body: object,
+  idempotencyKey: string,
+  handlers: ChatStreamHandlers,
+  signal: AbortSignal
+): Promise<string> => {
+  const response = await fetch("http://localhost:8001/api/chat/stream", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      // a retry waits for the Langflow run already going instead of starting another
+      "Idempotency-Key": idempotencyKey,
+    },
+    body: JSON.stringify(body),
+    signal,
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error("Failed to get response from AI");
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      // Lines starting with ":" are heartbeats
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (!data) continue;
+
+      const payload = JSON.parse(data);
+      if (event === "token") handlers.onToken(payload.chunk);
+      else if (event === "reset") handlers.onReset();
+      else if (event === "saved") window.dispatchEvent(new CustomEvent("storyboard:stories-saved", { detail: payload }));
+      else if (event === "done") return payload.message;
+      else if (event === "error") throw new ChatTurnError(payload.detail);
+    }
+  }
+
+  throw new Error("Chat stream ended before the response was complete");
+};
+
 const EnhancedChatbot: React.FC<EnhancedChatbotProps> = ({ className }) => {
   const scrollAreaRef = useRef<HTMLDivElement>(null);
   const [messages, setMessages] = useState<Message[]>([]);
@@ -137,6 +202,22 @@ const EnhancedChatbot: React.FC<EnhancedChatbotProps> = ({ className }) => {
     return () => clearTimeout(timeoutId);
   }, [messages, projectId]);
 
+  // Messages saved from another editor of this project arrive over its WebSocket
+  useEffect(() => {
+    const handleChatMessage = (event: Event) => {
+      const msg = (event as CustomEvent).detail;
+      if (!msg?.id) return;
+      setMessages((prev) =>
+        prev.some((existing) => existing.id === msg.id)
+          ? prev
+          : [...prev, { id: msg.id, role: msg.role, content: msg.content, createdAt: new Date(msg.createdAt) }]
+      );
+    };
+
+    window.addEventListener("storyboard:chat-message", handleChatMessage);
+    return () => window.removeEventListener("storyboard:chat-message", handleChatMessage);
+  }, []);
+
   useEffect(() => {
     scrollToBottom();
   }, [messages]);
@@ -145,6 +226,58 @@ const EnhancedChatbot: React.FC<EnhancedChatbotProps> = ({ className }) => {
     setInput(e.target.value);
   };
 
+  // Stream the reply into an assistant message as it is generated
+  const sendToAI = async (content: string) => {
+    const aiMessageId = (Date.now() + 1).toString();
+    const setAIContent = (update: (previous: string) => string) => {
+      setMessages((prev) => {
+        if (!prev.some((msg) => msg.id === aiMessageId)) {
+          return [...prev, { id: aiMessageId, role: "assistant", content: update(""), createdAt: new Date() }];
+        }
+        return prev.map((msg) => (msg.id === aiMessageId ? { ...msg, content: update(msg.content) } : msg));
+      });
+    };
+
+    const body = {
+      message: content,
+      conversation_history: messages.map((msg) => ({
+        role: msg.role,
+        content: msg.content,
+      })),
+      project_id: projectId,
+    };
+    const handlers = {
+      onToken: (chunk: string) => setAIContent((previous) => previous + chunk),
+      onReset: () => setAIContent(() => ""),
+    };
+    const idempotencyKey = `chat-${projectId ?? "none"}-${aiMessageId}`;
+
+    try {
+      // A dropped or timed-out stream is retried once with the same key and body,
+      // which attaches to the turn still running on the server
+      for (let attempt = 0; ; attempt++) {
+        // Extended timeout for Langflow processing
+        const controller = new AbortController();
+        const timeoutId = setTimeout(() => controller.abort(), 380000); // 6 minutes 20 seconds
+        try {
+          const message = await streamChat(body, idempotencyKey, handlers, controller.signal);
+          setAIContent(() => message);
+          break;
+        } catch (error) {
+          if (error instanceof ChatTurnError || attempt > 0) throw error;
+          console.warn("Chat stream dropped, waiting for the running turn:", error);
+        } finally {
+          clearTimeout(timeoutId);
+        }
+      }
+    } catch (error) {
+      console.error("Error calling AI API:", error);
+      setAIContent(() => "I'm having trouble connecting to the AI service right now. Please try again in a moment.");
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!input.trim() || isLoading) return;
@@ -161,59 +294,7 @@ const EnhancedChatbot: React.FC<EnhancedChatbotProps> = ({ className }) => {
     setInput("");
     setIsLoading(true);
 
-    try {
-      // Call backend API with extended timeout for Langflow processing
-      const controller = new AbortController();
-      const timeoutId = setTimeout(() => controller.abort(), 380000); // 6 minutes 20 seconds
-
-      const response = await fetch("http://localhost:8001/api/chat", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          message: currentInput,
-          conversation_history: messages.map((msg) => ({
-            role: msg.role,
-            content: msg.content,
-          })),
-          project_id: projectId,
-        }),
-        signal: controller.signal,
-      });
-
-      clearTimeout(timeoutId);
-
-      if (!response.ok) {
-        throw new Error("Failed to get response from AI");
-      }
-
-      const data = await response.json();
-
-      const aiResponse: Message = {
-        id: (Date.now() + 1).toString(),
-        role: "assistant",
-        content: data.message,
-        createdAt: new Date(),
-      };
-
-      setMessages((prev) => [...prev, aiResponse]);
-    } catch (error) {
-      console.error("Error calling AI API:", error);
-
-      // Fallback to mock response if API fails
-      const aiResponse: Message = {
-        id: (Date.now() + 1).toString(),
-        role: "assistant",
-        content:
-          "I'm having trouble connecting to the AI service right now. Please try again in a moment.",
-        createdAt: new Date(),
-      };
-
-      setMessages((prev) => [...prev, aiResponse]);
-    } finally {
-      setIsLoading(false);
-    }
+    await sendToAI(currentInput);
   };
 
   const handleKeyDown = (e: React.KeyboardEvent) => {
@@ -236,59 +317,7 @@ const EnhancedChatbot: React.FC<EnhancedChatbotProps> = ({ className }) => {
     setMessages((prev) => [...prev, userMessage]);
     setIsLoading(true);
 
-    try {
-      // Call backend API with extended timeout for Langflow processing
-      const controller = new AbortController();
-      const timeoutId = setTimeout(() => controller.abort(), 380000); // 6 minutes 20 seconds
-
-      const response = await fetch("http://localhost:8001/api/chat", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          message: action,
-          conversation_history: messages.map((msg) => ({
-            role: msg.role,
-            content: msg.content,
-          })),
-          project_id: projectId,
-        }),
-        signal: controller.signal,
-      });
-
-      clearTimeout(timeoutId);
-
-      if (!response.ok) {
-        throw new Error("Failed to get response from AI");
-      }
-
-      const data = await response.json();
-
-      const aiResponse: Message = {
-        id: (Date.now() + 1).toString(),
-        role: "assistant",
-        content: data.message,
-        createdAt: new Date(),
-      };
-
-      setMessages((prev) => [...prev, aiResponse]);
-    } catch (error) {
-      console.error("Error calling AI API:", error);
-
-      // Fallback to mock response if API fails
-      const aiResponse: Message = {
-        id: (Date.now() + 1).toString(),
-        role: "assistant",
-        content:
-          "I'm having trouble connecting to the AI service right now. Please try again in a moment.",
-        createdAt: new Date(),
-      };
-
-      setMessages((prev) => [...prev, aiResponse]);
-    } finally {
-      setIsLoading(false);
-    }
+    await sendToAI(action);
   };
 
   return (
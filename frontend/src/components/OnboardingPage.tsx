@@ -67,6 +67,7 @@ const OnboardingPage: React.FC = () => {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
+          "Idempotency-Key": `create-project-${projectId}`,
         },
         body: JSON.stringify({
           projectId,
@@ -124,6 +125,8 @@ const OnboardingPage: React.FC = () => {
             method: "POST",
             headers: {
               "Content-Type": "application/json",
+              // a retried first turn waits for the running Langflow flow instead of starting another
+              "Idempotency-Key": `initial-chat-${projectId}`,
             },
             body: JSON.stringify({
               message: promptWithType,
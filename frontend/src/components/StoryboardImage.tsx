@@ -8,11 +8,17 @@ interface StoryboardImageProps {
   className?: string;
 }
 
+// Images served by the backend proxy come in fixed thumbnail widths
+const PROXY_PREFIX = "/api/images/";
+const PROXY_WIDTHS = [320, 640, 1280];
+
 const StoryboardImage: React.FC<StoryboardImageProps> = ({
   imageUrl,
   alt,
   className
 }) => {
+  const isProxied = imageUrl?.startsWith(PROXY_PREFIX);
+
   return (
     <div className={cn(
       "w-64 h-40 bg-muted rounded-lg flex items-center justify-center overflow-hidden flex-shrink-0",
@@ -20,7 +26,10 @@ const StoryboardImage: React.FC<StoryboardImageProps> = ({
     )}>
       {imageUrl ? (
         <img
-          src={imageUrl}
+          src={isProxied ? `${imageUrl}?w=640` : imageUrl}
+          srcSet={isProxied ? PROXY_WIDTHS.map((w) => `${imageUrl}?w=${w} ${w}w`).join(", ") : undefined}
+          sizes={isProxied ? "256px" : undefined}
+          loading="lazy"
           alt={alt}
           className="object-cover w-full h-full"
           onError={(e) => {
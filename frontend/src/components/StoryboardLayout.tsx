@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 import StoryboardEditor from "@/components/StoryboardEditor";
 import EnhancedChatbot from "@/components/EnhancedChatbot";
@@ -19,6 +19,61 @@ interface Story {
   [key: string]: any;
 }
 
+interface ImageProgress {
+  total: number;
+  pending: number;
+  ready: number;
+  missing: number;
+  error: number;
+}
+
+// How often to re-read the project while story images are still being found
+const IMAGE_POLL_INTERVAL_MS = 2000;
+
+const PROJECT_EVENTS_URL = "ws://localhost:8001/ws/project";
+const RECONNECT_DELAY_MS = 3000;
+
+// Stories in display order with the story file ids the server knows them by
+interface Storyboard {
+  ids: string[];
+  stories: Story[];
+}
+
+interface ProjectEvent {
+  type: string;
+  project_id: string;
+  seq?: number;
+  data?: any;
+}
+
+const replaceStory = (
+  storyboard: Storyboard,
+  storyId: string,
+  update: (story: Story) => Story
+): Storyboard => {
+  const index = storyboard.ids.indexOf(storyId);
+  if (index === -1) {
+    return storyboard;
+  }
+  const stories = [...storyboard.stories];
+  stories[index] = update(stories[index]);
+  return { ...storyboard, stories };
+};
+
+const countImages = (stories: Story[]): ImageProgress => {
+  const progress: ImageProgress = { total: 0, pending: 0, ready: 0, missing: 0, error: 0 };
+  for (const story of stories) {
+    const status = story.image_status || "ready";
+    progress.total += 1;
+    if (status === "pending" || status === "missing" || status === "error") {
+      progress[status] += 1;
+    } else {
+      progress.ready += 1;
+    }
+  }
+  return progress;
+};
+
 interface ProjectData {
   id: string;
   type: number;
@@ -33,9 +88,32 @@ const StoryboardLayout: React.FC = () => {
   const { projectId } = useParams<{ projectId: string }>();
   const navigate = useNavigate();
   const [projectData, setProjectData] = useState<ProjectData | null>(null);
-  const [stories, setStories] = useState<Story[]>([]);
+  const [storyboard, setStoryboard] = useState<Storyboard>({ ids: [], stories: [] });
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const [imageProgress, setImageProgress] = useState<ImageProgress | null>(null);
+  const [liveUpdates, setLiveUpdates] = useState(false);
+  // Stories pushed before the storyboard update that lists them
+  const incomingStories = useRef<Record<string, Story>>({});
+
+  const applyProject = (data: any) => {
+    const stories: Story[] = data.stories || [];
+    setStoryboard({ ids: data.story_ids || stories.map((_, i) => `story_${i}`), stories });
+    setImageProgress(data.images || null);
+  };
+
+  const refreshProject = async () => {
+    try {
+      const response = await fetch(
+        `http://localhost:8001/api/project/${projectId}`
+      );
+      if (response.ok) {
+        applyProject(await response.json());
+      }
+    } catch (error) {
+      console.error("Error refreshing stories:", error);
+    }
+  };
 
   useEffect(() => {
     const loadProjectData = async () => {
@@ -61,7 +139,7 @@ const StoryboardLayout: React.FC = () => {
 
         const data = await response.json();
         setProjectData(data.project);
-        setStories(data.stories || []);
+        applyProject(data);
 
         // Update sessionStorage with project context for chatbot
         sessionStorage.setItem("projectId", projectId);
@@ -85,6 +163,113 @@ const StoryboardLayout: React.FC = () => {
     loadProjectData();
   }, [projectId]);
 
+  // Stories are saved before their images are found; without live updates,
+  // refresh them until none are pending
+  useEffect(() => {
+    if (!projectId || liveUpdates || !imageProgress?.pending) {
+      return;
+    }
+
+    const timer = setTimeout(refreshProject, IMAGE_POLL_INTERVAL_MS);
+    return () => clearTimeout(timer);
+  }, [projectId, imageProgress, liveUpdates]);
+
+  // Apply changes pushed over the project's WebSocket instead of refetching the project
+  useEffect(() => {
+    if (!projectId) {
+      return;
+    }
+
+    const handleEvent = (event: ProjectEvent) => {
+      switch (event.type) {
+        case "story.added":
+        case "story.updated": {
+          const { story_id, story } = event.data;
+          incomingStories.current[story_id] = story;
+          setStoryboard((prev) => replaceStory(prev, story_id, () => story));
+          break;
+        }
+        case "image.resolved": {
+          const { story_id, ...imageFields } = event.data;
+          setStoryboard((prev) => replaceStory(prev, story_id, (story) => ({ ...story, ...imageFields })));
+          break;
+        }
+        case "storyboard.updated": {
+          const ids: string[] = event.data.stories;
+          setStoryboard((prev) => {
+            const known: Record<string, Story> = { ...incomingStories.current };
+            prev.ids.forEach((id, i) => {
+              known[id] = known[id] || prev.stories[i];
+            });
+            if (ids.some((id) => !known[id])) {
+              refreshProject();
+              return prev;
+            }
+            return { ids, stories: ids.map((id) => known[id]) };
+          });
+          incomingStories.current = {};
+          break;
+        }
+        case "chat.message":
+          window.dispatchEvent(new CustomEvent("storyboard:chat-message", { detail: event.data.message }));
+          break;
+        case "resync":
+          refreshProject();
+          break;
+      }
+    };
+
+    let socket: WebSocket | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    let closed = false;
+
+    const connect = () => {
+      socket = new WebSocket(`${PROJECT_EVENTS_URL}/${projectId}`);
+      socket.onopen = () => {
+        setLiveUpdates(true);
+        // catch up on anything that changed while disconnected
+        refreshProject();
+      };
+      socket.onmessage = (message) => handleEvent(JSON.parse(message.data));
+      socket.onclose = () => {
+        setLiveUpdates(false);
+        if (!closed) {
+          retryTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      socket?.close();
+    };
+  }, [projectId]);
+
+  // Image progress follows the stories as deltas arrive
+  useEffect(() => {
+    if (liveUpdates) {
+      setImageProgress(countImages(storyboard.stories));
+    }
+  }, [storyboard, liveUpdates]);
+
+  // Without live updates, the chat stream's announcement of new stories triggers a refetch
+  useEffect(() => {
+    if (!projectId || liveUpdates) {
+      return;
+    }
+
+    const handleStoriesSaved = (event: Event) => {
+      if ((event as CustomEvent).detail?.project_id === projectId) {
+        refreshProject();
+      }
+    };
+
+    window.addEventListener("storyboard:stories-saved", handleStoriesSaved);
+    return () => window.removeEventListener("storyboard:stories-saved", handleStoriesSaved);
+  }, [projectId, liveUpdates]);
+
   if (isLoading) {
     return (
       <div className="h-screen flex items-center justify-center">
@@ -121,7 +306,7 @@ const StoryboardLayout: React.FC = () => {
           <StoryboardHeader projectData={projectData} />
         </div>
         <div className="flex flex-1 min-h-0 pt-4 px-4 overflow-hidden">
-          <StoryboardEditor className="h-full" stories={stories} />
+          <StoryboardEditor className="h-full" stories={storyboard.stories} />
         </div>
       </div>
       <div className="w-1/4 h-full">